@@ -11,6 +11,7 @@
  * - 構造化された出力
  * - ウォッチドッグタイマー対応
  * - メモリ使用量最適化
+ * - WiFi (TCP) コンソール: シリアルと同じコマンドを受け付け、出力は両方に送る
  */
 
 #include <WiFiNINA.h>
@@ -33,17 +34,70 @@
 #define POWER_LED_PIN 8     // 電源表示LED
 #define RESET_PIN 9         // リセットボタン (オプション)
 
+// WiFi コンソール (ビルド時に -DWIFI_SSID='"..."' -DWIFI_PASSWORD='"..."' で指定。空なら使わない)
+#ifndef WIFI_SSID
+#define WIFI_SSID ""
+#endif
+#ifndef WIFI_PASSWORD
+#define WIFI_PASSWORD ""
+#endif
+#define CONSOLE_TCP_PORT 2323
+#define WIFI_RETRY_INTERVAL 60000   // つながらないときに接続し直す間隔
+#define WIFI_POLL_INTERVAL 500      // WiFi.status() で接続状態を見る間隔 (1回ごとに NINA との SPI 転送)
+
 // システム定数 (設定可能)
 #define LED_COUNT 4
 #define DEFAULT_TEMP_THRESHOLD 5.0
 #define DEFAULT_DISTANCE_THRESHOLD 10
 #define DEFAULT_DETECTION_THRESHOLD 4
 #define DEFAULT_SAMPLING_INTERVAL 200
+#define PIR_POLL_INTERVAL 5         // PIR のレベル確認の間隔 (ms)。立ち上がりは割り込みでも拾う
+#define AMBIENT_READ_INTERVAL 10000 // 環境温度はゆっくりしか変わらないので、この間隔で読み置く (ms)
+#define MOTION_HOLD_TIME 2000       // PIR・温度に兆候があってから、この間は超音波で距離も測る (ms)
+#define ULTRASONIC_TIMEOUT 30000    // エコー待ちの上限 (µs)
+#define ULTRASONIC_PING_INTERVAL 60 // 超音波を続けて測るときの間隔 (ms)。前の残響が消えるまで空ける
+#define DISTANCE_MEDIAN_SIZE 5      // 距離の中央値フィルタの幅 (奇数)
+#define FUSION_WINDOW 8             // 検知の判断に使う直近のサンプル数 (偶数。新しい半分と古い半分を比べる)
+#define FUSION_CONFIRM 2            // スコアがこの回数続けて閾値以上になったら検知する
+#define PIR_CONFIRM_HITS 2          // 窓内で PIR が反応したサンプルがこの数以上なら PIR の根拠とする
 #define DEFAULT_ALERT_DURATION 3000
 #define CALIBRATION_TIME 30000
+#define CALIBRATION_READINGS 20     // 環境温度の測定回数
+#define CALIBRATION_READ_INTERVAL 100
+#define LED_REFRESH_INTERVAL 50     // LED表示の更新間隔 (ms)
+#define STARTUP_RAINBOW_FRAMES 128
+#define STARTUP_FRAME_INTERVAL 20
 #define WATCHDOG_TIMEOUT 30000
 #define MAX_SERIAL_BUFFER 256
+#define SERIAL_READ_CHUNK 64       // 1回にまとめて読み込むバイト数
+#define MAX_BATCH_SETTINGS 8       // 1つの set で変更できる項目数
 #define JSON_BUFFER_SIZE 512
+#define JSON_STATUS_BUFFER_SIZE 1024
+#define DETAILS_BUFFER_SIZE 56     // 検知詳細の表示用
+#define STATS_WINDOW 32            // 窓統計のサンプル数 (リングバッファ長)
+#define STATS_EMA_ALPHA 0.1        // 指数移動平均の係数
+
+// バイナリフレーム (bin コマンドで有効。サンプリングごとに1フレーム送る)
+// キーフレーム: A5 5A | 1 | seq | timestamp(4) | flags | 物体温度(2) | 環境温度(2) | 距離(2) | 検知回数(4) | CRC(2)
+// 差分フレーム: A5 5A | 2 | seq | 経過ms(2)    | flags | Δ物体温度 | Δ環境温度 | Δ距離 | CRC(2)
+// 多バイト値はリトルエンディアン。温度は 0.01°C、距離は 0.1cm 単位の整数。
+// CRC は type から CRC の直前まで (CRC-16/CCITT-FALSE)
+#define FRAME_SYNC1 0xA5
+#define FRAME_SYNC2 0x5A
+#define FRAME_KEY 1
+#define FRAME_DELTA 2
+#define KEY_FRAME_SIZE 21
+#define DELTA_FRAME_SIZE 12
+#define KEY_FRAME_INTERVAL 16      // 差分フレームが続いてもこの数ごとにキーフレームを送る
+#define FRAME_TEMP_NONE INT16_MIN  // 温度が NaN
+#define FRAME_DISTANCE_NONE 0xFFFF // 距離が測れなかった (-1)
+#define FRAME_FLAG_PIR1 0x01
+#define FRAME_FLAG_PIR2 0x02
+#define FRAME_FLAG_VALID 0x04
+#define FRAME_FLAG_DETECTION 0x08  // 差分フレームで検知回数が1増えた
+#define FRAME_STATE_SHIFT 4
+#define HISTORY_SIZE 512           // 直近のサンプル履歴 (200ms 間隔で約100秒分、dump コマンドで送る)
+#define DUMP_FRAMES_PER_LOOP 4     // dump で1回の loop() に送るフレーム数の上限
 
 // エラーコード
 enum ErrorCode {
@@ -55,6 +109,17 @@ enum ErrorCode {
   ERROR_COMMUNICATION = 5
 };
 
+// 検知理由 (ビットの組み合わせ)
+enum DetectionReason : uint8_t {
+  REASON_NONE = 0,
+  REASON_PIR_LEFT = 1,    // PIR1 (左側)
+  REASON_PIR_RIGHT = 2,   // PIR2 (右側)
+  REASON_TEMP = 4,
+  REASON_MOVE = 8,
+  REASON_DIR_LEFT_RIGHT = 16,  // 左の PIR が先に反応した (左から右へ通過)
+  REASON_DIR_RIGHT_LEFT = 32
+};
+
 // システム設定構造体
 struct SystemConfig {
   float tempThreshold = DEFAULT_TEMP_THRESHOLD;
@@ -65,9 +130,18 @@ struct SystemConfig {
   bool enableSound = true;
   bool enableLEDs = true;
   bool enableJsonOutput = false;
+  bool enableBinaryOutput = false;
   bool debugMode = false;
 };
 
+// コンソール出力 (シリアルと、接続中なら TCP クライアントの両方に書く)
+class ConsoleOutput : public Print {
+ public:
+  size_t write(uint8_t c) override;
+  size_t write(const uint8_t *buffer, size_t size) override;
+  using Print::write;
+};
+
 // センサーオブジェクト
 Adafruit_MLX90614 mlx = Adafruit_MLX90614();
 Adafruit_NeoPixel strip(LED_COUNT, LED_PIN, NEO_GRB + NEO_KHZ800);
@@ -81,19 +155,209 @@ enum SystemState {
   ERROR_STATE
 };
 
+// 音の1ステップ (周波数0は休符)
+struct ToneStep {
+  uint16_t frequency;
+  uint16_t duration;   // 鳴らす時間 (ms)
+  uint16_t step;       // 次の音までの時間 (ms)
+};
+
+// 鬼アラート (鳴らす時間の1.3倍で次の音へ)
+const ToneStep ONI_MELODY[] = {
+  {262, 200, 260}, {247, 200, 260}, {220, 200, 260}, {196, 200, 260}, {175, 400, 520},
+  {196, 200, 260}, {220, 200, 260}, {247, 200, 260}, {262, 400, 520}
+};
+const ToneStep STARTUP_MELODY[] = {
+  {440, 200, 250}, {554, 200, 250}, {659, 400, 500}
+};
+
+// 再生中のメロディ (loop() ごとに updateMelody で1音ずつ進める)
+struct MelodyPlayer {
+  const ToneStep *steps = NULL;
+  uint8_t length = 0;
+  uint8_t index = 0;
+  unsigned long nextTime = 0;
+};
+
+// LEDアニメーション
+enum LedAnimation {
+  ANIMATION_NONE,
+  ANIMATION_STARTUP
+};
+
+// キャリブレーションの進行状況
+struct CalibrationProgress {
+  unsigned long startTime = 0;
+  unsigned long nextReadTime = 0;
+  uint8_t readings = 0;
+  uint8_t validReadings = 0;
+  float tempSum = 0;
+};
+
 // グローバル変数
 SystemConfig config;
 SystemState currentState = STANDBY;
 ErrorCode lastError = ERROR_NONE;
 unsigned long lastSampleTime = 0;
+unsigned long lastLedRefresh = 0;
+MelodyPlayer melody;
+LedAnimation ledAnimation = ANIMATION_NONE;
+uint16_t animationFrame = 0;
+unsigned long nextAnimationTime = 0;
+CalibrationProgress calibration;
 unsigned long alertStartTime = 0;
 unsigned long lastWatchdogTime = 0;
 unsigned long systemStartTime = 0;
-float previousDistance = 0;
 float ambientTemp = 0;
 bool sensorsInitialized = false;
 char serialBuffer[MAX_SERIAL_BUFFER];
 int serialBufferIndex = 0;
+ConsoleOutput Console;
+WiFiServer tcpServer(CONSOLE_TCP_PORT);
+WiFiClient tcpClient;
+bool wifiEnabled = false;     // SSID が設定されていて接続を試みている (切れても false にしない)
+bool wifiConnected = false;   // 直近の WiFi.status() でつながっていた
+unsigned long lastWifiAttempt = 0;
+unsigned long lastWifiPoll = 0;
+char tcpBuffer[MAX_SERIAL_BUFFER];
+int tcpBufferIndex = 0;
+
+// set コマンドで変更できる設定項目
+enum SettingType : uint8_t {
+  SETTING_FLOAT,
+  SETTING_INT,
+  SETTING_ULONG,
+  SETTING_BOOL   // on/off, 1/0, true/false
+};
+
+struct SettingEntry {
+  const char *name;
+  const char *alias;    // 別名 (なければ NULL)。名前はどちらも小文字
+  SettingType type;
+  void *target;
+  float minValue;       // 数値の範囲 (両端を含む)
+  float maxValue;
+  const char *label;    // config と set の表示
+  const char *unit;
+};
+
+union SettingValue {
+  float f;
+  long i;
+};
+
+// printConfiguration はこの順に表示する
+const SettingEntry SETTINGS[] = {
+  {"temp", "tempthreshold", SETTING_FLOAT, &config.tempThreshold, 0.5, 50, "温度閾値", "°C"},
+  {"distance", "distancethreshold", SETTING_FLOAT, &config.distanceThreshold, 1, 400, "距離閾値", "cm"},
+  {"score", "detectionthreshold", SETTING_INT, &config.detectionThreshold, 1, 6, "検知スコア閾値", ""},
+  {"interval", "samplinginterval", SETTING_ULONG, &config.samplingInterval, 20, 10000, "サンプリング間隔", "ms"},
+  {"alert", "alertduration", SETTING_ULONG, &config.alertDuration, 100, 60000, "アラート時間", "ms"},
+  {"sound", NULL, SETTING_BOOL, &config.enableSound, 0, 1, "音声", ""},
+  {"led", "leds", SETTING_BOOL, &config.enableLEDs, 0, 1, "LED", ""},
+};
+#define SETTING_COUNT (sizeof(SETTINGS) / sizeof(SETTINGS[0]))
+
+// コマンド表 (名前は小文字。args は名前の後ろの残りで、なければ空文字列)
+typedef void (*CommandHandler)(char *args);
+struct CommandEntry {
+  const char *name;
+  CommandHandler handler;
+  bool acceptsArgs;     // false なら引数付きは不明なコマンドとして扱う
+};
+
+// バイナリフレームの送信状態 (差分の基準になる直前の値)
+struct FrameEncoder {
+  uint8_t sequence = 0;
+  uint8_t sinceKeyFrame = KEY_FRAME_INTERVAL;  // KEY_FRAME_INTERVAL 以上なら次はキーフレーム
+  unsigned long timestamp = 0;
+  int16_t objectTemp = 0;
+  int16_t ambientTemp = 0;
+  uint16_t distance = 0;
+  unsigned long detections = 0;
+};
+FrameEncoder frameEncoder;
+
+// 履歴1件分 (バイナリフレームと同じ量子化と flags。FRAME_FLAG_DETECTION はこのサンプルで検知したこと)
+struct HistorySample {
+  unsigned long timestamp;
+  int16_t objectTemp;
+  int16_t ambientTemp;
+  uint16_t distance;
+  uint8_t flags;
+};
+HistorySample history[HISTORY_SIZE];
+uint16_t historyHead = 0;   // 次に書く位置
+uint16_t historyCount = 0;
+
+// dump の送信状況 (一度に送ると 115200bps で1秒近く loop() が止まるので、loop() ごとに少しずつ送る)
+struct HistoryDump {
+  bool active = false;
+  uint16_t first = 0;              // 最初に送るサンプルの位置
+  uint16_t count = 0;              // 送るサンプル数
+  uint16_t sent = 0;
+  unsigned long detections = 0;    // 直前に送ったサンプルの時点の検知回数
+  FrameEncoder encoder;
+  bool tagged = false;             // "#<番号> dump" なら DUMP END の後に "#<番号> END" を出す
+  uint32_t tag = 0;
+};
+HistoryDump historyDump;
+
+// センサー1系統分のストリーミング統計
+// 直近 STATS_WINDOW 件の平均・分散・最小・最大と、指数移動平均・分散を O(1) で更新する
+struct StreamStats {
+  float window[STATS_WINDOW];       // 直近の値 (リングバッファ)
+  uint16_t minQueue[STATS_WINDOW];  // 窓内の最小値候補 (通し番号、値の昇順)
+  uint16_t maxQueue[STATS_WINDOW];  // 窓内の最大値候補 (通し番号、値の降順)
+  uint8_t minHead = 0, minCount = 0;
+  uint8_t maxHead = 0, maxCount = 0;
+  uint8_t count = 0;                // 窓内の件数
+  uint16_t sequence = 0;            // 次の値の通し番号
+  unsigned long total = 0;          // これまでの有効サンプル数
+  float mean = 0;                   // 窓内の平均
+  float m2 = 0;                     // 窓内の偏差平方和
+  float ema = 0;
+  float emaVariance = 0;
+};
+
+// 1回分の検知の内容
+struct DetectionRecord {
+  uint8_t score = 0;
+  uint8_t reasons = REASON_NONE;
+  float tempDiff = 0;
+  float distanceChange = 0;
+};
+
+// 検知の融合 (直近 FUSION_WINDOW サンプルのリングバッファ)
+// 新しい半分・古い半分それぞれの合計を1件ごとに差し替えるので、窓の長さによらず O(1)。
+// 温度差は 0.01°C、距離は 0.1cm 単位の整数で持ち、合計に丸め誤差をためない
+struct FusionSample {
+  uint8_t pir;          // REASON_PIR_LEFT | REASON_PIR_RIGHT
+  bool hasDistance;
+  int16_t distance;     // 0.1cm
+  long tempDiff;        // 0.01°C
+};
+
+struct DetectionFusion {
+  FusionSample window[FUSION_WINDOW];
+  uint8_t next = 0;
+  uint8_t count = 0;
+  uint8_t leftHits = 0;              // 窓内で PIR1 が反応したサンプル数
+  uint8_t rightHits = 0;
+  uint8_t pirSamples = 0;            // どちらかが反応したサンプル数
+  long recentTemp = 0;               // 新しい半分の温度差の合計
+  long olderTemp = 0;
+  long recentDistance = 0;
+  long olderDistance = 0;
+  uint8_t recentDistanceCount = 0;
+  uint8_t olderDistanceCount = 0;
+  unsigned long sequence = 0;        // 入れたサンプルの通し番号
+  unsigned long leftOnset = 0;       // 窓内で最初に PIR1 が反応したサンプルの通し番号 (0 はなし)
+  unsigned long rightOnset = 0;
+  uint8_t confirmCount = 0;          // スコアが続けて閾値以上だった回数
+};
+
+DetectionFusion fusion;
 
 // 検知統計
 struct DetectionStats {
@@ -102,11 +366,14 @@ struct DetectionStats {
   unsigned long lastDetectionTime = 0;
   unsigned long uptime = 0;
   int errorCount = 0;
-  float averageDistance = 0;
-  float averageObjectTemp = 0;
+  StreamStats distance;
+  StreamStats objectTemp;
+  StreamStats ambientTemp;
 };
 
 DetectionStats stats;
+DetectionRecord lastDetection;
+char detailsBuffer[DETAILS_BUFFER_SIZE];
 
 // センサーデータ構造体
 struct SensorData {
@@ -117,8 +384,52 @@ struct SensorData {
   float distance;
   unsigned long timestamp;
   bool isValid;
+  bool ambientFresh;    // 前回のサンプルより後に読んだ値か (読み置きの値なら false)
+  bool distanceFresh;
 };
 
+// センサーの読み置き (loop() が周期の違う読み取りをここに溜め、サンプルはここから組み立てる)
+// 遅い読み取り (I2C・超音波) は loop() の1周に1つまで
+struct SensorCache {
+  bool pir1 = false;                 // 前回のサンプルより後に ON になったか
+  bool pir2 = false;
+  float ambientTemp = NAN;
+  float distance = -1;               // 最後に測った距離 (超音波を止めている間は据え置き)
+  bool ambientFresh = false;
+  bool distanceFresh = false;
+  unsigned long lastPirPoll = 0;
+  unsigned long lastAmbientRead = 0;
+  unsigned long motionUntil = 0;     // この時刻まで超音波で距離を測る
+};
+
+SensorCache sensorCache;
+volatile bool pir1Rose = false;      // PIR の立ち上がり (割り込みで立てる)
+volatile bool pir2Rose = false;
+
+// 超音波の非同期測定 (トリガーを出したらすぐ戻り、エコーの立ち上がり・立ち下がりは割り込みで記録する)
+enum RangingPhase : uint8_t {
+  RANGING_IDLE,
+  RANGING_WAIT_RISE,
+  RANGING_WAIT_FALL,
+  RANGING_DONE
+};
+
+struct UltrasonicRanger {
+  bool async = false;                        // ECHO_PIN が割り込みを使えるか (使えなければ pulseIn で待つ)
+  volatile uint8_t phase = RANGING_IDLE;
+  volatile unsigned long echoStart = 0;      // µs
+  volatile unsigned long echoDuration = 0;   // µs
+  unsigned long triggerTime = 0;             // µs
+  unsigned long lastPing = 0;                // ms
+  // 中央値フィルタ: 到着順のリングバッファと、同じ値を昇順に並べた配列 (1件ごとに差し替える)
+  float window[DISTANCE_MEDIAN_SIZE];
+  float sorted[DISTANCE_MEDIAN_SIZE];
+  uint8_t count = 0;
+  uint8_t next = 0;
+};
+
+UltrasonicRanger ranger;
+
 void setup() {
   Serial.begin(115200);
   
@@ -139,26 +450,18 @@ void setup() {
   // センサー初期化
   if (initializeSensors()) {
     sensorsInitialized = true;
-    Serial.println(F("=== 節分人物検知システム v" FIRMWARE_VERSION " ==="));
-    Serial.println(F("Build: " BUILD_DATE));
-    Serial.println(F("初期化完了"));
+    Console.println(F("=== 節分人物検知システム v" FIRMWARE_VERSION " ==="));
+    Console.println(F("Build: " BUILD_DATE));
+    Console.println(F("初期化完了"));
     
-    // キャリブレーション実行
-    currentState = CALIBRATING;
-    if (calibrateSystem()) {
-      currentState = MONITORING;
-      Serial.println(F("システム稼働開始"));
-    } else {
-      setErrorState(ERROR_CALIBRATION);
-    }
+    // WiFi コンソール (SSID が設定されているときだけ)
+    connectWifi();
+    
+    // キャリブレーション開始 (loop() の中で進める)
+    startCalibration();
   } else {
     setErrorState(ERROR_SENSOR_INIT);
   }
-  
-  // 起動完了シーケンス
-  if (currentState == MONITORING) {
-    startupSequence();
-  }
 }
 
 void loop() {
@@ -166,51 +469,83 @@ void loop() {
   
   // ウォッチドッグタイマー
   if (currentTime - lastWatchdogTime > WATCHDOG_TIMEOUT) {
-    Serial.println(F("WARNING: Watchdog timeout"));
+    Console.println(F("WARNING: Watchdog timeout"));
     lastWatchdogTime = currentTime;
   }
   
   // シリアルコマンド処理
   handleSerialCommands();
+  serviceHistoryDump();
   
-  // メイン処理
-  if (sensorsInitialized && currentTime - lastSampleTime >= config.samplingInterval) {
-    lastSampleTime = currentTime;
+  // 音・LEDアニメーション・キャリブレーションを1ステップずつ進める
+  updateMelody(currentTime);
+  updateAnimation(currentTime);
+  if (currentState == CALIBRATING) {
+    updateCalibration(currentTime);
+  }
+  
+  // メイン処理 (samplingInterval の周期を保つ。大きく遅れたときは現在時刻に合わせ直す)
+  bool sensorWork = false;
+  if (sensorsInitialized && currentState != CALIBRATING) {
+    pollPir(currentTime);
+  }
+  if (sensorsInitialized && currentState != CALIBRATING &&
+      currentTime - lastSampleTime >= config.samplingInterval) {
+    lastSampleTime += config.samplingInterval;
+    if (currentTime - lastSampleTime >= config.samplingInterval) {
+      lastSampleTime = currentTime;
+    }
     
-    // センサーデータ取得
-    SensorData data = readSensors();
+    // センサーデータ取得 (物体温度だけ読み、ほかは読み置きの値)
+    SensorData data = takeSample(currentTime);
+    sensorWork = true;
+    unsigned long detectionsBefore = stats.totalDetections;
     
     if (data.isValid) {
       // 統計更新
       updateStatistics(data);
       
-      // 検知処理
-      if (currentState == MONITORING) {
-        processDetection(data);
-      }
+      // 検知処理 (窓はどの状態でも更新し、検知は MONITORING のときだけ)
+      processDetection(data);
       
       // 状態更新
       updateSystemState(currentTime);
       
-      // LED更新
-      if (config.enableLEDs) {
-        updateLEDs();
-      }
-      
       // ウォッチドッグ更新
       lastWatchdogTime = currentTime;
     }
+    
+    // 履歴に残し、バイナリ出力が有効ならフレームで送る (検知・状態更新の後の値)
+    recordSample(data, stats.totalDetections != detectionsBefore);
+  } else if (sensorsInitialized && currentState != CALIBRATING) {
+    sensorWork = updateSensorCache(currentTime);
+  }
+  
+  // LED更新 (アニメーション再生中・キャリブレーション中はそちらの表示を優先)
+  if (config.enableLEDs && ledAnimation == ANIMATION_NONE && currentState != CALIBRATING &&
+      currentTime - lastLedRefresh >= LED_REFRESH_INTERVAL) {
+    lastLedRefresh = currentTime;
+    updateLEDs();
   }
   
-  delay(10); // CPU負荷軽減
+  // CPU負荷軽減 (音・LEDの刻みより十分短く)。センサーを読んだ周はそれで時間を使っているので待たない
+  if (!sensorWork) {
+    delay(1);
+  }
 }
 
 // ピン初期化
 void initializePins() {
   pinMode(PIR1_PIN, INPUT);
   pinMode(PIR2_PIN, INPUT);
+  attachInterrupt(digitalPinToInterrupt(PIR1_PIN), onPir1Rise, RISING);
+  attachInterrupt(digitalPinToInterrupt(PIR2_PIN), onPir2Rise, RISING);
   pinMode(TRIG_PIN, OUTPUT);
   pinMode(ECHO_PIN, INPUT);
+  ranger.async = digitalPinToInterrupt(ECHO_PIN) != NOT_AN_INTERRUPT;
+  if (ranger.async) {
+    attachInterrupt(digitalPinToInterrupt(ECHO_PIN), onEchoChange, CHANGE);
+  }
   pinMode(SPEAKER_PIN, OUTPUT);
   pinMode(POWER_LED_PIN, OUTPUT);
   if (RESET_PIN > 0) {
@@ -223,78 +558,262 @@ bool initializeSensors() {
   Wire.begin();
   
   if (!mlx.begin()) {
-    Serial.println(F("ERROR: MLX90614 initialization failed"));
+    Console.println(F("ERROR: MLX90614 initialization failed"));
     return false;
   }
   
   // センサー疎通確認
   float testTemp = mlx.readAmbientTempC();
   if (isnan(testTemp) || testTemp < -40 || testTemp > 85) {
-    Serial.println(F("ERROR: MLX90614 sensor test failed"));
+    Console.println(F("ERROR: MLX90614 sensor test failed"));
     return false;
   }
   
-  Serial.println(F("センサー初期化完了"));
+  Console.println(F("センサー初期化完了"));
   return true;
 }
 
-// システムキャリブレーション
-bool calibrateSystem() {
-  Serial.println(F("キャリブレーション開始..."));
-  
-  // 環境温度測定
-  float tempSum = 0;
-  int validReadings = 0;
+// システムキャリブレーション開始
+void startCalibration() {
+  Console.println(F("キャリブレーション開始..."));
+  currentState = CALIBRATING;
+  calibration = CalibrationProgress();
+  fusion = DetectionFusion();
+  calibration.startTime = millis();
+  calibration.nextReadTime = calibration.startTime;
+}
+
+// キャリブレーションを1ステップ進める
+// 環境温度を CALIBRATION_READ_INTERVAL ごとに測定し、その後 CALIBRATION_TIME まで PIR の安定を待つ
+void updateCalibration(unsigned long currentTime) {
+  lastWatchdogTime = currentTime;  // キャリブレーション中はサンプリングしないので、ここで更新する
   
-  for (int i = 0; i < 20; i++) {
+  if (calibration.readings < CALIBRATION_READINGS) {
+    if ((long)(currentTime - calibration.nextReadTime) < 0) return;
+    calibration.nextReadTime += CALIBRATION_READ_INTERVAL;
     float temp = mlx.readAmbientTempC();
     if (!isnan(temp)) {
-      tempSum += temp;
-      validReadings++;
+      calibration.tempSum += temp;
+      calibration.validReadings++;
+    }
+    calibration.readings++;
+    if (calibration.readings < CALIBRATION_READINGS) return;
+    
+    if (calibration.validReadings < 10) {
+      Console.println(F("ERROR: 環境温度測定失敗"));
+      setErrorState(ERROR_CALIBRATION);
+      return;
     }
-    delay(100);
+    ambientTemp = calibration.tempSum / calibration.validReadings;
+    Console.print(F("環境温度: "));
+    Console.print(ambientTemp, 1);
+    Console.println(F("°C"));
+    Console.println(F("PIRセンサー安定化中..."));
+    calibration.startTime = currentTime;  // ここから CALIBRATION_TIME 待つ
+    return;
   }
   
-  if (validReadings < 10) {
-    Serial.println(F("ERROR: 環境温度測定失敗"));
-    return false;
+  unsigned long elapsed = currentTime - calibration.startTime;
+  if (elapsed < CALIBRATION_TIME) {
+    if (config.enableLEDs && currentTime - lastLedRefresh >= LED_REFRESH_INTERVAL) {
+      lastLedRefresh = currentTime;
+      calibrationLEDs(elapsed, CALIBRATION_TIME);
+    }
+    return;
   }
   
-  ambientTemp = tempSum / validReadings;
-  Serial.print(F("環境温度: "));
-  Serial.print(ambientTemp, 1);
-  Serial.println(F("°C"));
-  
-  // PIRセンサー安定化
-  Serial.println(F("PIRセンサー安定化中..."));
-  unsigned long calibStart = millis();
+  Console.println(F("キャリブレーション完了"));
+  currentState = MONITORING;
+  lastSampleTime = currentTime;
+  Console.println(F("システム稼働開始"));
+  startupSequence();
+}
+
+// キャリブレーション中断 ('q' 受信時)
+void abortCalibration() {
+  Console.println(F("キャリブレーション中断"));
+  setErrorState(ERROR_CALIBRATION);
+}
+
+// PIR の立ち上がり (割り込み)
+void onPir1Rise() {
+  pir1Rose = true;
+}
+
+void onPir2Rise() {
+  pir2Rose = true;
+}
+
+// PIR の確認 (割り込みで拾った立ち上がりと、PIR_POLL_INTERVAL ごとのレベル。どちらも安い)
+void pollPir(unsigned long now) {
+  noInterrupts();
+  bool pir1 = pir1Rose;
+  bool pir2 = pir2Rose;
+  pir1Rose = false;
+  pir2Rose = false;
+  interrupts();
   
-  while (millis() - calibStart < CALIBRATION_TIME) {
-    // キャリブレーション表示
-    if (config.enableLEDs) {
-      calibrationLEDs(millis() - calibStart, CALIBRATION_TIME);
+  if (now - sensorCache.lastPirPoll >= PIR_POLL_INTERVAL) {
+    sensorCache.lastPirPoll = now;
+    pir1 = pir1 || digitalRead(PIR1_PIN);
+    pir2 = pir2 || digitalRead(PIR2_PIN);
+  }
+  if (pir1 || pir2) {
+    sensorCache.pir1 = sensorCache.pir1 || pir1;
+    sensorCache.pir2 = sensorCache.pir2 || pir2;
+    sensorCache.motionUntil = now + MOTION_HOLD_TIME;
+  }
+}
+
+// 読み置きの更新 (サンプルを取らない周に呼ぶ。遅い読み取りを1つだけ行ったら true)
+// 超音波は PIR・温度に兆候がある間だけ測る。非同期なら ULTRASONIC_PING_INTERVAL ごとに測って
+// 中央値を距離とし、pulseIn で待つときはサンプルごとに1回だけ測る
+bool updateSensorCache(unsigned long now) {
+  bool motion = (long)(sensorCache.motionUntil - now) > 0;
+  if (ranger.async) {
+    if (serviceRanging()) {
+      sensorCache.distance = distanceMedian();
+      sensorCache.distanceFresh = true;
     }
-    
-    // 中断チェック
-    if (Serial.available()) {
-      if (Serial.read() == 'q') {
-        Serial.println(F("キャリブレーション中断"));
-        return false;
-      }
+    if (!motion) {
+      ranger.count = 0;  // 次に動きがあったら前の値を混ぜずに測り直す
+    } else if (ranger.phase == RANGING_IDLE && now - ranger.lastPing >= ULTRASONIC_PING_INTERVAL) {
+      startRanging(now);
     }
-    
-    delay(500);
+  } else if (motion && !sensorCache.distanceFresh) {
+    sensorCache.distance = readUltrasonicDistance();
+    sensorCache.distanceFresh = true;
+    return true;
+  }
+  if (now - sensorCache.lastAmbientRead >= AMBIENT_READ_INTERVAL) {
+    readAmbientCache(now);
+    return true;
+  }
+  return false;
+}
+
+void readAmbientCache(unsigned long now) {
+  sensorCache.ambientTemp = mlx.readAmbientTempC();
+  sensorCache.ambientFresh = true;
+  sensorCache.lastAmbientRead = now;
+}
+
+// サンプルを組み立てる (読むのは物体温度だけ。PIR は前回のサンプルより後に ON になったか)
+SensorData takeSample(unsigned long now) {
+  SensorData data;
+  data.timestamp = now;
+  data.isValid = true;
+  
+  data.pir1_triggered = sensorCache.pir1 || digitalRead(PIR1_PIN);
+  data.pir2_triggered = sensorCache.pir2 || digitalRead(PIR2_PIN);
+  sensorCache.pir1 = false;
+  sensorCache.pir2 = false;
+  
+  if (isnan(sensorCache.ambientTemp)) {
+    readAmbientCache(now);  // 起動直後・読み取り失敗の後
+  }
+  data.objectTemp = mlx.readObjectTempC();
+  data.ambientTemp = sensorCache.ambientTemp;
+  data.ambientFresh = sensorCache.ambientFresh;
+  data.distance = sensorCache.distance;
+  data.distanceFresh = sensorCache.distanceFresh;
+  sensorCache.ambientFresh = false;
+  sensorCache.distanceFresh = false;
+  
+  // 温度データ検証
+  if (isnan(data.objectTemp) || isnan(data.ambientTemp)) {
+    data.isValid = false;
+    setErrorState(ERROR_SENSOR_READ);
+    return data;
+  }
+  
+  // 兆候があれば、しばらく超音波で距離も測る
+  if (data.pir1_triggered || data.pir2_triggered ||
+      data.objectTemp - data.ambientTemp > config.tempThreshold) {
+    sensorCache.motionUntil = now + MOTION_HOLD_TIME;
+  }
+  return data;
+}
+
+// エコーの立ち上がり・立ち下がり (割り込み)
+void onEchoChange() {
+  unsigned long now = micros();
+  if (digitalRead(ECHO_PIN) == HIGH) {
+    if (ranger.phase == RANGING_WAIT_RISE) {
+      ranger.echoStart = now;
+      ranger.phase = RANGING_WAIT_FALL;
+    }
+  } else if (ranger.phase == RANGING_WAIT_FALL) {
+    ranger.echoDuration = now - ranger.echoStart;
+    ranger.phase = RANGING_DONE;
   }
+}
+
+// トリガーを出してすぐ戻る (結果は serviceRanging で受け取る)
+void startRanging(unsigned long now) {
+  ranger.lastPing = now;
+  digitalWrite(TRIG_PIN, LOW);
+  delayMicroseconds(2);
+  ranger.triggerTime = micros();
+  ranger.phase = RANGING_WAIT_RISE;
+  digitalWrite(TRIG_PIN, HIGH);
+  delayMicroseconds(10);
+  digitalWrite(TRIG_PIN, LOW);
+}
+
+// 測定が終わっていれば距離を中央値フィルタに入れて true (エコーがなければ -1 を入れる)
+bool serviceRanging() {
+  uint8_t phase = ranger.phase;
+  if (phase == RANGING_IDLE) return false;
   
-  Serial.println(F("キャリブレーション完了"));
+  float distance;
+  if (phase == RANGING_DONE) {
+    distance = echoToDistance(ranger.echoDuration);
+  } else if (micros() - ranger.triggerTime > ULTRASONIC_TIMEOUT) {
+    distance = -1;
+  } else {
+    return false;
+  }
+  noInterrupts();
+  ranger.phase = RANGING_IDLE;
+  interrupts();
+  addDistanceSample(distance);
   return true;
 }
 
-// センサーデータ読み取り
+// 中央値フィルタに1件入れる (一番古い値を sorted から抜き、新しい値を挿入する。並べ直しはしない)
+void addDistanceSample(float distance) {
+  uint8_t size = ranger.count;
+  if (size == DISTANCE_MEDIAN_SIZE) {
+    float oldest = ranger.window[ranger.next];
+    uint8_t i = 0;
+    while (ranger.sorted[i] != oldest) i++;
+    for (; i + 1 < size; i++) ranger.sorted[i] = ranger.sorted[i + 1];
+    size--;
+  }
+  uint8_t i = size;
+  while (i > 0 && ranger.sorted[i - 1] > distance) {
+    ranger.sorted[i] = ranger.sorted[i - 1];
+    i--;
+  }
+  ranger.sorted[i] = distance;
+  ranger.window[ranger.next] = distance;
+  ranger.next = (ranger.next + 1) % DISTANCE_MEDIAN_SIZE;
+  if (ranger.count < DISTANCE_MEDIAN_SIZE) ranger.count++;
+}
+
+// 直近 DISTANCE_MEDIAN_SIZE 件の中央値 (エコーなしの -1 が過半数なら -1)
+float distanceMedian() {
+  return ranger.count ? ranger.sorted[ranger.count / 2] : -1;
+}
+
+// センサーデータ読み取り (すべてのセンサーをその場で読む。デバッグ表示用)
 SensorData readSensors() {
   SensorData data;
   data.timestamp = millis();
   data.isValid = true;
+  data.ambientFresh = true;
+  data.distanceFresh = true;
   
   // PIRセンサー
   data.pir1_triggered = digitalRead(PIR1_PIN);
@@ -324,7 +843,12 @@ float readUltrasonicDistance() {
   delayMicroseconds(10);
   digitalWrite(TRIG_PIN, LOW);
   
-  long duration = pulseIn(ECHO_PIN, HIGH, 30000);
+  long duration = pulseIn(ECHO_PIN, HIGH, ULTRASONIC_TIMEOUT);
+  return echoToDistance(duration);
+}
+
+// エコーの長さ (µs) から距離 (cm)。エコーなし・範囲外は -1
+float echoToDistance(unsigned long duration) {
   if (duration == 0) return -1;
   
   float distance = (duration * 0.034) / 2;
@@ -337,88 +861,291 @@ float readUltrasonicDistance() {
   return distance;
 }
 
-// 検知処理
-void processDetection(SensorData data) {
-  int detectionScore = 0;
-  String detectionDetails = "";
+// 検知処理 (有効なサンプルごとに呼ばれるのでヒープを使わない)
+// 窓にサンプルを入れてスコアを出し、閾値以上が FUSION_CONFIRM 回続いたところで1回だけ検知する
+// (閾値を下回るまで次の検知はしない)
+void processDetection(const SensorData &data) {
+  addFusionSample(data);
+  DetectionRecord detection;
+  evaluateFusion(detection);
   
-  // PIRセンサー評価
-  if (data.pir1_triggered || data.pir2_triggered) {
-    detectionScore += 3;
-    detectionDetails += F("PIR:");
-    
-    if (data.pir1_triggered && data.pir2_triggered) {
-      detectionDetails += F("BOTH ");
-    } else if (data.pir1_triggered) {
-      detectionDetails += F("LEFT ");
-    } else {
-      detectionDetails += F("RIGHT ");
+  if (detection.score < config.detectionThreshold) {
+    fusion.confirmCount = 0;
+    return;
+  }
+  if (fusion.confirmCount < FUSION_CONFIRM) {
+    fusion.confirmCount++;
+    if (fusion.confirmCount == FUSION_CONFIRM && currentState == MONITORING) {
+      triggerDetection(detection);
+    }
+  }
+}
+
+// 窓に1サンプル入れる (一番古いサンプルを古い半分から抜き、真ん中のサンプルを古い半分へ移す)
+void addFusionSample(const SensorData &data) {
+  const uint8_t half = FUSION_WINDOW / 2;
+  FusionSample &slot = fusion.window[fusion.next];
+  if (fusion.count == FUSION_WINDOW) {
+    if (slot.pir & REASON_PIR_LEFT) fusion.leftHits--;
+    if (slot.pir & REASON_PIR_RIGHT) fusion.rightHits--;
+    if (slot.pir) fusion.pirSamples--;
+    fusion.olderTemp -= slot.tempDiff;
+    if (slot.hasDistance) {
+      fusion.olderDistance -= slot.distance;
+      fusion.olderDistanceCount--;
+    }
+  }
+  if (fusion.count >= half) {
+    const FusionSample &middle = fusion.window[(fusion.next + FUSION_WINDOW - half) % FUSION_WINDOW];
+    fusion.recentTemp -= middle.tempDiff;
+    fusion.olderTemp += middle.tempDiff;
+    if (middle.hasDistance) {
+      fusion.recentDistance -= middle.distance;
+      fusion.olderDistance += middle.distance;
+      fusion.recentDistanceCount--;
+      fusion.olderDistanceCount++;
     }
   }
   
-  // 温度センサー評価
-  float tempDiff = data.objectTemp - data.ambientTemp;
-  if (tempDiff > config.tempThreshold) {
-    detectionScore += 2;
-    detectionDetails += F("TEMP:+");
-    detectionDetails += String(tempDiff, 1);
-    detectionDetails += F("°C ");
+  fusion.sequence++;
+  slot.pir = (data.pir1_triggered ? REASON_PIR_LEFT : 0) | (data.pir2_triggered ? REASON_PIR_RIGHT : 0);
+  if (data.pir1_triggered && fusion.leftHits++ == 0) fusion.leftOnset = fusion.sequence;
+  if (data.pir2_triggered && fusion.rightHits++ == 0) fusion.rightOnset = fusion.sequence;
+  if (slot.pir) fusion.pirSamples++;
+  slot.tempDiff = lroundf((data.objectTemp - data.ambientTemp) * 100);
+  fusion.recentTemp += slot.tempDiff;
+  slot.hasDistance = data.distance > 0;
+  if (slot.hasDistance) {
+    slot.distance = lroundf(data.distance * 10);
+    fusion.recentDistance += slot.distance;
+    fusion.recentDistanceCount++;
   }
   
-  // 超音波センサー評価
-  if (data.distance > 0 && previousDistance > 0) {
-    float distanceChange = abs(data.distance - previousDistance);
-    if (distanceChange > config.distanceThreshold) {
-      detectionScore += 1;
-      detectionDetails += F("MOVE:");
-      detectionDetails += String(distanceChange, 1);
-      detectionDetails += F("cm ");
+  fusion.next = (fusion.next + 1) % FUSION_WINDOW;
+  if (fusion.count < FUSION_WINDOW) fusion.count++;
+}
+
+// 窓全体の根拠からスコアを出す (重みは PIR 3・温度 2・距離 1 で、最大 6)
+// - PIR: 反応したサンプルが PIR_CONFIRM_HITS 以上 (1回だけのちらつきは数えない)。
+//   左右が別々のサンプルで反応し始めていれば、先に反応した側から通過方向を決める
+// - 温度: 新しい半分の平均の温度差が tempThreshold を超えれば +2、
+//   超えていなくても古い半分からの上がり幅が tempThreshold を超えれば +1
+// - 距離: 距離が取れたサンプルの平均が、古い半分と新しい半分で distanceThreshold より大きく違えば +1
+void evaluateFusion(DetectionRecord &detection) {
+  const uint8_t recentCount = fusion.count < FUSION_WINDOW / 2 ? fusion.count : FUSION_WINDOW / 2;
+  const uint8_t olderCount = fusion.count - recentCount;
+  
+  if (fusion.pirSamples >= PIR_CONFIRM_HITS) {
+    detection.score += 3;
+    if (fusion.leftHits) detection.reasons |= REASON_PIR_LEFT;
+    if (fusion.rightHits) detection.reasons |= REASON_PIR_RIGHT;
+    if (fusion.leftHits && fusion.rightHits && fusion.leftOnset != fusion.rightOnset) {
+      detection.reasons |= fusion.leftOnset < fusion.rightOnset ? REASON_DIR_LEFT_RIGHT : REASON_DIR_RIGHT_LEFT;
     }
   }
-  previousDistance = data.distance;
   
-  // 検知判定
-  if (detectionScore >= config.detectionThreshold) {
-    triggerDetection(detectionScore, detectionDetails);
+  long tempThreshold = lroundf(config.tempThreshold * 100);
+  detection.tempDiff = fusion.recentTemp / (100.0f * recentCount);
+  if (fusion.recentTemp > tempThreshold * recentCount) {
+    detection.score += 2;
+    detection.reasons |= REASON_TEMP;
+  } else if (olderCount &&
+             fusion.recentTemp * olderCount - fusion.olderTemp * recentCount > tempThreshold * recentCount * olderCount) {
+    detection.score += 1;
+    detection.reasons |= REASON_TEMP;
+  }
+  
+  uint8_t recentDistances = fusion.recentDistanceCount;
+  uint8_t olderDistances = fusion.olderDistanceCount;
+  if (recentDistances && olderDistances) {
+    long change = labs(fusion.recentDistance * olderDistances - fusion.olderDistance * recentDistances);
+    long scale = (long)recentDistances * olderDistances;
+    detection.distanceChange = change / (10.0f * scale);
+    if (change > lroundf(config.distanceThreshold * 10) * scale) {
+      detection.score += 1;
+      detection.reasons |= REASON_MOVE;
+    }
   }
 }
 
 // 検知トリガー
-void triggerDetection(int score, String details) {
+void triggerDetection(const DetectionRecord &detection) {
   if (currentState != ALERT) {
-    Serial.println(F("=== 人物検知 ==="));
-    Serial.print(F("スコア: "));
-    Serial.print(score);
-    Serial.print(F("/6, 詳細: "));
-    Serial.println(details);
+    formatDetectionDetails(detailsBuffer, sizeof(detailsBuffer), detection);
+    Console.println(F("=== 人物検知 ==="));
+    Console.print(F("スコア: "));
+    Console.print(detection.score);
+    Console.print(F("/6, 詳細: "));
+    Console.println(detailsBuffer);
     
     currentState = ALERT;
     alertStartTime = millis();
     stats.totalDetections++;
     stats.lastDetectionTime = millis();
+    lastDetection = detection;
     
-    // アラート実行
+    // アラート実行 (鳴らし終わりを待たずに戻る)
     if (config.enableSound) {
       playOniAlert();
     }
   }
 }
 
-// 統計更新
-void updateStatistics(SensorData data) {
+// 検知詳細の文字列 ("PIR:BOTH DIR:L>R TEMP:+5.2°C MOVE:12.3cm") を固定長バッファに書く
+void formatDetectionDetails(char *out, size_t size, const DetectionRecord &detection) {
+  size_t length = 0;
+  out[0] = '\0';
+  
+  uint8_t pir = detection.reasons & (REASON_PIR_LEFT | REASON_PIR_RIGHT);
+  if (pir) {
+    length = appendText(out, size, length, "PIR:");
+    length = appendText(out, size, length,
+                        pir == (REASON_PIR_LEFT | REASON_PIR_RIGHT) ? "BOTH " :
+                        pir == REASON_PIR_LEFT ? "LEFT " : "RIGHT ");
+  }
+  if (detection.reasons & (REASON_DIR_LEFT_RIGHT | REASON_DIR_RIGHT_LEFT)) {
+    length = appendText(out, size, length,
+                        detection.reasons & REASON_DIR_LEFT_RIGHT ? "DIR:L>R " : "DIR:R>L ");
+  }
+  if (detection.reasons & REASON_TEMP) {
+    length = appendText(out, size, length, "TEMP:+");
+    length = appendTenths(out, size, length, detection.tempDiff);
+    length = appendText(out, size, length, "°C ");
+  }
+  if (detection.reasons & REASON_MOVE) {
+    length = appendText(out, size, length, "MOVE:");
+    length = appendTenths(out, size, length, detection.distanceChange);
+    length = appendText(out, size, length, "cm ");
+  }
+}
+
+// バッファの末尾に文字列を追加 (入りきらない分は切り捨て) し、新しい長さを返す
+size_t appendText(char *out, size_t size, size_t length, const char *text) {
+  while (*text && length + 1 < size) {
+    out[length++] = *text++;
+  }
+  out[length] = '\0';
+  return length;
+}
+
+// バッファの末尾に小数点以下1桁の数値を追加
+size_t appendTenths(char *out, size_t size, size_t length, float value) {
+  long tenths = lroundf(value * 10);
+  char number[16];
+  snprintf(number, sizeof(number), "%s%ld.%ld", tenths < 0 ? "-" : "", labs(tenths) / 10, labs(tenths) % 10);
+  return appendText(out, size, length, number);
+}
+
+// 統計更新 (センサーごとに有効な値だけを数える)
+void updateStatistics(const SensorData &data) {
   stats.uptime = millis() - systemStartTime;
   
-  // 移動平均更新 (簡易版)
-  static int sampleCount = 0;
-  sampleCount++;
+  // 読み置きの値は新しく読んだときだけ数える
+  if (data.distanceFresh && data.distance > 0) {
+    streamStatsAdd(stats.distance, data.distance);
+  }
+  if (!isnan(data.objectTemp)) {
+    streamStatsAdd(stats.objectTemp, data.objectTemp);
+  }
+  if (data.ambientFresh && !isnan(data.ambientTemp)) {
+    streamStatsAdd(stats.ambientTemp, data.ambientTemp);
+  }
+}
+
+// ストリーミング統計に1件追加
+void streamStatsAdd(StreamStats &s, float value) {
+  uint8_t slot = s.sequence % STATS_WINDOW;
   
-  if (data.distance > 0) {
-    stats.averageDistance = ((stats.averageDistance * (sampleCount - 1)) + data.distance) / sampleCount;
+  // 窓の平均と偏差平方和 (古い値を入れ替える Welford 法)
+  if (s.count < STATS_WINDOW) {
+    s.count++;
+    float delta = value - s.mean;
+    s.mean += delta / s.count;
+    s.m2 += delta * (value - s.mean);
+  } else {
+    float old = s.window[slot];
+    float oldMean = s.mean;
+    s.mean += (value - old) / STATS_WINDOW;
+    s.m2 += (value - old) * (value - s.mean + old - oldMean);
   }
+  s.window[slot] = value;
   
-  if (!isnan(data.objectTemp)) {
-    stats.averageObjectTemp = ((stats.averageObjectTemp * (sampleCount - 1)) + data.objectTemp) / sampleCount;
+  // 窓を1周するごとに丸め誤差の蓄積をリセット (償却 O(1))
+  if (slot == STATS_WINDOW - 1 && s.count == STATS_WINDOW) {
+    float sum = 0;
+    for (int i = 0; i < STATS_WINDOW; i++) sum += s.window[i];
+    s.mean = sum / STATS_WINDOW;
+    float m2 = 0;
+    for (int i = 0; i < STATS_WINDOW; i++) m2 += (s.window[i] - s.mean) * (s.window[i] - s.mean);
+    s.m2 = m2;
+  }
+  
+  // 最小・最大 (単調キュー。窓から外れた先頭を捨て、末尾から劣る候補を捨てる)
+  uint16_t expired = s.sequence - STATS_WINDOW;
+  if (s.minCount > 0 && s.minQueue[s.minHead] == expired) {
+    s.minHead = (s.minHead + 1) % STATS_WINDOW;
+    s.minCount--;
+  }
+  while (s.minCount > 0 && s.window[s.minQueue[(s.minHead + s.minCount - 1) % STATS_WINDOW] % STATS_WINDOW] >= value) {
+    s.minCount--;
+  }
+  s.minQueue[(s.minHead + s.minCount++) % STATS_WINDOW] = s.sequence;
+  if (s.maxCount > 0 && s.maxQueue[s.maxHead] == expired) {
+    s.maxHead = (s.maxHead + 1) % STATS_WINDOW;
+    s.maxCount--;
+  }
+  while (s.maxCount > 0 && s.window[s.maxQueue[(s.maxHead + s.maxCount - 1) % STATS_WINDOW] % STATS_WINDOW] <= value) {
+    s.maxCount--;
   }
+  s.maxQueue[(s.maxHead + s.maxCount++) % STATS_WINDOW] = s.sequence;
+  
+  // 指数移動平均・分散
+  if (s.total == 0) {
+    s.ema = value;
+    s.emaVariance = 0;
+  } else {
+    float diff = value - s.ema;
+    float increment = STATS_EMA_ALPHA * diff;
+    s.ema += increment;
+    s.emaVariance = (1 - STATS_EMA_ALPHA) * (s.emaVariance + diff * increment);
+  }
+  
+  s.sequence++;
+  s.total++;
+}
+
+float streamStatsVariance(const StreamStats &s) {
+  return s.count > 1 ? max(s.m2, 0.0f) / (s.count - 1) : 0;
+}
+
+float streamStatsMin(const StreamStats &s) {
+  return s.minCount > 0 ? s.window[s.minQueue[s.minHead] % STATS_WINDOW] : NAN;
+}
+
+float streamStatsMax(const StreamStats &s) {
+  return s.maxCount > 0 ? s.window[s.maxQueue[s.maxHead] % STATS_WINDOW] : NAN;
+}
+
+// ストリーミング統計の表示 (1行)
+void printStreamStats(const __FlashStringHelper *label, const StreamStats &s, const __FlashStringHelper *unit) {
+  Console.print(label);
+  Console.print(s.mean); Console.print(unit);
+  Console.print(F(" (EMA ")); Console.print(s.ema);
+  Console.print(F(", σ ")); Console.print(sqrt(streamStatsVariance(s)));
+  Console.print(F(", 最小 ")); Console.print(streamStatsMin(s));
+  Console.print(F(", 最大 ")); Console.print(streamStatsMax(s));
+  Console.print(F(", ")); Console.print(s.total); Console.println(F("件)"));
+}
+
+// ストリーミング統計の JSON 出力
+void addStreamStatsJson(JsonObject obj, const StreamStats &s) {
+  obj["mean"] = s.mean;
+  obj["std"] = sqrt(streamStatsVariance(s));
+  obj["min"] = streamStatsMin(s);
+  obj["max"] = streamStatsMax(s);
+  obj["ema"] = s.ema;
+  obj["ema_std"] = sqrt(s.emaVariance);
+  obj["count"] = s.total;
 }
 
 // システム状態更新
@@ -433,10 +1160,11 @@ void updateSystemState(unsigned long currentTime) {
       break;
       
     case ALERT:
-      if (currentTime - alertStartTime >= config.alertDuration) {
+      // alertStartTime は検知時の millis() なので currentTime より後のことがある (符号付きで比べる)
+      if ((long)(currentTime - alertStartTime) >= (long)config.alertDuration) {
         currentState = MONITORING;
         if (config.debugMode) {
-          Serial.println(F("アラート終了"));
+          Console.println(F("アラート終了"));
         }
       }
       break;
@@ -446,7 +1174,7 @@ void updateSystemState(unsigned long currentTime) {
       if (currentTime % 10000 == 0) {
         if (initializeSensors()) {
           currentState = MONITORING;
-          Serial.println(F("センサー復旧"));
+          Console.println(F("センサー復旧"));
         }
       }
       break;
@@ -468,21 +1196,23 @@ void updateLEDs() {
       }
       break;
       
-    case ALERT:
+    case ALERT: {
       // 赤色点滅
       int brightness = (millis() / 100) % 2 ? 255 : 0;
       for (int i = 0; i < LED_COUNT; i++) {
         strip.setPixelColor(i, strip.Color(brightness, 0, 0));
       }
       break;
+    }
       
-    case ERROR_STATE:
+    case ERROR_STATE: {
       // 黄色点滅
       int errorBright = (millis() / 200) % 2 ? 255 : 0;
       for (int i = 0; i < LED_COUNT; i++) {
         strip.setPixelColor(i, strip.Color(errorBright, errorBright, 0));
       }
       break;
+    }
   }
   strip.show();
 }
@@ -507,91 +1237,434 @@ void setErrorState(ErrorCode error) {
   lastError = error;
   stats.errorCount++;
   
-  Serial.print(F("ERROR CODE: "));
-  Serial.println(error);
+  Console.print(F("ERROR CODE: "));
+  Console.println(error);
 }
 
-// シリアルコマンド処理
+// シリアル・TCP コマンド処理
 void handleSerialCommands() {
-  while (Serial.available()) {
-    char c = Serial.read();
+  char chunk[SERIAL_READ_CHUNK];
+  int count;
+  // 届いている分をまとめて読む (available() 以下なら readBytes は待たない)
+  while ((count = Serial.available()) > 0) {
+    count = Serial.readBytes(chunk, min(count, SERIAL_READ_CHUNK));
+    if (count <= 0) break;
+    feedCommandBytes(chunk, count, serialBuffer, serialBufferIndex);
+  }
+  
+  if (wifiEnabled) {
+    updateWifi(millis());
+  }
+}
+
+// 読み込んだバイト列を行に分け、そろった行をコマンドとして処理する
+void feedCommandBytes(const char *data, int count, char *buffer, int &length) {
+  for (int i = 0; i < count; i++) {
+    char c = data[i];
+    
+    if (c == 'q' && currentState == CALIBRATING) {
+      abortCalibration();
+      continue;
+    }
     
     if (c == '\n' || c == '\r') {
-      if (serialBufferIndex > 0) {
-        serialBuffer[serialBufferIndex] = '\0';
-        processCommand(String(serialBuffer));
-        serialBufferIndex = 0;
+      if (length > 0) {
+        buffer[length] = '\0';
+        processCommand(buffer);
+        length = 0;
       } else {
         // 空の入力 - デバッグ情報出力
+        finishHistoryDump();
         printDebugInfo();
       }
-    } else if (serialBufferIndex < MAX_SERIAL_BUFFER - 1) {
-      serialBuffer[serialBufferIndex++] = c;
-    }
-  }
-}
-
-// コマンド処理
-void processCommand(String cmd) {
-  cmd.trim();
-  cmd.toLowerCase();
-  
-  if (cmd == "status") {
-    printSystemStatus();
-  } else if (cmd == "config") {
-    printConfiguration();
-  } else if (cmd == "reset") {
-    Serial.println(F("システムリセット..."));
-    delay(100);
-    // ソフトウェアリセット
-    asm volatile ("  jmp 0");
-  } else if (cmd.startsWith("set ")) {
-    processSetCommand(cmd.substring(4));
-  } else if (cmd == "json") {
-    config.enableJsonOutput = !config.enableJsonOutput;
-    Serial.print(F("JSON出力: "));
-    Serial.println(config.enableJsonOutput ? F("ON") : F("OFF"));
-  } else if (cmd == "help") {
-    printHelp();
+    } else if (length < MAX_SERIAL_BUFFER - 1) {
+      buffer[length++] = c;
+    }
+  }
+}
+
+// WiFi への接続を始める (完了は待たない。つながったら updateWifi が TCP コンソールを開く)
+void connectWifi() {
+  if (strlen(WIFI_SSID) == 0) return;
+  wifiEnabled = true;
+  beginWifi(millis());
+}
+
+void beginWifi(unsigned long now) {
+  lastWifiAttempt = now;
+  // タイムアウト 0 で WiFi.begin が接続の完了を待たずに戻る (待つと loop() が数秒止まる)
+  WiFi.setTimeout(0);
+  WiFi.begin(WIFI_SSID, WIFI_PASSWORD);
+}
+
+// WIFI_POLL_INTERVAL ごとに接続状態を見て、つながったら TCP コンソールを開き、
+// つながらないまま WIFI_RETRY_INTERVAL たったら接続し直す
+void updateWifi(unsigned long now) {
+  if (now - lastWifiPoll >= WIFI_POLL_INTERVAL) {
+    lastWifiPoll = now;
+    bool connected = WiFi.status() == WL_CONNECTED;
+    if (connected && !wifiConnected) {
+      tcpServer.begin();
+      Console.print(F("TCPコンソール: ポート "));
+      Console.println(CONSOLE_TCP_PORT);
+    } else if (!connected && wifiConnected) {
+      if (tcpClient) tcpClient.stop();
+      Console.println(F("WiFi切断"));
+    }
+    wifiConnected = connected;
+    if (!connected && now - lastWifiAttempt >= WIFI_RETRY_INTERVAL) {
+      Console.println(F("WiFi接続失敗 - 再接続します"));
+      beginWifi(now);
+    }
+  }
+  if (wifiConnected) {
+    handleTcpConsole();
+  }
+}
+
+// TCP コンソール (同時に1接続。新しい接続は切断後に受け付ける)
+void handleTcpConsole() {
+  if (!tcpClient || !tcpClient.connected()) {
+    if (tcpClient) tcpClient.stop();
+    tcpClient = tcpServer.available();
+    tcpBufferIndex = 0;
+    if (!tcpClient) return;
+  }
+  char chunk[SERIAL_READ_CHUNK];
+  int count;
+  // WiFiClient の read() は1回ごとに NINA モジュールとの SPI 転送になるのでまとめて読む
+  while ((count = tcpClient.available()) > 0) {
+    count = tcpClient.read((uint8_t *)chunk, min(count, SERIAL_READ_CHUNK));
+    if (count <= 0) break;
+    feedCommandBytes(chunk, count, tcpBuffer, tcpBufferIndex);
+  }
+}
+
+size_t ConsoleOutput::write(uint8_t c) {
+  return write(&c, 1);
+}
+
+size_t ConsoleOutput::write(const uint8_t *buffer, size_t size) {
+  Serial.write(buffer, size);
+  if (tcpClient && tcpClient.connected()) {
+    tcpClient.write(buffer, size);
+  }
+  return size;
+}
+
+// 次の単語を切り出す (区切りの空白を '\0' にし、*cursor を続きの先頭へ進める。なければ NULL)
+char *nextToken(char **cursor) {
+  char *p = *cursor;
+  while (*p == ' ' || *p == '\t') p++;
+  if (*p == '\0') {
+    *cursor = p;
+    return NULL;
+  }
+  char *token = p;
+  while (*p != '\0' && *p != ' ' && *p != '\t') p++;
+  if (*p != '\0') *p++ = '\0';
+  *cursor = p;
+  return token;
+}
+
+bool isBlank(const char *text) {
+  while (*text == ' ' || *text == '\t') text++;
+  return *text == '\0';
+}
+
+// 各コマンドの処理
+void commandStatus(char *args) {
+  printSystemStatus();
+}
+
+void commandConfig(char *args) {
+  printConfiguration();
+}
+
+void commandReset(char *args) {
+  Console.println(F("システムリセット..."));
+  delay(100);
+  // ソフトウェアリセット
+  NVIC_SystemReset();
+}
+
+void commandJson(char *args) {
+  config.enableJsonOutput = !config.enableJsonOutput;
+  Console.print(F("JSON出力: "));
+  Console.println(config.enableJsonOutput ? F("ON") : F("OFF"));
+}
+
+void commandBin(char *args) {
+  config.enableBinaryOutput = !config.enableBinaryOutput;
+  frameEncoder.sinceKeyFrame = KEY_FRAME_INTERVAL;  // 再開後の最初はキーフレーム
+  Console.print(F("バイナリ出力: "));
+  Console.println(config.enableBinaryOutput ? F("ON") : F("OFF"));
+}
+
+void commandDump(char *args) {
+  dumpHistory(*args ? args : NULL);
+}
+
+void commandFalsePositive(char *args) {
+  markFalsePositive();
+}
+
+void commandHelp(char *args) {
+  printHelp();
+}
+
+const CommandEntry COMMANDS[] = {
+  {"status", commandStatus, false},
+  {"config", commandConfig, false},
+  {"set", commandSet, true},
+  {"json", commandJson, false},
+  {"bin", commandBin, false},
+  {"dump", commandDump, true},
+  {"fp", commandFalsePositive, false},
+  {"help", commandHelp, false},
+  {"reset", commandReset, false},
+};
+#define COMMAND_COUNT (sizeof(COMMANDS) / sizeof(COMMANDS[0]))
+
+// コマンド処理 (入力バッファをその場で書き換えて解釈する)
+void processCommand(char *cmd) {
+  for (char *p = cmd; *p; p++) *p = tolower((unsigned char)*p);
+  while (*cmd == ' ' || *cmd == '\t') cmd++;
+  // 送り途中の dump があれば、応答が混ざらないよう先に送り切る
+  finishHistoryDump();
+  
+  // "#<番号> <コマンド>" は処理後に "#<番号> END" を出力する (ホストが応答の終わりを知るため)
+  if (cmd[0] == '#') {
+    char *rest = cmd + 1;
+    uint32_t tag = 0;
+    while (*rest >= '0' && *rest <= '9') tag = tag * 10 + (*rest++ - '0');
+    if (isBlank(rest)) {
+      printDebugInfo();
+    } else {
+      processCommand(rest);
+    }
+    if (historyDump.active) {
+      // dump を始めたなら END は DUMP END の後 (endHistoryDump) に出す
+      historyDump.tagged = true;
+      historyDump.tag = tag;
+      return;
+    }
+    printTagEnd(tag);
+    return;
+  }
+  
+  if (*cmd == '\0') {
+    printDebugInfo();
+    return;
+  }
+  
+  // ';' で区切った複数のコマンドを順に実行する (空のコマンドは無視)
+  while (cmd != NULL) {
+    char *next = strchr(cmd, ';');
+    if (next != NULL) *next++ = '\0';
+    runCommand(cmd);
+    cmd = next;
+  }
+}
+
+// 1つのコマンドを表から探して実行する
+void runCommand(char *cmd) {
+  finishHistoryDump();  // "dump;status" などで dump の後の応答が先に出ないように
+  char *args = cmd;
+  char *name = nextToken(&args);
+  if (name == NULL) return;
+  
+  // 引数の前後の空白を除く
+  while (*args == ' ' || *args == '\t') args++;
+  char *end = args + strlen(args);
+  while (end > args && (end[-1] == ' ' || end[-1] == '\t')) *--end = '\0';
+  
+  for (uint8_t i = 0; i < COMMAND_COUNT; i++) {
+    if (strcmp(name, COMMANDS[i].name) != 0) continue;
+    if (*args && !COMMANDS[i].acceptsArgs) break;
+    COMMANDS[i].handler(args);
+    return;
+  }
+  Console.println(F("不明なコマンド (help で使用法表示)"));
+}
+
+const SettingEntry *findSetting(const char *name) {
+  for (uint8_t i = 0; i < SETTING_COUNT; i++) {
+    const SettingEntry &entry = SETTINGS[i];
+    if (strcmp(name, entry.name) == 0 || (entry.alias != NULL && strcmp(name, entry.alias) == 0)) {
+      return &entry;
+    }
+  }
+  return NULL;
+}
+
+// 値を解釈する (10進数のみ。inf・nan・16進は受け付けない)
+bool parseSetting(const SettingEntry &entry, const char *text, SettingValue &value) {
+  if (entry.type == SETTING_BOOL) {
+    if (strcmp(text, "on") == 0 || strcmp(text, "1") == 0 || strcmp(text, "true") == 0) {
+      value.i = 1;
+    } else if (strcmp(text, "off") == 0 || strcmp(text, "0") == 0 || strcmp(text, "false") == 0) {
+      value.i = 0;
+    } else {
+      return false;
+    }
+    return true;
+  }
+  const char *allowed = entry.type == SETTING_FLOAT ? "0123456789+-.e" : "0123456789+-";
+  if (text[strspn(text, allowed)] != '\0') return false;
+  char *end;
+  if (entry.type == SETTING_FLOAT) {
+    value.f = strtod(text, &end);
+  } else {
+    value.i = strtol(text, &end, 10);
+  }
+  return end != text && *end == '\0';
+}
+
+bool settingInRange(const SettingEntry &entry, const SettingValue &value) {
+  double number = entry.type == SETTING_FLOAT ? value.f : value.i;
+  return number >= entry.minValue && number <= entry.maxValue;
+}
+
+void applySetting(const SettingEntry &entry, const SettingValue &value) {
+  switch (entry.type) {
+    case SETTING_FLOAT: *(float *)entry.target = value.f; break;
+    case SETTING_INT: *(int *)entry.target = value.i; break;
+    case SETTING_ULONG: *(unsigned long *)entry.target = value.i; break;
+    case SETTING_BOOL: *(bool *)entry.target = value.i != 0; break;
+  }
+}
+
+void printSetting(const SettingEntry &entry) {
+  Console.print(entry.label);
+  Console.print(F(": "));
+  switch (entry.type) {
+    case SETTING_FLOAT: Console.print(*(float *)entry.target); break;
+    case SETTING_INT: Console.print(*(int *)entry.target); break;
+    case SETTING_ULONG: Console.print(*(unsigned long *)entry.target); break;
+    case SETTING_BOOL: Console.print(*(bool *)entry.target ? F("ON") : F("OFF")); break;
+  }
+  Console.println(entry.unit);
+}
+
+void printSettingRange(const SettingEntry &entry) {
+  if (entry.type == SETTING_BOOL) {
+    Console.print(F("on/off"));
+  } else if (entry.type == SETTING_FLOAT) {
+    Console.print(entry.minValue);
+    Console.print(F("〜"));
+    Console.print(entry.maxValue);
   } else {
-    Serial.println(F("不明なコマンド (help で使用法表示)"));
+    Console.print((long)entry.minValue);
+    Console.print(F("〜"));
+    Console.print((long)entry.maxValue);
   }
+  Console.print(entry.unit);
 }
 
-// Set コマンド処理
-void processSetCommand(String params) {
-  int spaceIndex = params.indexOf(' ');
-  if (spaceIndex == -1) return;
+// set コマンド ("<項目> <値>" を1組以上。全部の値が正しいときだけまとめて反映する)
+void commandSet(char *args) {
+  const SettingEntry *entries[MAX_BATCH_SETTINGS];
+  SettingValue values[MAX_BATCH_SETTINGS];
+  uint8_t count = 0;
+  char *name;
   
-  String param = params.substring(0, spaceIndex);
-  String value = params.substring(spaceIndex + 1);
+  while ((name = nextToken(&args)) != NULL) {
+    if (count == MAX_BATCH_SETTINGS) {
+      Console.print(F("一度に設定できるのは "));
+      Console.print(MAX_BATCH_SETTINGS);
+      Console.println(F(" 項目までです"));
+      return;
+    }
+    char *text = nextToken(&args);
+    const SettingEntry *entry = findSetting(name);
+    if (entry == NULL) {
+      Console.print(F("不明な項目: "));
+      Console.println(name);
+      return;
+    }
+    if (text == NULL) {
+      Console.print(F("値がありません: "));
+      Console.println(name);
+      return;
+    }
+    if (!parseSetting(*entry, text, values[count])) {
+      Console.print(F("不正な値: "));
+      Console.print(name);
+      Console.print(' ');
+      Console.println(text);
+      return;
+    }
+    if (!settingInRange(*entry, values[count])) {
+      Console.print(F("範囲外: "));
+      Console.print(name);
+      Console.print(F(" ("));
+      printSettingRange(*entry);
+      Console.println(')');
+      return;
+    }
+    entries[count++] = entry;
+  }
   
-  if (param == "temp") {
-    config.tempThreshold = value.toFloat();
-    Serial.print(F("温度閾値: "));
-    Serial.println(config.tempThreshold);
-  } else if (param == "distance") {
-    config.distanceThreshold = value.toFloat();
-    Serial.print(F("距離閾値: "));
-    Serial.println(config.distanceThreshold);
-  } else if (param == "score") {
-    config.detectionThreshold = value.toInt();
-    Serial.print(F("検知閾値: "));
-    Serial.println(config.detectionThreshold);
+  if (count == 0) {
+    Console.println(F("使用法: set <項目> <値> [<項目> <値> ...] (help で項目一覧)"));
+    return;
+  }
+  for (uint8_t i = 0; i < count; i++) {
+    applySetting(*entries[i], values[i]);
+    printSetting(*entries[i]);
+  }
+  applyOutputSettings();
+}
+
+// 音声・LED を OFF にしたら、再生中のメロディと点灯中の LED を止める
+void applyOutputSettings() {
+  if (!config.enableSound && melody.steps != NULL) {
+    melody.steps = NULL;
+    noTone(SPEAKER_PIN);
+  }
+  if (!config.enableLEDs) {
+    ledAnimation = ANIMATION_NONE;
+    for (int i = 0; i < LED_COUNT; i++) {
+      strip.setPixelColor(i, strip.Color(0, 0, 0));
+    }
+    strip.show();
+  }
+}
+
+// 直前の検知を誤検知として記録 (閾値調整の評価用)
+void markFalsePositive() {
+  if (stats.falsePositives < stats.totalDetections) {
+    stats.falsePositives++;
   }
+  Console.print(F("誤検知: "));
+  Console.print(stats.falsePositives);
+  Console.print(F("/"));
+  Console.println(stats.totalDetections);
 }
 
 // ヘルプ表示
 void printHelp() {
-  Serial.println(F("=== コマンド一覧 ==="));
-  Serial.println(F("status     - システム状態表示"));
-  Serial.println(F("config     - 設定表示"));
-  Serial.println(F("json       - JSON出力切替"));
-  Serial.println(F("reset      - システムリセット"));
-  Serial.println(F("set temp X - 温度閾値設定"));
-  Serial.println(F("set distance X - 距離閾値設定"));
-  Serial.println(F("set score X - 検知スコア閾値設定"));
-  Serial.println(F("Enter      - デバッグ情報表示"));
+  Console.println(F("=== コマンド一覧 ==="));
+  Console.println(F("status     - システム状態表示"));
+  Console.println(F("config     - 設定表示"));
+  Console.println(F("json       - JSON出力切替"));
+  Console.println(F("bin        - バイナリフレーム出力切替"));
+  Console.println(F("dump [ms]  - 履歴をバイナリフレームで出力 (ms より後のみ)"));
+  Console.println(F("reset      - システムリセット"));
+  Console.println(F("fp         - 直前の検知を誤検知として記録"));
+  Console.println(F("set 項目 値 [項目 値 ...] - 設定変更 (全部の値が正しいときだけ反映)"));
+  for (uint8_t i = 0; i < SETTING_COUNT; i++) {
+    Console.print(F("  "));
+    Console.print(SETTINGS[i].name);
+    Console.print(F(" ("));
+    printSettingRange(SETTINGS[i]);
+    Console.print(F(") - "));
+    Console.println(SETTINGS[i].label);
+  }
+  Console.println(F("A; B       - 複数のコマンドを順に実行"));
+  Console.println(F("#N コマンド - 実行後に \"#N END\" を出力"));
+  Console.println(F("Enter      - デバッグ情報表示"));
 }
 
 // システム状態表示
@@ -599,70 +1672,80 @@ void printSystemStatus() {
   if (config.enableJsonOutput) {
     printJsonStatus();
   } else {
-    Serial.println(F("=== システム状態 ==="));
-    Serial.print(F("バージョン: ")); Serial.println(F(FIRMWARE_VERSION));
-    Serial.print(F("稼働時間: ")); Serial.print(stats.uptime / 1000); Serial.println(F("秒"));
-    Serial.print(F("状態: ")); Serial.println(getStateString());
-    Serial.print(F("総検知回数: ")); Serial.println(stats.totalDetections);
-    Serial.print(F("エラー回数: ")); Serial.println(stats.errorCount);
-    Serial.print(F("最終エラー: ")); Serial.println(lastError);
-    Serial.print(F("平均距離: ")); Serial.print(stats.averageDistance); Serial.println(F("cm"));
-    Serial.print(F("平均物体温度: ")); Serial.print(stats.averageObjectTemp); Serial.println(F("°C"));
+    Console.println(F("=== システム状態 ==="));
+    Console.print(F("バージョン: ")); Console.println(F(FIRMWARE_VERSION));
+    Console.print(F("稼働時間: ")); Console.print(stats.uptime / 1000); Console.println(F("秒"));
+    Console.print(F("状態: ")); Console.println(getStateString());
+    Console.print(F("総検知回数: ")); Console.println(stats.totalDetections);
+    Console.print(F("誤検知回数: ")); Console.println(stats.falsePositives);
+    Console.print(F("エラー回数: ")); Console.println(stats.errorCount);
+    Console.print(F("最終エラー: ")); Console.println(lastError);
+    Console.print(F("空きメモリ: ")); Console.print(freeMemory()); Console.println(F(" bytes"));
+    printStreamStats(F("平均距離: "), stats.distance, F("cm"));
+    printStreamStats(F("平均物体温度: "), stats.objectTemp, F("°C"));
+    printStreamStats(F("平均環境温度: "), stats.ambientTemp, F("°C"));
   }
 }
 
 // JSON形式状態出力
 void printJsonStatus() {
-  StaticJsonDocument<JSON_BUFFER_SIZE> doc;
+  StaticJsonDocument<JSON_STATUS_BUFFER_SIZE> doc;
   
   doc["version"] = FIRMWARE_VERSION;
   doc["uptime"] = stats.uptime / 1000;
   doc["state"] = getStateString();
   doc["total_detections"] = stats.totalDetections;
+  doc["false_positives"] = stats.falsePositives;
   doc["error_count"] = stats.errorCount;
   doc["last_error"] = lastError;
-  doc["avg_distance"] = stats.averageDistance;
-  doc["avg_object_temp"] = stats.averageObjectTemp;
+  doc["free_memory"] = freeMemory();
+  doc["avg_distance"] = stats.distance.mean;
+  doc["avg_object_temp"] = stats.objectTemp.mean;
+  JsonObject sensors = doc.createNestedObject("stats");
+  addStreamStatsJson(sensors.createNestedObject("distance"), stats.distance);
+  addStreamStatsJson(sensors.createNestedObject("object_temp"), stats.objectTemp);
+  addStreamStatsJson(sensors.createNestedObject("ambient_temp"), stats.ambientTemp);
   doc["timestamp"] = millis();
   
-  serializeJson(doc, Serial);
-  Serial.println();
+  serializeJson(doc, Console);
+  Console.println();
 }
 
 // 設定表示
 void printConfiguration() {
-  Serial.println(F("=== システム設定 ==="));
-  Serial.print(F("温度閾値: ")); Serial.print(config.tempThreshold); Serial.println(F("°C"));
-  Serial.print(F("距離閾値: ")); Serial.print(config.distanceThreshold); Serial.println(F("cm"));
-  Serial.print(F("検知スコア閾値: ")); Serial.println(config.detectionThreshold);
-  Serial.print(F("サンプリング間隔: ")); Serial.print(config.samplingInterval); Serial.println(F("ms"));
-  Serial.print(F("アラート時間: ")); Serial.print(config.alertDuration); Serial.println(F("ms"));
-  Serial.print(F("音声: ")); Serial.println(config.enableSound ? F("ON") : F("OFF"));
-  Serial.print(F("LED: ")); Serial.println(config.enableLEDs ? F("ON") : F("OFF"));
-  Serial.print(F("JSON出力: ")); Serial.println(config.enableJsonOutput ? F("ON") : F("OFF"));
+  Console.println(F("=== システム設定 ==="));
+  for (uint8_t i = 0; i < SETTING_COUNT; i++) {
+    printSetting(SETTINGS[i]);
+  }
+  Console.print(F("JSON出力: ")); Console.println(config.enableJsonOutput ? F("ON") : F("OFF"));
+  Console.print(F("バイナリ出力: ")); Console.println(config.enableBinaryOutput ? F("ON") : F("OFF"));
 }
 
 // デバッグ情報出力
 void printDebugInfo() {
   SensorData data = readSensors();
   
-  if (config.enableJsonOutput) {
+  if (config.enableBinaryOutput) {
+    HistorySample sample;
+    quantizeSample(data, false, sample);
+    writeBinaryFrame(frameEncoder, sample, stats.totalDetections);
+  } else if (config.enableJsonOutput) {
     printJsonSensorData(data);
   } else {
-    Serial.println(F("=== センサー状態 ==="));
-    Serial.print(F("PIR1: ")); Serial.print(data.pir1_triggered ? F("ON") : F("OFF"));
-    Serial.print(F(", PIR2: ")); Serial.println(data.pir2_triggered ? F("ON") : F("OFF"));
-    Serial.print(F("物体温度: ")); Serial.print(data.objectTemp, 1);
-    Serial.print(F("°C, 環境温度: ")); Serial.print(data.ambientTemp, 1); Serial.println(F("°C"));
-    Serial.print(F("距離: ")); Serial.print(data.distance, 1); Serial.println(F("cm"));
-    Serial.print(F("状態: ")); Serial.println(getStateString());
-    Serial.print(F("総検知回数: ")); Serial.println(stats.totalDetections);
-    Serial.println(F("=================="));
+    Console.println(F("=== センサー状態 ==="));
+    Console.print(F("PIR1: ")); Console.print(data.pir1_triggered ? F("ON") : F("OFF"));
+    Console.print(F(", PIR2: ")); Console.println(data.pir2_triggered ? F("ON") : F("OFF"));
+    Console.print(F("物体温度: ")); Console.print(data.objectTemp, 1);
+    Console.print(F("°C, 環境温度: ")); Console.print(data.ambientTemp, 1); Console.println(F("°C"));
+    Console.print(F("距離: ")); Console.print(data.distance, 1); Console.println(F("cm"));
+    Console.print(F("状態: ")); Console.println(getStateString());
+    Console.print(F("総検知回数: ")); Console.println(stats.totalDetections);
+    Console.println(F("=================="));
   }
 }
 
 // JSON形式センサーデータ出力
-void printJsonSensorData(SensorData data) {
+void printJsonSensorData(const SensorData &data) {
   StaticJsonDocument<JSON_BUFFER_SIZE> doc;
   
   doc["timestamp"] = data.timestamp;
@@ -675,56 +1758,286 @@ void printJsonSensorData(SensorData data) {
   doc["detection_count"] = stats.totalDetections;
   doc["valid"] = data.isValid;
   
-  serializeJson(doc, Serial);
-  Serial.println();
+  serializeJson(doc, Console);
+  Console.println();
+}
+
+// サンプルを履歴のリングバッファに残し、バイナリ出力が有効ならフレームで送る
+void recordSample(const SensorData &data, bool detected) {
+  // 送り途中の dump がまだ送っていないサンプルを上書きするなら、先にそこまで送る
+  if (historyDump.active) {
+    uint16_t offset = (historyHead + HISTORY_SIZE - historyDump.first) % HISTORY_SIZE;
+    while (offset < historyDump.count && historyDump.sent <= offset) sendDumpFrame();
+  }
+  HistorySample &sample = history[historyHead];
+  quantizeSample(data, detected, sample);
+  historyHead = (historyHead + 1) % HISTORY_SIZE;
+  if (historyCount < HISTORY_SIZE) historyCount++;
+  
+  // dump の送信中はライブのフレームを送らない (見出しの件数とずれるため。履歴には残る)
+  if (config.enableBinaryOutput && !historyDump.active) {
+    writeBinaryFrame(frameEncoder, sample, stats.totalDetections);
+  }
+}
+
+// センサー値をバイナリフレームの単位に量子化する
+void quantizeSample(const SensorData &data, bool detected, HistorySample &sample) {
+  sample.timestamp = data.timestamp;
+  sample.objectTemp = quantizeTemp(data.objectTemp);
+  sample.ambientTemp = quantizeTemp(data.ambientTemp);
+  sample.distance = FRAME_DISTANCE_NONE;
+  if (data.distance >= 0) {
+    sample.distance = (uint16_t)min(lroundf(data.distance * 10), 0xFFFEL);
+  }
+  
+  sample.flags = (uint8_t)currentState << FRAME_STATE_SHIFT;
+  if (data.pir1_triggered) sample.flags |= FRAME_FLAG_PIR1;
+  if (data.pir2_triggered) sample.flags |= FRAME_FLAG_PIR2;
+  if (data.isValid) sample.flags |= FRAME_FLAG_VALID;
+  if (detected) sample.flags |= FRAME_FLAG_DETECTION;
+}
+
+// 履歴をバイナリフレームで送る ("dump <ms>" はその時刻より後のサンプルだけ)
+// "DUMP <件数> <欠落>" の行、フレーム、"DUMP END" の行の順に出力する。
+// ここでは見出しと最初の数フレームだけを送り、残りは loop() の serviceHistoryDump が送る
+void dumpHistory(const char *since) {
+  finishHistoryDump();
+  uint16_t oldest = (historyHead + HISTORY_SIZE - historyCount) % HISTORY_SIZE;
+  uint16_t skip = 0;
+  bool truncated = false;
+  if (since != NULL) {
+    unsigned long sinceTime = strtoul(since, NULL, 10);
+    while (skip < historyCount &&
+           (long)(history[(oldest + skip) % HISTORY_SIZE].timestamp - sinceTime) <= 0) {
+      skip++;
+    }
+    // 一周した履歴の最古より前から要求されたら、その間のサンプルは上書きされている
+    truncated = skip == 0 && historyCount == HISTORY_SIZE;
+  }
+  uint16_t count = historyCount - skip;
+  uint16_t first = (oldest + skip) % HISTORY_SIZE;
+  
+  // 最初のサンプル時点の検知回数 (それより後に検知したサンプルの数を引く)
+  unsigned long detections = stats.totalDetections;
+  for (uint16_t i = 1; i < count; i++) {
+    if (history[(first + i) % HISTORY_SIZE].flags & FRAME_FLAG_DETECTION) detections--;
+  }
+  
+  Console.print(F("DUMP "));
+  Console.print(count);
+  Console.print(' ');
+  Console.println(truncated ? 1 : 0);
+  
+  // 通し番号はライブのフレームから続け、ダンプ後の最初のライブフレームはキーフレームにする
+  historyDump = HistoryDump();
+  historyDump.active = true;
+  historyDump.first = first;
+  historyDump.count = count;
+  historyDump.detections = detections;
+  historyDump.encoder.sequence = frameEncoder.sequence;
+  serviceHistoryDump();
+}
+
+// dump の続きを送る (DUMP_FRAMES_PER_LOOP まで。送信バッファが詰まっていれば1フレームだけ)
+void serviceHistoryDump() {
+  if (!historyDump.active) return;
+  for (uint8_t i = 0; i < DUMP_FRAMES_PER_LOOP && historyDump.sent < historyDump.count; i++) {
+    if (i > 0 && Serial.availableForWrite() < KEY_FRAME_SIZE) return;
+    sendDumpFrame();
+  }
+  if (historyDump.sent == historyDump.count) {
+    endHistoryDump();
+  }
+}
+
+// 送り途中の dump を最後まで送る
+void finishHistoryDump() {
+  while (historyDump.active && historyDump.sent < historyDump.count) {
+    sendDumpFrame();
+  }
+  if (historyDump.active) {
+    endHistoryDump();
+  }
+}
+
+void sendDumpFrame() {
+  const HistorySample &sample = history[(historyDump.first + historyDump.sent) % HISTORY_SIZE];
+  if (historyDump.sent > 0 && (sample.flags & FRAME_FLAG_DETECTION)) historyDump.detections++;
+  writeBinaryFrame(historyDump.encoder, sample, historyDump.detections);
+  historyDump.sent++;
+}
+
+void endHistoryDump() {
+  historyDump.active = false;
+  frameEncoder.sequence = historyDump.encoder.sequence;
+  frameEncoder.sinceKeyFrame = KEY_FRAME_INTERVAL;
+  Console.println(F("DUMP END"));
+  if (historyDump.tagged) {
+    printTagEnd(historyDump.tag);
+  }
+}
+
+void printTagEnd(uint32_t tag) {
+  Console.print('#');
+  Console.print((unsigned long)tag);
+  Console.println(F(" END"));
+}
+
+// バイナリフレーム出力 (直前のフレームとの差分が1バイトに収まれば差分フレームにする)
+void writeBinaryFrame(FrameEncoder &enc, const HistorySample &sample, unsigned long detections) {
+  uint8_t flags = sample.flags & ~FRAME_FLAG_DETECTION;
+  unsigned long elapsed = sample.timestamp - enc.timestamp;
+  unsigned long newDetections = detections - enc.detections;
+  long objectDelta = (long)sample.objectTemp - enc.objectTemp;
+  long ambientDelta = (long)sample.ambientTemp - enc.ambientTemp;
+  long distanceDelta = (long)sample.distance - enc.distance;
+  bool delta = enc.sinceKeyFrame < KEY_FRAME_INTERVAL && elapsed <= 0xFFFF && newDetections <= 1 &&
+               sample.objectTemp != FRAME_TEMP_NONE && enc.objectTemp != FRAME_TEMP_NONE &&
+               sample.ambientTemp != FRAME_TEMP_NONE && enc.ambientTemp != FRAME_TEMP_NONE &&
+               sample.distance != FRAME_DISTANCE_NONE && enc.distance != FRAME_DISTANCE_NONE &&
+               fitsInt8(objectDelta) && fitsInt8(ambientDelta) && fitsInt8(distanceDelta);
+  
+  uint8_t frame[KEY_FRAME_SIZE];
+  uint8_t length = 0;
+  frame[length++] = FRAME_SYNC1;
+  frame[length++] = FRAME_SYNC2;
+  if (delta) {
+    frame[length++] = FRAME_DELTA;
+    frame[length++] = enc.sequence;
+    length = putLittleEndian(frame, length, elapsed, 2);
+    frame[length++] = newDetections ? flags | FRAME_FLAG_DETECTION : flags;
+    frame[length++] = (uint8_t)(int8_t)objectDelta;
+    frame[length++] = (uint8_t)(int8_t)ambientDelta;
+    frame[length++] = (uint8_t)(int8_t)distanceDelta;
+    enc.sinceKeyFrame++;
+  } else {
+    frame[length++] = FRAME_KEY;
+    frame[length++] = enc.sequence;
+    length = putLittleEndian(frame, length, sample.timestamp, 4);
+    frame[length++] = flags;
+    length = putLittleEndian(frame, length, (uint16_t)sample.objectTemp, 2);
+    length = putLittleEndian(frame, length, (uint16_t)sample.ambientTemp, 2);
+    length = putLittleEndian(frame, length, sample.distance, 2);
+    length = putLittleEndian(frame, length, detections, 4);
+    enc.sinceKeyFrame = 0;
+  }
+  length = putLittleEndian(frame, length, crc16(frame + 2, length - 2), 2);
+  Console.write(frame, length);
+  
+  enc.sequence++;
+  enc.timestamp = sample.timestamp;
+  enc.objectTemp = sample.objectTemp;
+  enc.ambientTemp = sample.ambientTemp;
+  enc.distance = sample.distance;
+  enc.detections = detections;
 }
 
-// 状態文字列取得
-String getStateString() {
+// 温度を 0.01°C 単位の整数にする (NaN は FRAME_TEMP_NONE)
+int16_t quantizeTemp(float temp) {
+  if (isnan(temp)) return FRAME_TEMP_NONE;
+  return (int16_t)constrain(lroundf(temp * 100), (long)INT16_MIN + 1, (long)INT16_MAX);
+}
+
+bool fitsInt8(long value) {
+  return value >= -128 && value <= 127;
+}
+
+uint8_t putLittleEndian(uint8_t *frame, uint8_t offset, unsigned long value, uint8_t size) {
+  for (uint8_t i = 0; i < size; i++) {
+    frame[offset++] = (uint8_t)(value >> (8 * i));
+  }
+  return offset;
+}
+
+// CRC-16/CCITT-FALSE (多項式 0x1021, 初期値 0xFFFF)
+uint16_t crc16(const uint8_t *data, uint8_t length) {
+  uint16_t crc = 0xFFFF;
+  for (uint8_t i = 0; i < length; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (uint8_t bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+// 状態文字列取得 (文字列リテラルを返すのでヒープを使わない)
+const char *getStateString() {
   switch (currentState) {
-    case STANDBY: return F("待機中");
-    case CALIBRATING: return F("校正中");
-    case MONITORING: return F("監視中");
-    case ALERT: return F("警戒中");
-    case ERROR_STATE: return F("エラー");
-    default: return F("不明");
+    case STANDBY: return "待機中";
+    case CALIBRATING: return "校正中";
+    case MONITORING: return "監視中";
+    case ALERT: return "警戒中";
+    case ERROR_STATE: return "エラー";
+    default: return "不明";
   }
 }
 
-// 各種アラート・シーケンス関数
+// 空きメモリ (ヒープの末尾からスタックの先頭まで)
+extern "C" char *sbrk(int incr);
+int freeMemory() {
+  char top;
+  return &top - reinterpret_cast<char *>(sbrk(0));
+}
+
+// 各種アラート・シーケンス関数 (どれも開始するだけで、進行は loop() が行う)
 void playOniAlert() {
-  int melody[] = {262, 247, 220, 196, 175, 196, 220, 247, 262};
-  int durations[] = {200, 200, 200, 200, 400, 200, 200, 200, 400};
+  startMelody(ONI_MELODY, sizeof(ONI_MELODY) / sizeof(ONI_MELODY[0]));
+}
+
+void startupSequence() {
+  // 虹色アニメーションの後に起動音 (updateAnimation が続けて鳴らす)
+  ledAnimation = ANIMATION_STARTUP;
+  animationFrame = 0;
+  nextAnimationTime = millis();
+}
+
+// メロディ再生開始 (再生中のものは置き換える)
+void startMelody(const ToneStep *steps, uint8_t length) {
+  melody.steps = steps;
+  melody.length = length;
+  melody.index = 0;
+  melody.nextTime = millis();
+}
+
+// メロディを進める (次の音の時刻になったら鳴らす)
+void updateMelody(unsigned long currentTime) {
+  if (melody.steps == NULL || (long)(currentTime - melody.nextTime) < 0) return;
   
-  for (int i = 0; i < 9; i++) {
-    tone(SPEAKER_PIN, melody[i], durations[i]);
-    delay(durations[i] * 1.3);
+  if (melody.index >= melody.length) {
     noTone(SPEAKER_PIN);
+    melody.steps = NULL;
+    return;
+  }
+  const ToneStep &step = melody.steps[melody.index++];
+  if (step.frequency > 0) {
+    tone(SPEAKER_PIN, step.frequency, step.duration);
   }
+  melody.nextTime += step.step;
 }
 
-void startupSequence() {
-  for (int j = 0; j < 128; j++) {
+// LEDアニメーションを1フレーム進める
+void updateAnimation(unsigned long currentTime) {
+  if (ledAnimation == ANIMATION_NONE || (long)(currentTime - nextAnimationTime) < 0) return;
+  nextAnimationTime += STARTUP_FRAME_INTERVAL;
+  
+  if (animationFrame < STARTUP_RAINBOW_FRAMES) {
     for (int i = 0; i < LED_COUNT; i++) {
-      strip.setPixelColor(i, wheel((i * 256 / LED_COUNT + j) & 255));
+      strip.setPixelColor(i, wheel((i * 256 / LED_COUNT + animationFrame) & 255));
     }
     strip.show();
-    delay(20);
+    animationFrame++;
+    return;
   }
   
   for (int i = 0; i < LED_COUNT; i++) {
     strip.setPixelColor(i, strip.Color(0, 0, 0));
   }
   strip.show();
+  ledAnimation = ANIMATION_NONE;
   
   // 起動音
-  tone(SPEAKER_PIN, 440, 200);
-  delay(250);
-  tone(SPEAKER_PIN, 554, 200);
-  delay(250);
-  tone(SPEAKER_PIN, 659, 400);
-  delay(500);
-  noTone(SPEAKER_PIN);
+  startMelody(STARTUP_MELODY, sizeof(STARTUP_MELODY) / sizeof(STARTUP_MELODY[0]));
 }
 
 uint32_t wheel(byte wheelPos) {
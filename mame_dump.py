@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+節分検知システムの履歴ダンプクライアント
+
+ファームウェアは直近 HISTORY_SIZE 件のサンプルをリングバッファに持ち、`dump <ms>` で
+その時刻より後のサンプルをバイナリフレームでまとめて送る。このクライアントは複数の
+デバイスに同時に dump を送り、
+
+    DUMP <件数> <欠落>
+    （フレーム）
+    DUMP END
+
+の間のフレームだけを取り出す（前後に流れてくるライブのフレームは捨てる）。
+行の host_time はダンプを受け取った時刻になる。
+
+--store を指定すると、デバイスごとにストアの最後の timestamp より後だけを要求して追記する。
+ホストの取り込みが止まっていた間の欠けを、取り込みを再開する前に埋めるために使う。
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from mame_ingest import DEFAULT_BAUD, open_serial
+from mame_protocol import FrameParser
+from mame_store import ColumnarStore, ColumnBatch
+
+logger = logging.getLogger("mame_dump")
+
+DEFAULT_TIMEOUT = 5.0
+DEFAULT_CONCURRENCY = 64
+
+
+@dataclass
+class DumpResult:
+    """1台分のダンプ結果"""
+    device: str
+    since: Optional[int]
+    rows: List[tuple] = field(default_factory=list)
+    expected: int = 0          # 見出し行の件数
+    truncated: bool = False    # since 以降の一部が履歴から既に消えていた
+    elapsed: float = 0.0
+    bytes: int = 0
+    error: Optional[str] = None
+
+    @property
+    def complete(self) -> bool:
+        return self.error is None and len(self.rows) == self.expected
+
+
+class DumpSession:
+    """1台のシリアルポートに dump を送り、応答の範囲を切り出す"""
+
+    def __init__(self, path: str, since: Optional[int] = None, baud: int = DEFAULT_BAUD):
+        self.path = path
+        self.baud = baud
+        self.result = DumpResult(path, since)
+        self.parser = FrameParser(on_text=self._on_text)
+        self._rows: List[tuple] = []
+        self._start: Optional[int] = None
+        self._end: Optional[int] = None
+        self._done: Optional[asyncio.Event] = None
+        self._fd: Optional[int] = None
+
+    def _on_text(self, line: bytes) -> None:
+        # どちらも feed の途中で呼ばれるので、行の位置だけ覚えて切り出しは feed の後で行う
+        if line.startswith(b"DUMP END"):
+            if self._start is not None:
+                self._end = self.parser.rows_decoded
+        elif line.startswith(b"DUMP "):
+            fields = line.split()
+            self.result.expected = int(fields[1])
+            self.result.truncated = len(fields) > 2 and fields[2] == b"1"
+            self._start = self.parser.rows_decoded
+
+    def _on_readable(self) -> None:
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self.result.error = "接続が切れました"
+            self._done.set()
+            return
+        self.result.bytes += len(data)
+        rows, _ = self.parser.feed(data, time.time())
+        self._rows.extend(rows)
+        if self._end is not None and not self._done.is_set():
+            self.result.rows = self._rows[self._start:self._end]
+            self._done.set()
+        elif self._start is None:
+            # 見出し行より前のライブのフレームは要らない
+            self._rows.clear()
+            self.parser.rows_decoded = 0
+
+    async def run(self, timeout: float = DEFAULT_TIMEOUT) -> DumpResult:
+        loop = asyncio.get_running_loop()
+        self._done = asyncio.Event()
+        start = time.perf_counter()
+        try:
+            self._fd = open_serial(self.path, self.baud)
+        except OSError as e:
+            self.result.error = str(e)
+            return self.result
+        try:
+            loop.add_reader(self._fd, self._on_readable)
+            since = self.result.since
+            command = "dump" if since is None else f"dump {since}"
+            os.write(self._fd, command.encode("utf-8") + b"\n")
+            await asyncio.wait_for(self._done.wait(), timeout)
+        except asyncio.TimeoutError:
+            self.result.error = f"{timeout}秒以内に DUMP END が届きませんでした"
+        except OSError as e:
+            self.result.error = str(e)
+        finally:
+            loop.remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+            self.result.elapsed = time.perf_counter() - start
+        return self.result
+
+
+async def dump_all(paths: List[str], since: Optional[Dict[str, Optional[int]]] = None,
+                   baud: int = DEFAULT_BAUD, timeout: float = DEFAULT_TIMEOUT,
+                   concurrency: int = DEFAULT_CONCURRENCY) -> List[DumpResult]:
+    """複数のデバイスから同時にダンプを取る（since はデバイスごとの開始時刻）"""
+    since = since or {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(path: str) -> DumpResult:
+        async with semaphore:
+            return await DumpSession(path, since.get(path), baud).run(timeout)
+
+    return await asyncio.gather(*(one(path) for path in paths))
+
+
+def backfill(store: ColumnarStore, results: List[DumpResult]) -> int:
+    """ダンプの行をストアに追記し、書き込んだ件数を返す"""
+    written = 0
+    for result in results:
+        if not result.rows:
+            continue
+        batch = ColumnBatch(store.columns)
+        for row in result.rows:
+            batch.append(row)
+        written += store.append(result.device, batch)
+    return written
+
+
+def last_timestamps(store: ColumnarStore, paths: List[str]) -> Dict[str, Optional[int]]:
+    """デバイスごとにストアの最後の timestamp（なければ None で全履歴を要求する）"""
+    return {path: store.last(path, "timestamp") for path in paths}
+
+
+async def run(args) -> List[DumpResult]:
+    devices = []
+    paths = list(args.devices)
+    if args.simulate:
+        from mame_sim import start_fleet
+        devices = await start_fleet(args.simulate)
+        for device in devices:
+            # 実機と同じく sampling_interval ごとにサンプリングしてフレームを流させる
+            device.detector.config["enable_binary"] = True
+        paths.extend(device.path for device in devices)
+        await asyncio.sleep(args.warmup)
+
+    store = ColumnarStore(args.store) if args.store else None
+    since = last_timestamps(store, paths) if store else {path: args.since for path in paths}
+    try:
+        results = await dump_all(paths, since, args.baud, args.timeout, args.concurrency)
+    finally:
+        for device in devices:
+            device.close()
+    if store:
+        written = backfill(store, results)
+        logger.info(f"{written}件をストアに追記しました")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="節分検知システムの履歴ダンプ（複数デバイス同時）")
+    parser.add_argument("devices", nargs="*", help="シリアルポートのパス（/dev/ttyACM0 など）")
+    parser.add_argument("--since", type=int, help="この時刻（デバイスの millis）より後だけを要求する")
+    parser.add_argument("--store", help="列指向ストアのディレクトリ（最後の timestamp より後を追記する）")
+    parser.add_argument("--baud", type=int, default=DEFAULT_BAUD, help="ボーレート")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="1台あたりのタイムアウト（秒）")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="同時に開くポート数")
+    parser.add_argument("--simulate", type=int, default=0, metavar="N",
+                        help="N台の模擬デバイス（pty）を起動してダンプする")
+    parser.add_argument("--warmup", type=float, default=3.0, help="模擬デバイスに履歴を溜める時間（秒）")
+    parser.add_argument("--log-level", default="INFO",
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level, format="%(asctime)s [%(levelname)s] %(message)s")
+    if not args.devices and not args.simulate:
+        parser.error("デバイスのパスか --simulate を指定してください")
+
+    start = time.perf_counter()
+    try:
+        results = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        return
+    elapsed = time.perf_counter() - start
+    for result in results:
+        if result.error:
+            logger.warning(f"{result.device}: {result.error}")
+        elif not result.complete:
+            logger.warning(f"{result.device}: {len(result.rows)}/{result.expected}件しか復元できませんでした")
+        if result.truncated:
+            logger.warning(f"{result.device}: 要求した時刻以降の一部は履歴から消えていました")
+    total = sum(len(result.rows) for result in results)
+    complete = sum(result.complete for result in results)
+    logger.info(f"{len(results)}台中{complete}台から{total}件を取得しました "
+                f"({sum(r.bytes for r in results)} bytes, {elapsed:.2f}秒)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+節分検知システムの複数台管理
+
+デバイスごとに接続（シリアル・pty、または WiFi の TCP コンソール tcp://host:port）を
+張ったままプールし、コマンドを全台へ同時に送る。応答の終わりはファームウェアの
+"#<番号> <コマンド>" → "#<番号> END" で判別するので、1台に複数の要求を続けて送れる。
+
+- status: 全台の printJsonStatus を集めて、状態ごとの台数・検知回数・空きメモリなどを集計する
+- command: 任意のコマンド（set score 5 など）を全台に送り、応答行を返す
+- 応答時間はデバイスごとに StreamingStats で持つ（直近の平均・最大など）
+
+接続時に `#1 config` で JSON 出力の設定を確かめ、OFF なら `json` で ON にする。
+"""
+
+import argparse
+import asyncio
+import logging
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+from mame_ingest import DEFAULT_BAUD, open_serial
+from mame_protocol import FrameParser, is_status_record
+from mame_stats import StreamingStats
+
+logger = logging.getLogger("mame_fleet")
+
+DEFAULT_TIMEOUT = 2.0
+RECONNECT_DELAY = 2.0
+
+
+@dataclass
+class Response:
+    """1台分のコマンド応答"""
+    device: str
+    lines: List[str] = field(default_factory=list)
+    records: List[Dict] = field(default_factory=list)
+    latency: float = math.nan    # 秒
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def status(self) -> Optional[Dict]:
+        """応答に含まれる printJsonStatus（なければ None）"""
+        for record in self.records:
+            if is_status_record(record):
+                return record
+        return None
+
+
+class _Pending:
+    __slots__ = ("tag", "response", "future", "sent")
+
+    def __init__(self, tag: int, response: Response, future: asyncio.Future):
+        self.tag = tag
+        self.response = response
+        self.future = future
+        self.sent = time.perf_counter()
+
+
+class DeviceConnection(ABC):
+    """1台分の接続。要求に番号を付けて送り、"#<番号> END" までの出力を応答にまとめる
+
+    番号のない出力（検知時の表示など）は、その時点で一番古い未完了の要求に入れる。
+    テキスト行と JSON レコードは届いた順に処理する（FrameParser の on_text・on_record）。
+    """
+
+    def __init__(self, address: str, baud: int = DEFAULT_BAUD):
+        self.address = address
+        self.baud = baud
+        self.latency = StreamingStats()   # ミリ秒
+        self.requests = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.reconnects = 0
+        self.json_enabled: Optional[bool] = None
+        self._pending: Deque[_Pending] = deque()
+        self._next_tag = 1
+        self._parser = self._new_parser()
+        self._connected = False
+        self._ever_connected = False
+        self._connecting: Optional[asyncio.Future] = None
+        self._last_failure = -math.inf
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    def _new_parser(self) -> FrameParser:
+        return FrameParser(on_text=self._on_text, on_record=self._on_record)
+
+    # ---- 接続の種類ごとの実装 ----
+
+    @abstractmethod
+    async def _open(self) -> None:
+        """接続を開き、受信したデータを _on_data に渡すようにする"""
+
+    @abstractmethod
+    def _write(self, data: bytes) -> None:
+        """送信する（切断済みなら ConnectionError）"""
+
+    @abstractmethod
+    def _close(self) -> None:
+        """接続を閉じる（閉じていれば何もしない）"""
+
+    # ---- 共通 ----
+
+    async def connect(self) -> None:
+        """接続して JSON 出力を ON にする（同時に呼ばれても接続は1回）"""
+        if self._connected:
+            return
+        if self._connecting is not None:
+            await asyncio.shield(self._connecting)
+            return
+        self._connecting = asyncio.get_running_loop().create_future()
+        try:
+            self._parser = self._new_parser()
+            await self._open()
+            self._connected = True
+            if self._ever_connected:
+                self.reconnects += 1
+            self._ever_connected = True
+            config = await self._request("config", DEFAULT_TIMEOUT)
+            if config.error:
+                raise ConnectionError(config.error)
+            self.json_enabled = any(line.startswith("JSON出力: ON") for line in config.lines)
+            if not self.json_enabled:
+                toggled = await self._request("json", DEFAULT_TIMEOUT)
+                self.json_enabled = any(line.startswith("JSON出力: ON") for line in toggled.lines)
+            self._connecting.set_result(None)
+        except BaseException as e:
+            self._last_failure = time.monotonic()
+            self._disconnect(f"接続できません ({e})")
+            self._connecting.set_exception(ConnectionError(str(e)))
+            self._connecting.exception()   # 待っている側がいなくても警告を出さない
+            raise
+        finally:
+            self._connecting = None
+
+    async def request(self, command: str, timeout: float = DEFAULT_TIMEOUT) -> Response:
+        """コマンドを送って応答を待つ（未接続なら接続してから。失敗は Response.error に入れる）"""
+        if not self._connected:
+            if time.monotonic() - self._last_failure < RECONNECT_DELAY:
+                return Response(self.address, error="接続できません（再接続待ち）")
+            try:
+                await self.connect()
+            except (OSError, ConnectionError, asyncio.TimeoutError) as e:
+                return Response(self.address, error=str(e) or "接続できません")
+        return await self._request(command, timeout)
+
+    async def _request(self, command: str, timeout: float) -> Response:
+        tag = self._next_tag
+        self._next_tag += 1
+        response = Response(self.address)
+        pending = _Pending(tag, response, asyncio.get_running_loop().create_future())
+        self._pending.append(pending)
+        self.requests += 1
+        try:
+            self._write(f"#{tag} {command}\n".encode("utf-8"))
+            await asyncio.wait_for(asyncio.shield(pending.future), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            response.error = f"{timeout}秒以内に応答がありません"
+        except (OSError, ConnectionError) as e:
+            self.errors += 1
+            response.error = str(e) or "接続が切れました"
+            self._disconnect(response.error)
+        finally:
+            if pending in self._pending:
+                self._pending.remove(pending)
+        return response
+
+    def _on_data(self, data: bytes) -> None:
+        # センサー値（フレーム・JSON）は使わない
+        self._parser.feed(data)
+
+    def _on_record(self, record: Dict) -> None:
+        if self._pending:
+            self._pending[0].response.records.append(record)
+
+    def _on_text(self, line: bytes) -> None:
+        text = line.decode("utf-8", "replace")
+        if text.startswith("#") and text.endswith(" END"):
+            try:
+                tag = int(text[1:-4])
+            except ValueError:
+                tag = -1
+            while self._pending and self._pending[0].tag <= tag:
+                pending = self._pending.popleft()
+                if pending.tag != tag:
+                    pending.response.error = "応答が欠けました"
+                latency = time.perf_counter() - pending.sent
+                pending.response.latency = latency
+                if pending.tag == tag:
+                    self.latency.add(latency * 1000)
+                if not pending.future.done():
+                    pending.future.set_result(None)
+            return
+        if self._pending:
+            self._pending[0].response.lines.append(text)
+
+    def _disconnect(self, reason: str, expected: bool = False) -> None:
+        if self._connected and not expected:
+            logger.warning(f"{self.address}: {reason}")
+        self._connected = False
+        try:
+            self._close()
+        except OSError:
+            pass
+        while self._pending:
+            pending = self._pending.popleft()
+            if not pending.future.done():
+                pending.future.set_exception(ConnectionError(reason))
+                pending.future.exception()
+
+    def close(self) -> None:
+        self._disconnect("切断しました", expected=True)
+
+
+class SerialConnection(DeviceConnection):
+    """シリアルポート・pty"""
+
+    def __init__(self, address: str, baud: int = DEFAULT_BAUD):
+        super().__init__(address, baud)
+        self._fd: Optional[int] = None
+
+    async def _open(self) -> None:
+        self._fd = open_serial(self.address, self.baud)
+        asyncio.get_running_loop().add_reader(self._fd, self._on_readable)
+
+    def _on_readable(self) -> None:
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._disconnect("接続が切れました")
+            return
+        self._on_data(data)
+
+    def _write(self, data: bytes) -> None:
+        if self._fd is None:
+            raise ConnectionError("接続していません")
+        os.write(self._fd, data)
+
+    def _close(self) -> None:
+        if self._fd is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+
+
+class TcpConnection(DeviceConnection):
+    """WiFi の TCP コンソール（tcp://host:port）"""
+
+    def __init__(self, address: str, baud: int = DEFAULT_BAUD):
+        super().__init__(address, baud)
+        host, _, port = address[len("tcp://"):].rpartition(":")
+        self.host = host
+        self.port = int(port)
+        self._transport: Optional[asyncio.Transport] = None
+
+    async def _open(self) -> None:
+        loop = asyncio.get_running_loop()
+        connection = self
+
+        class _Protocol(asyncio.Protocol):
+            def data_received(self, data: bytes) -> None:
+                connection._on_data(data)
+
+            def connection_lost(self, exc) -> None:
+                if connection._transport is not None:
+                    connection._transport = None
+                    connection._disconnect("接続が切れました")
+
+        self._transport, _ = await asyncio.wait_for(
+            loop.create_connection(_Protocol, self.host, self.port), DEFAULT_TIMEOUT)
+
+    def _write(self, data: bytes) -> None:
+        if self._transport is None:
+            raise ConnectionError("接続していません")
+        self._transport.write(data)
+
+    def _close(self) -> None:
+        if self._transport is not None:
+            transport, self._transport = self._transport, None
+            transport.close()
+
+
+def open_connection(address: str, baud: int = DEFAULT_BAUD) -> DeviceConnection:
+    if address.startswith("tcp://"):
+        return TcpConnection(address, baud)
+    return SerialConnection(address, baud)
+
+
+@dataclass
+class FleetStatus:
+    """status の一斉取得の結果"""
+    responses: List[Response]
+    elapsed: float
+
+    def summary(self) -> Dict:
+        statuses = [r.status for r in self.responses if r.status is not None]
+        latencies = sorted(r.latency * 1000 for r in self.responses if r.ok and not math.isnan(r.latency))
+        free_memory = [s["free_memory"] for s in statuses if s.get("free_memory") is not None]
+        return {
+            "devices": len(self.responses),
+            "reachable": len(statuses),
+            "states": dict(Counter(s.get("state") for s in statuses)),
+            "total_detections": sum(s.get("total_detections", 0) for s in statuses),
+            "false_positives": sum(s.get("false_positives", 0) for s in statuses),
+            "error_count": sum(s.get("error_count", 0) for s in statuses),
+            "min_free_memory": min(free_memory) if free_memory else None,
+            "latency_p50_ms": _percentile(latencies, 0.5),
+            "latency_p95_ms": _percentile(latencies, 0.95),
+            "latency_max_ms": latencies[-1] if latencies else None,
+            "elapsed_ms": self.elapsed * 1000,
+        }
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class FleetManager:
+    """接続のプールと一斉送信"""
+
+    def __init__(self, addresses: List[str], baud: int = DEFAULT_BAUD, timeout: float = DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self.connections: Dict[str, DeviceConnection] = {
+            address: open_connection(address, baud) for address in addresses}
+
+    async def connect(self) -> int:
+        """全台に接続し、つながった台数を返す"""
+        results = await asyncio.gather(*(c.connect() for c in self.connections.values()),
+                                       return_exceptions=True)
+        for address, result in zip(self.connections, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"{address}: {result}")
+        return sum(c.connected for c in self.connections.values())
+
+    async def broadcast(self, command: str) -> List[Response]:
+        """全台に同じコマンドを送り、応答をアドレス順に返す"""
+        return list(await asyncio.gather(
+            *(c.request(command, self.timeout) for c in self.connections.values())))
+
+    async def poll_status(self) -> FleetStatus:
+        start = time.perf_counter()
+        responses = await self.broadcast("status")
+        return FleetStatus(responses, time.perf_counter() - start)
+
+    def latency_table(self) -> List[Tuple[str, Dict]]:
+        """デバイスごとの応答時間の統計（ミリ秒）"""
+        return [(address, {
+            "requests": c.requests,
+            "timeouts": c.timeouts,
+            "mean": c.latency.mean,
+            "max": c.latency.maximum,
+            "ema": c.latency.ema,
+        }) for address, c in self.connections.items()]
+
+    def close(self) -> None:
+        for connection in self.connections.values():
+            connection.close()
+
+
+def print_status(status: FleetStatus, connections: Dict[str, DeviceConnection]) -> None:
+    print(f"{'デバイス':<28} {'状態':<6} {'検知':>6} {'誤検知':>6} {'エラー':>6} {'空きメモリ':>10} {'応答ms':>8}")
+    for response in status.responses:
+        s = response.status
+        if s is None:
+            print(f"{response.device:<28} {'-':<6} {response.error or '応答なし'}")
+            continue
+        print(f"{response.device:<28} {s.get('state', '?'):<6} {s.get('total_detections', 0):>6} "
+              f"{s.get('false_positives', 0):>6} {s.get('error_count', 0):>6} "
+              f"{s.get('free_memory', '-'):>10} {response.latency * 1000:>8.1f}")
+
+
+async def run(args) -> int:
+    servers = []
+    addresses = list(args.devices)
+    if args.simulate:
+        if args.transport == "tcp":
+            from mame_sim import start_tcp_fleet
+            servers = await start_tcp_fleet(args.simulate)
+            addresses.extend(server.address for server in servers)
+        else:
+            from mame_sim import start_fleet
+            servers = await start_fleet(args.simulate)
+            addresses.extend(server.path for server in servers)
+
+    fleet = FleetManager(addresses, args.baud, args.timeout)
+    try:
+        start = time.perf_counter()
+        connected = await fleet.connect()
+        logger.info(f"{len(addresses)}台中{connected}台に接続しました ({(time.perf_counter() - start) * 1000:.0f}ms)")
+
+        if args.command:
+            responses = await fleet.broadcast(args.command)
+            for response in responses:
+                output = " / ".join(response.lines) if response.ok else f"エラー: {response.error}"
+                print(f"{response.device}: {output} ({response.latency * 1000:.1f}ms)")
+            return 0 if all(r.ok for r in responses) else 1
+
+        status = None
+        for round_index in range(args.rounds):
+            status = await fleet.poll_status()
+            summary = status.summary()
+            logger.info(f"{round_index + 1}回目: {summary['reachable']}/{summary['devices']}台 "
+                        f"{summary['elapsed_ms']:.0f}ms (p50 {summary['latency_p50_ms'] or 0:.1f}ms, "
+                        f"p95 {summary['latency_p95_ms'] or 0:.1f}ms)")
+            if round_index + 1 < args.rounds:
+                await asyncio.sleep(args.interval)
+        if args.verbose:
+            print_status(status, fleet.connections)
+        summary = status.summary()
+        for key, value in summary.items():
+            print(f"{key}: {value:.1f}" if isinstance(value, float) else f"{key}: {value}")
+        return 0 if summary["reachable"] == summary["devices"] else 1
+    finally:
+        fleet.close()
+        for server in servers:
+            server.close()
+        if args.simulate and args.transport == "tcp":
+            await asyncio.gather(*(server.wait_closed() for server in servers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="節分検知システムの複数台管理（状態の一斉取得・コマンドの一斉送信）")
+    parser.add_argument("devices", nargs="*", help="シリアルポートのパスか tcp://host:port")
+    parser.add_argument("--command", help="全台に送るコマンド（省略時は status を集計する）")
+    parser.add_argument("--rounds", type=int, default=1, help="status を取得する回数")
+    parser.add_argument("--interval", type=float, default=1.0, help="status を取得する間隔（秒）")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="1台あたりのタイムアウト（秒）")
+    parser.add_argument("--baud", type=int, default=DEFAULT_BAUD, help="ボーレート")
+    parser.add_argument("--simulate", type=int, default=0, metavar="N", help="N台の模擬デバイスを起動する")
+    parser.add_argument("--transport", choices=["tcp", "pty"], default="tcp", help="模擬デバイスの接続方法")
+    parser.add_argument("-v", "--verbose", action="store_true", help="デバイスごとの状態を表示する")
+    parser.add_argument("--log-level", default="INFO",
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level, format="%(asctime)s [%(levelname)s] %(message)s")
+    if not args.devices and not args.simulate:
+        parser.error("デバイスのアドレスか --simulate を指定してください")
+    try:
+        exit_code = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        return
+    raise SystemExit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
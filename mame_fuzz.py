@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+節分検知システムのコマンドパーサーのファズテストと応答時間の計測
+
+mame_host でファームウェアをホスト上にビルドし、キャリブレーションが終わった後に、
+生成したコマンド行を1件ずつシリアルに入れて handleSerialCommands() を呼ぶ。1件ごとに
+応答の出力・処理にかかった時間（ホストの実時間）・処理後の設定値を受け取り、同じバイト列を
+FakeDetector（mame_sim）にも与えて
+
+- 設定値が一致すること
+- 出力が決まるコマンド（status・dump・fp・空行以外）の応答がバイト単位で一致すること
+
+を確かめる。食い違いがあれば終了コード 1 を返す。
+
+入力は文法に沿った行（大小文字・空白・#タグ・';' 区切り・複数項目の set・範囲外や
+解釈できない値）に突然変異を加えたものと、任意のバイト列（改行・NUL・上位ビット・
+行バッファより長い行を含む）を混ぜる。reset を含むものは除く。
+"""
+
+import argparse
+import random
+import subprocess
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import mame_host
+from mame_protocol import MAX_COMMAND_LENGTH, SETTINGS
+from mame_sim import FakeDetector, split_commands
+
+# ハーネス（入力は [長さ(4バイト, LE)][バイト列] の繰り返し。
+# 出力は1件ごとに "<ns> <出力バイト数> <設定値...>\n" と出力そのもの）
+FUZZ_HARNESS = r'''
+#include <time.h>
+static char fuzzCapture[1 << 16];
+static char fuzzInput[4096];
+
+int main(int argc, char **argv) {
+  hostBegin(1);
+  setup();
+  // キャリブレーション中は 'q' で中断されるので、監視を始めるまで進めておく
+  while (currentState != MONITORING && hostMicros < 120000000ULL) hostRunUntil(hostMicros + 100000);
+  hostCapture = fuzzCapture;
+  hostCaptureCapacity = sizeof(fuzzCapture);
+
+  uint32_t size;
+  while (fread(&size, sizeof(size), 1, stdin) == 1 && size <= sizeof(fuzzInput)) {
+    if (fread(fuzzInput, 1, size, stdin) != size) break;
+    hostSerialInput(fuzzInput, size);
+    hostCaptureSize = 0;
+    timespec start, end;
+    clock_gettime(CLOCK_MONOTONIC, &start);
+    handleSerialCommands();
+    finishHistoryDump();  // dump の残り（実機では loop() が少しずつ送る）
+    clock_gettime(CLOCK_MONOTONIC, &end);
+    long long ns = (end.tv_sec - start.tv_sec) * 1000000000LL + (end.tv_nsec - start.tv_nsec);
+    printf("%lld %zu %.6f %.6f %d %lu %lu %d %d %d\n", ns, hostCaptureSize,
+           config.tempThreshold, config.distanceThreshold, config.detectionThreshold,
+           config.samplingInterval, config.alertDuration,
+           config.enableSound, config.enableLEDs, config.enableJsonOutput);
+    fwrite(fuzzCapture, 1, hostCaptureSize, stdout);
+  }
+  return 0;
+}
+'''
+
+COMMAND_WORDS = ("status", "config", "json", "bin", "dump", "fp", "help")
+SETTING_NAMES = [name for setting in SETTINGS for name in (setting.name, setting.alias) if name]
+GARBAGE_VALUES = ("", "abc", "nan", "inf", "-inf", "0x10", "1e", "1e3", "1e-3", "1e40", "1e400", "+", "-",
+                  ".", ".5", "5.", "+3", "-5", "--1", "1_0", "99999999999999999999", "on", "off", "yes", "2")
+WHITESPACE = (" ", " ", " ", "  ", "\t", " \t ")
+
+
+class MirrorDetector(FakeDetector):
+    """応答が時刻やセンサー値で変わるコマンドを実行したかを覚えておく FakeDetector"""
+
+    def __init__(self):
+        super().__init__(seed=1)
+        self.varies = False
+        self.first_command: Optional[str] = None
+
+    def _debug_info(self):
+        self.varies = True
+        self.first_command = self.first_command or "(空行)"
+        return super()._debug_info()
+
+    def _run_command(self, command: str):
+        name = command.strip(" \t").replace("\t", " ").split(" ", 1)[0]
+        if name and self.first_command is None:
+            self.first_command = name if name in self._commands else "(不明)"
+        return super()._run_command(command)
+
+    def _command_status(self, args):
+        self.varies = True
+        return super()._command_status(args)
+
+    def _command_dump(self, args):
+        self.varies = True
+        return super()._command_dump(args)
+
+    def _command_fp(self, args):
+        # 検知回数は空行で取ったセンサー値しだい（ハーネスは loop() を回さない）
+        self.varies = True
+        return super()._command_fp(args)
+
+
+def _random_value(rng: random.Random, setting) -> str:
+    r = rng.random()
+    if r < 0.15:
+        return rng.choice(GARBAGE_VALUES)
+    if setting.type is bool:
+        return rng.choice(("on", "off", "1", "0", "true", "false", "ON", "Off"))
+    low, high = setting.minimum, setting.maximum
+    if r < 0.3:
+        value = rng.choice((low, high, low - 1, high + 1, 0, -low))
+    else:
+        value = rng.uniform(low - (high - low) * 0.1, high * 1.1)
+    if setting.type is int:
+        return str(int(value))
+    return rng.choice((f"{value:.1f}", f"{value:.3f}", f"{value:g}", f"{value:.2e}", repr(value)))
+
+
+def _random_set(rng: random.Random) -> str:
+    pairs = []
+    for _ in range(rng.choice((1, 1, 1, 2, 3, 5, 8, 9))):
+        r = rng.random()
+        if r < 0.05:
+            pairs.append(rng.choice(SETTING_NAMES))         # 値がない
+            continue
+        if r < 0.1:
+            name = rng.choice(("foo", "threshold", "tmp", "intervals", "s"))
+            pairs.append(f"{name} 1")
+            continue
+        setting = rng.choice(SETTINGS)
+        name = rng.choice([n for n in (setting.name, setting.alias) if n])
+        pairs.append(f"{name}{rng.choice(WHITESPACE)}{_random_value(rng, setting)}")
+    return "set" + "".join(rng.choice(WHITESPACE) + pair for pair in pairs)
+
+
+def _random_command(rng: random.Random) -> str:
+    r = rng.random()
+    if r < 0.5:
+        return _random_set(rng)
+    if r < 0.85:
+        word = rng.choice(COMMAND_WORDS)
+        if rng.random() < 0.15:
+            word += rng.choice(WHITESPACE) + rng.choice(("1", "x", "123456", "on"))
+        return word
+    if r < 0.95:
+        return rng.choice(("sett", "stat", "statuss", "conf", "x", "?", "#", "set;", "dumps"))
+    return ""
+
+
+def _mutate(rng: random.Random, text: str) -> str:
+    chars = list(text)
+    for _ in range(rng.randint(1, 4)):
+        op = rng.random()
+        position = rng.randint(0, len(chars))
+        if op < 0.4:
+            chars.insert(position, rng.choice(" \t;#0123456789.-+eaz"))
+        elif chars and op < 0.7:
+            del chars[min(position, len(chars) - 1)]
+        elif chars:
+            i = min(position, len(chars) - 1)
+            chars.insert(i, chars[i])
+    return "".join(chars)
+
+
+def random_line(rng: random.Random) -> bytes:
+    """文法に沿ったコマンド行（改行付き）"""
+    commands = [_random_command(rng) for _ in range(rng.choice((1, 1, 1, 2, 3, 4)))]
+    line = rng.choice((";", "; ", " ; ")).join(commands)
+    if rng.random() < 0.2:
+        line = f"#{rng.randint(0, 10 ** rng.randint(1, 12))}{rng.choice(('', ' ', '  '))}{line}"
+    if rng.random() < 0.3:
+        line = "".join(c.upper() if rng.random() < 0.5 else c for c in line)
+    if rng.random() < 0.3:
+        line = rng.choice(WHITESPACE) + line + rng.choice(WHITESPACE)
+    if rng.random() < 0.2:
+        line = _mutate(rng, line)
+    if rng.random() < 0.02:
+        line = line + " " + "x" * rng.randint(MAX_COMMAND_LENGTH - len(line), 600)
+    return line.encode("utf-8") + rng.choice((b"\n", b"\n", b"\n", b"\r", b"\r\n"))
+
+
+def random_bytes(rng: random.Random) -> bytes:
+    """任意のバイト列（途中の改行で複数行になる・改行で終わらないこともある）"""
+    alphabet = b"set temp score led 0123456789.;#\t\n\r\x00\xe3\x81\x82\xff"
+    size = rng.choice((1, 4, 16, 64, 300))
+    data = bytes(rng.choice(alphabet) if rng.random() < 0.7 else rng.randrange(256) for _ in range(size))
+    return data if rng.random() < 0.2 else data + b"\n"
+
+
+def generate(count: int, seed: int = 1, raw_ratio: float = 0.1) -> List[bytes]:
+    rng = random.Random(seed)
+    records = []
+    while len(records) < count:
+        record = random_bytes(rng) if rng.random() < raw_ratio else random_line(rng)
+        if b"reset" not in record.lower():
+            records.append(record)
+    return records
+
+
+@dataclass
+class FuzzResult:
+    """1件分のファームウェアの応答"""
+    input: bytes
+    nanoseconds: int
+    config: Tuple[str, ...]
+    output: bytes
+
+
+def run_firmware(records: List[bytes], source: Optional[str] = None,
+                 timeout: Optional[float] = None) -> List[FuzzResult]:
+    binary = mame_host.build(FUZZ_HARNESS, source=source)
+    data = b"".join(len(record).to_bytes(4, "little") + record for record in records)
+    result = subprocess.run([binary], input=data, capture_output=True, timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError(f"ファームウェアが異常終了しました ({result.returncode}): "
+                           f"{result.stderr.decode('utf-8', 'replace').strip()}")
+    results = []
+    stdout = result.stdout
+    position = 0
+    for record in records:
+        end = stdout.index(b"\n", position)
+        fields = stdout[position:end].decode("ascii").split()
+        size = int(fields[1])
+        output = stdout[end + 1:end + 1 + size]
+        position = end + 1 + size
+        results.append(FuzzResult(record, int(fields[0]), tuple(fields[2:]), output))
+    if len(results) != len(records):
+        raise RuntimeError(f"{len(records)}件中{len(results)}件しか処理されませんでした")
+    return results
+
+
+def _mirror_config(detector: FakeDetector) -> Tuple[str, ...]:
+    c = detector.config
+    return (f"{c['temp_threshold']:.6f}", f"{c['distance_threshold']:.6f}", str(c["detection_threshold"]),
+            str(c["sampling_interval"]), str(c["alert_duration"]),
+            str(int(c["enable_sound"])), str(int(c["enable_leds"])), str(int(c["enable_json"])))
+
+
+def check(results: List[FuzzResult], limit: int = 5) -> Tuple[List[str], Dict[str, List[int]]]:
+    """FakeDetector と比べた食い違い（最初の limit 件）と、最初のコマンドごとの処理時間（ns）を返す"""
+    detector = MirrorDetector()
+    pending = b""
+    problems = []
+    timings: Dict[str, List[int]] = defaultdict(list)
+    for index, result in enumerate(results):
+        detector.varies = False
+        detector.first_command = None
+        lines, pending = split_commands(pending, result.input)
+        output = []
+        for line in lines:
+            output.extend(detector.handle_line(line.decode("utf-8", "surrogateescape")))
+        expected = b"".join(item if isinstance(item, bytes) else item.encode("utf-8", "surrogateescape") + b"\r\n"
+                            for item in output)
+        timings[detector.first_command or "(行の途中)"].append(result.nanoseconds)
+
+        if len(problems) >= limit:
+            continue
+        if result.config != _mirror_config(detector):
+            problems.append(f"{index}件目 {result.input!r}: 設定値が違います "
+                            f"(ファームウェア {result.config}, 模擬 {_mirror_config(detector)})")
+        elif not detector.varies and result.output != expected:
+            problems.append(f"{index}件目 {result.input!r}: 応答が違います\n"
+                            f"  ファームウェア: {result.output!r}\n  模擬: {expected!r}")
+    return problems, timings
+
+
+def _percentile(values: List[int], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="コマンドパーサーのファズテストと応答時間の計測（ホスト上で実行）")
+    parser.add_argument("--count", type=int, default=20000, help="入力の件数")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--raw-ratio", type=float, default=0.1, help="任意のバイト列の割合")
+    parser.add_argument("--firmware", help="検査するスケッチ（省略時は mame.py）")
+    parser.add_argument("--no-check", action="store_true", help="模擬デバイスと比べず、時間だけを計測する")
+    args = parser.parse_args()
+
+    source = None
+    if args.firmware:
+        with open(args.firmware, encoding="utf-8") as f:
+            source = f.read()
+    records = generate(args.count, args.seed, args.raw_ratio)
+    try:
+        results = run_firmware(records, source)
+    except (RuntimeError, subprocess.TimeoutExpired) as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+
+    problems, timings = check(results)
+    print("コマンド        件数   中央値(µs)  p95(µs)  p99(µs)  最大(µs)")
+    for name, values in sorted(timings.items(), key=lambda item: -len(item[1])):
+        print(f"{name:12s}  {len(values):6d}  {_percentile(values, 0.5) / 1000:10.2f}  "
+              f"{_percentile(values, 0.95) / 1000:7.2f}  {_percentile(values, 0.99) / 1000:7.2f}  "
+              f"{max(values) / 1000:8.2f}")
+    total = sum(result.nanoseconds for result in results)
+    print(f"{len(results)}件 {sum(len(r.input) for r in results)} bytes, 合計 {total / 1e6:.1f}ms")
+    if args.no_check:
+        return
+    if problems:
+        for problem in problems:
+            print(f"NG: {problem}")
+        sys.exit(1)
+    print("OK: 設定値と応答はすべて模擬デバイスと一致しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,793 @@
+"""
+節分検知システムのファームウェア (mame.py) をホスト上でビルド・実行する
+
+Arduino IDE の .ino 前処理（関数プロトタイプの自動生成）を真似てスケッチを C++ にし、
+最小限の Arduino コア・ライブラリのエミュレーションと一緒に g++ でネイティブに
+ビルドする。エミュレーションは次のものを持つ。
+
+- 仮想時計: millis()/micros() は delay() やセンサーの読み取り時間の分だけ進む
+- 模擬環境: 人がポアソン過程で通りかかり、PIR・MLX90614・HC-SR04 がそれに応じた値を返す
+- 割り込み: HC-SR04 のトリガーでエコーの立ち上がり・立ち下がりの時刻を決め、
+  ファームウェアが時計を読んだときに過ぎていれば ECHO_PIN の割り込みハンドラを呼ぶ
+- シリアル: 入力はキューから読み、出力は標準出力に書くか捨てる
+- ヒープ: malloc/realloc/free と new/delete を 32KB の first-fit アロケータに差し替え、
+  sbrk(0) はその使用済み末尾を返す（ファームウェアの freeMemory() がそのまま動く）。
+  Adafruit_NeoPixel は実機と同じくピクセルバッファをヒープに確保する
+
+ハーネス（main 関数）は呼び出し側が用意し、スケッチと同じ翻訳単位に入れる
+（ファームウェアのグローバル変数をそのまま参照できる）。
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from typing import Dict, List, Optional
+
+FIRMWARE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mame.py")
+
+CXX = os.environ.get("CXX", "g++")
+CXXFLAGS = ["-std=gnu++17", "-O2", "-w", "-Wl,--wrap=malloc,--wrap=free,--wrap=realloc,--wrap=calloc"]
+
+ARDUINO_H = r'''
+#pragma once
+#include <cstdint>
+#include <cstring>
+#include <cstdlib>
+#include <cstdio>
+#include <cctype>
+#include <cmath>
+#include <algorithm>
+typedef uint8_t byte;
+typedef bool boolean;
+#define HIGH 1
+#define LOW 0
+#define INPUT 0
+#define OUTPUT 1
+#define INPUT_PULLUP 2
+#define RISING 3
+#define FALLING 4
+#define CHANGE 5
+#define NOT_AN_INTERRUPT -1
+#define DEC 10
+#define HEX 16
+#define PROGMEM
+class __FlashStringHelper;
+#define F(s) (reinterpret_cast<const __FlashStringHelper *>(s))
+#define PSTR(s) (s)
+using std::isnan;
+using std::isinf;
+using std::abs;
+using std::min;
+using std::max;
+template <class T> T constrain(T a, T b, T c) { return a < b ? b : (a > c ? c : a); }
+
+// ---- 仮想時計・入出力（host_core.inc で定義） ----
+extern uint64_t hostMicros;
+unsigned long millis();
+unsigned long micros();
+void delay(unsigned long ms);
+void delayMicroseconds(unsigned int us);
+int digitalRead(int pin);
+void digitalWrite(int pin, int value);
+void pinMode(int pin, int mode);
+unsigned long pulseIn(int pin, int state, unsigned long timeout = 1000000UL);
+void tone(int pin, unsigned int frequency, unsigned long duration = 0);
+void noTone(int pin);
+long map(long x, long inMin, long inMax, long outMin, long outMax);
+int digitalPinToInterrupt(int pin);
+void attachInterrupt(int interrupt, void (*handler)(), int mode);
+void detachInterrupt(int interrupt);
+void noInterrupts();
+void interrupts();
+void NVIC_SystemReset();
+void hostWrite(const char *data, size_t size);
+
+// ---- Arduino の String（ヒープを realloc で伸ばす実装を再現） ----
+class String {
+ public:
+  String(const char *text = "") { assign(text, strlen(text)); }
+  String(const __FlashStringHelper *text) : String(reinterpret_cast<const char *>(text)) {}
+  String(const String &other) { assign(other.buffer ? other.buffer : "", other.len); }
+  String(char c) { char text[2] = {c, 0}; assign(text, 1); }
+  String(int value) { char text[16]; snprintf(text, sizeof(text), "%d", value); assign(text, strlen(text)); }
+  String(unsigned int value) { char text[16]; snprintf(text, sizeof(text), "%u", value); assign(text, strlen(text)); }
+  String(long value) { char text[24]; snprintf(text, sizeof(text), "%ld", value); assign(text, strlen(text)); }
+  String(unsigned long value) { char text[24]; snprintf(text, sizeof(text), "%lu", value); assign(text, strlen(text)); }
+  String(float value, unsigned char digits = 2) { format(value, digits); }
+  String(double value, unsigned char digits = 2) { format(value, digits); }
+  ~String() { free(buffer); }
+  String &operator=(const String &other) { if (this != &other) assign(other.buffer ? other.buffer : "", other.len); return *this; }
+  String &operator+=(const String &other) { return concat(other.buffer ? other.buffer : "", other.len); }
+  String &operator+=(const char *text) { return concat(text, strlen(text)); }
+  String &operator+=(const __FlashStringHelper *text) { return *this += reinterpret_cast<const char *>(text); }
+  String &operator+=(char c) { return concat(&c, 1); }
+  bool operator==(const char *text) const { return strcmp(c_str(), text) == 0; }
+  bool operator==(const String &other) const { return strcmp(c_str(), other.c_str()) == 0; }
+  bool operator!=(const char *text) const { return !(*this == text); }
+  char operator[](unsigned int index) const { return index < len ? buffer[index] : 0; }
+  void trim() {
+    if (!buffer) return;
+    unsigned int start = 0, end = len;
+    while (start < end && isspace((unsigned char)buffer[start])) start++;
+    while (end > start && isspace((unsigned char)buffer[end - 1])) end--;
+    len = end - start;
+    memmove(buffer, buffer + start, len);
+    buffer[len] = 0;
+  }
+  void toLowerCase() { for (unsigned int i = 0; i < len; i++) buffer[i] = tolower((unsigned char)buffer[i]); }
+  bool startsWith(const char *prefix) const { return strncmp(c_str(), prefix, strlen(prefix)) == 0; }
+  String substring(unsigned int from, unsigned int to = 0xFFFFFFFF) const {
+    if (to > len) to = len;
+    if (from > to) from = to;
+    String result;
+    result.assign(c_str() + from, to - from);
+    return result;
+  }
+  int indexOf(char c) const { const char *p = buffer ? strchr(buffer, c) : nullptr; return p ? (int)(p - buffer) : -1; }
+  float toFloat() const { return atof(c_str()); }
+  long toInt() const { return atol(c_str()); }
+  const char *c_str() const { return buffer ? buffer : ""; }
+  unsigned int length() const { return len; }
+
+ private:
+  char *buffer = nullptr;
+  unsigned int len = 0;
+  unsigned int capacity = 0;
+  bool reserve(unsigned int size) {
+    if (buffer && capacity >= size) return true;
+    char *grown = (char *)realloc(buffer, size + 1);
+    if (!grown) return false;
+    buffer = grown;
+    capacity = size;
+    return true;
+  }
+  void assign(const char *text, unsigned int size) {
+    if (!reserve(size)) return;
+    memmove(buffer, text, size);
+    len = size;
+    buffer[len] = 0;
+  }
+  String &concat(const char *text, unsigned int size) {
+    if (size == 0) return *this;
+    if (!reserve(len + size)) return *this;
+    memmove(buffer + len, text, size);
+    len += size;
+    buffer[len] = 0;
+    return *this;
+  }
+  void format(double value, unsigned char digits) {
+    char text[48];
+    snprintf(text, sizeof(text), "%.*f", digits, value);
+    assign(text, strlen(text));
+  }
+};
+
+// ---- Print / Stream / Serial ----
+class Print {
+ public:
+  virtual ~Print() {}
+  virtual size_t write(uint8_t c) = 0;
+  virtual size_t write(const uint8_t *data, size_t size) {
+    for (size_t i = 0; i < size; i++) write(data[i]);
+    return size;
+  }
+  size_t write(const char *text, size_t size) { return write(reinterpret_cast<const uint8_t *>(text), size); }
+  size_t print(const char *text) { return write(text, strlen(text)); }
+  size_t print(const __FlashStringHelper *text) { return print(reinterpret_cast<const char *>(text)); }
+  size_t print(const String &text) { return print(text.c_str()); }
+  size_t print(char c) { return write(&c, 1); }
+  size_t print(unsigned char value, int base = DEC) { return print((unsigned long)value, base); }
+  size_t print(int value, int base = DEC) { return print((long)value, base); }
+  size_t print(unsigned int value, int base = DEC) { return print((unsigned long)value, base); }
+  size_t print(long value, int base = DEC) {
+    char text[24];
+    snprintf(text, sizeof(text), base == HEX ? "%lx" : "%ld", value);
+    return print(text);
+  }
+  size_t print(unsigned long value, int base = DEC) {
+    char text[24];
+    snprintf(text, sizeof(text), base == HEX ? "%lx" : "%lu", value);
+    return print(text);
+  }
+  size_t print(double value, int digits = 2) {
+    if (isnan(value)) return print("nan");
+    if (isinf(value)) return print("inf");
+    char text[48];
+    snprintf(text, sizeof(text), "%.*f", digits, value);
+    return print(text);
+  }
+  size_t println() { return write("\r\n", 2); }
+  template <class T> size_t println(T value) { size_t n = print(value); return n + println(); }
+  template <class T> size_t println(T value, int format) { size_t n = print(value, format); return n + println(); }
+  void flush() {}
+};
+
+class Stream : public Print {
+ public:
+  virtual int available() = 0;
+  virtual int read() = 0;
+  virtual int peek() = 0;
+  virtual size_t readBytes(char *buffer, size_t length) {
+    size_t count = 0;
+    int c;
+    while (count < length && (c = read()) >= 0) buffer[count++] = (char)c;
+    return count;
+  }
+  int availableForWrite() { return 64; }
+  void setTimeout(unsigned long) {}
+};
+
+class HardwareSerial : public Stream {
+ public:
+  size_t write(uint8_t c) override { char ch = (char)c; hostWrite(&ch, 1); return 1; }
+  size_t write(const uint8_t *data, size_t size) override { hostWrite(reinterpret_cast<const char *>(data), size); return size; }
+  using Print::write;
+  int available() override;
+  int read() override;
+  int peek() override;
+  size_t readBytes(char *buffer, size_t length) override;
+  void begin(unsigned long) {}
+  operator bool() { return true; }
+};
+extern HardwareSerial Serial;
+'''
+
+ARDUINO_JSON_H = r'''
+#pragma once
+#include "Arduino.h"
+// ArduinoJson 6 の StaticJsonDocument の必要な部分だけ（固定長のノード配列、ヒープ不使用）
+struct JsonNode {
+  const char *key;
+  enum Type { NONE, OBJECT, BOOL, LONG, ULONG, DOUBLE, STRING } type;
+  union { bool b; long l; unsigned long u; double d; const char *s; };
+  int firstChild, lastChild, next;
+};
+
+struct JsonPool {
+  JsonNode *nodes;
+  int capacity;
+  int used;
+  char *text;
+  int textCapacity;
+  int textUsed;
+  const char *copy(const char *value) {
+    int size = (int)strlen(value) + 1;
+    if (textUsed + size > textCapacity) return nullptr;
+    char *stored = text + textUsed;
+    memcpy(stored, value, size);
+    textUsed += size;
+    return stored;
+  }
+  int add(int parent, const char *key) {
+    for (int i = nodes[parent].firstChild; i >= 0; i = nodes[i].next) {
+      if (strcmp(nodes[i].key, key) == 0) return i;
+    }
+    if (used >= capacity) return -1;
+    int index = used++;
+    nodes[index] = JsonNode{key, JsonNode::NONE, {}, -1, -1, -1};
+    if (nodes[parent].lastChild >= 0) nodes[nodes[parent].lastChild].next = index;
+    else nodes[parent].firstChild = index;
+    nodes[parent].lastChild = index;
+    return index;
+  }
+};
+
+class JsonObject {
+ public:
+  JsonObject(JsonPool *pool = nullptr, int index = -1) : pool(pool), index(index) {}
+  JsonObject operator[](const char *key) {
+    if (!pool || index < 0) return JsonObject();
+    if (pool->nodes[index].type == JsonNode::NONE) pool->nodes[index].type = JsonNode::OBJECT;
+    return JsonObject(pool, pool->add(index, key));
+  }
+  JsonObject createNestedObject(const char *key) {
+    JsonObject child = (*this)[key];
+    if (child.valid()) child.node().type = JsonNode::OBJECT;
+    return child;
+  }
+  JsonObject &operator=(bool value) { if (valid()) { node().type = JsonNode::BOOL; node().b = value; } return *this; }
+  JsonObject &operator=(int value) { return *this = (long)value; }
+  JsonObject &operator=(unsigned int value) { return *this = (unsigned long)value; }
+  JsonObject &operator=(long value) { if (valid()) { node().type = JsonNode::LONG; node().l = value; } return *this; }
+  JsonObject &operator=(unsigned long value) { if (valid()) { node().type = JsonNode::ULONG; node().u = value; } return *this; }
+  JsonObject &operator=(float value) { return *this = (double)value; }
+  JsonObject &operator=(double value) { if (valid()) { node().type = JsonNode::DOUBLE; node().d = value; } return *this; }
+  JsonObject &operator=(const char *value) { if (valid()) { node().type = JsonNode::STRING; node().s = value; } return *this; }
+  JsonObject &operator=(const __FlashStringHelper *value) { return *this = reinterpret_cast<const char *>(value); }
+  // String は実物と同じくドキュメント内にコピーする
+  JsonObject &operator=(const String &value) {
+    const char *stored = pool ? pool->copy(value.c_str()) : nullptr;
+    return stored ? (*this = stored) : *this;
+  }
+  bool valid() const { return pool && index >= 0; }
+  JsonNode &node() { return pool->nodes[index]; }
+
+ private:
+  JsonPool *pool;
+  int index;
+};
+
+template <int N>
+class StaticJsonDocument {
+ public:
+  StaticJsonDocument() : pool{nodes, N / 16 > 1 ? N / 16 : 2, 1, text, N / 2, 0} { nodes[0] = JsonNode{"", JsonNode::OBJECT, {}, -1, -1, -1}; }
+  JsonObject operator[](const char *key) { return JsonObject(&pool, 0)[key]; }
+  JsonObject createNestedObject(const char *key) { return JsonObject(&pool, 0).createNestedObject(key); }
+  JsonPool pool;
+  JsonNode nodes[N / 16 > 1 ? N / 16 : 2];
+  char text[N / 2];
+};
+
+inline void hostJsonString(Print &out, const char *text) {
+  out.print('"');
+  for (; *text; text++) {
+    if (*text == '"' || *text == '\\') out.print('\\');
+    out.print(*text);
+  }
+  out.print('"');
+}
+
+inline void hostJsonWrite(Print &out, JsonPool &pool, int index) {
+  JsonNode &node = pool.nodes[index];
+  char number[40];
+  switch (node.type) {
+    case JsonNode::OBJECT:
+      out.print('{');
+      for (int i = node.firstChild; i >= 0; i = pool.nodes[i].next) {
+        if (i != node.firstChild) out.print(',');
+        hostJsonString(out, pool.nodes[i].key);
+        out.print(':');
+        hostJsonWrite(out, pool, i);
+      }
+      out.print('}');
+      break;
+    case JsonNode::BOOL: out.print(node.b ? "true" : "false"); break;
+    case JsonNode::LONG: out.print(node.l); break;
+    case JsonNode::ULONG: out.print(node.u); break;
+    case JsonNode::DOUBLE:
+      if (isnan(node.d) || isinf(node.d)) { out.print("null"); break; }
+      snprintf(number, sizeof(number), "%.9g", node.d);
+      out.print(number);
+      break;
+    case JsonNode::STRING: hostJsonString(out, node.s); break;
+    default: out.print("null");
+  }
+}
+
+template <int N, class S>
+size_t serializeJson(StaticJsonDocument<N> &doc, S &out) {
+  hostJsonWrite(out, doc.pool, 0);
+  return 0;
+}
+'''
+
+LIBRARY_HEADERS = {
+    "Wire.h": r'''
+#pragma once
+#include "Arduino.h"
+class TwoWire { public: void begin() {} void setClock(long) {} };
+extern TwoWire Wire;
+''',
+    "WiFiNINA.h": r'''
+#pragma once
+#include "Arduino.h"
+// ホストでは WiFi につながらない (WIFI_SSID が空なら呼ばれない)
+#define WL_CONNECTED 3
+#define WL_CONNECT_FAILED 4
+class WiFiClient : public Stream {
+ public:
+  size_t write(uint8_t) override { return 1; }
+  size_t write(const uint8_t *, size_t size) override { return size; }
+  using Print::write;
+  int available() override { return 0; }
+  int read() override { return -1; }
+  int read(uint8_t *, size_t) { return 0; }
+  int peek() override { return -1; }
+  bool connected() { return false; }
+  void stop() {}
+  operator bool() { return false; }
+};
+class WiFiServer {
+ public:
+  WiFiServer(int) {}
+  void begin() {}
+  WiFiClient available() { return WiFiClient(); }
+};
+class WiFiClass {
+ public:
+  int begin(const char *, const char *) { return WL_CONNECT_FAILED; }
+  int status() { return WL_CONNECT_FAILED; }
+  void setTimeout(unsigned long) {}
+};
+static WiFiClass WiFi;
+''',
+    "Adafruit_MLX90614.h": r'''
+#pragma once
+#include "Arduino.h"
+double hostReadObjectTemp();
+double hostReadAmbientTemp();
+class Adafruit_MLX90614 {
+ public:
+  bool begin() { return true; }
+  double readObjectTempC() { return hostReadObjectTemp(); }
+  double readAmbientTempC() { return hostReadAmbientTemp(); }
+};
+''',
+    "Adafruit_NeoPixel.h": r'''
+#pragma once
+#include "Arduino.h"
+#define NEO_GRB 1
+#define NEO_KHZ800 2
+void hostLedShow();
+// 実機のライブラリと同じく、コンストラクタでピクセルバッファを malloc する（RGB で1灯3バイト）
+class Adafruit_NeoPixel {
+ public:
+  Adafruit_NeoPixel(int count, int, int) : pixels((uint8_t *)calloc(count, 3)), numLEDs(pixels ? count : 0) {}
+  ~Adafruit_NeoPixel() { free(pixels); }
+  void begin() {}
+  void show() { hostLedShow(); }
+  void setPixelColor(int n, uint32_t color) {
+    if (n < 0 || n >= numLEDs) return;
+    uint8_t *p = pixels + n * 3;
+    p[0] = (uint8_t)(color >> 8);
+    p[1] = (uint8_t)(color >> 16);
+    p[2] = (uint8_t)color;
+  }
+  static uint32_t Color(uint8_t r, uint8_t g, uint8_t b) { return ((uint32_t)r << 16) | ((uint32_t)g << 8) | b; }
+ private:
+  uint8_t *pixels;
+  int numLEDs;
+};
+''',
+    "ArduinoJson.h": ARDUINO_JSON_H,
+    "Arduino.h": ARDUINO_H,
+}
+
+# 仮想時計・模擬環境・ヒープ・シリアルの実装（スケッチの後に連結する）
+HOST_CORE = r'''
+#include <cstdarg>
+
+// ---- 仮想時計 ----
+uint64_t hostMicros = 0;
+void hostDeliverInterrupts();
+unsigned long millis() { hostDeliverInterrupts(); return (unsigned long)(hostMicros / 1000); }
+unsigned long micros() { hostDeliverInterrupts(); return (unsigned long)hostMicros; }
+void delay(unsigned long ms) { hostMicros += (uint64_t)ms * 1000; }
+void delayMicroseconds(unsigned int us) { hostMicros += us; }
+
+// ---- 模擬環境（人がポアソン過程で通りかかる） ----
+struct HostWorld {
+  uint64_t rng = 88172645463325252ULL;
+  uint64_t visitStart = 0, visitEnd = 0;   // µs
+  double visitDistance = 95;
+  double meanGapMs = 20000;
+  uint64_t samples = 0;
+  uint64_t ledShows = 0;
+  uint64_t tones = 0;
+  double uniform() {
+    rng ^= rng << 13; rng ^= rng >> 7; rng ^= rng << 17;
+    return (rng >> 11) * (1.0 / 9007199254740992.0);
+  }
+  double gauss() {
+    double u = uniform() + 1e-12, v = uniform();
+    return sqrt(-2 * log(u)) * cos(6.283185307179586 * v);
+  }
+  bool present() {
+    while (hostMicros >= visitEnd) {
+      double gap = -log(uniform() + 1e-12) * meanGapMs;
+      visitStart = visitEnd + (uint64_t)(gap * 1000);
+      visitEnd = visitStart + (uint64_t)((1000 + uniform() * 3000) * 1000);
+      visitDistance = 60 + uniform() * 80;
+    }
+    return hostMicros >= visitStart;
+  }
+} hostWorld;
+
+// HC-SR04 のエコー（トリガーの立ち下がりで時刻を決める。µs）
+struct HostEchoPulse {
+  bool triggerHigh = false;
+  bool pending = false;
+  bool rose = false;
+  uint64_t rise = 0, fall = 0;
+} hostEchoPulse;
+
+int digitalRead(int pin) {
+  if (pin == PIR1_PIN || pin == PIR2_PIN) return hostWorld.present() && hostWorld.uniform() < 0.8;
+  if (pin == ECHO_PIN) {
+    return hostEchoPulse.pending && hostMicros >= hostEchoPulse.rise && hostMicros < hostEchoPulse.fall;
+  }
+  return HIGH;
+}
+void digitalWrite(int pin, int value) {
+  if (pin != TRIG_PIN) return;
+  if (value == HIGH) {
+    hostEchoPulse.triggerHigh = true;
+  } else if (hostEchoPulse.triggerHigh) {
+    // 8パルスの送信に約 0.45ms かかってからエコーが立ち上がる。何も返らなければ約 38ms で下がる
+    hostEchoPulse.triggerHigh = false;
+    double distance = hostWorld.present() ? hostWorld.visitDistance + 12 * hostWorld.gauss() : 250 + 3 * hostWorld.gauss();
+    hostEchoPulse.pending = true;
+    hostEchoPulse.rose = false;
+    hostEchoPulse.rise = hostMicros + 450;
+    hostEchoPulse.fall = hostEchoPulse.rise + std::min<uint64_t>((uint64_t)(distance * 2 / 0.034), 38000);
+  }
+}
+void pinMode(int, int) {}
+
+double hostReadObjectTemp() {
+  hostMicros += 500;  // I2C 読み取り
+  hostWorld.samples++;
+  return 22 + (hostWorld.present() ? 9 + hostWorld.gauss() : 0.5 + 0.3 * hostWorld.gauss());
+}
+double hostReadAmbientTemp() {
+  hostMicros += 500;
+  return 22 + 0.05 * hostWorld.gauss();
+}
+
+// トリガー済みのエコーが下がるまで待つ（割り込みハンドラにも同じ立ち上がり・立ち下がりが届く）
+unsigned long pulseIn(int, int, unsigned long timeout) {
+  if (!hostEchoPulse.pending || hostEchoPulse.fall - hostMicros > timeout) {
+    hostMicros += timeout;
+    return 0;
+  }
+  hostMicros = hostEchoPulse.fall;
+  return (unsigned long)(hostEchoPulse.fall - hostEchoPulse.rise);
+}
+
+void tone(int, unsigned int, unsigned long) { hostWorld.tones++; }
+void noTone(int) {}
+void hostLedShow() { hostMicros += 150; hostWorld.ledShows++; }
+long map(long x, long inMin, long inMax, long outMin, long outMax) {
+  return (x - inMin) * (outMax - outMin) / (inMax - inMin) + outMin;
+}
+// ---- 割り込み（ECHO_PIN の CHANGE だけを配る） ----
+static void (*hostEchoHandler)() = nullptr;
+static bool hostInterruptsOff = false;
+uint64_t hostInterrupts = 0;
+
+int digitalPinToInterrupt(int pin) { return pin; }
+void attachInterrupt(int interrupt, void (*handler)(), int) {
+  if (interrupt == ECHO_PIN) hostEchoHandler = handler;
+}
+void detachInterrupt(int interrupt) {
+  if (interrupt == ECHO_PIN) hostEchoHandler = nullptr;
+}
+void noInterrupts() { hostInterruptsOff = true; }
+void interrupts() { hostInterruptsOff = false; }
+
+// 割り込みハンドラはエッジの時刻で呼ぶ（ハンドラの中の micros() はその時刻を返す）
+static void hostCallInterrupt(uint64_t at) {
+  if (!hostEchoHandler) return;
+  uint64_t now = hostMicros;
+  hostInterruptsOff = true;
+  hostMicros = at;
+  hostEchoHandler();
+  hostMicros = now + 2;  // 割り込みの出入り
+  hostInterruptsOff = false;
+  hostInterrupts++;
+}
+
+void hostDeliverInterrupts() {
+  HostEchoPulse &echo = hostEchoPulse;
+  if (hostInterruptsOff || !echo.pending) return;
+  if (!echo.rose && hostMicros >= echo.rise) {
+    echo.rose = true;
+    hostCallInterrupt(echo.rise);
+  }
+  if (echo.rose && hostMicros >= echo.fall) {
+    echo.pending = false;
+    hostCallInterrupt(echo.fall);
+  }
+}
+void NVIC_SystemReset() { fprintf(stderr, "reset requested\n"); exit(3); }
+TwoWire Wire;
+
+// ---- シリアル ----
+HardwareSerial Serial;
+static char hostInput[4096];
+static size_t hostInputHead = 0, hostInputTail = 0;
+bool hostEcho = false;
+uint64_t hostOutputBytes = 0;
+// hostCapture を設定すると出力をそこへ溜める（hostCaptureSize を 0 に戻すまで。あふれた分は捨てる）
+char *hostCapture = nullptr;
+size_t hostCaptureCapacity = 0;
+size_t hostCaptureSize = 0;
+void hostWrite(const char *data, size_t size) {
+  hostOutputBytes += size;
+  if (hostEcho) fwrite(data, 1, size, stdout);
+  if (hostCapture) {
+    size_t room = hostCaptureCapacity - hostCaptureSize;
+    size_t n = size < room ? size : room;
+    memcpy(hostCapture + hostCaptureSize, data, n);
+    hostCaptureSize += n;
+  }
+}
+void hostSerialInput(const char *data, size_t size) {
+  for (size_t i = 0; i < size; i++) {
+    if (hostInputTail - hostInputHead >= sizeof(hostInput)) return;
+    hostInput[hostInputTail++ % sizeof(hostInput)] = data[i];
+  }
+}
+void hostSerialInput(const char *text) { hostSerialInput(text, strlen(text)); }
+int HardwareSerial::available() { return (int)(hostInputTail - hostInputHead); }
+int HardwareSerial::read() { return hostInputHead < hostInputTail ? (unsigned char)hostInput[hostInputHead++ % sizeof(hostInput)] : -1; }
+int HardwareSerial::peek() { return hostInputHead < hostInputTail ? (unsigned char)hostInput[hostInputHead % sizeof(hostInput)] : -1; }
+size_t HardwareSerial::readBytes(char *buffer, size_t length) {
+  size_t count = 0;
+  while (count < length && hostInputHead < hostInputTail) buffer[count++] = hostInput[hostInputHead++ % sizeof(hostInput)];
+  return count;
+}
+
+// ---- ヒープ（first-fit、隣接する空きブロックは結合する） ----
+#define HOST_HEAP_SIZE 32768
+struct HostBlock { uint32_t size; uint32_t free; };
+alignas(16) static unsigned char hostHeap[HOST_HEAP_SIZE];
+static size_t hostHeapTop = 0;          // 使用中の末尾（sbrk(0) に相当）
+size_t hostHeapInUse = 0;
+uint64_t hostAllocations = 0;
+uint64_t hostHeapFailures = 0;
+static char *hostStackBase = nullptr;
+
+static size_t hostAlign(size_t size) { return (size + 15) & ~(size_t)15; }
+
+extern "C" void *__wrap_malloc(size_t size) {
+  size = hostAlign(size ? size : 1);
+  hostAllocations++;
+  size_t offset = 0;
+  while (offset < hostHeapTop) {
+    HostBlock *block = (HostBlock *)(hostHeap + offset);
+    if (block->free && block->size >= size) {
+      if (block->size >= size + 2 * sizeof(HostBlock) + 16) {
+        HostBlock *rest = (HostBlock *)(hostHeap + offset + sizeof(HostBlock) + size);
+        rest->size = block->size - size - sizeof(HostBlock);
+        rest->free = 1;
+        block->size = size;
+      }
+      block->free = 0;
+      hostHeapInUse += block->size;
+      return block + 1;
+    }
+    offset += sizeof(HostBlock) + block->size;
+  }
+  if (hostHeapTop + sizeof(HostBlock) + size > HOST_HEAP_SIZE) { hostHeapFailures++; return nullptr; }
+  HostBlock *block = (HostBlock *)(hostHeap + hostHeapTop);
+  block->size = size;
+  block->free = 0;
+  hostHeapTop += sizeof(HostBlock) + size;
+  hostHeapInUse += size;
+  return block + 1;
+}
+
+extern "C" void __wrap_free(void *pointer) {
+  if (!pointer) return;
+  HostBlock *block = (HostBlock *)pointer - 1;
+  block->free = 1;
+  hostHeapInUse -= block->size;
+  // 結合し、末尾の空きブロックはヒープを縮める（newlib の trim に相当）
+  size_t offset = 0, last = 0;
+  HostBlock *previous = nullptr;
+  while (offset < hostHeapTop) {
+    HostBlock *current = (HostBlock *)(hostHeap + offset);
+    if (previous && previous->free && current->free) {
+      previous->size += sizeof(HostBlock) + current->size;
+    } else {
+      previous = current;
+      last = offset;
+    }
+    offset = (size_t)((unsigned char *)previous - hostHeap) + sizeof(HostBlock) + previous->size;
+  }
+  if (previous && previous->free) hostHeapTop = last;
+}
+
+extern "C" void *__wrap_realloc(void *pointer, size_t size) {
+  if (!pointer) return __wrap_malloc(size);
+  HostBlock *block = (HostBlock *)pointer - 1;
+  if (block->size >= size) return pointer;
+  void *grown = __wrap_malloc(size);
+  if (!grown) return nullptr;
+  memcpy(grown, pointer, block->size);
+  __wrap_free(pointer);
+  return grown;
+}
+
+extern "C" void *__wrap_calloc(size_t count, size_t size) {
+  void *pointer = __wrap_malloc(count * size);
+  if (pointer) memset(pointer, 0, count * size);
+  return pointer;
+}
+
+// new/delete も同じヒープから確保する（AVR コアの new.cpp と同じく malloc/free を呼ぶ。
+// libstdc++ の operator new は --wrap の対象外なので、ここで定義しないと数えられない）
+void *operator new(size_t size) { void *pointer = __wrap_malloc(size); if (!pointer) abort(); return pointer; }
+void *operator new[](size_t size) { return operator new(size); }
+void operator delete(void *pointer) noexcept { __wrap_free(pointer); }
+void operator delete[](void *pointer) noexcept { __wrap_free(pointer); }
+void operator delete(void *pointer, size_t) noexcept { __wrap_free(pointer); }
+void operator delete[](void *pointer, size_t) noexcept { __wrap_free(pointer); }
+
+// ファームウェアの freeMemory() は &スタック変数 - sbrk(0)。
+// スタックの底から HOST_HEAP_SIZE 下をヒープの先頭とみなす
+extern "C" char *sbrk(int) {
+  return hostStackBase - HOST_HEAP_SIZE + hostHeapTop;
+}
+
+// ハーネスの main から最初に呼ぶ
+void hostBegin(uint64_t seed) {
+  char base;
+  hostStackBase = &base;
+  hostWorld.rng ^= seed * 0x9E3779B97F4A7C15ULL;
+}
+
+// 現在のスタック位置から見た空きメモリ（freeMemory() と同じ式）
+long hostFreeMemory() {
+  char top;
+  return &top - sbrk(0);
+}
+
+void hostRunUntil(uint64_t endMicros, void (*each)() = nullptr) {
+  while (hostMicros < endMicros) {
+    loop();
+    hostMicros += 5;  // loop() 自体の処理時間
+    if (each) each();
+  }
+}
+'''
+
+_PROTOTYPE = re.compile(r"^([A-Za-z_][\w<>\s\*&:]*?[\s\*&])([A-Za-z_]\w*)\s*\(([^;{)]*)\)\s*\{", re.M)
+
+
+def preprocess_sketch(source: str) -> str:
+    """Arduino IDE と同じく、関数定義のプロトタイプを setup() の前に差し込む"""
+    prototypes = []
+    for match in _PROTOTYPE.finditer(source):
+        ret, name, args = match.group(1).strip(), match.group(2), match.group(3)
+        if ret in ("else", "return", "switch", "if", "while", "for") or name in ("if", "while", "for", "switch"):
+            continue
+        if ret.startswith("struct") or ret.startswith("class") or ret.startswith("extern"):
+            continue
+        prototypes.append(f"{ret} {name}({args});")
+    marker = "\nvoid setup() {"
+    if marker not in source:
+        raise ValueError("setup() が見つかりません")
+    return ('#include "Arduino.h"\n'
+            + source.replace(marker, "\n" + "\n".join(prototypes) + "\n" + marker, 1))
+
+
+def build(harness: str, source: Optional[str] = None, cache_dir: Optional[str] = None,
+          defines: Optional[Dict[str, str]] = None) -> str:
+    """スケッチとハーネスをビルドして実行ファイルのパスを返す（同じ入力なら再利用する）"""
+    if shutil.which(CXX) is None:
+        raise RuntimeError(f"C++ コンパイラ ({CXX}) が見つかりません")
+    if source is None:
+        with open(FIRMWARE_PATH, encoding="utf-8") as f:
+            source = f.read()
+    define_lines = "".join(f"#define {name} {value}\n" for name, value in (defines or {}).items())
+    unit = define_lines + preprocess_sketch(source) + "\n" + HOST_CORE + "\n" + harness
+
+    digest = hashlib.sha256("\0".join([unit, *LIBRARY_HEADERS.values(), *CXXFLAGS]).encode()).hexdigest()[:16]
+    root = cache_dir or os.path.join(tempfile.gettempdir(), "mame_host")
+    work = os.path.join(root, digest)
+    binary = os.path.join(work, "firmware")
+    if os.path.exists(binary):
+        return binary
+
+    os.makedirs(work, exist_ok=True)
+    for name, content in LIBRARY_HEADERS.items():
+        with open(os.path.join(work, name), "w", encoding="utf-8") as f:
+            f.write(content)
+    unit_path = os.path.join(work, "sketch.cpp")
+    with open(unit_path, "w", encoding="utf-8") as f:
+        f.write(unit)
+    result = subprocess.run([CXX, *CXXFLAGS, "-I", work, "-x", "c++", unit_path, "-o", binary + ".tmp"],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ビルドに失敗しました:\n{result.stderr[-4000:]}")
+    os.replace(binary + ".tmp", binary)
+    return binary
+
+
+def run(binary: str, args: List[str], timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+    return subprocess.run([binary, *args], capture_output=True, text=True, timeout=timeout)
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+節分検知システムのシリアル出力取り込みサービス
+
+複数のシリアルポート（または pty）を1つの asyncio ループで同時に読み、
+JSON 行を増分パーサーで解析して、センサー値をデバイスごとに列形式で溜め、
+件数か時間の閾値でまとめて ColumnarStore に書き込む。書き込み（ファイルへの追記と
+ロールアップの書き直し）は専用のスレッド1本で行い、イベントループは止めない。
+
+ファームウェアは空行を受け取ったときだけセンサー値を出すので、poll_interval ごとに
+空行を送って要求する。JSON 出力が OFF なら接続時に `json` コマンドで ON にする。
+
+binary を指定すると接続時に `bin` コマンドでバイナリフレーム出力を ON にし、
+サンプリングごとに送られてくるフレームを FrameParser で読む（要求は送らない）。
+
+status_interval を指定すると、その間隔で `status` を送って printJsonStatus を受け取り、
+on_status に渡す（mame_status のキャッシュはこれとセンサー値で更新する）。
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import termios
+import time
+import tty
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set
+
+from mame_protocol import FrameParser, LineParser, is_sensor_record, is_status_record, sensor_row
+from mame_stats import SensorStats
+from mame_store import ColumnarStore, ColumnBatch
+
+logger = logging.getLogger("mame_ingest")
+
+DEFAULT_BAUD = 115200
+DEFAULT_POLL_INTERVAL = 0.2
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_FLUSH_INTERVAL = 1.0
+RECONNECT_DELAY = 2.0
+
+
+@dataclass
+class SourceStats:
+    """1デバイス分の取り込みカウンタ"""
+    bytes: int = 0
+    records: int = 0
+    status_records: int = 0
+    parse_errors: int = 0
+    reconnects: int = 0
+    connected: bool = False
+
+
+def open_serial(path: str, baud: int = DEFAULT_BAUD) -> int:
+    """シリアルポートを生モード・ノンブロッキングで開く"""
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        tty.setraw(fd)
+        attrs = termios.tcgetattr(fd)
+        speed = getattr(termios, f"B{baud}", None)
+        if speed is not None:
+            attrs[4] = attrs[5] = speed
+            termios.tcsetattr(fd, termios.TCSANOW, attrs)
+    except termios.error:
+        # pty などボーレートを持たない端末はそのまま使う
+        pass
+    return fd
+
+
+class SerialSource:
+    """1台分の接続。読み取り・定期要求・再接続を受け持つ"""
+
+    def __init__(self, path: str, service: "IngestService", baud: int = DEFAULT_BAUD,
+                 binary: bool = False):
+        self.path = path
+        self.service = service
+        self.baud = baud
+        self.binary = binary
+        self.fd: Optional[int] = None
+        self.parser = FrameParser() if binary else LineParser()
+        self.stats = SourceStats()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def connect(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self.fd = open_serial(self.path, self.baud)
+        self.parser = FrameParser(on_text=self._on_text) if self.binary else LineParser(on_text=self._on_text)
+        self._loop.add_reader(self.fd, self._on_readable)
+        self.stats.connected = True
+        # 現在の JSON・バイナリ出力設定を確認する（OFF なら _on_text で切り替える）
+        self.send("config")
+
+    def disconnect(self) -> None:
+        if self.fd is not None:
+            self._loop.remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = None
+        self.stats.connected = False
+
+    def send(self, command: str) -> None:
+        if self.fd is None:
+            return
+        try:
+            os.write(self.fd, command.encode("utf-8") + b"\n")
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._lost()
+
+    def _on_text(self, line: bytes) -> None:
+        if line.startswith("JSON出力: OFF".encode("utf-8")):
+            self.send("json")
+        elif self.binary and line.startswith("バイナリ出力: OFF".encode("utf-8")):
+            self.send("bin")
+
+    def _on_readable(self) -> None:
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._lost()
+            return
+        self.stats.bytes += len(data)
+        now = time.time()
+        if self.binary:
+            rows, records = self.parser.feed(data, now)
+            for row in rows:
+                self.service.add_sensor_row(self.path, row)
+            self.stats.records += len(rows)
+        else:
+            records = self.parser.feed(data)
+        for record in records:
+            if is_sensor_record(record):
+                self.service.add_sensor_row(self.path, sensor_row(record, now))
+                self.stats.records += 1
+            elif is_status_record(record):
+                self.service.on_status(self.path, record)
+                self.stats.status_records += 1
+        self.stats.parse_errors = self.parser.errors
+
+    def _lost(self) -> None:
+        logger.warning(f"{self.path}: 接続が切れました")
+        self.disconnect()
+        self.stats.reconnects += 1
+        self.service.schedule_reconnect(self)
+
+    async def poll(self, interval: float, command: str = "") -> None:
+        """interval 秒ごとに command を送る（空行ならセンサー値の要求）"""
+        while True:
+            await asyncio.sleep(interval)
+            self.send(command)
+
+
+class IngestService:
+    """複数デバイスからの取り込みとストアへのバッチ書き込み"""
+
+    def __init__(self, store: ColumnarStore, batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 on_status: Optional[Callable[[str, Dict], None]] = None,
+                 binary: bool = False,
+                 on_sensor: Optional[Callable[[str, tuple], None]] = None,
+                 status_interval: float = 0.0):
+        # poll_interval: 空行でセンサー値を要求する間隔（0 なら要求しない。binary では常に要求しない）
+        # on_status: printJsonStatus の行を受け取ったときに呼ぶコールバック
+        # on_sensor: センサー値を1件受け取るたびに呼ぶコールバック（行は SENSOR_COLUMNS の順）
+        # status_interval: `status` を送る間隔（0 なら送らない）
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.poll_interval = 0 if binary else poll_interval
+        self.status_interval = status_interval
+        self.binary = binary
+        self.status_callback = on_status
+        self.sensor_callback = on_sensor
+        self.sources: List[SerialSource] = []
+        self.batches: Dict[str, ColumnBatch] = {}
+        self.latest_status: Dict[str, Dict] = {}
+        # デバイスごとの直近のセンサー統計（ファームウェアの status の stats と同じ計算）
+        self.sensor_stats: Dict[str, SensorStats] = {}
+        names = [name for name, _ in store.columns]
+        self._stat_columns = (names.index("distance"), names.index("object_temp"),
+                              names.index("ambient_temp"), names.index("valid"))
+        self.records_written = 0
+        # ストアへの書き込みは1本のスレッドで順に行う（ストアはスレッドセーフではない）
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mame_ingest_writer")
+        self._writes: Set[asyncio.Future] = set()
+        # 実行中のタスク（終わったものは _spawn のコールバックで外す）
+        self._tasks: Set[asyncio.Task] = set()
+
+    def add_sensor_row(self, device: str, row: tuple) -> None:
+        batch = self.batches.get(device)
+        if batch is None:
+            batch = self.batches[device] = ColumnBatch(self.store.columns)
+        batch.append(row)
+        distance, object_temp, ambient_temp, valid = self._stat_columns
+        if row[valid]:
+            stats = self.sensor_stats.get(device)
+            if stats is None:
+                stats = self.sensor_stats[device] = SensorStats()
+            stats.update_values(row[distance], row[object_temp], row[ambient_temp])
+        if self.sensor_callback is not None:
+            self.sensor_callback(device, row)
+        if len(batch) >= self.batch_size:
+            self._flush_device(device)
+
+    def on_status(self, device: str, record: Dict) -> None:
+        self.latest_status[device] = record
+        if self.status_callback is not None:
+            self.status_callback(device, record)
+
+    def _flush_device(self, device: str) -> None:
+        batch = self.batches[device]
+        if not len(batch):
+            return
+        # 溜まったバッチは書き込みスレッドに渡し、以降の行は新しいバッチに溜める
+        self.batches[device] = ColumnBatch(self.store.columns)
+        future = asyncio.get_running_loop().run_in_executor(self._writer, self.store.append, device, batch)
+        self._writes.add(future)
+        future.add_done_callback(self._on_written)
+
+    def _on_written(self, future: asyncio.Future) -> None:
+        self._writes.discard(future)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.error(f"ストアへの書き込みに失敗しました: {error}")
+            return
+        self.records_written += future.result()
+
+    def flush(self) -> None:
+        """溜まっている全デバイスのバッチを書き込みスレッドに渡す（完了は drain で待つ）"""
+        for device in self.batches:
+            self._flush_device(device)
+
+    async def drain(self) -> None:
+        """書き込みスレッドに渡したバッチがすべて書き終わるのを待つ"""
+        while self._writes:
+            await asyncio.gather(*list(self._writes), return_exceptions=True)
+
+    def _spawn(self, coroutine) -> None:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def schedule_reconnect(self, source: SerialSource) -> None:
+        self._spawn(self._reconnect(source))
+
+    async def _reconnect(self, source: SerialSource) -> None:
+        while source.fd is None:
+            await asyncio.sleep(RECONNECT_DELAY)
+            try:
+                source.connect()
+                logger.info(f"{source.path}: 再接続しました")
+            except OSError:
+                continue
+
+    async def _flusher(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    async def start(self, paths: List[str], baud: int = DEFAULT_BAUD) -> None:
+        for path in paths:
+            source = SerialSource(path, self, baud, binary=self.binary)
+            self.sources.append(source)
+            try:
+                source.connect()
+            except OSError as e:
+                logger.warning(f"{path}: 接続できません ({e})")
+                self.schedule_reconnect(source)
+            if self.poll_interval > 0:
+                self._spawn(source.poll(self.poll_interval))
+            if self.status_interval > 0:
+                self._spawn(source.poll(self.status_interval, "status"))
+        self._spawn(self._flusher())
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        self._tasks.clear()
+        for source in self.sources:
+            source.disconnect()
+        self.flush()
+        await self.drain()
+        self._writer.shutdown()
+
+    def total_stats(self) -> Dict[str, int]:
+        return {
+            "devices": len(self.sources),
+            "connected": sum(s.stats.connected for s in self.sources),
+            "bytes": sum(s.stats.bytes for s in self.sources),
+            "records": sum(s.stats.records for s in self.sources),
+            "status_records": sum(s.stats.status_records for s in self.sources),
+            "parse_errors": sum(s.stats.parse_errors for s in self.sources),
+            "records_written": self.records_written,
+        }
+
+
+async def run(args) -> Dict[str, int]:
+    devices = []
+    paths = list(args.devices)
+    if args.simulate:
+        from mame_sim import start_fleet
+        devices = await start_fleet(args.simulate, stream_hz=args.stream_hz)
+        paths.extend(device.path for device in devices)
+
+    service = IngestService(ColumnarStore(args.store), batch_size=args.batch_size,
+                            flush_interval=args.flush_interval,
+                            poll_interval=0 if args.stream_hz else args.poll_interval,
+                            binary=args.binary)
+    await service.start(paths, args.baud)
+    start = time.perf_counter()
+    try:
+        if args.duration:
+            await asyncio.sleep(args.duration)
+        else:
+            await asyncio.Event().wait()
+    finally:
+        await service.stop()
+        for device in devices:
+            device.close()
+    stats = service.total_stats()
+    stats["elapsed"] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="節分検知システムのシリアル出力取り込み")
+    parser.add_argument("devices", nargs="*", help="シリアルポートのパス（/dev/ttyACM0 など）")
+    parser.add_argument("--store", default="mame_data", help="列指向ストアのディレクトリ")
+    parser.add_argument("--baud", type=int, default=DEFAULT_BAUD, help="ボーレート")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="センサー値を要求する間隔（秒）")
+    parser.add_argument("--binary", action="store_true",
+                        help="バイナリフレーム出力で取り込む（サンプリングごとに送られる）")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="この件数が溜まったらストアへ書き込む")
+    parser.add_argument("--flush-interval", type=float, default=DEFAULT_FLUSH_INTERVAL,
+                        help="ストアへ書き込む間隔（秒）")
+    parser.add_argument("--simulate", type=int, default=0, metavar="N",
+                        help="N台の模擬デバイス（pty）を起動して取り込む")
+    parser.add_argument("--stream-hz", type=float, default=0.0,
+                        help="模擬デバイスに要求なしで送らせる頻度（負荷試験用）")
+    parser.add_argument("--duration", type=float, help="指定秒数で終了する")
+    parser.add_argument("--log-level", default="INFO",
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level, format="%(asctime)s [%(levelname)s] %(message)s")
+    if not args.devices and not args.simulate:
+        parser.error("デバイスのパスか --simulate を指定してください")
+
+    try:
+        stats = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        return
+    rate = stats["records"] / stats["elapsed"] if stats["elapsed"] else 0.0
+    logger.info(f"{stats['devices']}台から{stats['records']}件を取り込みました "
+                f"({rate:.0f}件/秒, 解析エラー{stats['parse_errors']}件, 書き込み{stats['records_written']}件)")
+
+
+if __name__ == "__main__":
+    main()
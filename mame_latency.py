@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+節分検知システムのファームウェアの loop() 所要時間ベンチマーク
+
+mame_host でファームウェアをホスト上にビルドし、キャリブレーションが終わって監視中に
+なってから仮想時計で loop() を回して、1回ごとの所要時間（仮想時計の進み）を集める。
+所要時間には MLX90614 の読み取り・HC-SR04 のエコー待ち・LED 転送・delay が入る
+（見積もりは mame_host のスタブを参照）。人の来訪は mame_host の HostWorld が作る。
+
+--baseline に改修前のスケッチを渡すと同じシードで両方を回して並べる。例:
+
+    git show HEAD~1:mame.py > /tmp/old_mame.ino
+    python mame_latency.py --baseline /tmp/old_mame.ino
+"""
+
+import argparse
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import mame_host
+
+# ハーネス（所要時間を 1µs 刻みのヒストグラムで数える。それより長いものは最後のビン）
+LATENCY_HARNESS = r'''
+#define LATENCY_BINS 100000
+static uint32_t latencyHistogram[LATENCY_BINS];
+
+int main(int argc, char **argv) {
+  double seconds = argc > 1 ? atof(argv[1]) : 600;
+  uint64_t seed = argc > 2 ? strtoull(argv[2], nullptr, 10) : 1;
+  hostBegin(seed);
+  setup();
+  while (currentState != MONITORING && hostMicros < 120000000ULL) {
+    hostRunUntil(hostMicros + 100000);
+  }
+  uint64_t samplesBefore = hostWorld.samples;
+  unsigned long detectionsBefore = stats.totalDetections;
+  uint64_t end = hostMicros + (uint64_t)(seconds * 1e6);
+  uint64_t loops = 0, longest = 0;
+  while (hostMicros < end) {
+    uint64_t start = hostMicros;
+    loop();
+    uint64_t elapsed = hostMicros - start;
+    hostMicros += 5;  // loop() 自体の処理時間
+    latencyHistogram[elapsed < LATENCY_BINS ? elapsed : LATENCY_BINS - 1]++;
+    if (elapsed > longest) longest = elapsed;
+    loops++;
+  }
+  fprintf(stdout, "%llu %llu %llu %lu\n", (unsigned long long)loops, (unsigned long long)longest,
+          (unsigned long long)(hostWorld.samples - samplesBefore), stats.totalDetections - detectionsBefore);
+  for (uint32_t i = 0; i < LATENCY_BINS; i++) {
+    if (latencyHistogram[i]) fprintf(stdout, "%u %u\n", i, latencyHistogram[i]);
+  }
+  return 0;
+}
+'''
+
+PERCENTILES = (("p50", 0.5), ("p99", 0.99), ("p99.9", 0.999))
+
+
+@dataclass
+class LatencyReport:
+    """loop() 所要時間の集計（µs）"""
+    loops: int
+    longest: int
+    samples: int
+    detections: int
+    histogram: Dict[int, int]
+
+    def percentile(self, q: float) -> int:
+        target = q * self.loops
+        seen = 0
+        for value in sorted(self.histogram):
+            seen += self.histogram[value]
+            if seen > target:
+                return value
+        return self.longest
+
+
+def run_latency(seconds: float, seed: int = 1, source: str = None,
+                timeout: float = None) -> LatencyReport:
+    binary = mame_host.build(LATENCY_HARNESS, source=source)
+    result = mame_host.run(binary, [str(seconds), str(seed)], timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError(f"ファームウェアが異常終了しました ({result.returncode}): {result.stderr.strip()}")
+    lines = result.stdout.splitlines()
+    loops, longest, samples, detections = (int(value) for value in lines[0].split())
+    histogram = {}
+    for line in lines[1:]:
+        value, count = line.split()
+        histogram[int(value)] = int(count)
+    return LatencyReport(loops, longest, samples, detections, histogram)
+
+
+def _read(path: Optional[str]) -> Optional[str]:
+    if not path:
+        return None
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ファームウェアの loop() 所要時間ベンチマーク（ホスト上の仮想時計で実行）")
+    parser.add_argument("--seconds", type=float, default=600, help="監視中に回す仮想時間（秒）")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--firmware", help="計測するスケッチ（省略時は mame.py）")
+    parser.add_argument("--baseline", help="比べるスケッチ（改修前の mame.py など）")
+    args = parser.parse_args()
+
+    targets = [("firmware", _read(args.firmware))]
+    if args.baseline:
+        targets.insert(0, ("baseline", _read(args.baseline)))
+    reports = {}
+    try:
+        for name, source in targets:
+            reports[name] = run_latency(args.seconds, args.seed, source)
+    except (RuntimeError, subprocess.TimeoutExpired) as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+
+    print(f"{'':16s}" + "".join(f"{name:>12s}" for name in reports))
+    for label, q in PERCENTILES:
+        print(f"{label + ' (µs)':16s}" + "".join(f"{r.percentile(q):12d}" for r in reports.values()))
+    rows = (("最大 (µs)", "longest"), ("loop() 回数", "loops"), ("サンプル数", "samples"), ("検知回数", "detections"))
+    for label, key in rows:
+        print(f"{label:16s}" + "".join(f"{getattr(r, key):12d}" for r in reports.values()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""
+節分検知システムの loop() タイミングシミュレーション
+
+ファームウェアの loop() を仮想時計の上で回し、センサー読み取りや LED 更新などの所要時間を
+積み上げて、サンプリング間隔のずれ（ジッター）と、サンプルを1つも取れないまま人が
+通り過ぎた回数を測る。
+
+- blocking: 改修前の動作。playOniAlert（約2.9秒）・startupSequence（約3.6秒）・
+  calibrateSystem（約32秒）を delay で待ち、loop() の末尾で delay(10)、
+  サンプル時刻は lastSampleTime = currentTime
+- cooperative: メロディ・LED アニメーション・キャリブレーションを loop() の刻みごとに
+  1ステップ進め、delay(1)、サンプル時刻は lastSampleTime += samplingInterval。
+  サンプルごとに readSensors で MLX90614 2回と HC-SR04 を読む
+- scheduled: 現在の動作。cooperative に加えてセンサーごとに読む頻度を分ける。PIR は
+  PIR_POLL_INTERVAL ごとに読み、サンプルでは物体温度だけ読む。環境温度は
+  AMBIENT_READ_INTERVAL ごと、超音波は動きがあってから MOTION_HOLD_TIME の間だけ、
+  どちらもサンプルのない loop() で1回に1つだけ読む。センサーを読んだ loop() では delay(1) しない
+- async: 現在の動作（ECHO_PIN が割り込みを使える場合）。scheduled の超音波を非同期にしたもの。
+  動きがある間は ULTRASONIC_PING_INTERVAL ごとにトリガーだけ出して戻り、エコーは割り込みで
+  受けて、次の loop() で直近 DISTANCE_MEDIAN_SIZE 回の中央値を距離にする
+
+サンプリングのずれに加えて、loop() 1回の所要時間（delay を除く）の分布と、人がいるときの
+サンプルの距離と実際の距離の差（超音波のばらつき・読み置きや中央値による遅れ）も出す。
+
+所要時間は LoopCosts の見積もり（HC-SR04 のエコー待ちは距離に比例）を使う。
+"""
+
+import argparse
+import random
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from mame_stats import RunningMedian
+
+# ファームウェアの定数
+CALIBRATION_READINGS = 20
+CALIBRATION_READ_INTERVAL = 100
+CALIBRATION_TIME = 30000
+LED_REFRESH_INTERVAL = 50
+STARTUP_RAINBOW_FRAMES = 128
+STARTUP_FRAME_INTERVAL = 20
+# (周波数, 鳴らす時間, 次の音までの時間)
+ONI_MELODY = ((262, 200, 260), (247, 200, 260), (220, 200, 260), (196, 200, 260), (175, 400, 520),
+              (196, 200, 260), (220, 200, 260), (247, 200, 260), (262, 400, 520))
+STARTUP_MELODY = ((440, 200, 250), (554, 200, 250), (659, 400, 500))
+PIR_POLL_INTERVAL = 5
+AMBIENT_READ_INTERVAL = 10000
+MOTION_HOLD_TIME = 2000
+ULTRASONIC_PING_INTERVAL = 60
+DISTANCE_MEDIAN_SIZE = 5
+
+MODES = ("blocking", "cooperative", "scheduled", "async")
+
+
+@dataclass
+class LoopCosts:
+    """loop() の中の処理にかかる時間の見積もり（ms）"""
+    loop_overhead: float = 0.02
+    mlx_read: float = 0.5             # MLX90614 の1回の読み取り（I2C）
+    echo_per_cm: float = 0.0583       # HC-SR04 の往復（58.3µs/cm）
+    echo_timeout: float = 30.0        # pulseIn のタイムアウト
+    led_show: float = 0.15            # WS2812B ×4 の転送
+    tone: float = 0.02
+    pir_poll: float = 0.005           # PIR 2本の digitalRead
+    echo_delay: float = 0.45          # トリガーからエコーの立ち上がりまで
+    interrupt: float = 0.002          # 割り込みの出入り
+    background_distance: float = 250.0
+    distance_noise: float = 12.0      # 人までの距離のばらつき（cm）
+    echo_dropout: float = 0.02        # エコーが返らない割合
+
+    def echo(self, distance: float) -> float:
+        """トリガーパルスとエコー待ち"""
+        return 0.012 + (self.echo_timeout if distance <= 0 else distance * self.echo_per_cm)
+
+    def sensor_read(self, distance: float) -> float:
+        return 2 * self.mlx_read + self.echo(distance)
+
+
+@dataclass
+class Visit:
+    """人が検知範囲にいる区間"""
+    start: float
+    end: float
+    distance: float
+
+
+@dataclass
+class LoopReport:
+    mode: str
+    sample_times: List[float] = field(default_factory=list)
+    detections: List[float] = field(default_factory=list)
+    loop_times: List[float] = field(default_factory=list)
+    distance_errors: List[float] = field(default_factory=list)
+    monitoring_start: float = 0.0
+    first_sample: float = 0.0
+    visits: int = 0
+    unsampled_visits: int = 0
+    detected_visits: int = 0
+
+    def intervals(self) -> List[float]:
+        times = self.sample_times
+        return [b - a for a, b in zip(times, times[1:])]
+
+    def summary(self, sampling_interval: int) -> Dict[str, float]:
+        intervals = sorted(self.intervals())
+        if not intervals:
+            return {"samples": len(self.sample_times)}
+        jitter = [abs(value - sampling_interval) for value in intervals]
+        jitter.sort()
+        loops = sorted(self.loop_times)
+        errors = sorted(self.distance_errors)
+        return {
+            "loop_p50": _percentile(loops, 0.5),
+            "loop_p99": _percentile(loops, 0.99),
+            "loop_p999": _percentile(loops, 0.999),
+            "loop_max": loops[-1],
+            "distance_error": _percentile(errors, 0.5) if errors else float("nan"),
+            "distance_error_p90": _percentile(errors, 0.9) if errors else float("nan"),
+            "samples": len(self.sample_times),
+            "mean_interval": sum(intervals) / len(intervals),
+            "max_interval": intervals[-1],
+            "p99_jitter": _percentile(jitter, 0.99),
+            "max_jitter": jitter[-1],
+            "startup_gap": self.first_sample - self.monitoring_start,
+            "visits": self.visits,
+            "unsampled_visits": self.unsampled_visits,
+            "detected_visits": self.detected_visits,
+        }
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """ソート済みの values の q 分位点"""
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def make_visits(duration: float, rate_per_minute: float, seed: int,
+                min_length: float = 500, max_length: float = 3000) -> List[Visit]:
+    """人が来る区間をポアソン過程で作る（時刻は ms）"""
+    rng = random.Random(seed)
+    visits = []
+    t = 0.0
+    mean_gap = 60000.0 / rate_per_minute
+    while True:
+        t += rng.expovariate(1.0 / mean_gap)
+        if t >= duration:
+            return visits
+        length = rng.uniform(min_length, max_length)
+        visits.append(Visit(t, t + length, rng.uniform(40, 150)))
+        t += length
+
+
+class LoopSimulator:
+    """仮想時計で loop() を回す"""
+
+    def __init__(self, mode: str, visits: List[Visit], sampling_interval: int = 200,
+                 alert_duration: int = 3000, enable_sound: bool = True,
+                 costs: LoopCosts = None):
+        if mode not in MODES:
+            raise ValueError(f"mode は {MODES} のいずれか: {mode}")
+        self.mode = mode
+        self.visits = visits
+        self.sampling_interval = sampling_interval
+        self.alert_duration = alert_duration
+        self.enable_sound = enable_sound
+        self.costs = costs if costs is not None else LoopCosts()
+        self.clock = 0.0
+        self._visit_index = 0
+        self._rng = random.Random(0)
+
+    def millis(self) -> int:
+        return int(self.clock)
+
+    def _visit_at(self, t: float):
+        visits = self.visits
+        while self._visit_index < len(visits) and visits[self._visit_index].end < t:
+            self._visit_index += 1
+        if self._visit_index < len(visits) and visits[self._visit_index].start <= t:
+            return visits[self._visit_index]
+        return None
+
+    def _sample(self, report: LoopReport) -> bool:
+        """センサーを読み、人がいれば True（読み取り時間だけ時計を進める）"""
+        report.sample_times.append(self.clock)
+        visit = self._visit_at(self.clock)
+        distance = visit.distance if visit else self.costs.background_distance
+        self._record_distance(report, visit, self._measure(self.clock))
+        self.clock += self.costs.sensor_read(distance)
+        return visit is not None
+
+    def _sample_scheduled(self, report: LoopReport, distance: float) -> bool:
+        """物体温度だけ読む（PIR はポーリング済み、環境温度と距離は読み置き）"""
+        report.sample_times.append(self.clock)
+        visit = self._visit_at(self.clock)
+        self._record_distance(report, visit, distance)
+        self.clock += self.costs.mlx_read
+        return visit is not None
+
+    def _distance_at(self, t: float) -> float:
+        visit = self._visit_at(t)
+        return visit.distance if visit else self.costs.background_distance
+
+    def _measure(self, t: float) -> float:
+        """時刻 t の超音波1回分の測定値（エコーなしは -1）"""
+        if self._rng.random() < self.costs.echo_dropout:
+            return -1.0
+        visit = self._visit_at(t)
+        if visit is None:
+            return self.costs.background_distance + self._rng.gauss(0, 3)
+        return visit.distance + self._rng.gauss(0, self.costs.distance_noise)
+
+    @staticmethod
+    def _record_distance(report: LoopReport, visit, distance: float) -> None:
+        if visit is not None and distance > 0:
+            report.distance_errors.append(abs(distance - visit.distance))
+
+    def run(self, duration: float) -> LoopReport:
+        report = LoopReport(self.mode)
+        if self.mode == "blocking":
+            self._run_blocking(duration, report)
+        else:
+            self._run_cooperative(duration, report)
+        self._score_visits(report)
+        return report
+
+    def _melody_time(self, melody) -> float:
+        return sum(step for _, _, step in melody)
+
+    def _run_blocking(self, duration: float, report: LoopReport) -> None:
+        costs = self.costs
+        # calibrateSystem: 100ms ごとの測定20回 + 500ms 刻みで30秒待つ
+        self.clock += CALIBRATION_READINGS * (CALIBRATION_READ_INTERVAL + costs.mlx_read)
+        self.clock += CALIBRATION_TIME + 500 - CALIBRATION_TIME % 500
+        report.monitoring_start = self.clock
+        # startupSequence: 虹色 128 フレーム + 起動音（delay 250/250/500）
+        self.clock += STARTUP_RAINBOW_FRAMES * (STARTUP_FRAME_INTERVAL + costs.led_show) + costs.led_show
+        self.clock += self._melody_time(STARTUP_MELODY)
+
+        last_sample = 0
+        alert_start = None
+        while self.clock < duration:
+            now = self.millis()
+            loop_start = self.clock
+            self.clock += costs.loop_overhead
+            if now - last_sample >= self.sampling_interval:
+                last_sample = now
+                present = self._sample(report)
+                if alert_start is None and present:
+                    report.detections.append(self.clock)
+                    alert_start = self.millis()
+                    if self.enable_sound:
+                        self.clock += self._melody_time(ONI_MELODY) + len(ONI_MELODY) * costs.tone
+                if alert_start is not None and now - alert_start >= self.alert_duration:
+                    alert_start = None
+                self.clock += costs.led_show
+            report.loop_times.append(self.clock - loop_start)
+            self.clock += 10
+        report.first_sample = report.sample_times[0] if report.sample_times else duration
+
+    def _run_cooperative(self, duration: float, report: LoopReport) -> None:
+        costs = self.costs
+        scheduled = self.mode in ("scheduled", "async")
+        ranging_async = self.mode == "async"
+        last_pir_poll = 0
+        last_ambient_read = 0
+        motion_until = 0
+        distance = -1.0
+        distance_fresh = False
+        median = RunningMedian(DISTANCE_MEDIAN_SIZE)
+        echo_done = None      # 測定中のエコーが下がる時刻（None なら測っていない）
+        echo_distance = -1.0
+        last_ping = 0
+        calibration_reads = 0
+        next_read = 0.0
+        settle_start = None
+        monitoring = False
+        animation_frame = None
+        next_frame = 0.0
+        melody = ()
+        melody_index = 0
+        next_tone = 0.0
+        last_sample = 0
+        last_led = 0
+        alert_start = None
+
+        while self.clock < duration:
+            now = self.millis()
+            loop_start = self.clock
+            self.clock += costs.loop_overhead
+            sensor_work = False
+
+            # updateMelody
+            if melody and now >= next_tone:
+                if melody_index >= len(melody):
+                    melody = ()
+                else:
+                    self.clock += costs.tone
+                    next_tone += melody[melody_index][2]
+                    melody_index += 1
+
+            # updateAnimation
+            if animation_frame is not None and now >= next_frame:
+                next_frame += STARTUP_FRAME_INTERVAL
+                self.clock += costs.led_show
+                animation_frame += 1
+                if animation_frame > STARTUP_RAINBOW_FRAMES:
+                    animation_frame = None
+                    melody, melody_index, next_tone = STARTUP_MELODY, 0, now
+
+            # updateCalibration
+            if not monitoring:
+                if calibration_reads < CALIBRATION_READINGS:
+                    if now >= next_read:
+                        next_read += CALIBRATION_READ_INTERVAL
+                        self.clock += costs.mlx_read
+                        calibration_reads += 1
+                        if calibration_reads == CALIBRATION_READINGS:
+                            settle_start = now
+                elif now - settle_start >= CALIBRATION_TIME:
+                    monitoring = True
+                    report.monitoring_start = self.clock
+                    last_sample = now
+                    animation_frame, next_frame = 0, now
+                elif now - last_led >= LED_REFRESH_INTERVAL:
+                    last_led = now
+                    self.clock += costs.led_show
+
+            # サンプリング（周期を保つ）
+            elif now - last_sample >= self.sampling_interval:
+                if scheduled and now - last_pir_poll >= PIR_POLL_INTERVAL:
+                    last_pir_poll = now
+                    self.clock += costs.pir_poll
+                last_sample += self.sampling_interval
+                if now - last_sample >= self.sampling_interval:
+                    last_sample = now
+                if scheduled:
+                    present = self._sample_scheduled(report, distance)
+                    sensor_work = True
+                    distance_fresh = False
+                    if present:
+                        motion_until = now + MOTION_HOLD_TIME
+                else:
+                    present = self._sample(report)
+                if alert_start is None and present:
+                    report.detections.append(self.clock)
+                    alert_start = self.millis()
+                    if self.enable_sound:
+                        melody, melody_index, next_tone = ONI_MELODY, 0, self.millis()
+                if alert_start is not None and now - alert_start >= self.alert_duration:
+                    alert_start = None
+
+            # updateSensorCache（読むのは1回に1つだけ）
+            elif scheduled:
+                if now - last_pir_poll >= PIR_POLL_INTERVAL:
+                    last_pir_poll = now
+                    self.clock += costs.pir_poll
+                if ranging_async:
+                    # serviceRanging: 割り込みで受けたエコー（またはタイムアウト）を中央値に入れる
+                    if echo_done is not None and self.clock >= echo_done:
+                        self.clock += 2 * costs.interrupt
+                        median.add(echo_distance)
+                        distance = median.median
+                        echo_done = None
+                    if motion_until <= now:
+                        median.clear()
+                    elif echo_done is None and now - last_ping >= ULTRASONIC_PING_INTERVAL:
+                        last_ping = now
+                        echo_distance = self._measure(self.clock)
+                        echo = costs.echo_timeout if echo_distance <= 0 else echo_distance * costs.echo_per_cm
+                        echo_done = self.clock + costs.echo_delay + echo
+                        self.clock += 0.012
+                if not ranging_async and motion_until > now and not distance_fresh:
+                    distance = self._measure(self.clock)
+                    self.clock += costs.echo(self._distance_at(self.clock))
+                    distance_fresh = True
+                    sensor_work = True
+                elif now - last_ambient_read >= AMBIENT_READ_INTERVAL:
+                    last_ambient_read = now
+                    self.clock += costs.mlx_read
+                    sensor_work = True
+
+            # LED 更新
+            if monitoring and animation_frame is None and now - last_led >= LED_REFRESH_INTERVAL:
+                last_led = now
+                self.clock += costs.led_show
+
+            report.loop_times.append(self.clock - loop_start)
+            if not sensor_work:
+                self.clock += 1
+        report.first_sample = report.sample_times[0] if report.sample_times else duration
+
+    def _score_visits(self, report: LoopReport) -> None:
+        from bisect import bisect_left
+
+        times = report.sample_times
+        detections = report.detections
+        for visit in self.visits:
+            if visit.end < report.monitoring_start:
+                continue
+            report.visits += 1
+            first = bisect_left(times, visit.start)
+            if first >= len(times) or times[first] > visit.end:
+                report.unsampled_visits += 1
+            hit = bisect_left(detections, visit.start)
+            if hit < len(detections) and detections[hit] <= visit.end + self.costs.echo_timeout:
+                report.detected_visits += 1
+
+
+def compare(duration: float, visits: List[Visit], **kwargs) -> Dict[str, LoopReport]:
+    return {mode: LoopSimulator(mode, visits, **kwargs).run(duration) for mode in MODES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="検知器 loop() のサンプリングジッターのシミュレーション")
+    parser.add_argument("--duration", type=float, default=600, help="シミュレーションする時間（秒）")
+    parser.add_argument("--interval", type=int, default=200, help="samplingInterval（ms）")
+    parser.add_argument("--alert-duration", type=int, default=3000, help="alertDuration（ms）")
+    parser.add_argument("--visits", type=float, default=6.0, help="1分あたりの来訪数")
+    parser.add_argument("--no-sound", action="store_true", help="enableSound を OFF にする")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    duration = args.duration * 1000
+    visits = make_visits(duration, args.visits, args.seed)
+    reports = compare(duration, visits, sampling_interval=args.interval,
+                      alert_duration=args.alert_duration, enable_sound=not args.no_sound)
+
+    rows: List[Tuple[str, str, str]] = [
+        ("loop() p50 (ms)", "loop_p50", "{:.2f}"),
+        ("loop() p99 (ms)", "loop_p99", "{:.2f}"),
+        ("loop() p99.9 (ms)", "loop_p999", "{:.2f}"),
+        ("loop() 最大 (ms)", "loop_max", "{:.2f}"),
+        ("距離の誤差 p50 (cm)", "distance_error", "{:.1f}"),
+        ("距離の誤差 p90 (cm)", "distance_error_p90", "{:.1f}"),
+        ("サンプル数", "samples", "{:.0f}"),
+        ("平均間隔 (ms)", "mean_interval", "{:.1f}"),
+        ("最大間隔 (ms)", "max_interval", "{:.1f}"),
+        ("ジッター p99 (ms)", "p99_jitter", "{:.1f}"),
+        ("ジッター 最大 (ms)", "max_jitter", "{:.1f}"),
+        ("監視開始→初回サンプル (ms)", "startup_gap", "{:.0f}"),
+        ("来訪数", "visits", "{:.0f}"),
+        ("サンプルなしの来訪", "unsampled_visits", "{:.0f}"),
+        ("検知した来訪", "detected_visits", "{:.0f}"),
+    ]
+    summaries = {mode: report.summary(args.interval) for mode, report in reports.items()}
+    print(f"{'':28s}" + "".join(f"{mode:>14s}" for mode in MODES))
+    for label, key, fmt in rows:
+        values = "".join(f"{fmt.format(summaries[mode].get(key, float('nan'))):>14s}" for mode in MODES)
+        print(f"{label:28s}{values}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+"""
+節分検知システム (mame.py) のシリアル出力形式
+
+ファームウェアは `json` コマンドで JSON 出力を有効にすると、
+- 空行を受け取るたびに printJsonSensorData でセンサー値を1行
+- `status` で printJsonStatus の状態を1行
+出力する。それ以外の行（日本語の人間向け表示）は JSON ではない。
+
+`bin` コマンドでバイナリ出力を有効にすると、サンプリングごとにセンサー値を固定長の
+フレーム（writeBinaryFrame）で送る。フレームとテキスト行は同じストリームに混ざる。
+
+このモジュールは行単位の増分パーサー、バイナリフレームの増分パーサーとエンコーダー、
+センサー値を列形式で持つためのスキーマ、`set` コマンドで変更できる設定項目の表を提供する。
+"""
+
+import binascii
+import json
+import math
+import re
+import struct
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+# ファームウェアの getStateString と SystemState の対応
+STATE_NAMES = ("待機中", "校正中", "監視中", "警戒中", "エラー")
+STATE_CODES = {name: code for code, name in enumerate(STATE_NAMES)}
+STANDBY, CALIBRATING, MONITORING, ALERT, ERROR_STATE = range(len(STATE_NAMES))
+UNKNOWN_STATE = -1
+
+# printJsonSensorData のフィールドと列の型（array の型コード）
+# host_time はホストで受信した時刻（UNIX 秒）
+SENSOR_COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ("host_time", "d"),
+    ("timestamp", "Q"),
+    ("pir1", "B"),
+    ("pir2", "B"),
+    ("object_temp", "f"),
+    ("ambient_temp", "f"),
+    ("distance", "f"),
+    ("state", "b"),
+    ("detection_count", "Q"),
+    ("valid", "B"),
+)
+
+# printJsonStatus のフィールド
+# stats はセンサーごとの窓統計 {"distance": {"mean", "std", "min", "max", "ema", "ema_std", "count"}, ...}
+STATUS_FIELDS = (
+    "version", "uptime", "state", "total_detections", "false_positives", "error_count",
+    "last_error", "free_memory", "avg_distance", "avg_object_temp", "stats", "timestamp",
+)
+
+
+# バイナリフレーム（ファームウェアの FRAME_* と同じ）
+# 同期バイトの後ろから CRC の前まで。温度は 0.01°C、距離は 0.1cm 単位
+FRAME_SYNC = b"\xa5\x5a"
+FRAME_KEY = 1
+FRAME_DELTA = 2
+KEY_FRAME = struct.Struct("<BBIBhhHI")    # type, seq, timestamp, flags, 物体温度, 環境温度, 距離, 検知回数
+DELTA_FRAME = struct.Struct("<BBHBbbb")   # type, seq, 経過ms, flags, Δ物体温度, Δ環境温度, Δ距離
+FRAME_CRC = struct.Struct("<H")
+KEY_FRAME_SIZE = len(FRAME_SYNC) + KEY_FRAME.size + FRAME_CRC.size
+DELTA_FRAME_SIZE = len(FRAME_SYNC) + DELTA_FRAME.size + FRAME_CRC.size
+KEY_FRAME_INTERVAL = 16
+HISTORY_SIZE = 512
+FRAME_TEMP_NONE = -32768
+FRAME_DISTANCE_NONE = 0xFFFF
+FRAME_FLAG_PIR1 = 0x01
+FRAME_FLAG_PIR2 = 0x02
+FRAME_FLAG_VALID = 0x04
+FRAME_FLAG_DETECTION = 0x08
+FRAME_STATE_SHIFT = 4
+
+# コマンド行の長さ（ファームウェアの MAX_SERIAL_BUFFER - 1。超えた分は捨てられる）
+MAX_COMMAND_LENGTH = 255
+MAX_BATCH_SETTINGS = 8
+
+
+class Setting(NamedTuple):
+    """set コマンドで変更できる設定項目（ファームウェアの SettingEntry）"""
+    name: str
+    alias: Optional[str]
+    key: str           # FakeDetector.config のキー
+    type: type         # float / int / bool
+    minimum: float
+    maximum: float
+    label: str
+    unit: str
+
+
+# ファームウェアの SETTINGS と同じ表・同じ順（config の表示順）
+SETTINGS: Tuple[Setting, ...] = (
+    Setting("temp", "tempthreshold", "temp_threshold", float, 0.5, 50, "温度閾値", "°C"),
+    Setting("distance", "distancethreshold", "distance_threshold", float, 1, 400, "距離閾値", "cm"),
+    Setting("score", "detectionthreshold", "detection_threshold", int, 1, 6, "検知スコア閾値", ""),
+    Setting("interval", "samplinginterval", "sampling_interval", int, 20, 10000, "サンプリング間隔", "ms"),
+    Setting("alert", "alertduration", "alert_duration", int, 100, 60000, "アラート時間", "ms"),
+    Setting("sound", None, "enable_sound", bool, 0, 1, "音声", ""),
+    Setting("led", "leds", "enable_leds", bool, 0, 1, "LED", ""),
+)
+_SETTINGS_BY_NAME = {name: setting for setting in SETTINGS
+                     for name in (setting.name, setting.alias) if name is not None}
+_BOOL_VALUES = {"on": True, "1": True, "true": True, "off": False, "0": False, "false": False}
+_FLOAT_TEXT = re.compile(r"[0-9+\-.e]+")
+_INT_TEXT = re.compile(r"[0-9+\-]+")
+_FLOAT32 = struct.Struct("<f")
+
+
+def find_setting(name: str) -> Optional[Setting]:
+    """名前か別名（小文字）から設定項目を探す"""
+    return _SETTINGS_BY_NAME.get(name)
+
+
+def parse_setting(setting: Setting, text: str) -> Optional[Union[float, int, bool]]:
+    """parseSetting と同じく値を解釈する（10進数のみ。解釈できなければ None）
+
+    float の項目はファームウェアと同じく単精度に丸めた値を返す。範囲は確かめない。
+    """
+    if setting.type is bool:
+        return _BOOL_VALUES.get(text)
+    pattern = _FLOAT_TEXT if setting.type is float else _INT_TEXT
+    if not pattern.fullmatch(text):
+        return None
+    try:
+        value = float(text) if setting.type is float else int(text)
+    except ValueError:
+        return None
+    if setting.type is float:
+        try:
+            value = _FLOAT32.unpack(_FLOAT32.pack(value))[0]
+        except OverflowError:
+            # 単精度に収まらない値はファームウェアでは無限大になる（範囲外）
+            value = math.copysign(math.inf, value)
+    return value
+
+
+def setting_in_range(setting: Setting, value) -> bool:
+    return setting.minimum <= value <= setting.maximum
+
+
+def format_setting(setting: Setting, value) -> str:
+    """printSetting と同じ1行表示"""
+    if setting.type is bool:
+        text = "ON" if value else "OFF"
+    elif setting.type is float:
+        text = f"{value:.2f}"
+    else:
+        text = str(value)
+    return f"{setting.label}: {text}{setting.unit}"
+
+
+def format_setting_range(setting: Setting) -> str:
+    """printSettingRange と同じ表示"""
+    if setting.type is bool:
+        return "on/off"
+    if setting.type is float:
+        return f"{setting.minimum:.2f}〜{setting.maximum:.2f}{setting.unit}"
+    return f"{int(setting.minimum)}〜{int(setting.maximum)}{setting.unit}"
+
+
+def frame_crc(data) -> int:
+    """CRC-16/CCITT-FALSE（ファームウェアの crc16）"""
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def state_code(name: Optional[str]) -> int:
+    return STATE_CODES.get(name, UNKNOWN_STATE)
+
+
+def _float(value) -> float:
+    # ArduinoJson は NaN を null として出力する
+    return math.nan if value is None else float(value)
+
+
+def sensor_row(record: Dict, host_time: float) -> Tuple:
+    """センサー値の JSON を SENSOR_COLUMNS の順のタプルにする"""
+    return (
+        host_time,
+        int(record.get("timestamp", 0)),
+        1 if record.get("pir1") else 0,
+        1 if record.get("pir2") else 0,
+        _float(record.get("object_temp")),
+        _float(record.get("ambient_temp")),
+        _float(record.get("distance")),
+        state_code(record.get("state")),
+        int(record.get("detection_count", 0)),
+        1 if record.get("valid", True) else 0,
+    )
+
+
+def is_sensor_record(record: Dict) -> bool:
+    return "pir1" in record
+
+
+def is_status_record(record: Dict) -> bool:
+    return "uptime" in record
+
+
+class LineParser:
+    """バイト列を受け取り、完成した行から JSON レコードを取り出す増分パーサー
+
+    行の途中で切れたデータは次回の feed まで保持する。JSON 以外の行は on_text
+    （設定されていれば）に渡して捨てる。on_record を設定すると、JSON レコードは返さずに
+    テキスト行と同じ順番でそちらに渡す。
+    """
+
+    def __init__(self, max_line: int = 4096, on_text=None, on_record=None):
+        self.max_line = max_line
+        self.on_text = on_text
+        self.on_record = on_record
+        self._pending = b""
+        self.lines = 0
+        self.text_lines = 0
+        self.errors = 0
+
+    def feed(self, data: bytes) -> List[Dict]:
+        buffer = self._pending + data if self._pending else data
+        end = buffer.rfind(b"\n")
+        if end < 0:
+            self._pending = buffer
+            if len(self._pending) > self.max_line:
+                # 改行の来ない異常な入力は捨てて同期し直す
+                self._pending = b""
+                self.errors += 1
+            return []
+        self._pending = buffer[end + 1:]
+
+        records = []
+        for line in buffer[:end].split(b"\n"):
+            line = line.strip()
+            if not line:
+                continue
+            self.lines += 1
+            if line[:1] != b"{":
+                self.text_lines += 1
+                if self.on_text is not None:
+                    self.on_text(line)
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                self.errors += 1
+                continue
+            if not isinstance(record, dict):
+                self.errors += 1
+            elif self.on_record is not None:
+                self.on_record(record)
+            else:
+                records.append(record)
+        return records
+
+
+def _quantize_temp(value: float) -> int:
+    if value is None or math.isnan(value):
+        return FRAME_TEMP_NONE
+    return max(-32767, min(32767, round(value * 100)))
+
+
+def _quantize_distance(value: float) -> int:
+    if value is None or math.isnan(value) or value < 0:
+        return FRAME_DISTANCE_NONE
+    return min(round(value * 10), 0xFFFE)
+
+
+class FrameEncoder:
+    """センサー値をバイナリフレームにする（ファームウェアの writeBinaryFrame と同じ規則）
+
+    模擬デバイスとテスト用。直前のフレームとの差分が1バイトに収まり、キーフレームから
+    KEY_FRAME_INTERVAL 未満なら差分フレームにする。
+    """
+
+    def __init__(self):
+        self.sequence = 0
+        self.since_key_frame = KEY_FRAME_INTERVAL
+        self._last = (0, 0, 0, 0, 0)   # timestamp, 物体温度, 環境温度, 距離, 検知回数
+
+    def reset(self) -> None:
+        """次のフレームをキーフレームにする（出力の再開時）"""
+        self.since_key_frame = KEY_FRAME_INTERVAL
+
+    def encode(self, record: Dict, state: int, detection_count: int) -> bytes:
+        """printJsonSensorData と同じキーのセンサー値を1フレームにする"""
+        timestamp = int(record["timestamp"])
+        object_temp = _quantize_temp(record.get("object_temp"))
+        ambient_temp = _quantize_temp(record.get("ambient_temp"))
+        distance = _quantize_distance(record.get("distance"))
+        flags = (state << FRAME_STATE_SHIFT
+                 | (FRAME_FLAG_PIR1 if record.get("pir1") else 0)
+                 | (FRAME_FLAG_PIR2 if record.get("pir2") else 0)
+                 | (FRAME_FLAG_VALID if record.get("valid", True) else 0))
+
+        last_time, last_object, last_ambient, last_distance, last_detections = self._last
+        elapsed = (timestamp - last_time) & 0xFFFFFFFF
+        new_detections = detection_count - last_detections
+        deltas = (object_temp - last_object, ambient_temp - last_ambient, distance - last_distance)
+        if (self.since_key_frame < KEY_FRAME_INTERVAL and elapsed <= 0xFFFF and 0 <= new_detections <= 1
+                and FRAME_TEMP_NONE not in (object_temp, ambient_temp, last_object, last_ambient)
+                and FRAME_DISTANCE_NONE not in (distance, last_distance)
+                and all(-128 <= d <= 127 for d in deltas)):
+            if new_detections:
+                flags |= FRAME_FLAG_DETECTION
+            body = DELTA_FRAME.pack(FRAME_DELTA, self.sequence, elapsed, flags, *deltas)
+            self.since_key_frame += 1
+        else:
+            body = KEY_FRAME.pack(FRAME_KEY, self.sequence, timestamp & 0xFFFFFFFF, flags,
+                                  object_temp, ambient_temp, distance, detection_count & 0xFFFFFFFF)
+            self.since_key_frame = 0
+
+        self.sequence = (self.sequence + 1) & 0xFF
+        self._last = (timestamp, object_temp, ambient_temp, distance, detection_count)
+        return FRAME_SYNC + body + FRAME_CRC.pack(frame_crc(body))
+
+
+class FrameParser:
+    """バイナリフレームとテキスト行が混ざったバイト列の増分パーサー
+
+    フレームは CRC を確かめて sensor_row と同じ順のタプルにし、フレーム以外のバイト列は
+    LineParser に渡して JSON レコードにする。差分フレームは直前のフレームを基準に復元するので、
+    通し番号が飛んだ（フレームを取りこぼした）ら次のキーフレームまでの差分フレームは捨てる。
+
+    rows_decoded はこれまでに返した（返す予定の）行数で、on_text の中で読むと
+    そのテキスト行より前にあったフレームの数になる（dump の範囲の切り出しに使う）。
+    """
+
+    def __init__(self, max_line: int = 4096, on_text=None, on_record=None):
+        self.lines = LineParser(max_line, on_text, on_record)
+        self._pending = bytearray()
+        self._last: Optional[Tuple] = None   # seq, timestamp, 物体温度, 環境温度, 距離, 検知回数
+        self.rows_decoded = 0
+        self.frames = 0
+        self.key_frames = 0
+        self.crc_errors = 0
+        self.gaps = 0
+        self.dropped = 0
+
+    @property
+    def errors(self) -> int:
+        return self.lines.errors + self.crc_errors
+
+    def feed(self, data: bytes, host_time: float = 0.0) -> Tuple[List[Tuple], List[Dict]]:
+        """(センサー値の行, JSON レコード) を返す"""
+        buffer = self._pending
+        buffer += data
+        rows: List[Tuple] = []
+        records: List[Dict] = []
+        append = rows.append
+        find = buffer.find
+        key_unpack, delta_unpack, crc_unpack = KEY_FRAME.unpack_from, DELTA_FRAME.unpack_from, FRAME_CRC.unpack_from
+        crc_hqx = binascii.crc_hqx
+        nan = math.nan
+        last = self._last
+        decoded = self.rows_decoded
+        text_start = position = 0
+        end = len(buffer)
+        with memoryview(buffer) as view:
+            while True:
+                # フレームが連続していれば find を省く
+                start = position if buffer[position:position + 2] == FRAME_SYNC else find(FRAME_SYNC, position)
+                if start < 0:
+                    # 末尾の1バイトは次の同期バイトの前半かもしれないので残す
+                    position = end - 1 if end > text_start and buffer[-1] == 0xA5 else end
+                    break
+                if start + 2 >= end:
+                    position = start
+                    break
+                kind = buffer[start + 2]
+                size = KEY_FRAME_SIZE if kind == FRAME_KEY else DELTA_FRAME_SIZE if kind == FRAME_DELTA else 0
+                if not size:
+                    position = start + 1
+                    continue
+                frame_end = start + size
+                if frame_end > end:
+                    position = start
+                    break
+                if crc_hqx(view[start + 2:frame_end - 2], 0xFFFF) != crc_unpack(buffer, frame_end - 2)[0]:
+                    # テキストにたまたま同期バイトの並びがあった場合もここに来る
+                    self.crc_errors += 1
+                    position = start + 1
+                    continue
+                if start > text_start:
+                    self.rows_decoded = decoded + len(rows)
+                    records.extend(self.lines.feed(bytes(view[text_start:start])))
+                text_start = position = frame_end
+                self.frames += 1
+
+                if kind == FRAME_KEY:
+                    _, sequence, timestamp, flags, object_temp, ambient_temp, distance, detections = \
+                        key_unpack(buffer, start + 2)
+                    if last is not None and sequence != (last[0] + 1) & 0xFF:
+                        self.gaps += 1
+                    self.key_frames += 1
+                else:
+                    _, sequence, elapsed, flags, object_delta, ambient_delta, distance_delta = \
+                        delta_unpack(buffer, start + 2)
+                    if last is None or sequence != (last[0] + 1) & 0xFF:
+                        # 基準のフレームを取りこぼしたので次のキーフレームまで復元できない
+                        if last is not None:
+                            self.gaps += 1
+                        self.dropped += 1
+                        last = None
+                        continue
+                    timestamp = (last[1] + elapsed) & 0xFFFFFFFF
+                    object_temp = last[2] + object_delta
+                    ambient_temp = last[3] + ambient_delta
+                    distance = last[4] + distance_delta
+                    detections = last[5] + 1 if flags & FRAME_FLAG_DETECTION else last[5]
+                last = (sequence, timestamp, object_temp, ambient_temp, distance, detections)
+                append((
+                    host_time,
+                    timestamp,
+                    flags & FRAME_FLAG_PIR1,
+                    (flags & FRAME_FLAG_PIR2) >> 1,
+                    nan if object_temp == FRAME_TEMP_NONE else object_temp / 100,
+                    nan if ambient_temp == FRAME_TEMP_NONE else ambient_temp / 100,
+                    -1.0 if distance == FRAME_DISTANCE_NONE else distance / 10,
+                    flags >> FRAME_STATE_SHIFT,
+                    detections,
+                    (flags & FRAME_FLAG_VALID) >> 2,
+                ))
+            self.rows_decoded = decoded + len(rows)
+            if position > text_start:
+                records.extend(self.lines.feed(bytes(view[text_start:position])))
+        del buffer[:position]
+        self._last = last
+        return rows, records
@@ -0,0 +1,571 @@
+#!/usr/bin/env python3
+"""
+節分検知システムの検知ロジックのオフライン再生
+
+mame.py の processDetection / triggerDetection / updateSystemState を Python で再現し、
+記録済みのセンサー値（printJsonSensorData の JSON Lines）を実時間より速く再生する。
+
+- DetectorStateMachine: 1サンプルずつ処理する基準実装（ファームウェアと同じ分岐）
+- replay_vectorized: NumPy 版。窓の合計は累積和の差で一括計算し、Python のループは
+  検知イベントと状態遷移の回数だけ回すので、数百万サンプル/秒で処理できる
+
+ファームウェアとの対応:
+- 有効なサンプルは状態によらず直近 FUSION_WINDOW 件の窓（DetectionFusion）に入る。
+  温度差は 0.01°C、距離は 0.1cm 単位の整数（lroundf）で持つので、合計は丸め誤差なく一致する
+- スコア: 窓内で PIR が反応したサンプルが PIR_CONFIRM_HITS 以上で +3、
+  新しい半分の温度差の平均 > tempThreshold で +2（でなければ古い半分からの上がり幅が
+  tempThreshold を超えると +1）、距離の平均が古い半分と新しい半分で distanceThreshold より
+  大きく違えば +1（どちらの半分にも正の距離があるとき）
+- スコアが detectionThreshold 以上の有効サンプルが FUSION_CONFIRM 回続いたサンプルで1回だけ
+  検知イベントになり、MONITORING なら検知する（閾値を下回るまで次のイベントは出ない）
+- 左右の PIR が窓内で別々のサンプルから反応し始めていれば、先に反応した側から通過方向を決める
+- 検知後は ALERT になり、alertStartTime から alertDuration 経過したサンプルで MONITORING に戻る
+  （そのサンプルのイベントは使われない）
+- 温度が NaN（JSON では null）または valid=false のサンプルは ERROR_STATE にし errorCount を増やす。
+  ERROR_STATE からは timestamp が 10000 の倍数の有効サンプルでのみ復帰する
+- 時刻はサンプルの timestamp を使う（ファームウェアの millis() とは数ms ずれうる）
+"""
+
+import argparse
+import json
+import math
+import struct
+import time
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from mame_protocol import ALERT, ERROR_STATE, MONITORING, SENSOR_COLUMNS, is_sensor_record, sensor_row
+
+# 検知理由のビット
+REASON_PIR_LEFT = 1    # PIR1 (左側)
+REASON_PIR_RIGHT = 2   # PIR2 (右側)
+REASON_TEMP = 4
+REASON_MOVE = 8
+REASON_DIR_LEFT_RIGHT = 16   # 左の PIR が先に反応した
+REASON_DIR_RIGHT_LEFT = 32
+
+ERROR_RECOVERY_PERIOD = 10000
+FUSION_WINDOW = 8
+FUSION_CONFIRM = 2
+PIR_CONFIRM_HITS = 2
+
+
+def f32(value: float) -> float:
+    """float (32bit) に丸める"""
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+
+def lround(value: float) -> int:
+    """C の lroundf（ちょうど半分は 0 から遠い方へ）"""
+    return int(math.copysign(math.floor(abs(value) + 0.5), value))
+
+
+def fixed_temp_diff(object_temp: float, ambient_temp: float) -> int:
+    """物体温度 - 環境温度（0.01°C 単位。ファームウェアと同じく float で引いてから丸める）"""
+    return lround(f32(f32(f32(object_temp) - f32(ambient_temp)) * 100))
+
+
+def fixed_distance(distance: float) -> int:
+    """距離（0.1cm 単位）"""
+    return lround(f32(f32(distance) * 10))
+
+
+@dataclass
+class DetectorConfig:
+    """SystemConfig のうち検知に関わる設定"""
+    temp_threshold: float = 5.0
+    distance_threshold: float = 10.0
+    detection_threshold: int = 4
+    sampling_interval: int = 200
+    alert_duration: int = 3000
+
+
+@dataclass
+class DetectionEvent:
+    """triggerDetection が呼ばれた1回分"""
+    index: int
+    timestamp: int
+    score: int
+    reasons: int
+
+    def details(self) -> str:
+        """ファームウェアの detectionDetails に相当する要約"""
+        parts = []
+        if self.reasons & (REASON_PIR_LEFT | REASON_PIR_RIGHT):
+            side = {REASON_PIR_LEFT: "LEFT", REASON_PIR_RIGHT: "RIGHT"}.get(
+                self.reasons & (REASON_PIR_LEFT | REASON_PIR_RIGHT), "BOTH")
+            parts.append(f"PIR:{side}")
+        if self.reasons & REASON_DIR_LEFT_RIGHT:
+            parts.append("DIR:L>R")
+        elif self.reasons & REASON_DIR_RIGHT_LEFT:
+            parts.append("DIR:R>L")
+        if self.reasons & REASON_TEMP:
+            parts.append("TEMP")
+        if self.reasons & REASON_MOVE:
+            parts.append("MOVE")
+        return " ".join(parts)
+
+
+@dataclass
+class ReplayResult:
+    events: List[DetectionEvent] = field(default_factory=list)
+    total_detections: int = 0
+    error_count: int = 0
+    state: int = MONITORING
+    samples: int = 0
+
+
+class DetectionFusion:
+    """ファームウェアの DetectionFusion（直近 FUSION_WINDOW サンプルの窓）
+
+    新しい半分・古い半分の合計を1件ごとに差し替えるので、1サンプルあたり O(1)。
+    """
+
+    def __init__(self):
+        self.window = [(0, False, 0, 0)] * FUSION_WINDOW  # (PIR の理由, 距離あり, 距離, 温度差)
+        self.next = 0
+        self.count = 0
+        self.left_hits = 0
+        self.right_hits = 0
+        self.pir_samples = 0
+        self.recent_temp = 0
+        self.older_temp = 0
+        self.recent_distance = 0
+        self.older_distance = 0
+        self.recent_distance_count = 0
+        self.older_distance_count = 0
+        self.sequence = 0
+        self.left_onset = 0
+        self.right_onset = 0
+        self.confirm_count = 0
+
+    def add(self, pir1: bool, pir2: bool, temp_diff: int, distance: Optional[int]) -> None:
+        """addFusionSample（temp_diff は 0.01°C、distance は 0.1cm。距離がなければ None）"""
+        half = FUSION_WINDOW // 2
+        window = self.window
+        if self.count == FUSION_WINDOW:
+            pir, has_distance, old_distance, old_temp = window[self.next]
+            self.left_hits -= bool(pir & REASON_PIR_LEFT)
+            self.right_hits -= bool(pir & REASON_PIR_RIGHT)
+            self.pir_samples -= bool(pir)
+            self.older_temp -= old_temp
+            if has_distance:
+                self.older_distance -= old_distance
+                self.older_distance_count -= 1
+        if self.count >= half:
+            _, has_distance, middle_distance, middle_temp = window[(self.next - half) % FUSION_WINDOW]
+            self.recent_temp -= middle_temp
+            self.older_temp += middle_temp
+            if has_distance:
+                self.recent_distance -= middle_distance
+                self.older_distance += middle_distance
+                self.recent_distance_count -= 1
+                self.older_distance_count += 1
+
+        self.sequence += 1
+        pir = (REASON_PIR_LEFT if pir1 else 0) | (REASON_PIR_RIGHT if pir2 else 0)
+        if pir1:
+            if self.left_hits == 0:
+                self.left_onset = self.sequence
+            self.left_hits += 1
+        if pir2:
+            if self.right_hits == 0:
+                self.right_onset = self.sequence
+            self.right_hits += 1
+        if pir:
+            self.pir_samples += 1
+        self.recent_temp += temp_diff
+        if distance is not None:
+            self.recent_distance += distance
+            self.recent_distance_count += 1
+        window[self.next] = (pir, distance is not None, distance or 0, temp_diff)
+        self.next = (self.next + 1) % FUSION_WINDOW
+        if self.count < FUSION_WINDOW:
+            self.count += 1
+
+    def evaluate(self, config: DetectorConfig):
+        """evaluateFusion のスコアと理由"""
+        recent_count = min(self.count, FUSION_WINDOW // 2)
+        older_count = self.count - recent_count
+        score = 0
+        reasons = 0
+        if self.pir_samples >= PIR_CONFIRM_HITS:
+            score += 3
+            reasons |= (REASON_PIR_LEFT if self.left_hits else 0) | (REASON_PIR_RIGHT if self.right_hits else 0)
+            if self.left_hits and self.right_hits and self.left_onset != self.right_onset:
+                reasons |= REASON_DIR_LEFT_RIGHT if self.left_onset < self.right_onset else REASON_DIR_RIGHT_LEFT
+
+        temp_threshold = lround(f32(f32(config.temp_threshold) * 100))
+        if self.recent_temp > temp_threshold * recent_count:
+            score += 2
+            reasons |= REASON_TEMP
+        elif older_count and (self.recent_temp * older_count - self.older_temp * recent_count
+                              > temp_threshold * recent_count * older_count):
+            score += 1
+            reasons |= REASON_TEMP
+
+        recent_distances = self.recent_distance_count
+        older_distances = self.older_distance_count
+        if recent_distances and older_distances:
+            change = abs(self.recent_distance * older_distances - self.older_distance * recent_distances)
+            if change > lround(f32(f32(config.distance_threshold) * 10)) * recent_distances * older_distances:
+                score += 1
+                reasons |= REASON_MOVE
+        return score, reasons
+
+    def step(self, config: DetectorConfig, pir1: bool, pir2: bool, object_temp: float,
+             ambient_temp: float, distance: float):
+        """processDetection の窓の部分。検知イベントになるサンプルなら (スコア, 理由)、でなければ None"""
+        self.add(pir1, pir2, fixed_temp_diff(object_temp, ambient_temp),
+                 fixed_distance(distance) if f32(distance) > 0 else None)
+        score, reasons = self.evaluate(config)
+        if score < config.detection_threshold:
+            self.confirm_count = 0
+            return None
+        if self.confirm_count < FUSION_CONFIRM:
+            self.confirm_count += 1
+            if self.confirm_count == FUSION_CONFIRM:
+                return score, reasons
+        return None
+
+
+class DetectorStateMachine:
+    """ファームウェアの検知処理を1サンプルずつ再現する"""
+
+    def __init__(self, config: Optional[DetectorConfig] = None, state: int = MONITORING):
+        self.config = config if config is not None else DetectorConfig()
+        self.state = state
+        self.fusion = DetectionFusion()
+        self.alert_start = 0
+        self.total_detections = 0
+        self.error_count = 0
+        self.samples = 0
+
+    def step(self, index: int, timestamp: int, pir1: bool, pir2: bool,
+             object_temp: float, ambient_temp: float, distance: float,
+             valid: bool = True) -> Optional[DetectionEvent]:
+        """loop() の1回分（センサー読み取り後）を処理し、検知があればイベントを返す"""
+        self.samples += 1
+        if not valid or math.isnan(object_temp) or math.isnan(ambient_temp):
+            # readSensors が setErrorState(ERROR_SENSOR_READ) を呼ぶ
+            self.state = ERROR_STATE
+            self.error_count += 1
+            return None
+
+        event = None
+        fired = self.fusion.step(self.config, pir1, pir2, object_temp, ambient_temp, distance)
+        if fired is not None and self.state == MONITORING:
+            self.state = ALERT
+            self.alert_start = timestamp
+            self.total_detections += 1
+            event = DetectionEvent(index, timestamp, *fired)
+        self._update_state(timestamp)
+        return event
+
+    def _update_state(self, timestamp: int) -> None:
+        if self.state == ALERT:
+            if timestamp - self.alert_start >= self.config.alert_duration:
+                self.state = MONITORING
+        elif self.state == ERROR_STATE:
+            if timestamp % ERROR_RECOVERY_PERIOD == 0:
+                # initializeSensors() は成功するものとみなす
+                self.state = MONITORING
+
+    def result(self, events: List[DetectionEvent]) -> ReplayResult:
+        return ReplayResult(events, self.total_detections, self.error_count, self.state, self.samples)
+
+
+def replay_scalar(samples: Dict, config: Optional[DetectorConfig] = None,
+                  state: int = MONITORING) -> ReplayResult:
+    """列の辞書（load_jsonl の戻り値など）を1サンプルずつ再生する"""
+    machine = DetectorStateMachine(config, state)
+    events = []
+    columns = (samples["timestamp"], samples["pir1"], samples["pir2"], samples["object_temp"],
+               samples["ambient_temp"], samples["distance"], samples["valid"])
+    for index, (t, p1, p2, obj, amb, dist, valid) in enumerate(zip(*columns)):
+        event = machine.step(index, int(t), bool(p1), bool(p2), float(obj), float(amb),
+                             float(dist), bool(valid))
+        if event is not None:
+            events.append(event)
+    return machine.result(events)
+
+
+class PreparedSamples:
+    """設定に依存しない配列を前計算したサンプル列（同じデータを何度も再生するとき用）
+
+    窓に入るのは有効なサンプルだけなので、窓の集計は有効なサンプルを詰めた列の上で行う。
+    """
+
+    def __init__(self, samples: Dict):
+        self.t = np.asarray(samples["timestamp"], dtype=np.int64)
+        self.n = len(self.t)
+        pir1 = np.asarray(samples["pir1"], dtype=bool)
+        pir2 = np.asarray(samples["pir2"], dtype=bool)
+        obj = np.asarray(samples["object_temp"], dtype=np.float32)
+        amb = np.asarray(samples["ambient_temp"], dtype=np.float32)
+        dist = np.asarray(samples["distance"], dtype=np.float32)
+        valid = np.asarray(samples["valid"], dtype=bool) & ~np.isnan(obj) & ~np.isnan(amb)
+        self.valid = valid
+
+        # 有効なサンプルだけを詰めた列（position[j] が元の添字）
+        self.position = np.flatnonzero(valid)
+        pir1, pir2 = pir1[self.position], pir2[self.position]
+        temp_diff = _lround((obj[self.position] - amb[self.position]) * np.float32(100))
+        dist = dist[self.position]
+        has_distance = dist > 0
+        distance = np.where(has_distance, _lround(dist * np.float32(10)), 0)
+        m = len(self.position)
+        half = FUSION_WINDOW // 2
+
+        self.left_hits = _window_sum(pir1, FUSION_WINDOW)
+        self.right_hits = _window_sum(pir2, FUSION_WINDOW)
+        self.pir_samples = _window_sum(pir1 | pir2, FUSION_WINDOW)
+        # 窓内の最初の反応（ほかの反応がない窓に入ったサンプル）の通し番号
+        sequence = np.arange(1, m + 1, dtype=np.int64)
+        left_onset = pir1 & (self.left_hits == 1)
+        right_onset = pir2 & (self.right_hits == 1)
+        self.left_onset = np.maximum.accumulate(np.where(left_onset, sequence, 0)) if m else sequence
+        self.right_onset = np.maximum.accumulate(np.where(right_onset, sequence, 0)) if m else sequence
+        self.recent_temp = _window_sum(temp_diff, half)
+        self.older_temp = _window_sum(temp_diff, FUSION_WINDOW) - self.recent_temp
+        self.recent_count = np.minimum(sequence, half)
+        self.older_count = np.minimum(sequence, FUSION_WINDOW) - self.recent_count
+        self.recent_distance = _window_sum(distance, half)
+        self.older_distance = _window_sum(distance, FUSION_WINDOW) - self.recent_distance
+        self.recent_distances = _window_sum(has_distance, half)
+        self.older_distances = _window_sum(has_distance, FUSION_WINDOW) - self.recent_distances
+
+        # 二分探索は Python のリストに対して bisect で行う（numpy のスカラー呼び出しより速い）
+        self.t_list = self.t.tolist()
+        self.invalid_list = np.flatnonzero(~valid).tolist()
+        self.recover_list = np.flatnonzero(valid & (self.t % ERROR_RECOVERY_PERIOD == 0)).tolist()
+
+    def fusion_scores(self, config: DetectorConfig):
+        """有効なサンプルごとの evaluateFusion のスコアと理由"""
+        has_pir = self.pir_samples >= PIR_CONFIRM_HITS
+        score = np.where(has_pir, 3, 0).astype(np.int64)
+        reasons = np.where(has_pir, (self.left_hits > 0) * REASON_PIR_LEFT
+                           + (self.right_hits > 0) * REASON_PIR_RIGHT, 0).astype(np.int64)
+        directed = has_pir & (self.left_hits > 0) & (self.right_hits > 0) & (self.left_onset != self.right_onset)
+        reasons |= np.where(directed, np.where(self.left_onset < self.right_onset,
+                                               REASON_DIR_LEFT_RIGHT, REASON_DIR_RIGHT_LEFT), 0)
+
+        temp_threshold = lround(f32(f32(config.temp_threshold) * 100))
+        level = self.recent_temp > temp_threshold * self.recent_count
+        rising = ~level & (self.older_count > 0) & (
+            self.recent_temp * self.older_count - self.older_temp * self.recent_count
+            > temp_threshold * self.recent_count * self.older_count)
+        score += level * 2 + rising
+        reasons |= (level | rising) * REASON_TEMP
+
+        distance_threshold = lround(f32(f32(config.distance_threshold) * 10))
+        scale = self.recent_distances * self.older_distances
+        change = np.abs(self.recent_distance * self.older_distances - self.older_distance * self.recent_distances)
+        move = (scale > 0) & (change > distance_threshold * scale)
+        score += move
+        reasons |= move * REASON_MOVE
+        return score, reasons
+
+
+def _lround(values):
+    """lroundf の NumPy 版（float32 の値を float64 で丸めるので誤差はない）"""
+    values = values.astype(np.float64)
+    return (np.sign(values) * np.floor(np.abs(values) + 0.5)).astype(np.int64)
+
+
+def _window_sum(values, width: int):
+    """各位置で終わる直近 width 件の合計（先頭は入っている分だけ）"""
+    total = np.concatenate(([0], np.cumsum(values, dtype=np.int64)))
+    end = np.arange(1, len(values) + 1)
+    return total[end] - total[np.maximum(end - width, 0)]
+
+
+def fusion_events(data: PreparedSamples, config: DetectorConfig):
+    """検知イベントになるサンプル（元の添字）と、そのスコア・理由
+
+    閾値以上が FUSION_CONFIRM 回続いたサンプル。状態によらず決まる。
+    """
+    score, reasons = data.fusion_scores(config)
+    above = score >= config.detection_threshold
+    sequence = np.arange(len(above))
+    last_below = np.maximum.accumulate(np.where(above, -1, sequence)) if len(above) else sequence
+    fire = above & (sequence - last_below == FUSION_CONFIRM)
+    return data.position[fire].tolist(), score[fire].tolist(), reasons[fire].tolist()
+
+
+def replay_vectorized(samples, config: Optional[DetectorConfig] = None,
+                      state: int = MONITORING) -> ReplayResult:
+    """replay_scalar と同じ結果を NumPy で求める
+
+    samples は列の辞書か PreparedSamples。timestamp は単調非減少であること
+    （millis() の桁あふれをまたぐログは分割する）。
+    """
+    config = config if config is not None else DetectorConfig()
+    data = samples if isinstance(samples, PreparedSamples) else PreparedSamples(samples)
+    n = data.n
+    fire_list, fire_score, fire_reasons = fusion_events(data, config)
+    invalid_list = data.invalid_list
+    recover_list = data.recover_list
+    t_list = data.t_list
+
+    def next_after(indices, start):
+        pos = bisect_left(indices, start)
+        return indices[pos] if pos < len(indices) else n
+
+    result = ReplayResult(samples=n, state=state)
+    alert_start = 0
+    i = 0
+    while i < n:
+        if state == MONITORING:
+            m = next_after(invalid_list, i)
+            pos = bisect_left(fire_list, i)
+            k = fire_list[pos] if pos < len(fire_list) else n
+            if k < m:
+                result.events.append(DetectionEvent(k, t_list[k], fire_score[pos], fire_reasons[pos]))
+                result.total_detections += 1
+                state = ALERT
+                alert_start = t_list[k]
+                if config.alert_duration <= 0:
+                    state = MONITORING
+                i = k + 1
+                continue
+            if m >= n:
+                break
+            state = ERROR_STATE
+            result.error_count += 1
+            i = m + 1
+        elif state == ALERT:
+            j = max(i, bisect_left(t_list, alert_start + config.alert_duration))
+            m = next_after(invalid_list, i)
+            if m <= j and m < n:
+                state = ERROR_STATE
+                result.error_count += 1
+                i = m + 1
+                continue
+            if j >= n:
+                break
+            state = MONITORING
+            i = j + 1
+        elif state == ERROR_STATE:
+            r = next_after(recover_list, i)
+            result.error_count += bisect_left(invalid_list, min(r, n)) - bisect_left(invalid_list, i)
+            if r >= n:
+                break
+            state = MONITORING
+            i = r + 1
+        else:
+            # STANDBY / CALIBRATING では検知もエラー復帰も行われない（無効サンプルのみ反映）
+            m = next_after(invalid_list, i)
+            if m >= n:
+                break
+            state = ERROR_STATE
+            result.error_count += 1
+            i = m + 1
+
+    result.state = state
+    return result
+
+
+def load_jsonl(paths: Iterable[str]) -> Dict:
+    """printJsonSensorData の JSON Lines を列の辞書として読み込む"""
+    rows = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line.startswith("{"):
+                    continue
+                record = json.loads(line)
+                if is_sensor_record(record):
+                    rows.append(sensor_row(record, 0.0))
+    columns = {}
+    for position, (name, typecode) in enumerate(SENSOR_COLUMNS):
+        dtype = {"d": np.float64, "f": np.float32, "Q": np.int64, "B": np.uint8, "b": np.int8}[typecode]
+        columns[name] = np.array([row[position] for row in rows], dtype=dtype)
+    return columns
+
+
+def synthetic_samples(n: int, seed: int = 0, interval: int = 200, false_trigger_rate: float = 0.0) -> Dict:
+    """再生速度の計測用に、人が時々通る合成データを作る（present は正解ラベル）
+
+    false_trigger_rate: 人がいないのに PIR と物体温度が反応するサンプルの割合
+    （ペットや暖房の風など、誤検知の評価用）
+    """
+    gen = np.random.default_rng(seed)
+    t = np.arange(n, dtype=np.int64) * interval
+    blocks = n // 25 + 1
+    present = np.repeat(gen.random(blocks) < 0.1, 25)[:n]
+    # 人の表面温度は服装などで人ごとに違う
+    person_temp = np.repeat(gen.uniform(3, 12, blocks), 25)[:n] + gen.normal(0, 0.5, n)
+    ambient = (22 + gen.normal(0, 0.05, n)).astype(np.float32)
+    obj = np.where(present, ambient + person_temp, ambient + gen.normal(0.5, 0.3, n)).astype(np.float32)
+    dist = np.where(present, gen.normal(95, 12, n), gen.normal(250, 3, n)).astype(np.float32)
+    dist[gen.random(n) < 0.01] = -1
+    valid = gen.random(n) > 1e-5
+    pir1 = present & (gen.random(n) < 0.8)
+    pir2 = present & (gen.random(n) < 0.8)
+    if false_trigger_rate > 0:
+        false_trigger = ~present & (gen.random(n) < false_trigger_rate)
+        pir1 |= false_trigger & (gen.random(n) < 0.8)
+        pir2 |= false_trigger & (gen.random(n) < 0.8)
+        obj = np.where(false_trigger, ambient + gen.uniform(1, 6, n), obj).astype(np.float32)
+        dist = np.where(false_trigger & (gen.random(n) < 0.5), gen.uniform(30, 250, n), dist).astype(np.float32)
+    return {
+        "timestamp": t,
+        "pir1": pir1,
+        "pir2": pir2,
+        "object_temp": obj,
+        "ambient_temp": ambient,
+        "distance": dist,
+        "valid": valid,
+        "present": present,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="節分検知ロジックのオフライン再生")
+    parser.add_argument("logs", nargs="*", help="printJsonSensorData の JSON Lines ファイル")
+    parser.add_argument("--synthetic", type=int, metavar="N", help="N件の合成データで再生する")
+    parser.add_argument("--temp", type=float, default=5.0, help="温度閾値")
+    parser.add_argument("--distance", type=float, default=10.0, help="距離閾値")
+    parser.add_argument("--score", type=int, default=4, help="検知スコア閾値")
+    parser.add_argument("--alert-duration", type=int, default=3000, help="アラート時間（ms）")
+    parser.add_argument("--scalar", action="store_true", help="1サンプルずつの基準実装で再生する")
+    parser.add_argument("--check", action="store_true", help="基準実装と NumPy 版の結果を突き合わせる")
+    parser.add_argument("--events", action="store_true", help="検知イベントを1行ずつ表示する")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        samples = synthetic_samples(args.synthetic)
+    elif args.logs:
+        samples = load_jsonl(args.logs)
+    else:
+        parser.error("ログファイルか --synthetic を指定してください")
+
+    config = DetectorConfig(args.temp, args.distance, args.score, alert_duration=args.alert_duration)
+    replay = replay_scalar if args.scalar else replay_vectorized
+    start = time.perf_counter()
+    result = replay(samples, config)
+    elapsed = time.perf_counter() - start
+
+    if args.events:
+        for event in result.events:
+            print(f"{event.index}\t{event.timestamp}\tscore={event.score}\t{event.details()}")
+    rate = result.samples / elapsed if elapsed > 0 else float("inf")
+    print(f"{result.samples}サンプル / 検知{result.total_detections}回 / エラー{result.error_count}回 "
+          f"({elapsed:.3f}秒, {rate:,.0f}サンプル/秒)")
+
+    if args.check:
+        other = (replay_vectorized if args.scalar else replay_scalar)(samples, config)
+        same = (other.events == result.events and other.error_count == result.error_count
+                and other.state == result.state)
+        print("基準実装と一致しました" if same else "基準実装と一致しません")
+        if not same:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
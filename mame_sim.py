@@ -0,0 +1,489 @@
+"""
+節分検知システムの模擬デバイス
+
+FakeDetector はファームウェアのシリアルコマンド（空行・status・config・json・bin・dump・set・fp・help）に
+同じ形式で応答する（';' 区切りや set の複数項目など、コマンドの解釈も同じ）。PtyDevice はそれを疑似端末 (pty) に載せ、実機の代わりに
+/dev/pts/N として見せる。TcpDevice は WiFi の TCP コンソールとして tcp://127.0.0.1:N で見せる。ハードウェアなしで取り込み・監視ツールを試すために使う。
+"""
+
+import asyncio
+import json
+import os
+import random
+import re
+import string
+import time
+import tty
+from collections import deque
+from typing import Dict, List, Optional, Tuple, Union
+
+from mame_protocol import (HISTORY_SIZE, MAX_BATCH_SETTINGS, MAX_COMMAND_LENGTH, SETTINGS, STATE_NAMES,
+                           FrameEncoder, find_setting, format_setting, format_setting_range, parse_setting,
+                           setting_in_range)
+from mame_replay import DetectorConfig, DetectorStateMachine
+from mame_stats import SensorStats
+
+FIRMWARE_VERSION = "2.1.0"
+# 実機 (SAMD21, RAM 32KB) で setup() 後に freeMemory() が返す値の目安。
+# 検知・コマンド処理でヒープを使わないので稼働中も変わらない
+FREE_MEMORY = 27648
+
+
+class FakeDetector:
+    """ファームウェアのコマンド応答とセンサー値を模擬する"""
+
+    def __init__(self, seed: Optional[int] = None, clock=time.monotonic):
+        self.rng = random.Random(seed)
+        self.clock = clock
+        self.start_time = clock()
+        # SystemConfig の既定値
+        self.config: Dict = {
+            "temp_threshold": 5.0,
+            "distance_threshold": 10.0,
+            "detection_threshold": 4,
+            "sampling_interval": 200,
+            "alert_duration": 3000,
+            "enable_sound": True,
+            "enable_leds": True,
+            "enable_json": False,
+            "enable_binary": False,
+        }
+        self.machine = DetectorStateMachine(DetectorConfig())
+        self.last_error = 0
+        self.false_positives = 0
+        self.ambient = 22.0 + self.rng.uniform(-2, 2)
+        self.person_until = 0
+        self.stats = SensorStats()
+        self.encoder = FrameEncoder()
+        # dumpHistory と同じ履歴（センサー値, 状態, 検知回数）
+        self.history: deque = deque(maxlen=HISTORY_SIZE)
+        self._samples = 0
+        # ファームウェアの COMMANDS（名前 → (処理, 引数を取るか)）
+        self._commands = {
+            "status": (self._command_status, False),
+            "config": (self._command_config, False),
+            "set": (self._command_set, True),
+            "json": (self._command_json, False),
+            "bin": (self._command_bin, False),
+            "dump": (self._command_dump, True),
+            "fp": (self._command_fp, False),
+            "help": (self._command_help, False),
+            "reset": (self._command_reset, False),
+        }
+
+    @property
+    def state(self) -> int:
+        return self.machine.state
+
+    @property
+    def total_detections(self) -> int:
+        return self.machine.total_detections
+
+    @property
+    def error_count(self) -> int:
+        return self.machine.error_count
+
+    def _sync_config(self) -> None:
+        machine_config = self.machine.config
+        machine_config.temp_threshold = self.config["temp_threshold"]
+        machine_config.distance_threshold = self.config["distance_threshold"]
+        machine_config.detection_threshold = self.config["detection_threshold"]
+        machine_config.sampling_interval = self.config["sampling_interval"]
+        machine_config.alert_duration = self.config["alert_duration"]
+
+    def millis(self) -> int:
+        return int((self.clock() - self.start_time) * 1000)
+
+    def read_sensors(self) -> Dict:
+        """人が時々通りかかる環境のセンサー値を作る"""
+        now = self.millis()
+        if now >= self.person_until and self.rng.random() < 0.02:
+            self.person_until = now + self.rng.randint(1000, 4000)
+        present = now < self.person_until
+        object_temp = (self.ambient + self.rng.uniform(8, 12)) if present else (self.ambient + self.rng.gauss(0.5, 0.3))
+        distance = self.rng.uniform(40, 150) if present else self.rng.gauss(250, 3)
+        return {
+            "timestamp": now,
+            "pir1": present and self.rng.random() < 0.8,
+            "pir2": present and self.rng.random() < 0.8,
+            "object_temp": round(object_temp, 2),
+            "ambient_temp": round(self.ambient + self.rng.gauss(0, 0.05), 2),
+            "distance": round(distance, 2),
+            "valid": True,
+        }
+
+    def sample(self) -> Dict:
+        """1回分のサンプリング（統計・検知・状態更新）を行ってセンサー値を返す"""
+        data = self.read_sensors()
+        self._samples += 1
+        if data["valid"]:
+            self.stats.update(data)
+        self._sync_config()
+        self.machine.step(self._samples, data["timestamp"], data["pir1"], data["pir2"],
+                          data["object_temp"], data["ambient_temp"], data["distance"], data["valid"])
+        self.history.append((data, self.state, self.total_detections))
+        return data
+
+    def sensor_json(self, data: Dict) -> str:
+        record = dict(data)
+        valid = record.pop("valid")
+        record["state"] = STATE_NAMES[self.state]
+        record["detection_count"] = self.total_detections
+        record["valid"] = valid
+        return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+    def frame(self, data: Dict) -> bytes:
+        """writeBinaryFrame と同じバイナリフレーム"""
+        return self.encoder.encode(data, self.state, self.total_detections)
+
+    def dump(self, since: Optional[int] = None) -> List[Union[str, bytes]]:
+        """dumpHistory と同じく、履歴を見出し行・フレーム・終了行で返す"""
+        samples = list(self.history)
+        truncated = False
+        if since is not None:
+            skip = 0
+            while skip < len(samples) and samples[skip][0]["timestamp"] <= since:
+                skip += 1
+            truncated = skip == 0 and len(samples) == HISTORY_SIZE
+            samples = samples[skip:]
+        encoder = FrameEncoder()
+        encoder.sequence = self.encoder.sequence
+        lines: List[Union[str, bytes]] = [f"DUMP {len(samples)} {int(truncated)}"]
+        lines.extend(encoder.encode(data, state, detections) for data, state, detections in samples)
+        self.encoder.sequence = encoder.sequence
+        self.encoder.reset()
+        lines.append("DUMP END")
+        return lines
+
+    def status(self) -> Dict:
+        return {
+            "version": FIRMWARE_VERSION,
+            "uptime": self.millis() // 1000,
+            "state": STATE_NAMES[self.state],
+            "total_detections": self.total_detections,
+            "false_positives": self.false_positives,
+            "error_count": self.error_count,
+            "last_error": self.last_error,
+            "free_memory": FREE_MEMORY,
+            "avg_distance": round(self.stats["distance"].mean, 2),
+            "avg_object_temp": round(self.stats["object_temp"].mean, 2),
+            "stats": self.stats.to_dict(),
+            "timestamp": self.millis(),
+        }
+
+    def handle_line(self, line: str) -> List[Union[str, bytes]]:
+        """1行のコマンドを processCommand と同じく解釈し、出力行（バイナリフレームは bytes）を返す"""
+        cmd = line.split("\0", 1)[0].translate(_ASCII_LOWER).lstrip(" \t")
+        if cmd.startswith("#"):
+            # "#<番号> <コマンド>" は応答の後に "#<番号> END"（番号が読めなければ0）
+            digits = len(cmd) - 1 - len(cmd[1:].lstrip("0123456789"))
+            tag = int(cmd[1:1 + digits]) % 2 ** 32 if digits else 0
+            rest = cmd[1 + digits:]
+            output = self.handle_line(rest) if rest.strip(" \t") else self._debug_info()
+            return output + [f"#{tag} END"]
+        if not cmd:
+            return self._debug_info()
+        # ';' で区切った複数のコマンドを順に実行する（空のコマンドは無視）
+        output: List[Union[str, bytes]] = []
+        for command in cmd.split(";"):
+            output.extend(self._run_command(command))
+        return output
+
+    def _run_command(self, command: str) -> List[Union[str, bytes]]:
+        command = command.strip(" \t")
+        if not command:
+            return []
+        name = command.replace("\t", " ").split(" ", 1)[0]
+        args = command[len(name):].strip(" \t")
+        entry = self._commands.get(name)
+        if entry is None or (args and not entry[1]):
+            return ["不明なコマンド (help で使用法表示)"]
+        return entry[0](args)
+
+    def _debug_info(self) -> List[Union[str, bytes]]:
+        data = self.sample()
+        if self.config["enable_binary"]:
+            return [self.frame(data)]
+        if self.config["enable_json"]:
+            return [self.sensor_json(data)]
+        return [
+            "=== センサー状態 ===",
+            f"PIR1: {'ON' if data['pir1'] else 'OFF'}, PIR2: {'ON' if data['pir2'] else 'OFF'}",
+            f"物体温度: {data['object_temp']:.1f}°C, 環境温度: {data['ambient_temp']:.1f}°C",
+            f"距離: {data['distance']:.1f}cm",
+            f"状態: {STATE_NAMES[self.state]}",
+            f"総検知回数: {self.total_detections}",
+            "==================",
+        ]
+
+    def _command_status(self, args: str) -> List[str]:
+        status = self.status()
+        if self.config["enable_json"]:
+            return [json.dumps(status, ensure_ascii=False, separators=(",", ":"))]
+        return [
+            "=== システム状態 ===",
+            f"バージョン: {status['version']}",
+            f"稼働時間: {status['uptime']}秒",
+            f"状態: {status['state']}",
+            f"総検知回数: {status['total_detections']}",
+            f"誤検知回数: {status['false_positives']}",
+            f"エラー回数: {status['error_count']}",
+            f"最終エラー: {status['last_error']}",
+            f"空きメモリ: {status['free_memory']} bytes",
+            _stats_line("平均距離: ", self.stats["distance"], "cm"),
+            _stats_line("平均物体温度: ", self.stats["object_temp"], "°C"),
+            _stats_line("平均環境温度: ", self.stats["ambient_temp"], "°C"),
+        ]
+
+    def _command_config(self, args: str) -> List[str]:
+        c = self.config
+        return (["=== システム設定 ==="]
+                + [format_setting(setting, c[setting.key]) for setting in SETTINGS]
+                + [f"JSON出力: {'ON' if c['enable_json'] else 'OFF'}",
+                   f"バイナリ出力: {'ON' if c['enable_binary'] else 'OFF'}"])
+
+    def _command_json(self, args: str) -> List[str]:
+        self.config["enable_json"] = not self.config["enable_json"]
+        return [f"JSON出力: {'ON' if self.config['enable_json'] else 'OFF'}"]
+
+    def _command_bin(self, args: str) -> List[str]:
+        self.config["enable_binary"] = not self.config["enable_binary"]
+        self.encoder.reset()
+        return [f"バイナリ出力: {'ON' if self.config['enable_binary'] else 'OFF'}"]
+
+    def _command_dump(self, args: str) -> List[Union[str, bytes]]:
+        if not args:
+            return self.dump(None)
+        # ファームウェアの strtoul と同じく先頭の数字だけを読む（数字がなければ0）
+        match = re.match(r"[+-]?\d+", args)
+        return self.dump(int(match.group()) % 2 ** 32 if match else 0)
+
+    def _command_fp(self, args: str) -> List[str]:
+        if self.false_positives < self.total_detections:
+            self.false_positives += 1
+        return [f"誤検知: {self.false_positives}/{self.total_detections}"]
+
+    def _command_help(self, args: str) -> List[str]:
+        return HELP_LINES
+
+    def _command_reset(self, args: str) -> List[str]:
+        return ["システムリセット..."]
+
+    def _command_set(self, args: str) -> List[str]:
+        """"<項目> <値>" を1組以上。全部の値が正しいときだけまとめて反映する（commandSet と同じ）"""
+        tokens = args.replace("\t", " ").split()
+        changes = []
+        for i in range(0, len(tokens), 2):
+            if len(changes) == MAX_BATCH_SETTINGS:
+                return [f"一度に設定できるのは {MAX_BATCH_SETTINGS} 項目までです"]
+            name = tokens[i]
+            setting = find_setting(name)
+            if setting is None:
+                return [f"不明な項目: {name}"]
+            if i + 1 == len(tokens):
+                return [f"値がありません: {name}"]
+            value = parse_setting(setting, tokens[i + 1])
+            if value is None:
+                return [f"不正な値: {name} {tokens[i + 1]}"]
+            if not setting_in_range(setting, value):
+                return [f"範囲外: {name} ({format_setting_range(setting)})"]
+            changes.append((setting, value))
+        if not changes:
+            return ["使用法: set <項目> <値> [<項目> <値> ...] (help で項目一覧)"]
+        output = []
+        for setting, value in changes:
+            self.config[setting.key] = value
+            output.append(format_setting(setting, value))
+        self._sync_config()
+        return output
+
+
+# printHelp と同じ一覧
+HELP_LINES = [
+    "=== コマンド一覧 ===",
+    "status     - システム状態表示",
+    "config     - 設定表示",
+    "json       - JSON出力切替",
+    "bin        - バイナリフレーム出力切替",
+    "dump [ms]  - 履歴をバイナリフレームで出力 (ms より後のみ)",
+    "reset      - システムリセット",
+    "fp         - 直前の検知を誤検知として記録",
+    "set 項目 値 [項目 値 ...] - 設定変更 (全部の値が正しいときだけ反映)",
+    *(f"  {setting.name} ({format_setting_range(setting)}) - {setting.label}" for setting in SETTINGS),
+    "A; B       - 複数のコマンドを順に実行",
+    "#N コマンド - 実行後に \"#N END\" を出力",
+    "Enter      - デバッグ情報表示",
+]
+
+# tolower と同じく ASCII の英大文字だけを小文字にする
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def split_commands(pending: bytes, data: bytes) -> Tuple[List[bytes], bytes]:
+    """feedCommandBytes と同じく \\r と \\n をそれぞれ行末として行に分ける（空行はセンサー値の要求）
+
+    行は MAX_COMMAND_LENGTH バイトで切り詰める。戻り値は（そろった行, 次に持ち越す途中の行）。
+    """
+    *lines, pending = (pending + data).replace(b"\r", b"\n").split(b"\n")
+    return [line[:MAX_COMMAND_LENGTH] for line in lines], pending[:MAX_COMMAND_LENGTH]
+
+
+def _stats_line(label: str, stats, unit: str) -> str:
+    """ファームウェアの printStreamStats と同じ1行表示"""
+    return (f"{label}{stats.mean:.2f}{unit} (EMA {stats.ema:.2f}, σ {stats.std:.2f}, "
+            f"最小 {stats.minimum:.2f}, 最大 {stats.maximum:.2f}, {stats.total}件)")
+
+
+class PtyDevice:
+    """FakeDetector を疑似端末に載せた模擬デバイス
+
+    stream_hz を指定すると、要求がなくてもその頻度でセンサー値を送り続ける
+    （実機にはない負荷試験用の動作。JSON 出力も最初から有効にする）。
+    バイナリ出力が有効な間は、実機と同じく sampling_interval ごとにフレームを送る。
+    """
+
+    def __init__(self, detector: Optional[FakeDetector] = None, stream_hz: float = 0.0):
+        self.detector = detector if detector is not None else FakeDetector()
+        self.stream_hz = stream_hz
+        self.master_fd: Optional[int] = None
+        self.slave_fd: Optional[int] = None
+        self.path: Optional[str] = None
+        self._pending = b""
+        self._stream_task: Optional[asyncio.Task] = None
+        self.dropped_bytes = 0
+
+    def open(self) -> str:
+        self.master_fd, self.slave_fd = os.openpty()
+        # 行編集やエコーを無効にして実機のシリアルと同じ生のバイト列にする
+        tty.setraw(self.slave_fd)
+        os.set_blocking(self.master_fd, False)
+        self.path = os.ttyname(self.slave_fd)
+        return self.path
+
+    async def start(self) -> str:
+        path = self.open()
+        loop = asyncio.get_running_loop()
+        loop.add_reader(self.master_fd, self._on_readable)
+        if self.stream_hz > 0:
+            self.detector.config["enable_json"] = True
+        self._stream_task = asyncio.create_task(self._stream())
+        return path
+
+    def _write_lines(self, lines: List[Union[str, bytes]]) -> None:
+        if not lines:
+            return
+        data = b"".join(line if isinstance(line, bytes) else line.encode("utf-8") + b"\r\n" for line in lines)
+        try:
+            os.write(self.master_fd, data)
+        except BlockingIOError:
+            # 読み手がいない・遅い場合は実機と同様に取りこぼす
+            self.dropped_bytes += len(data)
+        except OSError:
+            self.dropped_bytes += len(data)
+
+    def _on_readable(self) -> None:
+        try:
+            data = os.read(self.master_fd, 4096)
+        except (BlockingIOError, OSError):
+            return
+        lines, self._pending = split_commands(self._pending, data)
+        for line in lines:
+            self._write_lines(self.detector.handle_line(line.decode("utf-8", "replace")))
+
+    async def _stream(self) -> None:
+        detector = self.detector
+        while True:
+            if self.stream_hz > 0:
+                await asyncio.sleep(1.0 / self.stream_hz)
+            else:
+                await asyncio.sleep(detector.config["sampling_interval"] / 1000)
+            binary = detector.config["enable_binary"]
+            if not binary and self.stream_hz <= 0:
+                continue
+            data = detector.sample()
+            self._write_lines([detector.frame(data) if binary else detector.sensor_json(data)])
+
+    def close(self) -> None:
+        if self._stream_task is not None:
+            self._stream_task.cancel()
+        if self.master_fd is not None:
+            try:
+                asyncio.get_running_loop().remove_reader(self.master_fd)
+            except RuntimeError:
+                pass
+            os.close(self.master_fd)
+            self.master_fd = None
+        if self.slave_fd is not None:
+            os.close(self.slave_fd)
+            self.slave_fd = None
+
+
+async def start_fleet(count: int, seed: int = 0, stream_hz: float = 0.0) -> List[PtyDevice]:
+    """count 台の模擬デバイスを起動する"""
+    devices = []
+    for i in range(count):
+        device = PtyDevice(FakeDetector(seed=seed + i), stream_hz=stream_hz)
+        await device.start()
+        devices.append(device)
+    return devices
+
+
+class TcpDevice:
+    """FakeDetector をファームウェアの TCP コンソール（CONSOLE_TCP_PORT）として見せる模擬デバイス"""
+
+    def __init__(self, detector: Optional[FakeDetector] = None, host: str = "127.0.0.1", port: int = 0):
+        self.detector = detector if detector is not None else FakeDetector()
+        self.host = host
+        self.port = port
+        self.address: Optional[str] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: Dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.address = f"tcp://{self.host}:{self.port}"
+        return self.address
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._clients[writer] = asyncio.current_task()
+        pending = b""
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                lines, pending = split_commands(pending, data)
+                output = []
+                for line in lines:
+                    output.extend(self.detector.handle_line(line.decode("utf-8", "replace")))
+                if output:
+                    writer.write(b"".join(item if isinstance(item, bytes) else item.encode("utf-8") + b"\r\n"
+                                          for item in output))
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.pop(writer, None)
+            writer.close()
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for writer in self._clients:
+            writer.close()
+
+    async def wait_closed(self) -> None:
+        """close() の後、接続中のクライアントの処理が終わるのを待つ"""
+        await asyncio.gather(*self._clients.values(), return_exceptions=True)
+
+
+async def start_tcp_fleet(count: int, seed: int = 0) -> List[TcpDevice]:
+    """count 台の模擬デバイスを TCP で起動する"""
+    devices = []
+    for i in range(count):
+        device = TcpDevice(FakeDetector(seed=seed + i))
+        await device.start()
+        devices.append(device)
+    return devices
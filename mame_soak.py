@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+節分検知システムのファームウェアの長時間ソークテスト
+
+mame_host でファームウェアをホスト上にビルドし、仮想時計で何日分も loop() を回す。
+その間、人が通りかかって検知・アラートが起き、シリアルからは status・json・set などの
+コマンドを定期的に送る。仮想時間の一定間隔ごとに空きメモリ（freeMemory() と同じ式）・
+ヒープの使用量・malloc の呼び出し回数を記録し、
+
+- 最初の1区間（起動・キャリブレーション）より後で空きメモリが減っていないこと
+- 同じく、malloc の呼び出し回数が増えていないこと（サンプルごとのヒープ確保がないこと）
+  （new/delete と、実機でヒープを使うライブラリ（NeoPixel のピクセルバッファ）も数える）
+
+を確認する。どちらかを満たさなければ終了コード 1 を返す。
+"""
+
+import argparse
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import List, Optional
+
+import mame_host
+
+# ハーネス（スケッチと同じ翻訳単位に入るのでファームウェアのグローバル変数を参照できる）
+SOAK_HARNESS = r'''
+static const char *soakCommands[] = {
+  "\n", "status\n", "json\n", "\n", "status\n", "json\n", "config\n",
+  "set temp 5.5\n", "set distance 10\n", "set score 4\n", "help\n", "fp\n", "dump\n", "unknown\n",
+};
+static uint64_t soakNextCommand = 0;
+static uint64_t soakCommandInterval = 0;
+static size_t soakCommandIndex = 0;
+
+static void soakEach() {
+  if (soakCommandInterval && hostMicros >= soakNextCommand) {
+    soakNextCommand += soakCommandInterval;
+    hostSerialInput(soakCommands[soakCommandIndex++ % (sizeof(soakCommands) / sizeof(soakCommands[0]))]);
+  }
+}
+
+int main(int argc, char **argv) {
+  double hours = argc > 1 ? atof(argv[1]) : 24;
+  double reportMinutes = argc > 2 ? atof(argv[2]) : 60;
+  double commandSeconds = argc > 3 ? atof(argv[3]) : 5;
+  uint64_t seed = argc > 4 ? strtoull(argv[4], nullptr, 10) : 1;
+  hostBegin(seed);
+  soakCommandInterval = (uint64_t)(commandSeconds * 1e6);
+
+  setup();
+  uint64_t end = (uint64_t)(hours * 3600e6);
+  uint64_t step = (uint64_t)(reportMinutes * 60e6);
+  soakNextCommand = soakCommandInterval;
+  for (uint64_t next = step; next <= end; next += step) {
+    hostRunUntil(next, soakEach);
+    fprintf(stdout, "%llu %ld %zu %zu %llu %llu %lu %llu\n",
+            (unsigned long long)(hostMicros / 1000), hostFreeMemory(), (size_t)(sbrk(0) - (hostStackBase - HOST_HEAP_SIZE)),
+            hostHeapInUse, (unsigned long long)hostAllocations, (unsigned long long)hostWorld.samples,
+            (unsigned long)stats.totalDetections, (unsigned long long)hostHeapFailures);
+    fflush(stdout);
+  }
+  return 0;
+}
+'''
+
+
+@dataclass
+class SoakPoint:
+    """1区間の終わりの計測値"""
+    millis: int
+    free_memory: int
+    heap_top: int
+    heap_in_use: int
+    allocations: int
+    samples: int
+    detections: int
+    heap_failures: int
+
+
+def default_report_minutes(hours: float) -> float:
+    """計測間隔の既定値（1時間ごと。短い実行でも check に必要な2区間は取れるようにする）"""
+    return min(60.0, hours * 60 / 2)
+
+
+def run_soak(hours: float, report_minutes: Optional[float] = None, command_seconds: float = 5, seed: int = 1,
+             source: str = None, timeout: float = None) -> List[SoakPoint]:
+    if report_minutes is None:
+        report_minutes = default_report_minutes(hours)
+    binary = mame_host.build(SOAK_HARNESS, source=source)
+    result = mame_host.run(binary, [str(hours), str(report_minutes), str(command_seconds), str(seed)],
+                           timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError(f"ファームウェアが異常終了しました ({result.returncode}): {result.stderr.strip()}")
+    return [SoakPoint(*(int(value) for value in line.split())) for line in result.stdout.splitlines()]
+
+
+def check(points: List[SoakPoint], tolerance: int = 0) -> List[str]:
+    """空きメモリとヒープ確保の問題点を返す（空なら合格）"""
+    if len(points) < 2:
+        return ["区間が2つ以上必要です（--hours を長くするか --report-minutes を短くしてください）"]
+    problems = []
+    baseline = points[0]
+    lowest = min(points[1:], key=lambda p: p.free_memory)
+    if lowest.free_memory < baseline.free_memory - tolerance:
+        problems.append(f"空きメモリが減少: {baseline.free_memory} → {lowest.free_memory} bytes "
+                        f"({lowest.millis / 3_600_000:.1f}時間目)")
+    allocations = points[-1].allocations - baseline.allocations
+    if allocations:
+        problems.append(f"起動後に malloc が{allocations}回呼ばれました")
+    if points[-1].heap_failures:
+        problems.append(f"malloc が{points[-1].heap_failures}回失敗しました（ヒープ不足）")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ファームウェアの長時間ソークテスト（ホスト上の仮想時計で実行）")
+    parser.add_argument("--hours", type=float, default=24, help="仮想時間での実行時間")
+    parser.add_argument("--report-minutes", type=float,
+                        help="計測間隔（仮想時間の分。省略時は60分、--hours が2時間未満ならその半分）")
+    parser.add_argument("--command-seconds", type=float, default=5, help="シリアルコマンドを送る間隔（0 で送らない）")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--firmware", help="検査するスケッチ（省略時は mame.py）")
+    parser.add_argument("--tolerance", type=int, default=0, help="許容する空きメモリの減少（bytes）")
+    args = parser.parse_args()
+
+    source = None
+    if args.firmware:
+        with open(args.firmware, encoding="utf-8") as f:
+            source = f.read()
+    try:
+        points = run_soak(args.hours, args.report_minutes, args.command_seconds, args.seed, source)
+    except (RuntimeError, subprocess.TimeoutExpired) as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+
+    print("時間   空きメモリ  ヒープ末尾  使用中  malloc回数  サンプル数  検知回数")
+    for p in points:
+        print(f"{p.millis / 3_600_000:5.1f}  {p.free_memory:10d}  {p.heap_top:10d}  {p.heap_in_use:6d}  "
+              f"{p.allocations:10d}  {p.samples:10d}  {p.detections:8d}")
+    problems = check(points, args.tolerance)
+    if problems:
+        for problem in problems:
+            print(f"NG: {problem}")
+        sys.exit(1)
+    print("OK: 空きメモリは一定で、起動後のヒープ確保はありません")
+
+
+if __name__ == "__main__":
+    main()
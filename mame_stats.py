@@ -0,0 +1,200 @@
+"""
+センサー値のストリーミング統計
+
+ファームウェアの StreamStats（mame.py の streamStatsAdd）と同じ計算を Python で行う。
+直近 window 件の平均・分散・最小・最大と、指数移動平均・分散をどれも1件あたり O(1)
+（償却）で更新し、メモリは window 件分のリングバッファに固定される。
+
+ホスト側では FakeDetector の status と、取り込んだセンサー値の監視に使う。
+"""
+
+import math
+from collections import deque
+from typing import Dict, Optional
+
+DEFAULT_WINDOW = 32
+DEFAULT_ALPHA = 0.1
+
+# status の stats に出すセンサーと、センサー値 JSON の対応
+STAT_SENSORS = ("distance", "object_temp", "ambient_temp")
+
+
+class StreamingStats:
+    """1系統分の窓統計と指数移動統計"""
+
+    __slots__ = ("window", "alpha", "_values", "_min", "_max", "_sequence",
+                 "total", "mean", "_m2", "ema", "ema_variance")
+
+    def __init__(self, window: int = DEFAULT_WINDOW, alpha: float = DEFAULT_ALPHA):
+        self.window = window
+        self.alpha = alpha
+        self._values = [0.0] * window
+        # 単調キュー（通し番号）。_min は値の昇順、_max は降順
+        self._min: deque = deque()
+        self._max: deque = deque()
+        self._sequence = 0
+        self.total = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.ema = 0.0
+        self.ema_variance = 0.0
+
+    @property
+    def count(self) -> int:
+        """窓内の件数"""
+        return min(self.total, self.window)
+
+    def add(self, value: float) -> None:
+        window = self.window
+        slot = self._sequence % window
+        values = self._values
+
+        if self.total < window:
+            delta = value - self.mean
+            self.mean += delta / (self.total + 1)
+            self._m2 += delta * (value - self.mean)
+        else:
+            old = values[slot]
+            old_mean = self.mean
+            self.mean += (value - old) / window
+            self._m2 += (value - old) * (value - self.mean + old - old_mean)
+        values[slot] = value
+
+        # 窓を1周するごとに丸め誤差の蓄積をリセットする
+        if slot == window - 1 and self.total >= window - 1:
+            self.mean = math.fsum(values) / window
+            self._m2 = math.fsum((v - self.mean) ** 2 for v in values)
+
+        # 窓から外れた先頭を捨て、新しい値に劣る末尾の候補を捨てる
+        expired = self._sequence - window
+        lows, highs = self._min, self._max
+        if lows and lows[0] == expired:
+            lows.popleft()
+        while lows and values[lows[-1] % window] >= value:
+            lows.pop()
+        lows.append(self._sequence)
+        if highs and highs[0] == expired:
+            highs.popleft()
+        while highs and values[highs[-1] % window] <= value:
+            highs.pop()
+        highs.append(self._sequence)
+
+        if self.total == 0:
+            self.ema = value
+            self.ema_variance = 0.0
+        else:
+            diff = value - self.ema
+            increment = self.alpha * diff
+            self.ema += increment
+            self.ema_variance = (1 - self.alpha) * (self.ema_variance + diff * increment)
+
+        self._sequence += 1
+        self.total += 1
+
+    @property
+    def variance(self) -> float:
+        """窓内の不偏分散"""
+        count = self.count
+        return max(self._m2, 0.0) / (count - 1) if count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    @property
+    def minimum(self) -> float:
+        return self._values[self._min[0] % self.window] if self._min else math.nan
+
+    @property
+    def maximum(self) -> float:
+        return self._values[self._max[0] % self.window] if self._max else math.nan
+
+    def to_dict(self) -> Dict[str, Optional[float]]:
+        """printJsonStatus の stats.<センサー> と同じ形式（NaN は ArduinoJson と同じく None）"""
+        return {
+            "mean": self.mean,
+            "std": self.std,
+            "min": None if math.isnan(self.minimum) else self.minimum,
+            "max": None if math.isnan(self.maximum) else self.maximum,
+            "ema": self.ema,
+            "ema_std": math.sqrt(self.ema_variance),
+            "count": self.total,
+        }
+
+
+class RunningMedian:
+    """直近 size 件の中央値（ファームウェアの addDistanceSample / distanceMedian と同じ）
+
+    到着順のリングバッファと昇順の配列を持ち、1件ごとに一番古い値を昇順の配列から抜いて
+    新しい値を挿入する（並べ直しはしない）。エコーなしの -1 もそのまま入れるので、
+    過半数がエコーなしなら中央値も -1 になる。
+    """
+
+    __slots__ = ("size", "_window", "_sorted", "_next")
+
+    def __init__(self, size: int = 5):
+        self.size = size
+        self._window = [0.0] * size
+        self._sorted: list = []
+        self._next = 0
+
+    def __len__(self) -> int:
+        return len(self._sorted)
+
+    def add(self, value: float) -> None:
+        ordered = self._sorted
+        if len(ordered) == self.size:
+            ordered.remove(self._window[self._next])
+        i = len(ordered)
+        ordered.append(value)
+        while i > 0 and ordered[i - 1] > value:
+            ordered[i] = ordered[i - 1]
+            i -= 1
+        ordered[i] = value
+        self._window[self._next] = value
+        self._next = (self._next + 1) % self.size
+
+    def clear(self) -> None:
+        """件数だけ 0 に戻す（ファームウェアの ranger.count = 0）"""
+        self._sorted.clear()
+
+    @property
+    def median(self) -> float:
+        ordered = self._sorted
+        return ordered[len(ordered) // 2] if ordered else -1.0
+
+
+class SensorStats:
+    """センサーごとの StreamingStats（有効な値だけを数える）"""
+
+    def __init__(self, window: int = DEFAULT_WINDOW, alpha: float = DEFAULT_ALPHA):
+        self.sensors = {name: StreamingStats(window, alpha) for name in STAT_SENSORS}
+
+    def __getitem__(self, name: str) -> StreamingStats:
+        return self.sensors[name]
+
+    def update(self, record: Dict) -> None:
+        """センサー値（printJsonSensorData の形式）を1件反映する"""
+        self.update_values(record.get("distance"), record.get("object_temp"), record.get("ambient_temp"))
+
+    def update_values(self, distance, object_temp, ambient_temp) -> None:
+        """距離（正の値のみ有効）と温度（None・NaN は無効）を反映する"""
+        distance = _number(distance)
+        if distance is not None and distance > 0:
+            self.sensors["distance"].add(distance)
+        object_temp = _number(object_temp)
+        if object_temp is not None:
+            self.sensors["object_temp"].add(object_temp)
+        ambient_temp = _number(ambient_temp)
+        if ambient_temp is not None:
+            self.sensors["ambient_temp"].add(ambient_temp)
+
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        return {name: stats.to_dict() for name, stats in self.sensors.items()}
+
+
+def _number(value) -> Optional[float]:
+    if value is None:
+        return None
+    value = float(value)
+    return None if math.isnan(value) else value
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+節分検知システムのフリート状態 HTTP/JSON サービス
+
+mame_ingest の取り込みと同じ asyncio ループで動き、ダッシュボード向けに全台の状態
+（稼働時間・状態・総検知回数・エラー回数・平均値）を HTTP で返す。
+HTTP の要求はデバイスに一切届かない。デバイスへは取り込みの定期要求（空行と、
+status_interval ごとの `status`）だけが行き、その応答でキャッシュを1件ずつ更新する。
+
+- センサー値: uptime（timestamp）・状態・総検知回数・平均値（IngestService.sensor_stats）
+- printJsonStatus: 上記に加えて誤検知回数・エラー回数・最終エラー・空きメモリ
+
+応答の JSON はキャッシュから ttl 秒ごとに作り直してバイト列のまま持つので、
+要求1件あたりの処理はパスの照合と書き込みだけになる。
+
+    GET /status             全台の集計（summary）とデバイスごとの状態（devices）
+    GET /status/summary     集計だけ
+    GET /devices/<デバイス>  1台分（名前は mame_store.device_dirname の形。/dev/ttyACM0 なら dev_ttyACM0）
+
+別のデバイスが同じ名前になる場合（/dev/ttyACM0 と dev/ttyACM0 など）は、後から来た方に
+_2, _3 ... を付けて区別する。各デバイスの名前は応答の name に入る。
+
+stale_after 秒以上更新のないデバイスは stale とし、集計の reachable・states から外す
+（累計の値は最後に受け取ったものを足す）。
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from mame_ingest import DEFAULT_BAUD, DEFAULT_POLL_INTERVAL, IngestService
+from mame_protocol import SENSOR_COLUMNS, STATE_NAMES
+from mame_stats import STAT_SENSORS, SensorStats
+from mame_store import ColumnarStore, device_dirname
+
+logger = logging.getLogger("mame_status")
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_TTL = 1.0
+DEFAULT_STALE_AFTER = 30.0
+DEFAULT_STATUS_INTERVAL = 10.0
+MAX_REQUEST_HEAD = 8192
+
+_COLUMN_INDEX = {name: i for i, (name, _) in enumerate(SENSOR_COLUMNS)}
+
+
+@dataclass
+class DeviceStatus:
+    """1台分のキャッシュ（センサー値と printJsonStatus で少しずつ更新する）"""
+    device: str
+    name: str                     # /devices/<name> の名前（全台で一意）
+    uptime: int = 0
+    state: Optional[str] = None
+    total_detections: int = 0
+    false_positives: int = 0
+    error_count: int = 0
+    last_error: int = 0           # ErrorCode
+    free_memory: Optional[int] = None
+    avg_distance: Optional[float] = None
+    avg_object_temp: Optional[float] = None
+    avg_ambient_temp: Optional[float] = None
+    version: Optional[str] = None
+    updated: float = 0.0          # 最後に更新した時刻（clock の値）
+    status_updated: float = math.nan
+
+    def to_dict(self, now: float, stale_after: float) -> Dict:
+        age = now - self.updated
+        return {
+            "device": self.device,
+            "name": self.name,
+            "version": self.version,
+            "uptime": self.uptime,
+            "state": self.state,
+            "total_detections": self.total_detections,
+            "false_positives": self.false_positives,
+            "error_count": self.error_count,
+            "last_error": self.last_error,
+            "free_memory": self.free_memory,
+            "avg_distance": self.avg_distance,
+            "avg_object_temp": self.avg_object_temp,
+            "avg_ambient_temp": self.avg_ambient_temp,
+            "age": round(age, 3),
+            "status_age": None if math.isnan(self.status_updated) else round(now - self.status_updated, 3),
+            "stale": age >= stale_after,
+        }
+
+
+def _mean(values: List[float]) -> Optional[float]:
+    return sum(values) / len(values) if values else None
+
+
+def _stat_mean(stats: Optional[SensorStats], name: str) -> Optional[float]:
+    if stats is None or stats[name].count == 0:
+        return None
+    return stats[name].mean
+
+
+class FleetStatusCache:
+    """全台の状態のキャッシュと、ttl 秒ごとに作り直す応答の JSON"""
+
+    def __init__(self, ttl: float = DEFAULT_TTL, stale_after: float = DEFAULT_STALE_AFTER,
+                 sensor_stats: Optional[Dict[str, SensorStats]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        # sensor_stats: IngestService.sensor_stats（平均値はこれの窓平均を使う）
+        self.ttl = ttl
+        self.stale_after = stale_after
+        self.sensor_stats = sensor_stats if sensor_stats is not None else {}
+        self.clock = clock
+        self.devices: Dict[str, DeviceStatus] = {}
+        self.updates = 0
+        self.rebuilds = 0
+        self._started = clock()
+        self._built = -math.inf
+        self._bodies: Dict[str, bytes] = {}
+        self._device_bodies: Dict[str, bytes] = {}
+
+    def _entry(self, device: str) -> DeviceStatus:
+        entry = self.devices.get(device)
+        if entry is None:
+            entry = self.devices[device] = DeviceStatus(device, self._unique_name(device))
+        return entry
+
+    def _unique_name(self, device: str) -> str:
+        base = device_dirname(device)
+        taken = {entry.name for entry in self.devices.values()}
+        name, suffix = base, 2
+        while name in taken:
+            name = f"{base}_{suffix}"
+            suffix += 1
+        if name != base:
+            logger.warning(f"{device}: {base} は別のデバイスが使っているので /devices/{name} で返します")
+        return name
+
+    def on_sensor(self, device: str, row: tuple) -> None:
+        """センサー値を1件反映する（IngestService の on_sensor）"""
+        entry = self._entry(device)
+        entry.uptime = row[_COLUMN_INDEX["timestamp"]] // 1000
+        state = row[_COLUMN_INDEX["state"]]
+        if 0 <= state < len(STATE_NAMES):
+            entry.state = STATE_NAMES[state]
+        entry.total_detections = row[_COLUMN_INDEX["detection_count"]]
+        entry.updated = self.clock()
+        self.updates += 1
+
+    def on_status(self, device: str, record: Dict) -> None:
+        """printJsonStatus を1件反映する（IngestService の on_status）"""
+        entry = self._entry(device)
+        entry.version = record.get("version", entry.version)
+        entry.uptime = int(record.get("uptime", entry.uptime))
+        entry.state = record.get("state", entry.state)
+        entry.total_detections = int(record.get("total_detections", entry.total_detections))
+        entry.false_positives = int(record.get("false_positives", entry.false_positives))
+        entry.error_count = int(record.get("error_count", entry.error_count))
+        entry.last_error = record.get("last_error", entry.last_error)
+        entry.free_memory = record.get("free_memory", entry.free_memory)
+        entry.avg_distance = record.get("avg_distance", entry.avg_distance)
+        entry.avg_object_temp = record.get("avg_object_temp", entry.avg_object_temp)
+        ambient = record.get("stats", {}).get("ambient_temp")
+        if ambient and ambient.get("count"):
+            entry.avg_ambient_temp = ambient.get("mean")
+        entry.updated = entry.status_updated = self.clock()
+        self.updates += 1
+
+    def _refresh_averages(self, entry: DeviceStatus) -> None:
+        # センサー値を取り込んでいれば status より新しい窓平均で置き換える
+        stats = self.sensor_stats.get(entry.device)
+        for name in STAT_SENSORS:
+            value = _stat_mean(stats, name)
+            if value is not None:
+                setattr(entry, f"avg_{name}", value)
+
+    def snapshot(self) -> Dict:
+        """集計とデバイスごとの状態（キャッシュを使わずに作る）"""
+        now = self.clock()
+        devices = {}
+        for entry in self.devices.values():
+            self._refresh_averages(entry)
+            devices[entry.name] = entry.to_dict(now, self.stale_after)
+        fresh = [d for d in devices.values() if not d["stale"]]
+        free_memory = [d["free_memory"] for d in devices.values() if d["free_memory"] is not None]
+        summary = {
+            "devices": len(devices),
+            "reachable": len(fresh),
+            "states": dict(Counter(d["state"] for d in fresh)),
+            "total_detections": sum(d["total_detections"] for d in devices.values()),
+            "false_positives": sum(d["false_positives"] for d in devices.values()),
+            "error_count": sum(d["error_count"] for d in devices.values()),
+            "min_uptime": min((d["uptime"] for d in fresh), default=None),
+            "min_free_memory": min(free_memory) if free_memory else None,
+        }
+        for name in STAT_SENSORS:
+            summary[f"avg_{name}"] = _mean([d[f"avg_{name}"] for d in fresh if d[f"avg_{name}"] is not None])
+        summary["generated_at"] = time.time()
+        summary["service_uptime"] = round(now - self._started, 3)
+        return {"summary": summary, "devices": devices}
+
+    def _rebuild(self) -> None:
+        snapshot = self.snapshot()
+        self._bodies = {"": _encode(snapshot), "summary": _encode(snapshot["summary"])}
+        self._device_bodies = {name: _encode(device) for name, device in snapshot["devices"].items()}
+        self._built = self.clock()
+        self.rebuilds += 1
+
+    def _fresh(self) -> None:
+        if self.clock() - self._built >= self.ttl:
+            self._rebuild()
+
+    def body(self, name: str = "") -> Optional[bytes]:
+        """全台の応答の JSON（"" は全体、"summary" は集計）。なければ None"""
+        self._fresh()
+        return self._bodies.get(name)
+
+    def device_body(self, name: str) -> Optional[bytes]:
+        """1台分の応答の JSON（name は DeviceStatus.name）。なければ None"""
+        self._fresh()
+        return self._device_bodies.get(name)
+
+
+def _encode(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+
+def _response(code: int, body: bytes, keep_alive: bool, max_age: int) -> bytes:
+    headers = [
+        f"HTTP/1.1 {code} {_REASONS[code]}",
+        "Content-Type: application/json; charset=utf-8",
+        f"Content-Length: {len(body)}",
+        f"Cache-Control: max-age={max_age}",
+        "Connection: " + ("keep-alive" if keep_alive else "close"),
+    ]
+    return ("\r\n".join(headers) + "\r\n\r\n").encode("ascii") + body
+
+
+def parse_request(head: bytes) -> Tuple[str, str, bool]:
+    """要求の先頭（空行まで）からメソッド・パス・keep-alive を取り出す"""
+    lines = head.decode("latin-1").split("\r\n")
+    parts = lines[0].split(" ")
+    if len(parts) != 3:
+        raise ValueError(lines[0])
+    method, target, version = parts
+    keep_alive = version == "HTTP/1.1"
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "connection":
+            keep_alive = value.strip().lower() != "close" if keep_alive else value.strip().lower() == "keep-alive"
+    return method, target.split("?", 1)[0], keep_alive
+
+
+class StatusServer:
+    """FleetStatusCache を返す最小限の HTTP/1.1 サーバー（GET のみ・keep-alive 対応）"""
+
+    def __init__(self, cache: FleetStatusCache, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        self.cache = cache
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self._max_age = max(0, int(cache.ttl))
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: Dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return f"http://{self.host}:{self.port}/status"
+
+    def route(self, method: str, path: str) -> Tuple[int, bytes]:
+        if method not in ("GET", "HEAD"):
+            return 405, _encode({"error": "GET のみ対応しています"})
+        path = path.rstrip("/")
+        if path == "/status":
+            body = self.cache.body()
+        elif path == "/status/summary":
+            body = self.cache.body("summary")
+        elif path.startswith("/devices/"):
+            name = path[len("/devices/"):]
+            body = self.cache.device_body(name)
+            if body is None:
+                return 404, _encode({"error": f"不明なデバイス: {name}"})
+        else:
+            body = None
+        if body is None:
+            return 404, _encode({"error": f"不明なパス: {path}"})
+        return 200, body
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._clients[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    writer.write(_response(400, _encode({"error": "要求が長すぎます"}), False, 0))
+                    break
+                if len(head) > MAX_REQUEST_HEAD:
+                    writer.write(_response(400, _encode({"error": "要求が長すぎます"}), False, 0))
+                    break
+                try:
+                    method, path, keep_alive = parse_request(head)
+                except ValueError:
+                    writer.write(_response(400, _encode({"error": "要求を解釈できません"}), False, 0))
+                    break
+                code, body = self.route(method, path)
+                self.requests += 1
+                # 本文を伴う要求（POST など）は読み捨てずに接続を閉じる
+                keep_alive = keep_alive and code != 405
+                response = _response(code, body, keep_alive, self._max_age)
+                if method == "HEAD":
+                    response = response[:len(response) - len(body)]
+                writer.write(response)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.pop(writer, None)
+            writer.close()
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for writer in self._clients:
+            writer.close()
+
+    async def wait_closed(self) -> None:
+        await asyncio.gather(*self._clients.values(), return_exceptions=True)
+
+
+async def bench(host: str, port: int, path: str = "/status/summary", connections: int = 8,
+                requests: int = 20000) -> Dict[str, float]:
+    """keep-alive の接続を connections 本張って合計 requests 件の GET を送る"""
+    request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode("ascii")
+    per_connection = requests // connections
+    errors = 0
+
+    async def client() -> None:
+        nonlocal errors
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for _ in range(per_connection):
+                writer.write(request)
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = int(head.split(b"Content-Length: ", 1)[1].split(b"\r\n", 1)[0])
+                await reader.readexactly(length)
+                if not head.startswith(b"HTTP/1.1 200"):
+                    errors += 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(connections)))
+    elapsed = time.perf_counter() - start
+    total = per_connection * connections
+    return {"requests": total, "errors": errors, "elapsed": elapsed, "rate": total / elapsed}
+
+
+async def run(args) -> int:
+    devices = []
+    paths = list(args.devices)
+    if args.simulate:
+        from mame_sim import start_fleet
+        devices = await start_fleet(args.simulate)
+        paths.extend(device.path for device in devices)
+
+    cache = FleetStatusCache(ttl=args.ttl, stale_after=args.stale_after)
+    service = IngestService(ColumnarStore(args.store), poll_interval=args.poll_interval,
+                            on_status=cache.on_status, on_sensor=cache.on_sensor,
+                            status_interval=args.status_interval, binary=args.binary)
+    cache.sensor_stats = service.sensor_stats
+    server = StatusServer(cache, args.host, args.port)
+    url = await server.start()
+    await service.start(paths, args.baud)
+    logger.info(f"{len(paths)}台の状態を {url} で返します")
+    try:
+        if args.bench:
+            # 全台の status が一度は届くまで待ってから負荷をかける
+            await asyncio.sleep(args.status_interval + 1.0)
+            polled = sum(s.stats.status_records for s in service.sources)
+            result = await bench(args.host, server.port, requests=args.bench, connections=args.bench_connections)
+            polled_after = sum(s.stats.status_records for s in service.sources)
+            summary = json.loads(cache.body("summary"))
+            print(f"{result['requests']}件 {result['elapsed']:.2f}秒 ({result['rate']:.0f}件/秒, エラー{result['errors']}件)")
+            print(f"キャッシュの作り直し {cache.rebuilds}回, 更新 {cache.updates}件, "
+                  f"その間の status 応答 {polled_after - polled}件")
+            print(f"reachable: {summary['reachable']}/{summary['devices']}")
+            return 0 if result["errors"] == 0 and summary["reachable"] == summary["devices"] else 1
+        if args.duration:
+            await asyncio.sleep(args.duration)
+        else:
+            await asyncio.Event().wait()
+    finally:
+        server.close()
+        await server.wait_closed()
+        await service.stop()
+        for device in devices:
+            device.close()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="節分検知システムのフリート状態 HTTP/JSON サービス")
+    parser.add_argument("devices", nargs="*", help="シリアルポートのパス（/dev/ttyACM0 など）")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="待ち受けるアドレス")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="待ち受けるポート（0 なら空きポート）")
+    parser.add_argument("--ttl", type=float, default=DEFAULT_TTL, help="応答の JSON を作り直す間隔（秒）")
+    parser.add_argument("--stale-after", type=float, default=DEFAULT_STALE_AFTER,
+                        help="この秒数更新のないデバイスを stale とする")
+    parser.add_argument("--status-interval", type=float, default=DEFAULT_STATUS_INTERVAL,
+                        help="デバイスに status を要求する間隔（秒）")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="センサー値を要求する間隔（秒）")
+    parser.add_argument("--binary", action="store_true", help="バイナリフレーム出力で取り込む")
+    parser.add_argument("--store", default="mame_data", help="列指向ストアのディレクトリ")
+    parser.add_argument("--baud", type=int, default=DEFAULT_BAUD, help="ボーレート")
+    parser.add_argument("--simulate", type=int, default=0, metavar="N", help="N台の模擬デバイス（pty）を起動する")
+    parser.add_argument("--duration", type=float, help="指定秒数で終了する")
+    parser.add_argument("--bench", type=int, default=0, metavar="N",
+                        help="起動後に N 件の GET を送って1秒あたりの件数を表示し、終了する")
+    parser.add_argument("--bench-connections", type=int, default=8, help="--bench の同時接続数")
+    parser.add_argument("--log-level", default="INFO",
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level, format="%(asctime)s [%(levelname)s] %(message)s")
+    if not args.devices and not args.simulate:
+        parser.error("デバイスのパスか --simulate を指定してください")
+    try:
+        exit_code = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        return
+    raise SystemExit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+"""
+検知器テレメトリのローカル列指向ストア
+
+デバイスごと・日ごと（host_time の UTC 日付）のセグメントに、列ごとの追記専用バイナリファイルを置く。
+  <root>/<device>/<YYYY-MM-DD>/<列名>.col
+各ファイルは SENSOR_COLUMNS の型コードの値をネイティブのバイト順で並べたもの。
+同じセグメントに 1秒・1分・1時間ごとのロールアップ（列ごとの件数・最小・最大・合計）も置く。
+  <root>/<device>/<YYYY-MM-DD>/rollup_<秒>.bin
+ロールアップは ROLLUP_DTYPE のレコードの並びで、追記のたびに最後のバケットだけ書き直す。
+
+読み出しは host_time（ロールアップは time）を np.memmap して二分探索し、範囲の行だけを
+列ごとに読むので、セグメント全体をメモリに読み込むことはない。
+長い期間はロールアップで読む（choose_resolution で点数に見合う粒度を選べる）。
+
+host_time はデバイスごとに単調非減少であること（受信時刻なので普通はそうなる）。
+ホストの時計が戻ったときは、戻った行を直前の host_time に揃えて書く。
+
+以前の形式（<root>/<device>/<列名>.col）のデバイスは、開いたときにこの形式へ移す。
+"""
+
+import argparse
+import logging
+import os
+import re
+import time
+from array import array
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from mame_protocol import SENSOR_COLUMNS
+
+logger = logging.getLogger("mame_store")
+
+_SAFE_NAME = re.compile(r"[^A-Za-z0-9_.-]")
+_SEGMENT_NAME = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+DAY = 86400
+ROLLUP_LEVELS = (1, 60, 3600)
+# ロールアップする列（distance は正の値、そのほかは有限の値だけを数える）
+ROLLUP_FIELDS = ("pir1", "pir2", "object_temp", "ambient_temp", "distance", "detection_count")
+ROLLUP_DTYPE = np.dtype([("time", "<i8")] + [
+    (f"{name}_{stat}", dtype)
+    for name in ROLLUP_FIELDS
+    for stat, dtype in (("count", "<u4"), ("min", "<f4"), ("max", "<f4"), ("sum", "<f8"))
+])
+ROLLUP_STATS = ("min", "max", "mean", "count")
+DEFAULT_MAX_POINTS = 2000
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def device_dirname(device: str) -> str:
+    """デバイス名（/dev/ttyACM0 など）をディレクトリ名に使える形にする"""
+    return _SAFE_NAME.sub("_", device).strip("_") or "device"
+
+
+def segment_name(day: int) -> str:
+    """UNIX 日（host_time // 86400）のセグメント名"""
+    return time.strftime("%Y-%m-%d", time.gmtime(day * DAY))
+
+
+def segment_day(name: str) -> int:
+    return date(int(name[:4]), int(name[5:7]), int(name[8:10])).toordinal() - _EPOCH_ORDINAL
+
+
+def choose_resolution(start: float, end: float, max_points: int = DEFAULT_MAX_POINTS) -> int:
+    """[start, end) をおおむね max_points 点以内で表せる最も細かいロールアップの粒度（秒）"""
+    for resolution in ROLLUP_LEVELS:
+        if (end - start) / resolution <= max_points:
+            return resolution
+    return ROLLUP_LEVELS[-1]
+
+
+class ColumnBatch:
+    """1デバイス分の未書き込みレコードを列ごとに溜めるバッファ"""
+
+    def __init__(self, columns: Tuple[Tuple[str, str], ...] = SENSOR_COLUMNS):
+        self.columns = columns
+        self.data: Dict[str, array] = {name: array(typecode) for name, typecode in columns}
+
+    def __len__(self) -> int:
+        return len(self.data[self.columns[0][0]])
+
+    def append(self, row: Tuple) -> None:
+        for (name, _), value in zip(self.columns, row):
+            self.data[name].append(value)
+
+    def clear(self) -> None:
+        for name, typecode in self.columns:
+            self.data[name] = array(typecode)
+
+
+def rollup(times: np.ndarray, values: Dict[str, np.ndarray], resolution: int) -> np.ndarray:
+    """時刻順の行を resolution 秒ごとのバケットにまとめる（ROLLUP_DTYPE の配列）"""
+    buckets = (times // resolution).astype(np.int64) * resolution
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    out = np.zeros(len(starts), ROLLUP_DTYPE)
+    out["time"] = buckets[starts]
+    for name in ROLLUP_FIELDS:
+        column = values[name].astype(np.float64)
+        ok = np.isfinite(column)
+        if name == "distance":
+            ok &= column > 0
+        count = np.add.reduceat(ok, starts)
+        out[f"{name}_count"] = count
+        out[f"{name}_sum"] = np.add.reduceat(np.where(ok, column, 0.0), starts)
+        with np.errstate(invalid="ignore"):
+            out[f"{name}_min"] = np.where(count > 0, np.minimum.reduceat(np.where(ok, column, np.inf), starts), np.nan)
+            out[f"{name}_max"] = np.where(count > 0, np.maximum.reduceat(np.where(ok, column, -np.inf), starts), np.nan)
+    return out
+
+
+def merge_rollup(a: np.void, b: np.void) -> np.ndarray:
+    """同じバケットの2つのレコードを1つにする"""
+    out = np.zeros(1, ROLLUP_DTYPE)
+    out["time"] = a["time"]
+    for name in ROLLUP_FIELDS:
+        out[f"{name}_count"] = a[f"{name}_count"] + b[f"{name}_count"]
+        out[f"{name}_sum"] = a[f"{name}_sum"] + b[f"{name}_sum"]
+        out[f"{name}_min"] = np.fmin(a[f"{name}_min"], b[f"{name}_min"])
+        out[f"{name}_max"] = np.fmax(a[f"{name}_max"], b[f"{name}_max"])
+    return out
+
+
+def rollup_columns(records: np.ndarray, fields: Iterable[str] = ROLLUP_FIELDS) -> Dict[str, np.ndarray]:
+    """ロールアップのレコードを time と <列>_min/_max/_mean/_count の列にする"""
+    result = {"time": np.array(records["time"])}
+    for name in fields:
+        count = records[f"{name}_count"]
+        result[f"{name}_min"] = np.array(records[f"{name}_min"])
+        result[f"{name}_max"] = np.array(records[f"{name}_max"])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result[f"{name}_mean"] = np.where(count > 0, records[f"{name}_sum"] / count, np.nan)
+        result[f"{name}_count"] = np.array(count)
+    return result
+
+
+def _memmap(path: str, dtype, length: Optional[int] = None) -> np.ndarray:
+    """ファイルを読み取り専用で np.memmap する（空・なしなら長さ 0 の配列）"""
+    dtype = np.dtype(dtype)
+    size = os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+    if length is not None:
+        size = min(size, length)
+    if size == 0:
+        return np.zeros(0, dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(size,))
+
+
+def _read_range(path: str, dtype, begin: int, stop: int) -> np.ndarray:
+    """ファイルの [begin, stop) 番目の値だけを読む"""
+    dtype = np.dtype(dtype)
+    return np.fromfile(path, dtype=dtype, count=stop - begin, offset=begin * dtype.itemsize)
+
+
+def _search(path: str, dtype, length: int, start: Optional[float], end: Optional[float],
+            field: Optional[str] = None) -> Tuple[int, int]:
+    """時刻順のファイルで [start, end) にあたる行の範囲（memmap した上で二分探索）"""
+    if start is None and end is None:
+        return 0, length
+    values = _memmap(path, dtype, length)
+    times = values[field] if field else values
+    begin = 0 if start is None else int(np.searchsorted(times, start, "left"))
+    stop = length if end is None else int(np.searchsorted(times, end, "left"))
+    return begin, stop
+
+
+class ColumnarStore:
+    """デバイス・日ごとのセグメントに列ごとの追記専用ファイルとロールアップを書き込むストア"""
+
+    def __init__(self, root: str, columns: Tuple[Tuple[str, str], ...] = SENSOR_COLUMNS):
+        self.root = root
+        self.columns = columns
+        self.dtypes = {name: np.dtype(typecode) for name, typecode in columns}
+        # デバイスごとの最後の host_time（逆戻りした行を揃えるため）
+        self._last_time: Dict[str, float] = {}
+        os.makedirs(root, exist_ok=True)
+        for device in self.devices():
+            if os.path.exists(os.path.join(root, device, "host_time.col")):
+                self._migrate_legacy(device)
+
+    def _device_path(self, device: str) -> str:
+        return os.path.join(self.root, device_dirname(device))
+
+    def _segment_path(self, device: str, segment: str) -> str:
+        return os.path.join(self._device_path(device), segment)
+
+    def _path(self, device: str, segment: str, column: str) -> str:
+        return os.path.join(self._segment_path(device, segment), f"{column}.col")
+
+    def _rollup_path(self, device: str, segment: str, resolution: int) -> str:
+        return os.path.join(self._segment_path(device, segment), f"rollup_{resolution}.bin")
+
+    # ---- 書き込み ----
+
+    def append(self, device: str, batch: ColumnBatch) -> int:
+        """バッチをまとめて追記し、書き込んだ件数を返す"""
+        count = len(batch)
+        if count == 0:
+            return 0
+        data = {name: np.frombuffer(batch.data[name], dtype=self.dtypes[name]) for name, _ in self.columns}
+        self.append_columns(device, data)
+        return count
+
+    def append_columns(self, device: str, data: Dict[str, np.ndarray]) -> None:
+        """列の配列（長さはすべて同じ）を日ごとのセグメントに分けて追記する"""
+        times = np.asarray(data["host_time"], dtype=np.float64)
+        if len(times) == 0:
+            return
+        last = self._last_time.get(device)
+        if last is None:
+            last = self.last(device, "host_time")
+        floor = -np.inf if last is None else last
+        monotonic = np.maximum.accumulate(np.maximum(times, floor))
+        if not np.array_equal(monotonic, times):
+            logger.warning("%s: host_time が戻った行を %d 件、直前の時刻に揃えました",
+                           device, int(np.count_nonzero(monotonic != times)))
+            data = dict(data, host_time=monotonic)
+            times = monotonic
+        self._last_time[device] = float(times[-1])
+
+        days = (times // DAY).astype(np.int64)
+        bounds = np.flatnonzero(np.concatenate(([True], days[1:] != days[:-1], [True])))
+        for begin, end in zip(bounds[:-1], bounds[1:]):
+            part = {name: np.ascontiguousarray(values[begin:end], dtype=self.dtypes[name])
+                    for name, values in data.items()}
+            self._append_segment(device, segment_name(int(days[begin])), part)
+
+    def _append_segment(self, device: str, segment: str, data: Dict[str, np.ndarray]) -> None:
+        os.makedirs(self._segment_path(device, segment), exist_ok=True)
+        for name, _ in self.columns:
+            with open(self._path(device, segment, name), "ab") as f:
+                data[name].tofile(f)
+        for resolution in ROLLUP_LEVELS:
+            self._append_rollup(self._rollup_path(device, segment, resolution),
+                                rollup(data["host_time"], data, resolution))
+
+    @staticmethod
+    def _append_rollup(path: str, records: np.ndarray) -> None:
+        itemsize = ROLLUP_DTYPE.itemsize
+        size = os.path.getsize(path) // itemsize if os.path.exists(path) else 0
+        with open(path, "r+b" if size else "wb") as f:
+            if size:
+                # 前回の最後のバケットに続く行は、そのレコードに足して書き直す
+                f.seek((size - 1) * itemsize)
+                previous = np.frombuffer(f.read(itemsize), ROLLUP_DTYPE)[0]
+                if previous["time"] == records[0]["time"]:
+                    records = np.concatenate((merge_rollup(previous, records[0]), records[1:]))
+                    f.seek((size - 1) * itemsize)
+                else:
+                    f.seek(size * itemsize)
+            records.tofile(f)
+
+    def _migrate_legacy(self, device: str) -> None:
+        """以前の形式（デバイス直下の <列名>.col）を日ごとのセグメントに移す"""
+        path = os.path.join(self.root, device)
+        legacy = {}
+        for name, typecode in self.columns:
+            values = array(typecode)
+            column_path = os.path.join(path, f"{name}.col")
+            if os.path.exists(column_path):
+                with open(column_path, "rb") as f:
+                    values.frombytes(f.read())
+            legacy[name] = np.frombuffer(values, dtype=self.dtypes[name]) if len(values) else np.zeros(0, self.dtypes[name])
+        length = min(len(values) for values in legacy.values())
+        if length:
+            self.append_columns(device, {name: values[:length] for name, values in legacy.items()})
+        for name, _ in self.columns:
+            column_path = os.path.join(path, f"{name}.col")
+            if os.path.exists(column_path):
+                os.remove(column_path)
+        logger.info("%s: 以前の形式の %d 件を日ごとのセグメントに移しました", device, length)
+
+    # ---- 読み出し ----
+
+    def devices(self) -> List[str]:
+        return sorted(entry for entry in os.listdir(self.root)
+                      if os.path.isdir(os.path.join(self.root, entry)))
+
+    def segments(self, device: str) -> List[str]:
+        """デバイスのセグメント名（日付順）"""
+        path = self._device_path(device)
+        if not os.path.isdir(path):
+            return []
+        return sorted(entry for entry in os.listdir(path) if _SEGMENT_NAME.match(entry))
+
+    def _segments_in(self, device: str, start: Optional[float],
+                     end: Optional[float]) -> List[Tuple[str, Optional[float], Optional[float]]]:
+        """[start, end) にかかるセグメントと、その中で絞り込む範囲（日全体が入るなら None）"""
+        result = []
+        for segment in self.segments(device):
+            day_start = segment_day(segment) * DAY
+            day_end = day_start + DAY
+            if (start is not None and day_end <= start) or (end is not None and day_start >= end):
+                continue
+            result.append((segment,
+                           start if start is not None and start > day_start else None,
+                           end if end is not None and end < day_end else None))
+        return result
+
+    def _segment_length(self, device: str, segment: str) -> int:
+        """セグメントの書き込み済みの件数（最も短い列に揃える）"""
+        sizes = []
+        for name, _ in self.columns:
+            path = self._path(device, segment, name)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            sizes.append(size // self.dtypes[name].itemsize)
+        return min(sizes, default=0)
+
+    def length(self, device: str) -> int:
+        """書き込み済みの件数"""
+        return sum(self._segment_length(device, segment) for segment in self.segments(device))
+
+    def last(self, device: str, column: str):
+        """列の最後の値（書き込みがなければ None）"""
+        for segment in reversed(self.segments(device)):
+            length = self._segment_length(device, segment)
+            if length:
+                values = _memmap(self._path(device, segment, column), self.dtypes[column], length)
+                return values[length - 1].item()
+        return None
+
+    def query(self, device: str, start: Optional[float] = None, end: Optional[float] = None,
+              columns: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """host_time が [start, end) の行を列の配列で返す（省略した側は制限なし）"""
+        names = [name for name, _ in self.columns if columns is None or name in columns]
+        parts: Dict[str, List[np.ndarray]] = {name: [] for name in names}
+        for segment, low, high in self._segments_in(device, start, end):
+            length = self._segment_length(device, segment)
+            begin, stop = _search(self._path(device, segment, "host_time"), self.dtypes["host_time"],
+                                  length, low, high)
+            if begin >= stop:
+                continue
+            for name in names:
+                parts[name].append(_read_range(self._path(device, segment, name), self.dtypes[name], begin, stop))
+        return {name: np.concatenate(chunks) if chunks else np.zeros(0, self.dtypes[name])
+                for name, chunks in parts.items()}
+
+    def read(self, device: str, columns: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """デバイスの列をすべて読み込む（columns 省略時は全列）"""
+        return self.query(device, columns=columns)
+
+    def rollups(self, device: str, start: Optional[float] = None, end: Optional[float] = None,
+                resolution: int = 60) -> np.ndarray:
+        """バケットの開始時刻が [start, end) のロールアップのレコード（ROLLUP_DTYPE）"""
+        if resolution not in ROLLUP_LEVELS:
+            raise ValueError(f"resolution は {ROLLUP_LEVELS} のいずれか: {resolution}")
+        parts = []
+        for segment, low, high in self._segments_in(device, start, end):
+            path = self._rollup_path(device, segment, resolution)
+            length = os.path.getsize(path) // ROLLUP_DTYPE.itemsize if os.path.exists(path) else 0
+            begin, stop = _search(path, ROLLUP_DTYPE, length, low, high, "time")
+            if begin < stop:
+                parts.append(_read_range(path, ROLLUP_DTYPE, begin, stop))
+        return np.concatenate(parts) if parts else np.zeros(0, ROLLUP_DTYPE)
+
+    def downsample(self, device: str, start: float, end: float, resolution: Optional[int] = None,
+                   fields: Iterable[str] = ROLLUP_FIELDS,
+                   max_points: int = DEFAULT_MAX_POINTS) -> Dict[str, np.ndarray]:
+        """[start, end) を time と <列>_min/_max/_mean/_count の列で返す
+
+        resolution を省略すると choose_resolution で粒度を選ぶ。
+        """
+        if resolution is None:
+            resolution = choose_resolution(start, end, max_points)
+        return rollup_columns(self.rollups(device, start, end, resolution), fields)
+
+
+def parse_time(text: str) -> float:
+    """UNIX 秒か ISO 8601（タイムゾーンなしは UTC）"""
+    try:
+        return float(text)
+    except ValueError:
+        moment = datetime.fromisoformat(text)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.timestamp()
+
+
+def synthetic_day(day: int, rate: float, seed: int) -> Dict[str, np.ndarray]:
+    """1日分の合成センサー値（rate Hz。ベンチマーク用）"""
+    gen = np.random.default_rng(seed)
+    n = int(DAY * rate)
+    host_time = day * DAY + np.arange(n) / rate
+    present = np.repeat(gen.random(n // 25 + 1) < 0.1, 25)[:n]
+    ambient = (22 + gen.normal(0, 0.05, n)).astype(np.float32)
+    return {
+        "host_time": host_time,
+        "timestamp": (np.arange(n) * (1000 / rate)).astype(np.uint64),
+        "pir1": (present & (gen.random(n) < 0.8)).astype(np.uint8),
+        "pir2": (present & (gen.random(n) < 0.8)).astype(np.uint8),
+        "object_temp": np.where(present, ambient + 9, ambient + 0.5).astype(np.float32),
+        "ambient_temp": ambient,
+        "distance": np.where(present, gen.normal(95, 12, n), gen.normal(250, 3, n)).astype(np.float32),
+        "state": np.full(n, 2, dtype=np.int8),
+        "detection_count": np.cumsum(np.concatenate(([False], present[1:] & ~present[:-1]))).astype(np.uint64),
+        "valid": np.ones(n, dtype=np.uint8),
+    }
+
+
+def bench(root: str, devices: int, days: int, rate: float) -> None:
+    """合成データを書き込み、期間全体・1時間・1日の範囲クエリの時間を測る"""
+    store = ColumnarStore(root)
+    first_day = int(time.time() // DAY) - days
+    names = [f"device{i:03d}" for i in range(devices)]
+    start = time.perf_counter()
+    rows = 0
+    for index, name in enumerate(names):
+        if store.segments(name):
+            continue
+        for day in range(first_day, first_day + days):
+            data = synthetic_day(day, rate, seed=index * 100003 + day)
+            store.append_columns(name, data)
+            rows += len(data["host_time"])
+    if rows:
+        elapsed = time.perf_counter() - start
+        print(f"書き込み: {rows:,}件 {elapsed:.1f}秒 ({rows / elapsed:,.0f}件/秒)")
+
+    begin, end = first_day * DAY, (first_day + days) * DAY
+    cases = [
+        ("全期間（自動の粒度）", lambda n: store.downsample(n, begin, end)),
+        ("全期間 1分", lambda n: store.downsample(n, begin, end, 60)),
+        ("1日 1秒", lambda n: store.downsample(n, end - DAY, end, 1)),
+        ("1時間 生データ", lambda n: store.query(n, end - 3600, end)),
+    ]
+    for label, run in cases:
+        start = time.perf_counter()
+        points = sum(len(next(iter(run(name).values()))) for name in names)
+        elapsed = time.perf_counter() - start
+        print(f"{label:20s} {devices}台 {points:>12,}行 {elapsed * 1000:8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="検知器テレメトリの列指向ストア")
+    parser.add_argument("--store", default="mame_data", help="ストアのディレクトリ")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("info", help="デバイスごとのセグメント数と件数")
+    query = sub.add_parser("query", help="範囲のロールアップ（--raw で生データ）を表示する")
+    query.add_argument("device")
+    query.add_argument("--start", required=True, help="開始（UNIX 秒か ISO 8601、UTC）")
+    query.add_argument("--end", required=True, help="終了（含まない）")
+    query.add_argument("--resolution", type=int, choices=ROLLUP_LEVELS, help="粒度（秒。省略時は自動）")
+    query.add_argument("--field", action="append", choices=ROLLUP_FIELDS, help="表示する列（複数可）")
+    query.add_argument("--raw", action="store_true", help="ロールアップでなく生データを表示する")
+    benchmark = sub.add_parser("bench", help="合成データでクエリの時間を測る")
+    benchmark.add_argument("--devices", type=int, default=100)
+    benchmark.add_argument("--days", type=int, default=30)
+    benchmark.add_argument("--rate", type=float, default=5.0, help="サンプリングレート（Hz）")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    if args.command == "bench":
+        bench(args.store, args.devices, args.days, args.rate)
+        return
+    store = ColumnarStore(args.store)
+    if args.command == "info":
+        for device in store.devices():
+            segments = store.segments(device)
+            span = f"{segments[0]} 〜 {segments[-1]}" if segments else "-"
+            print(f"{device}\t{len(segments)}日\t{store.length(device)}件\t{span}")
+        return
+
+    start, end = parse_time(args.start), parse_time(args.end)
+    if args.raw:
+        result = store.query(args.device, start, end)
+    else:
+        result = store.downsample(args.device, start, end, args.resolution, args.field or ROLLUP_FIELDS)
+    names = list(result)
+    print("\t".join(names))
+    for row in zip(*(result[name].tolist() for name in names)):
+        print("\t".join(f"{value:.6g}" if isinstance(value, float) else str(value) for value in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+節分検知システムの閾値チューナー
+
+正解ラベル付きの記録データを replay_vectorized で再生し、SystemConfig の
+tempThreshold / distanceThreshold / detectionThreshold / samplingInterval / alertDuration
+の組み合わせを総当たりで評価する。
+
+- 正解ラベルは「人がいた区間」（ファームウェアの timestamp で start,end ms）。
+  区間内（終了後 tolerance ms まで）に1回以上検知すれば検出、区間外の検知は誤検知とする
+- サンプルの列は multiprocessing.shared_memory に1度だけ置き、ワーカープロセスは
+  読み取り専用のビューとして参照する（設定ごとに配列をコピー・pickle しない）
+- samplingInterval は記録より粗い間隔だけ評価できる。timestamp を interval で区切った
+  各区間の最初のサンプルを残して間引く
+- 出力は検出率（最大化）と誤検知数（最小化）のパレート最適な設定
+
+実機では `fp` コマンドで直前の検知を誤検知として記録でき（stats.falsePositives）、
+status の false_positives で現場の誤検知率を確認できる。
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from mame_replay import DetectorConfig, PreparedSamples, load_jsonl, replay_vectorized, synthetic_samples
+
+REPLAY_COLUMNS = ("timestamp", "pir1", "pir2", "object_temp", "ambient_temp", "distance", "valid")
+DEFAULT_TOLERANCE = 1000
+DEFAULT_CHUNK_SIZE = 64
+SYNTHETIC_FALSE_TRIGGER_RATE = 0.01
+
+
+@dataclass
+class TuningResult:
+    """1つの設定の評価結果"""
+    temp_threshold: float
+    distance_threshold: float
+    detection_threshold: int
+    sampling_interval: int
+    alert_duration: int
+    detections: int
+    detected_episodes: int
+    false_positives: int
+    recall: float
+    false_positives_per_hour: float
+    median_latency: float
+
+    def config(self) -> DetectorConfig:
+        return DetectorConfig(self.temp_threshold, self.distance_threshold, self.detection_threshold,
+                              self.sampling_interval, self.alert_duration)
+
+    def commands(self) -> List[str]:
+        """この設定をシリアルで反映するコマンド（1行の set でまとめて変える）"""
+        return [f"set temp {self.temp_threshold:g} distance {self.distance_threshold:g} "
+                f"score {self.detection_threshold} interval {self.sampling_interval} "
+                f"alert {self.alert_duration}"]
+
+
+def episodes_from_mask(timestamps: np.ndarray, present: np.ndarray) -> np.ndarray:
+    """サンプルごとのラベルを (start, end) の区間の配列 (k, 2) にする"""
+    present = np.asarray(present, dtype=bool)
+    edges = np.diff(present.astype(np.int8), prepend=0, append=0)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) - 1
+    return np.stack([timestamps[starts], timestamps[ends]], axis=1).astype(np.int64)
+
+
+def load_episodes(path: str) -> np.ndarray:
+    """start_ms,end_ms の CSV（# 以降はコメント）から区間を読む"""
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            start, end = line.split(",")[:2]
+            rows.append((int(start), int(end)))
+    rows.sort()
+    return np.array(rows, dtype=np.int64).reshape(-1, 2)
+
+
+def decimation_index(timestamps: np.ndarray, interval: int) -> Optional[np.ndarray]:
+    """samplingInterval ごとに1サンプルを残す添字（記録と同じ間隔なら None）"""
+    if len(timestamps) < 2 or interval <= int(np.median(np.diff(timestamps[:1000]))):
+        return None
+    _, index = np.unique(timestamps // interval, return_index=True)
+    return index
+
+
+def score_events(event_times: np.ndarray, episodes: np.ndarray, tolerance: int) -> Tuple[int, int, float]:
+    """検知時刻から (検出した区間数, 誤検知数, 検知遅れの中央値 ms) を求める"""
+    if len(episodes) == 0:
+        return 0, len(event_times), float("nan")
+    starts, ends = episodes[:, 0], episodes[:, 1] + tolerance
+    # 各検知の直前に始まった区間に入っていれば正検知
+    owner = np.searchsorted(starts, event_times, side="right") - 1
+    hit = (owner >= 0) & (event_times <= ends[np.maximum(owner, 0)])
+    false_positives = int(np.count_nonzero(~hit))
+    # 各区間の最初の正検知
+    first = np.searchsorted(event_times[hit], starts, side="left")
+    hit_times = event_times[hit]
+    detected = first < len(hit_times)
+    detected[detected] &= hit_times[first[detected]] <= ends[detected]
+    latency = hit_times[first[detected]] - starts[detected] if detected.any() else np.empty(0)
+    median = float(np.median(latency)) if len(latency) else float("nan")
+    return int(np.count_nonzero(detected)), false_positives, median
+
+
+# ワーカープロセス側の共有データ（_init_worker で設定する）
+_shared: Dict = {}
+
+
+class SharedSamples:
+    """サンプルの列を共有メモリに置く（親プロセスで作成・破棄する）"""
+
+    def __init__(self, samples: Dict):
+        self.segments: List[shared_memory.SharedMemory] = []
+        self.spec: List[Tuple[str, str, str, Tuple[int, ...]]] = []
+        for name in REPLAY_COLUMNS:
+            array = np.ascontiguousarray(samples[name])
+            segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=segment.buf)[...] = array
+            self.segments.append(segment)
+            self.spec.append((name, segment.name, array.dtype.str, array.shape))
+
+    def close(self) -> None:
+        for segment in self.segments:
+            segment.close()
+            segment.unlink()
+        self.segments.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(spec) -> Tuple[Dict[str, np.ndarray], List[shared_memory.SharedMemory]]:
+    """共有メモリの列を読み取り専用の配列として開く"""
+    columns, segments = {}, []
+    for name, segment_name, dtype, shape in spec:
+        segment = shared_memory.SharedMemory(name=segment_name)
+        array = np.ndarray(shape, np.dtype(dtype), buffer=segment.buf)
+        array.flags.writeable = False
+        columns[name] = array
+        segments.append(segment)
+    return columns, segments
+
+
+def _init_worker(spec, episodes: np.ndarray, tolerance: int, duration_hours: float) -> None:
+    columns, segments = attach(spec)
+    _shared.update(columns=columns, segments=segments, episodes=episodes, tolerance=tolerance,
+                   duration_hours=duration_hours, prepared={})
+
+
+def _samples_for(interval: int) -> PreparedSamples:
+    # 間引きと設定に依存しない前計算はサンプリング間隔ごとに1度だけ行う
+    cache = _shared["prepared"]
+    if interval not in cache:
+        columns = _shared["columns"]
+        index = decimation_index(columns["timestamp"], interval)
+        if index is not None:
+            columns = {name: values[index] for name, values in columns.items()}
+        cache[interval] = PreparedSamples(columns)
+    return cache[interval]
+
+
+def evaluate(config: DetectorConfig) -> TuningResult:
+    """共有データに対して1つの設定を評価する（ワーカープロセス内で呼ぶ）"""
+    result = replay_vectorized(_samples_for(config.sampling_interval), config)
+    event_times = np.fromiter((event.timestamp for event in result.events), dtype=np.int64,
+                              count=len(result.events))
+    episodes = _shared["episodes"]
+    detected, false_positives, latency = score_events(event_times, episodes, _shared["tolerance"])
+    hours = _shared["duration_hours"]
+    return TuningResult(
+        config.temp_threshold, config.distance_threshold, config.detection_threshold,
+        config.sampling_interval, config.alert_duration,
+        detections=len(event_times),
+        detected_episodes=detected,
+        false_positives=false_positives,
+        recall=detected / len(episodes) if len(episodes) else float("nan"),
+        false_positives_per_hour=false_positives / hours if hours > 0 else float("nan"),
+        median_latency=latency,
+    )
+
+
+def _evaluate_chunk(configs: List[DetectorConfig]) -> List[TuningResult]:
+    return [evaluate(config) for config in configs]
+
+
+def config_grid(temps: Sequence[float], distances: Sequence[float], scores: Sequence[int],
+                intervals: Sequence[int], durations: Sequence[int]) -> List[DetectorConfig]:
+    return [DetectorConfig(*values) for values in itertools.product(temps, distances, scores,
+                                                                    intervals, durations)]
+
+
+def sweep(samples: Dict, episodes: np.ndarray, configs: List[DetectorConfig], workers: int = 1,
+          tolerance: int = DEFAULT_TOLERANCE, chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[TuningResult]:
+    """全設定を評価する。結果の順序は configs と同じ"""
+    timestamps = np.asarray(samples["timestamp"])
+    duration_hours = (int(timestamps[-1]) - int(timestamps[0])) / 3_600_000 if len(timestamps) else 0.0
+    chunks = [configs[i:i + chunk_size] for i in range(0, len(configs), chunk_size)]
+    with SharedSamples(samples) as shared:
+        init_args = (shared.spec, episodes, tolerance, duration_hours)
+        if workers <= 1:
+            _init_worker(*init_args)
+            try:
+                return [result for chunk in chunks for result in _evaluate_chunk(chunk)]
+            finally:
+                for segment in _shared.pop("segments"):
+                    segment.close()
+                _shared.clear()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=init_args) as pool:
+            return [result for chunk in pool.map(_evaluate_chunk, chunks) for result in chunk]
+
+
+def pareto_front(results: List[TuningResult]) -> List[TuningResult]:
+    """検出率が高く誤検知が少ない方向でパレート最適な結果（誤検知の少ない順）
+
+    同じ (検出率, 誤検知数) の設定が複数あるときは検知遅れの短いものを残す。
+    """
+    def key(r: TuningResult):
+        latency = r.median_latency if r.median_latency == r.median_latency else float("inf")
+        return (r.false_positives, -r.recall, latency)
+
+    front: List[TuningResult] = []
+    best_recall = -1.0
+    for result in sorted(results, key=key):
+        if result.recall > best_recall:
+            front.append(result)
+            best_recall = result.recall
+    return front
+
+
+def parse_values(text: str, kind=float) -> List:
+    """"1,2,3" または "start:stop:step"（stop を含む）を値のリストにする"""
+    if ":" in text:
+        start, stop, step = (float(part) for part in text.split(":"))
+        values = np.arange(start, stop + step / 2, step)
+        return [kind(round(value, 6)) for value in values]
+    return [kind(part) for part in text.split(",")]
+
+
+def write_results(path: str, results: List[TuningResult]) -> None:
+    rows = [asdict(result) for result in results]
+    if path.endswith(".json"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=1)
+        return
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else [])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="検知設定のグリッドサーチ")
+    parser.add_argument("logs", nargs="*", help="printJsonSensorData の JSON Lines ファイル")
+    parser.add_argument("--labels", help="人がいた区間の CSV（start_ms,end_ms）")
+    parser.add_argument("--synthetic", type=int, metavar="N", help="N件のラベル付き合成データを使う")
+    parser.add_argument("--temp", default="2:8:0.5", help="温度閾値（a,b,c または start:stop:step）")
+    parser.add_argument("--distance", default="5:40:5", help="距離閾値")
+    parser.add_argument("--score", default="3:6:1", help="検知スコア閾値")
+    parser.add_argument("--interval", default="200,400,600", help="サンプリング間隔（ms）")
+    parser.add_argument("--alert-duration", default="1000:5000:1000", help="アラート時間（ms）")
+    parser.add_argument("--tolerance", type=int, default=DEFAULT_TOLERANCE,
+                        help="区間終了後も正検知とみなす時間（ms）")
+    parser.add_argument("--workers", type=int, default=1, help="ワーカープロセス数")
+    parser.add_argument("--output", help="全結果の出力先（.csv または .json）")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        samples = synthetic_samples(args.synthetic, false_trigger_rate=SYNTHETIC_FALSE_TRIGGER_RATE)
+        episodes = episodes_from_mask(samples["timestamp"], samples["present"])
+    elif args.logs and args.labels:
+        samples = load_jsonl(args.logs)
+        episodes = load_episodes(args.labels)
+    else:
+        parser.error("ログファイルと --labels、または --synthetic を指定してください")
+
+    configs = config_grid(parse_values(args.temp), parse_values(args.distance),
+                          parse_values(args.score, int), parse_values(args.interval, int),
+                          parse_values(args.alert_duration, int))
+    print(f"{len(samples['timestamp'])}サンプル / 正解区間{len(episodes)}件 / 設定{len(configs)}通り")
+
+    start = time.perf_counter()
+    results = sweep(samples, episodes, configs, workers=args.workers, tolerance=args.tolerance)
+    elapsed = time.perf_counter() - start
+    print(f"評価完了: {elapsed:.1f}秒 ({len(configs) / elapsed:.0f}設定/秒)")
+
+    if args.output:
+        write_results(args.output, results)
+
+    print("=== パレート最適な設定 ===")
+    print("検出率  誤検知  誤検知/時  遅れ(ms)  温度  距離  スコア  間隔  アラート")
+    for r in pareto_front(results):
+        print(f"{r.recall:6.1%}  {r.false_positives:6d}  {r.false_positives_per_hour:9.2f}  "
+              f"{r.median_latency:8.0f}  {r.temp_threshold:4g}  {r.distance_threshold:4g}  "
+              f"{r.detection_threshold:6d}  {r.sampling_interval:4d}  {r.alert_duration:8d}")
+
+
+if __name__ == "__main__":
+    main()
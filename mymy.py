@@ -1,8 +1,89 @@
 #!/usr/bin/env python3
 """
 ソーセージ製造システム - Cron実行対応版
-""
-       
+"""
+
+import argparse
+import logging
+import random
+import sys
+from typing import Optional
+
+from sausage import DeliciousSausageMaker, RealClock, SimulatedClock, iter_batch_parallel
+from sausage_output import DEFAULT_FLUSH_INTERVAL, JsonlResultWriter
+from sausage_profile import StageProfiler
+
+# 終了コード
+EXIT_SUCCESS = 0
+EXIT_ERROR = 1
+EXIT_INTERRUPTED = 130
+
+
+def setup_logging(log_level: str, log_file: Optional[str] = None) -> logging.Logger:
+    """ログ設定を行う"""
+    logger = logging.getLogger("sausage")
+    logger.setLevel(getattr(logging, log_level))
+    logger.handlers.clear()
+
+    handler = logging.FileHandler(log_file, encoding="utf-8") if log_file else logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+    logger.addHandler(handler)
+    return logger
+
+
+def make_sausage(logger: logging.Logger, delay: bool = False,
+                 cooking_method: Optional[str] = None,
+                 random_seed: Optional[int] = None,
+                 batch: int = 1,
+                 workers: Optional[int] = None,
+                 profiler: Optional[StageProfiler] = None,
+                 writer: Optional[JsonlResultWriter] = None) -> bool:
+    """ソーセージを製造し、成功したかどうかを返す
+
+    workers を指定した場合はプロセスプールで並列製造する。乱数はグローバルな
+    random ではなく、シードから導出したチャンクごとの乱数列を使うため、
+    ワーカー数によらず同じ結果になる。
+    結果は1本ずつ集計・出力し、溜め込まないので本数によらずメモリは一定。
+    """
+    count = 0
+    score_sum = 0
+    best = None
+    elapsed = 0.0
+    try:
+        if workers is not None:
+            if random_seed is None:
+                random_seed = random.randrange(2 ** 32)
+            logger.debug(f"マスターシード: {random_seed}, ワーカー数: {workers}")
+            results = iter_batch_parallel(batch, random_seed, workers=workers,
+                                          delay=delay, cooking_method=cooking_method,
+                                          hook=profiler)
+        else:
+            if random_seed is not None:
+                random.seed(random_seed)
+                logger.debug(f"ランダムシード: {random_seed}")
+            clock = RealClock() if delay else SimulatedClock()
+            maker = DeliciousSausageMaker(clock=clock, verbose=False, cooking_method=cooking_method,
+                                          hooks=[profiler] if profiler is not None else None)
+            results = maker.iter_batch(batch)
+
+        for count, result in enumerate(results, 1):
+            score_sum += result.total_score
+            elapsed += result.simulated_seconds
+            if best is None or result.total_score > best.total_score:
+                best = result
+            if writer is not None:
+                writer.write(result, index=count)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"#{count} {result.to_dict()}")
+    except Exception as e:
+        logger.error(f"ソーセージ製造中にエラーが発生しました: {e}")
+        return False
+
+    if best is not None:
+        logger.info(f"{count}本製造完了 平均スコア: {score_sum / count:.1f}点 "
+                    f"最高: {best.total_score}点 {best.grade}")
+    logger.info(f"工程時間（シミュレーション含む）: {elapsed:.0f}秒")
+    return True
 
 
 def main():
@@ -18,6 +99,10 @@ def main():
   %(prog)s --log-file sausage.log   # ファイルにログ出力
   %(prog)s --cooking-method 焼く     # 調理方法を指定
   %(prog)s --random-seed 42         # ランダムシード指定
+  %(prog)s --batch 10000            # 1万本をまとめて製造（遅延なし）
+  %(prog)s --batch 100000 --workers 8  # 8プロセスで並列製造
+  %(prog)s --batch 1000 --profile json # 工程別の計測結果をJSONで出力
+  %(prog)s --batch 100000 --output results.jsonl.gz  # 結果をJSON Linesで逐次出力
         """
     )
     
@@ -52,20 +137,79 @@ def main():
         help="ランダムシード値（再現可能な結果を得るため）"
     )
     
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=1,
+        metavar="N",
+        help="まとめて製造する本数（デフォルト: 1）"
+    )
+    
+    parser.add_argument(
+        "--workers",
+        type=int,
+        metavar="N",
+        help="並列製造のプロセス数（指定するとシード導出による決定的な並列モード）"
+    )
+    
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="text",
+        choices=["text", "json", "prometheus"],
+        help="終了時に工程別の計測結果を出力（形式: text/json/prometheus、デフォルト: text）"
+    )
+    
+    parser.add_argument(
+        "--output",
+        type=str,
+        help="1本ごとの結果を書き出す JSON Lines ファイル（.gz で終わる場合は gzip 圧縮）"
+    )
+    
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="--output を拡張子によらず gzip 圧縮する"
+    )
+    
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=DEFAULT_FLUSH_INTERVAL,
+        help=f"--output を flush する間隔（秒、デフォルト: {DEFAULT_FLUSH_INTERVAL}）"
+    )
+    
     args = parser.parse_args()
     
     # ログ設定
     logger = setup_logging(args.log_level, args.log_file)
+    profiler = StageProfiler() if args.profile else None
+    writer = None
     
     try:
+        if args.output:
+            writer = JsonlResultWriter(args.output, compress=True if args.gzip else None,
+                                       flush_interval=args.flush_interval)
+        
         # ソーセージ製造実行
         result = make_sausage(
             logger=logger,
             delay=args.delay,
             cooking_method=args.cooking_method,
-            random_seed=args.random_seed
+            random_seed=args.random_seed,
+            batch=args.batch,
+            workers=args.workers,
+            profiler=profiler,
+            writer=writer
         )
         
+        if writer is not None:
+            writer.close()
+            logger.info(f"{writer.records_written}件を {args.output} に出力しました")
+        
+        if profiler is not None:
+            print(profiler.export(args.profile))
+        
         if result:
             logger.info("製造処理が正常に完了しました")
             sys.exit(EXIT_SUCCESS)
@@ -79,6 +223,11 @@ def main():
     except Exception as e:
         logger.critical(f"致命的なエラーが発生しました: {str(e)}")
         sys.exit(EXIT_ERROR)
+    finally:
+        # 中断時もバッファ済みの結果は書き出しておく
+        if writer is not None:
+            writer.close()
 
 
-
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,12 @@
+import hashlib
 import random
+import sys
 import time
-from typing import List, Dict
-from dataclasses import dataclass
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import List, Dict, Iterator, Optional
+from dataclasses import dataclass, field
 
 # 時間の遅延を調整するための定数
 PROCESSING_TIME = {
@@ -14,6 +19,85 @@ PROCESSING_TIME = {
     'quality_check': 1,
 }
 
+# 品質グレードの閾値（高い順）
+GRADE_THRESHOLDS = (
+    (80, "🌟 メッチャ旨い！（SSS級）"),
+    (60, "😋 とても美味しい（S級）"),
+    (40, "😊 美味しい（A級）"),
+)
+DEFAULT_GRADE = "🤔 普通（B級）"
+
+MIXING_TECHNIQUES = (
+    "手で優しく混ぜる伝統技法",
+    "スタンドミキサーで均一に混合",
+    "職人の手技による完璧な混合",
+)
+
+CASING_TYPES = ("天然豚腸", "天然羊腸", "コラーゲンケーシング")
+
+
+def grade_for(total_score: int) -> str:
+    """スコアから品質グレードを決定する"""
+    for threshold, grade in GRADE_THRESHOLDS:
+        if total_score >= threshold:
+            return grade
+    return DEFAULT_GRADE
+
+
+class RealClock:
+    """実時間で待機する時計"""
+
+    def __init__(self):
+        self.elapsed = 0.0
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+        self.elapsed += seconds
+
+
+class SimulatedClock:
+    """待機時間を記録するだけで実際には眠らない時計（バッチ製造用）"""
+
+    def __init__(self):
+        self.elapsed = 0.0
+
+    def sleep(self, seconds: float) -> None:
+        self.elapsed += seconds
+
+
+@dataclass
+class SausageResult:
+    """1本分の製造結果"""
+    meat_types: List[str] = field(default_factory=list)
+    spices: List[str] = field(default_factory=list)
+    mixing_technique: str = ""
+    casing: str = ""
+    cooking_method: str = ""
+    cooking_success: bool = True
+    base_score: int = 0
+    spice_score: int = 0
+    cooking_bonus: int = 0
+    total_score: int = 0
+    grade: str = ""
+    simulated_seconds: float = 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "meat_types": self.meat_types,
+            "spices": self.spices,
+            "mixing_technique": self.mixing_technique,
+            "casing": self.casing,
+            "cooking_method": self.cooking_method,
+            "cooking_success": self.cooking_success,
+            "base_score": self.base_score,
+            "spice_score": self.spice_score,
+            "cooking_bonus": self.cooking_bonus,
+            "total_score": self.total_score,
+            "grade": self.grade,
+            "simulated_seconds": self.simulated_seconds,
+        }
+
+
 @dataclass
 class SausageRecipe:
     """ソーセージのレシピを管理するクラス"""
@@ -22,10 +106,101 @@ class SausageRecipe:
     cooking_method: str
     deliciousness_score: int = 0
 
+class CatalogTable(dict):
+    """変更されたら通知する食材テーブル（入れ子の dict も同様に包む）"""
+
+    def __init__(self, data=(), on_change=None):
+        self._on_change = on_change
+        super().__init__()
+        for key, value in dict(data).items():
+            super().__setitem__(key, self._wrap(value))
+
+    def _wrap(self, value):
+        if isinstance(value, dict) and not isinstance(value, CatalogTable):
+            return CatalogTable(value, self._notify)
+        return value
+
+    def _notify(self) -> None:
+        if self._on_change is not None:
+            self._on_change()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, self._wrap(value))
+        self._notify()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._notify()
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            super().__setitem__(key, self._wrap(value))
+        self._notify()
+
+    def __ior__(self, other):
+        # dict.__ior__ は update を経由しないので、ここで包んで通知する
+        self.update(other)
+        return self
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        self._notify()
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+        self._notify()
+        return item
+
+    def clear(self):
+        super().clear()
+        self._notify()
+
+    def __reduce__(self):
+        # 通知先は複製せず、普通の dict として複製・pickle する
+        return (dict, (dict(self),))
+
+
+class IngredientCatalog:
+    """食材テーブルから一度だけ作る索引（キーのタプル・風味値・定数）"""
+
+    def __init__(self, meat_options: Dict, premium_spices: Dict, cooking_methods: Dict):
+        self.meat_keys = tuple(meat_options)
+        self.meat_flavor = {meat: info["flavor"] for meat, info in meat_options.items()}
+        self.essential_spices = tuple(spice for spice, info in premium_spices.items() if info["essential"])
+        self.optional_spices = tuple(spice for spice, info in premium_spices.items() if not info["essential"])
+        self.spice_flavor = {spice: info["flavor"] for spice, info in premium_spices.items()}
+        self.essential_score = sum(self.spice_flavor[spice] for spice in self.essential_spices)
+        self.method_keys = tuple(cooking_methods)
+        self.flavor_bonus = {method: info["flavor_bonus"] for method, info in cooking_methods.items()}
+        self.half_bonus = {method: bonus // 2 for method, bonus in self.flavor_bonus.items()}
+        # 調理の成功率（難易度が高いほど失敗の可能性あり）
+        self.success_rate = {
+            method: max(0.7, 1.0 - (info["difficulty"] / 20))
+            for method, info in cooking_methods.items()
+        }
+
+
 class DeliciousSausageMaker:
     """メッチャ旨いソーセージを作るクラス"""
     
-    def __init__(self):
+    def __init__(self, clock=None, rng=None, verbose: bool = True,
+                 cooking_method: Optional[str] = None, hooks=None):
+        # clock: sleep(秒) を持つ時計。省略時は実時間で待機する
+        # rng: random モジュール互換の乱数源。省略時はグローバルな random を使う
+        # hooks: 工程ごとの計測値を受け取るフック（add_hook を参照）
+        self.clock = clock if clock is not None else RealClock()
+        self.rng = rng if rng is not None else random
+        self.verbose = verbose
+        self.cooking_method = cooking_method
+        self.hooks = list(hooks or [])
+        self._catalog: Optional[IngredientCatalog] = None
+
         self.meat_options = {
             "豚肉": {"flavor": 8, "texture": 7},
             "牛肉": {"flavor": 9, "texture": 8},
@@ -58,117 +233,200 @@ class DeliciousSausageMaker:
             "オーブン焼き": {"difficulty": 5, "flavor_bonus": 8},
         }
 
+    # 食材テーブルは CatalogTable に包み、変更されたら索引を作り直す
+    _TABLES = ("meat_options", "premium_spices", "cooking_methods")
+
+    def _invalidate_catalog(self) -> None:
+        self._catalog = None
+
+    def _set_table(self, name: str, table: Dict) -> None:
+        setattr(self, f"_{name}", CatalogTable(table, self._invalidate_catalog))
+        self._invalidate_catalog()
+
+    @property
+    def meat_options(self) -> Dict:
+        return self._meat_options
+
+    @meat_options.setter
+    def meat_options(self, table: Dict) -> None:
+        self._set_table("meat_options", table)
+
+    @property
+    def premium_spices(self) -> Dict:
+        return self._premium_spices
+
+    @premium_spices.setter
+    def premium_spices(self, table: Dict) -> None:
+        self._set_table("premium_spices", table)
+
+    @property
+    def cooking_methods(self) -> Dict:
+        return self._cooking_methods
+
+    @cooking_methods.setter
+    def cooking_methods(self, table: Dict) -> None:
+        self._set_table("cooking_methods", table)
+
+    def __getstate__(self) -> Dict:
+        # 索引は複製せず、テーブルは普通の dict として複製・pickle する
+        state = self.__dict__.copy()
+        state["_catalog"] = None
+        for name in self._TABLES:
+            state[f"_{name}"] = dict(state[f"_{name}"])
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        # 複製先のテーブルを包み直し、変更が複製先の索引に届くようにする
+        self.__dict__.update(state)
+        for name in self._TABLES:
+            self._set_table(name, state[f"_{name}"])
+
+    @property
+    def catalog(self) -> IngredientCatalog:
+        """食材の索引（テーブルが変更されるまで使い回す）"""
+        if self._catalog is None:
+            self._catalog = IngredientCatalog(self.meat_options, self.premium_spices,
+                                              self.cooking_methods)
+        return self._catalog
+
+    def add_hook(self, hook) -> None:
+        """工程の計測フックを登録する
+
+        フックは on_stage(stage, wall_seconds, cpu_seconds, allocated_blocks, simulated_seconds)
+        を実装する。allocated_blocks は工程前後の sys.getallocatedblocks() の差分、
+        simulated_seconds は時計が進めた待機時間。
+        """
+        self.hooks.append(hook)
+
+    def _measured(self, stage: str, func, *args):
+        """フックが登録されていれば計測しながら工程を実行する"""
+        if not self.hooks:
+            return func(*args)
+        clock_start = self.clock.elapsed
+        blocks_start = sys.getallocatedblocks()
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        value = func(*args)
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        blocks = sys.getallocatedblocks() - blocks_start
+        simulated = self.clock.elapsed - clock_start
+        for hook in self.hooks:
+            hook.on_stage(stage, wall, cpu, blocks, simulated)
+        return value
+
+    def _say(self, message: str) -> None:
+        """verbose 時のみ進捗を表示する"""
+        if self.verbose:
+            print(message)
+
+    def _pick_meats(self) -> List[str]:
+        # ランダムに1-3種類の肉を選択（バランスを考慮）
+        return self.rng.sample(self.catalog.meat_keys, self.rng.randint(1, 3))
+
+    def _pick_optional_spices(self) -> List[str]:
+        # オプショナルスパイスをランダムに3-5種類選ぶ
+        return self.rng.sample(self.catalog.optional_spices, self.rng.randint(3, 5))
+
+    def _pick_spices(self) -> List[str]:
+        # 必須スパイス + オプショナルスパイス
+        return [*self.catalog.essential_spices, *self._pick_optional_spices()]
+
+    def _pick_cooking(self) -> tuple[str, bool]:
+        catalog = self.catalog
+        if self.cooking_method is not None:
+            method = self.cooking_method
+        else:
+            method = self.rng.choice(catalog.method_keys)
+        return method, self.rng.random() < catalog.success_rate[method]
+
+    def _cooking_bonus(self, method: str, cooking_success: bool) -> int:
+        catalog = self.catalog
+        return catalog.flavor_bonus[method] if cooking_success else catalog.half_bonus[method]
+
     def select_premium_meat(self) -> List[str]:
         """プレミアムな肉を選択する"""
-        print("🥩 最高級の肉を選んでいます...")
-        time.sleep(PROCESSING_TIME['select_meat'])
+        self._say("🥩 最高級の肉を選んでいます...")
+        self.clock.sleep(PROCESSING_TIME['select_meat'])
         
-        # ランダムに1-3種類の肉を選択（バランスを考慮）
-        selected_meats = random.sample(list(self.meat_options.keys()), 
-                                     random.randint(1, 3))
+        selected_meats = self._pick_meats()
         
-        print(f"選択された肉: {', '.join(selected_meats)}")
+        self._say(f"選択された肉: {', '.join(selected_meats)}")
         return selected_meats
 
     def grind_meat(self, meat_types: List[str]) -> str:
         """肉をミンチにする処理（改良版）"""
-        print("🔪 肉を最適な粒度でミンチにしています...")
-        time.sleep(PROCESSING_TIME['grind'])
+        self._say("🔪 肉を最適な粒度でミンチにしています...")
+        self.clock.sleep(PROCESSING_TIME['grind'])
         
         # 肉の種類による風味計算
         total_flavor = sum(self.meat_options[meat]["flavor"] for meat in meat_types)
         total_texture = sum(self.meat_options[meat]["texture"] for meat in meat_types)
         
-        print(f"ミンチ完了！風味レベル: {total_flavor}, 食感レベル: {total_texture}")
+        self._say(f"ミンチ完了！風味レベル: {total_flavor}, 食感レベル: {total_texture}")
         return f"プレミアムミンチ肉（{'+'.join(meat_types)}）"
 
     def add_premium_spices(self, minced_meat: str) -> tuple[str, int]:
         """プレミアムスパイスを追加する処理"""
-        print("🌿 秘伝のスパイスブレンドを準備しています...")
-        time.sleep(PROCESSING_TIME['add_spices'])
+        self._say("🌿 秘伝のスパイスブレンドを準備しています...")
+        self.clock.sleep(PROCESSING_TIME['add_spices'])
         
-        # 必須スパイスを追加
-        selected_spices = [spice for spice, info in self.premium_spices.items() 
-                          if info["essential"]]
-        
-        # オプショナルスパイスをランダムに3-5種類追加
-        optional_spices = [spice for spice, info in self.premium_spices.items() 
-                          if not info["essential"]]
-        selected_spices.extend(random.sample(optional_spices, random.randint(3, 5)))
+        selected_spices = self._pick_spices()
         
         # スパイスの風味スコア計算
         spice_score = sum(self.premium_spices[spice]["flavor"] for spice in selected_spices)
         
-        print(f"追加されたスパイス: {', '.join(selected_spices)}")
-        print(f"スパイス風味スコア: {spice_score}")
+        self._say(f"追加されたスパイス: {', '.join(selected_spices)}")
+        self._say(f"スパイス風味スコア: {spice_score}")
         
         return f"スパイス入り{minced_meat}", spice_score
 
     def mix_ingredients(self, seasoned_meat: str) -> str:
         """調味料を加えた肉をよく混ぜる処理（改良版）"""
-        print("🥄 プロの技術で完璧に混ぜています...")
-        time.sleep(PROCESSING_TIME['mix'])
-        
-        mixing_techniques = [
-            "手で優しく混ぜる伝統技法",
-            "スタンドミキサーで均一に混合",
-            "職人の手技による完璧な混合"
-        ]
+        self._say("🥄 プロの技術で完璧に混ぜています...")
+        self.clock.sleep(PROCESSING_TIME['mix'])
         
-        technique = random.choice(mixing_techniques)
-        print(f"使用技法: {technique}")
+        technique = self.rng.choice(MIXING_TECHNIQUES)
+        self._say(f"使用技法: {technique}")
         
         return f"完璧に混ぜられた{seasoned_meat}"
 
     def stuff_casing(self, mixed_meat: str) -> str:
         """肉をケーシングに詰める処理（改良版）"""
-        print("🌭 天然ケーシングに丁寧に詰めています...")
-        time.sleep(PROCESSING_TIME['stuff'])
+        self._say("🌭 天然ケーシングに丁寧に詰めています...")
+        self.clock.sleep(PROCESSING_TIME['stuff'])
         
-        casing_types = ["天然豚腸", "天然羊腸", "コラーゲンケーシング"]
-        selected_casing = random.choice(casing_types)
+        selected_casing = self.rng.choice(CASING_TYPES)
         
-        print(f"使用ケーシング: {selected_casing}")
+        self._say(f"使用ケーシング: {selected_casing}")
         return f"生ソーセージ（{selected_casing}使用）"
 
     def cook_sausage(self, raw_sausage: str) -> tuple[str, int]:
         """ソーセージを調理する処理（改良版）"""
-        method = random.choice(list(self.cooking_methods.keys()))
+        method, cooking_success = self._pick_cooking()
         method_info = self.cooking_methods[method]
         
-        print(f"🔥 {method}で調理しています...")
-        print(f"調理難易度: {method_info['difficulty']}/10")
-        
-        # 調理の成功度をランダムに決定（難易度が高いほど失敗の可能性あり）
-        success_rate = max(0.7, 1.0 - (method_info['difficulty'] / 20))
-        cooking_success = random.random() < success_rate
+        self._say(f"🔥 {method}で調理しています...")
+        self._say(f"調理難易度: {method_info['difficulty']}/10")
         
         if cooking_success:
-            print("✅ 調理成功！完璧な仕上がりです！")
-            flavor_bonus = method_info['flavor_bonus']
+            self._say("✅ 調理成功！完璧な仕上がりです！")
         else:
-            print("⚠️ 調理は成功しましたが、少し焦げました...")
-            flavor_bonus = method_info['flavor_bonus'] // 2
+            self._say("⚠️ 調理は成功しましたが、少し焦げました...")
+        flavor_bonus = self._cooking_bonus(method, cooking_success)
         
-        time.sleep(PROCESSING_TIME['cook'])
+        self.clock.sleep(PROCESSING_TIME['cook'])
         return f"完成したソーセージ（{method}）", flavor_bonus
 
     def quality_check(self, sausage: str, total_score: int) -> str:
         """品質チェックを行う"""
-        print("🔍 品質チェックを実施しています...")
-        time.sleep(PROCESSING_TIME['quality_check'])
-        
-        if total_score >= 80:
-            grade = "🌟 メッチャ旨い！（SSS級）"
-        elif total_score >= 60:
-            grade = "😋 とても美味しい（S級）"
-        elif total_score >= 40:
-            grade = "😊 美味しい（A級）"
-        else:
-            grade = "🤔 普通（B級）"
+        self._say("🔍 品質チェックを実施しています...")
+        self.clock.sleep(PROCESSING_TIME['quality_check'])
+        
+        grade = grade_for(total_score)
         
-        print(f"最終スコア: {total_score}点")
-        print(f"品質グレード: {grade}")
+        self._say(f"最終スコア: {total_score}点")
+        self._say(f"品質グレード: {grade}")
         
         return f"{sausage} - {grade}"
 
@@ -179,19 +437,19 @@ class DeliciousSausageMaker:
             print("=" * 50)
             
             # 各工程の実行
-            meat_types = self.select_premium_meat()
-            minced_meat = self.grind_meat(meat_types)
-            seasoned_meat, spice_score = self.add_premium_spices(minced_meat)
-            mixed_meat = self.mix_ingredients(seasoned_meat)
-            raw_sausage = self.stuff_casing(mixed_meat)
-            final_sausage, cooking_bonus = self.cook_sausage(raw_sausage)
+            meat_types = self._measured('select_meat', self.select_premium_meat)
+            minced_meat = self._measured('grind', self.grind_meat, meat_types)
+            seasoned_meat, spice_score = self._measured('add_spices', self.add_premium_spices, minced_meat)
+            mixed_meat = self._measured('mix', self.mix_ingredients, seasoned_meat)
+            raw_sausage = self._measured('stuff', self.stuff_casing, mixed_meat)
+            final_sausage, cooking_bonus = self._measured('cook', self.cook_sausage, raw_sausage)
             
             # 最終スコア計算
             base_score = sum(self.meat_options[meat]["flavor"] for meat in meat_types)
             total_score = base_score + spice_score + cooking_bonus
             
             # 品質チェック
-            graded_sausage = self.quality_check(final_sausage, total_score)
+            graded_sausage = self._measured('quality_check', self.quality_check, final_sausage, total_score)
             
             print("=" * 50)
             print(f"🎊 {graded_sausage} の製造が完了しました！")
@@ -206,6 +464,157 @@ class DeliciousSausageMaker:
         except Exception as e:
             print(f"❌ ソーセージ製造中にエラーが発生しました: {e}")
 
+    def _step_select(self, result: SausageResult) -> None:
+        result.meat_types = self._pick_meats()
+
+    def _step_grind(self, result: SausageResult) -> None:
+        meat_flavor = self.catalog.meat_flavor
+        result.base_score = sum(meat_flavor[meat] for meat in result.meat_types)
+
+    def _step_spices(self, result: SausageResult) -> None:
+        catalog = self.catalog
+        optional = self._pick_optional_spices()
+        result.spices = [*catalog.essential_spices, *optional]
+        result.spice_score = catalog.essential_score + sum(catalog.spice_flavor[spice] for spice in optional)
+
+    def _step_mix(self, result: SausageResult) -> None:
+        result.mixing_technique = self.rng.choice(MIXING_TECHNIQUES)
+
+    def _step_stuff(self, result: SausageResult) -> None:
+        result.casing = self.rng.choice(CASING_TYPES)
+
+    def _step_cook(self, result: SausageResult) -> None:
+        result.cooking_method, result.cooking_success = self._pick_cooking()
+        result.cooking_bonus = self._cooking_bonus(result.cooking_method, result.cooking_success)
+
+    def _step_quality_check(self, result: SausageResult) -> None:
+        result.total_score = result.base_score + result.spice_score + result.cooking_bonus
+        result.grade = grade_for(result.total_score)
+
+    def stage_steps(self) -> List[tuple]:
+        """(工程名, 処理関数) を工程順に返す
+
+        処理関数は SausageResult を受け取って該当工程の結果を書き込む。待機は含まないので、
+        呼び出し側が PROCESSING_TIME[工程名] だけ待つ（同期・非同期・スレッド版で共通）。
+        """
+        return [
+            ('select_meat', self._step_select),
+            ('grind', self._step_grind),
+            ('add_spices', self._step_spices),
+            ('mix', self._step_mix),
+            ('stuff', self._step_stuff),
+            ('cook', self._step_cook),
+            ('quality_check', self._step_quality_check),
+        ]
+
+    def produce(self) -> SausageResult:
+        """表示や文字列生成を省き、1本分の製造結果を構造化して返す
+
+        乱数の消費順は make_delicious_sausage と同じなので、同じシードなら同じ結果になる。
+        """
+        start = self.clock.elapsed
+        result = SausageResult()
+        for stage, step in self.stage_steps():
+            self._measured(stage, self._run_step, stage, step, result)
+        result.simulated_seconds = self.clock.elapsed - start
+        return result
+
+    def _run_step(self, stage: str, step, result: SausageResult) -> None:
+        self.clock.sleep(PROCESSING_TIME[stage])
+        step(result)
+
+    def make_batch(self, n: int) -> List[SausageResult]:
+        """n本をまとめて製造する
+
+        SimulatedClock を渡しておけば待機せず、CPU速度だけでスループットが決まる。
+        """
+        return list(self.iter_batch(n))
+
+    def iter_batch(self, n: int) -> Iterator[SausageResult]:
+        """n本を1本ずつ製造しながら返す（結果を溜めないのでメモリは一定）"""
+        if n < 0:
+            raise ValueError("製造本数は0以上を指定してください")
+        for _ in range(n):
+            yield self.produce()
+
+# 並列製造で1タスクあたりに作る本数（ワーカー数に依存させないことで結果を固定する）
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def derive_seed(master_seed: int, index: int) -> int:
+    """マスターシードとチャンク番号から独立した乱数シードを導出する"""
+    digest = hashlib.sha256(f"{master_seed}:{index}".encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def _produce_chunk(task: tuple) -> tuple:
+    """1チャンク分を独立した乱数列で製造する（プロセスプールのワーカーで実行）"""
+    seed, count, delay, cooking_method, hook = task
+    maker = DeliciousSausageMaker(
+        clock=RealClock() if delay else SimulatedClock(),
+        rng=random.Random(seed),
+        verbose=False,
+        cooking_method=cooking_method,
+        hooks=[hook] if hook is not None else None,
+    )
+    return maker.make_batch(count), hook
+
+
+def make_batch_parallel(n: int, master_seed: int, workers: int = 1,
+                        chunk_size: int = DEFAULT_CHUNK_SIZE, delay: bool = False,
+                        cooking_method: Optional[str] = None,
+                        hook=None) -> List[SausageResult]:
+    """n本を複数プロセスに分けて製造する
+
+    n本を chunk_size ごとのチャンクに分け、チャンクごとに master_seed から導出した
+    random.Random を使う。チャンク分割はワーカー数に依存しないので、
+    ワーカー数を変えても結果は同じになる。
+
+    hook を渡す場合は fork()（空の複製を返す）と merge(other) を実装していること。
+    各チャンクは fork() した複製で計測し、終了後に hook へ merge される。
+    """
+    return list(iter_batch_parallel(n, master_seed, workers, chunk_size, delay,
+                                    cooking_method, hook))
+
+
+def iter_batch_parallel(n: int, master_seed: int, workers: int = 1,
+                        chunk_size: int = DEFAULT_CHUNK_SIZE, delay: bool = False,
+                        cooking_method: Optional[str] = None,
+                        hook=None) -> Iterator[SausageResult]:
+    """make_batch_parallel の逐次版。チャンク順に結果を返す
+
+    実行中のチャンクは workers の2倍までに抑えるので、消費側が遅くてもメモリは増えない。
+    """
+    if n < 0:
+        raise ValueError("製造本数は0以上を指定してください")
+    if workers < 1 or chunk_size < 1:
+        raise ValueError("ワーカー数とチャンクサイズは1以上を指定してください")
+
+    tasks = (
+        (derive_seed(master_seed, index), min(chunk_size, n - start), delay, cooking_method,
+         hook.fork() if hook is not None else None)
+        for index, start in enumerate(range(0, n, chunk_size))
+    )
+
+    if workers == 1:
+        for chunk, chunk_hook in map(_produce_chunk, tasks):
+            if hook is not None:
+                hook.merge(chunk_hook)
+            yield from chunk
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque(executor.submit(_produce_chunk, task)
+                        for task in islice(tasks, workers * 2))
+        while pending:
+            chunk, chunk_hook = pending.popleft().result()
+            for task in islice(tasks, 1):
+                pending.append(executor.submit(_produce_chunk, task))
+            if hook is not None:
+                hook.merge(chunk_hook)
+            yield from chunk
+
+
 def main():
     """メイン関数"""
     print("Welcome to the Delicious Sausage Factory! 🏭")
@@ -0,0 +1,89 @@
+"""
+ソーセージ製造ラインの asyncio 版
+
+各工程をコルーチンにし、工程ごとの同時処理数（ライン数）を制限しながら
+複数のソーセージを並行して流す。待機は asyncio.sleep なので工程間で重なり合い、
+N本の所要時間は「最も遅い工程の時間 × N / その工程のライン数」に近づく。
+"""
+
+import asyncio
+from typing import Dict, List, Optional
+
+from sausage import PROCESSING_TIME, DeliciousSausageMaker, SausageResult
+
+
+class AsyncSausageMaker:
+    """工程ごとに同時処理数を制限した非同期製造ライン
+
+    乱数の消費は工程の実行順に従うため、複数本を並行させた場合の結果は
+    同期版の make_batch とは一致しない。
+    """
+
+    def __init__(self, maker: Optional[DeliciousSausageMaker] = None,
+                 stage_limits: Optional[Dict[str, int]] = None,
+                 time_scale: float = 1.0):
+        # maker: 食材テーブルと乱数源を提供する同期版メーカー
+        # stage_limits: 工程名 -> 同時処理数（省略した工程は1）
+        # time_scale: PROCESSING_TIME に掛ける倍率（テストやデモで短縮する）
+        self.maker = maker if maker is not None else DeliciousSausageMaker(verbose=False)
+        self.stage_limits = {stage: 1 for stage in PROCESSING_TIME}
+        self.stage_limits.update(stage_limits or {})
+        self.time_scale = time_scale
+
+    def _new_semaphores(self) -> Dict[str, asyncio.Semaphore]:
+        """工程ごとのライン枠を作る
+
+        Semaphore は最初に待った時点のイベントループに結び付くので、実行ごとに作り直す。
+        """
+        return {stage: asyncio.Semaphore(limit) for stage, limit in self.stage_limits.items()}
+
+    async def produce(self, semaphores: Optional[Dict[str, asyncio.Semaphore]] = None) -> SausageResult:
+        """1本を全工程に通す
+
+        semaphores: make_batch が共有するライン枠（省略時はこの1本だけの枠を作る）
+        """
+        if semaphores is None:
+            semaphores = self._new_semaphores()
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        result = SausageResult()
+        for stage, step in self.maker.stage_steps():
+            async with semaphores[stage]:
+                await asyncio.sleep(PROCESSING_TIME[stage] * self.time_scale)
+            step(result)
+        result.simulated_seconds = (loop.time() - start) / self.time_scale if self.time_scale else 0.0
+        return result
+
+    async def make_batch(self, n: int) -> List[SausageResult]:
+        """n本を同時にラインへ流し、投入順に結果を返す"""
+        if n < 0:
+            raise ValueError("製造本数は0以上を指定してください")
+        semaphores = self._new_semaphores()
+        return list(await asyncio.gather(*(self.produce(semaphores) for _ in range(n))))
+
+
+def run_batch(n: int, **kwargs) -> List[SausageResult]:
+    """同期コードから非同期ラインを実行する"""
+    return asyncio.run(AsyncSausageMaker(**kwargs).make_batch(n))
+
+
+def main():
+    """非同期ラインで製造して所要時間を表示する"""
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="ソーセージ製造ライン（asyncio版）")
+    parser.add_argument("-n", type=int, default=10, help="製造本数")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="工程時間の倍率")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = run_batch(args.n, time_scale=args.time_scale)
+    elapsed = time.perf_counter() - start
+
+    sequential = sum(PROCESSING_TIME.values()) * args.time_scale * args.n
+    print(f"{len(results)}本を{elapsed:.2f}秒で製造しました（逐次なら{sequential:.2f}秒）")
+
+
+if __name__ == "__main__":
+    main()
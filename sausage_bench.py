@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+ソーセージ製造パイプラインのベンチマーク
+
+待機なし（SimulatedClock）・固定シードで以下を計測し、JSONで出力する。
+- 1本あたりのレイテンシ
+- バッチ製造のスループット（1k / 100k / 1M 本）
+- 1本あたりのメモリ使用量
+- 採点のみのスループット（スカラー版・NumPy版）
+
+--baseline を指定すると保存済みの結果と比較し、スループットが
+--max-regression パーセントを超えて低下した項目があれば終了コード1で終わる。
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sausage import DeliciousSausageMaker, SausageResult, SimulatedClock
+
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+DEFAULT_SEED = 42
+
+EXIT_SUCCESS = 0
+EXIT_REGRESSION = 1
+
+
+def _maker(seed: int) -> DeliciousSausageMaker:
+    return DeliciousSausageMaker(clock=SimulatedClock(), rng=random.Random(seed), verbose=False)
+
+
+def _entry(value: float, unit: str, higher_is_better: bool) -> Dict:
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+
+def bench_latency(seed: int, samples: int = 10_000) -> Dict[str, Dict]:
+    """1本ずつ製造したときのレイテンシ分布"""
+    maker = _maker(seed)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        maker.produce()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "latency_p50": _entry(timings[len(timings) // 2] * 1e6, "us", False),
+        "latency_p99": _entry(timings[int(len(timings) * 0.99)] * 1e6, "us", False),
+    }
+
+
+def bench_throughput(seed: int, size: int, repeat: int) -> Dict[str, Dict]:
+    """size本を製造するスループット（結果は保持せず捨てる）"""
+    best = float("inf")
+    for _ in range(repeat):
+        maker = _maker(seed)
+        start = time.perf_counter()
+        for _ in range(size):
+            maker.produce()
+        best = min(best, time.perf_counter() - start)
+    return {f"throughput_{size}": _entry(size / best, "sausages/s", True)}
+
+
+def bench_memory(seed: int, size: int = 10_000) -> Dict[str, Dict]:
+    """make_batch の結果を保持したときの1本あたりメモリ"""
+    maker = _maker(seed)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    results = maker.make_batch(size)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del results
+    return {"memory_per_sausage": _entry((after - before) / size, "bytes", False)}
+
+
+def bench_scoring(seed: int, size: int, repeat: int) -> Dict[str, Dict]:
+    """採点のみのスループット
+
+    スカラー版は製造と同じ工程関数（_step_grind / _step_spices / _step_cook /
+    _step_quality_check）をそのまま呼ぶ。スパイスと調理方法の抽選も製造時と同じく含む。
+    """
+    maker = _maker(seed)
+    results: List[SausageResult] = maker.make_batch(min(size, 100_000))
+    scoring_steps = (maker._step_grind, maker._step_spices, maker._step_cook, maker._step_quality_check)
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for result in results:
+            for step in scoring_steps:
+                step(result)
+        best = min(best, time.perf_counter() - start)
+    entries = {"scoring_scalar": _entry(len(results) / best, "recipes/s", True)}
+
+    try:
+        from sausage_vectorized import VectorizedScorer
+    except ImportError:
+        return entries
+
+    scorer = VectorizedScorer(maker)
+    recipes = scorer.random_recipes(size, seed=seed)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        scorer.score(recipes)
+        best = min(best, time.perf_counter() - start)
+    entries["scoring_vectorized"] = _entry(size / best, "recipes/s", True)
+    return entries
+
+
+def run(sizes, seed: int, repeat: int) -> Dict:
+    benchmarks: Dict[str, Dict] = {}
+    benchmarks.update(bench_latency(seed))
+    for size in sizes:
+        benchmarks.update(bench_throughput(seed, size, repeat if size < 1_000_000 else 1))
+    benchmarks.update(bench_memory(seed))
+    benchmarks.update(bench_scoring(seed, max(sizes), repeat))
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "sizes": list(sizes),
+        },
+        "benchmarks": benchmarks,
+    }
+
+
+def compare(current: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """ベースラインより max_regression パーセント以上悪化した項目を返す
+
+    スループット（higher_is_better）の項目だけを判定対象にする。
+    """
+    regressions = []
+    for name, entry in current["benchmarks"].items():
+        base = baseline.get("benchmarks", {}).get(name)
+        if base is None or not entry["higher_is_better"] or base["value"] <= 0:
+            continue
+        change = (entry["value"] - base["value"]) / base["value"] * 100
+        if change < -max_regression:
+            regressions.append(f"{name}: {base['value']:.1f} -> {entry['value']:.1f} {entry['unit']} ({change:+.1f}%)")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="ソーセージ製造ベンチマーク")
+    parser.add_argument("--sizes", type=lambda s: [int(v) for v in s.split(",")],
+                        default=list(DEFAULT_SIZES), help="バッチサイズ（カンマ区切り）")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="乱数シード")
+    parser.add_argument("--repeat", type=int, default=3, help="各計測の繰り返し回数（最良値を採用）")
+    parser.add_argument("--output", help="結果を書き出すJSONファイル（省略時は標準出力）")
+    parser.add_argument("--baseline", help="比較するベースラインのJSONファイル")
+    parser.add_argument("--max-regression", type=float, default=10.0,
+                        help="許容するスループット低下率（パーセント、デフォルト: 10）")
+    args = parser.parse_args(argv)
+
+    result = run(args.sizes, args.seed, args.repeat)
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.max_regression)
+        if regressions:
+            print("スループットの低下を検出しました:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            return EXIT_REGRESSION
+    return EXIT_SUCCESS
+
+
+if __name__ == "__main__":
+    sys.exit(main())
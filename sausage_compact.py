@@ -0,0 +1,195 @@
+"""
+大量バッチ向けのコンパクトなレシピ表現
+
+肉・スパイス・調理方法・混合技法・ケーシングを DeliciousSausageMaker の
+テーブルに対する小さな整数IDに置き換える。肉とスパイスは選択順を持たない
+ビットマスクとして保持する（デコード時はテーブル順に並ぶ）。
+
+- CompactRecipe: __slots__ で1本分を保持する軽量オブジェクト
+- RecipeBatch: array による構造体配列（1本あたり10バイト、1000万本で約100MB）
+"""
+
+from array import array
+from typing import Iterator, List, Optional, Tuple
+
+from sausage import (
+    CASING_TYPES,
+    MIXING_TECHNIQUES,
+    DeliciousSausageMaker,
+    SausageResult,
+    grade_for,
+)
+
+
+# 採点結果の列（RecipeBatch.COLUMNS の型に収まるかを RecipeCodec.encode で確かめる）
+SCORE_FIELDS = ("base_score", "spice_score", "cooking_bonus")
+
+
+def column_range(typecode: str) -> Tuple[int, int]:
+    """array の整数型コードで表せる最小値と最大値"""
+    bits = array(typecode).itemsize * 8
+    if typecode.isupper():
+        return 0, (1 << bits) - 1
+    return -(1 << (bits - 1)), (1 << (bits - 1)) - 1
+
+
+class RecipeCodec:
+    """食材名と整数IDの相互変換表"""
+
+    def __init__(self, maker: Optional[DeliciousSausageMaker] = None):
+        maker = maker if maker is not None else DeliciousSausageMaker(verbose=False)
+        self.meats: Tuple[str, ...] = tuple(maker.meat_options)
+        self.spices: Tuple[str, ...] = tuple(maker.premium_spices)
+        self.methods: Tuple[str, ...] = tuple(maker.cooking_methods)
+        self.techniques: Tuple[str, ...] = MIXING_TECHNIQUES
+        self.casings: Tuple[str, ...] = CASING_TYPES
+        if len(self.meats) > 8 or len(self.spices) > 16:
+            raise ValueError("肉は8種類、スパイスは16種類までしかビットマスクに収まりません")
+        self._meat_bits = {name: 1 << i for i, name in enumerate(self.meats)}
+        self._spice_bits = {name: 1 << i for i, name in enumerate(self.spices)}
+        self._method_ids = {name: i for i, name in enumerate(self.methods)}
+        self._technique_ids = {name: i for i, name in enumerate(self.techniques)}
+        self._casing_ids = {name: i for i, name in enumerate(self.casings)}
+        typecodes = dict(RecipeBatch.COLUMNS)
+        self._score_ranges = tuple((name, *column_range(typecodes[name])) for name in SCORE_FIELDS)
+
+    def meat_mask(self, meats) -> int:
+        mask = 0
+        for meat in meats:
+            mask |= self._meat_bits[meat]
+        return mask
+
+    def spice_mask(self, spices) -> int:
+        mask = 0
+        for spice in spices:
+            mask |= self._spice_bits[spice]
+        return mask
+
+    @staticmethod
+    def _unmask(mask: int, names: Tuple[str, ...]) -> List[str]:
+        return [name for i, name in enumerate(names) if mask >> i & 1]
+
+    def encode(self, result: SausageResult) -> "CompactRecipe":
+        # 食材テーブルは実行中に変えられるので、スコアが列の型に収まるかを毎回確かめる
+        for name, low, high in self._score_ranges:
+            value = getattr(result, name)
+            if not low <= value <= high:
+                raise ValueError(f"{name}={value} は {low}〜{high} の範囲に収まりません"
+                                 "（食材テーブルの flavor が大きすぎます）")
+        return CompactRecipe(
+            self.meat_mask(result.meat_types),
+            self.spice_mask(result.spices),
+            self._method_ids[result.cooking_method],
+            self._technique_ids[result.mixing_technique],
+            self._casing_ids[result.casing],
+            result.cooking_success,
+            result.base_score,
+            result.spice_score,
+            result.cooking_bonus,
+        )
+
+    def decode(self, recipe: "CompactRecipe") -> SausageResult:
+        total = recipe.base_score + recipe.spice_score + recipe.cooking_bonus
+        return SausageResult(
+            meat_types=self._unmask(recipe.meat_mask, self.meats),
+            spices=self._unmask(recipe.spice_mask, self.spices),
+            mixing_technique=self.techniques[recipe.technique_id],
+            casing=self.casings[recipe.casing_id],
+            cooking_method=self.methods[recipe.method_id],
+            cooking_success=bool(recipe.cooking_success),
+            base_score=recipe.base_score,
+            spice_score=recipe.spice_score,
+            cooking_bonus=recipe.cooking_bonus,
+            total_score=total,
+            grade=grade_for(total),
+        )
+
+
+class CompactRecipe:
+    """整数IDで表した1本分のレシピと採点結果"""
+
+    __slots__ = ("meat_mask", "spice_mask", "method_id", "technique_id", "casing_id",
+                 "cooking_success", "base_score", "spice_score", "cooking_bonus")
+
+    def __init__(self, meat_mask: int, spice_mask: int, method_id: int,
+                 technique_id: int, casing_id: int, cooking_success: bool,
+                 base_score: int, spice_score: int, cooking_bonus: int):
+        self.meat_mask = meat_mask
+        self.spice_mask = spice_mask
+        self.method_id = method_id
+        self.technique_id = technique_id
+        self.casing_id = casing_id
+        self.cooking_success = cooking_success
+        self.base_score = base_score
+        self.spice_score = spice_score
+        self.cooking_bonus = cooking_bonus
+
+    @property
+    def total_score(self) -> int:
+        return self.base_score + self.spice_score + self.cooking_bonus
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"CompactRecipe({fields})"
+
+
+class RecipeBatch:
+    """レシピ群を列ごとの array に格納する構造体配列
+
+    スコアは肉が最大28、スパイスが最大65、調理ボーナスが最大12なので各1バイトに収める。
+    食材テーブルを変えて収まらなくなったスコアは RecipeCodec.encode が ValueError にする。
+    """
+
+    # 列名と array の型コード
+    COLUMNS = (
+        ("meat_mask", "B"),
+        ("spice_mask", "H"),
+        ("method_id", "B"),
+        ("technique_id", "B"),
+        ("casing_id", "B"),
+        ("cooking_success", "B"),
+        ("base_score", "B"),
+        ("spice_score", "B"),
+        ("cooking_bonus", "B"),
+    )
+
+    def __init__(self, codec: Optional[RecipeCodec] = None):
+        self.codec = codec if codec is not None else RecipeCodec()
+        for name, typecode in self.COLUMNS:
+            setattr(self, name, array(typecode))
+
+    def __len__(self) -> int:
+        return len(self.method_id)
+
+    def append(self, recipe: CompactRecipe) -> None:
+        for name, _ in self.COLUMNS:
+            getattr(self, name).append(getattr(recipe, name))
+
+    def append_result(self, result: SausageResult) -> None:
+        self.append(self.codec.encode(result))
+
+    def __getitem__(self, index: int) -> CompactRecipe:
+        return CompactRecipe(*(getattr(self, name)[index] for name, _ in self.COLUMNS))
+
+    def __iter__(self) -> Iterator[CompactRecipe]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def total_scores(self) -> array:
+        return array("H", (b + s + c for b, s, c in
+                           zip(self.base_score, self.spice_score, self.cooking_bonus)))
+
+    def nbytes(self) -> int:
+        """列データが占めるバイト数"""
+        return sum(len(column) * column.itemsize
+                   for column in (getattr(self, name) for name, _ in self.COLUMNS))
+
+    @classmethod
+    def produce(cls, maker: DeliciousSausageMaker, n: int) -> "RecipeBatch":
+        """n本を製造し、中間オブジェクトを保持せずに詰めていく"""
+        if n < 0:
+            raise ValueError("製造本数は0以上を指定してください")
+        batch = cls(RecipeCodec(maker))
+        for _ in range(n):
+            batch.append_result(maker.produce())
+        return batch
@@ -0,0 +1,74 @@
+"""
+製造結果のストリーミング出力（JSON Lines）
+
+1本ごとに1行のJSONを書き出す。行はメモリ上のバッファに溜めてまとめて書き込み、
+件数か経過時間のどちらかが閾値に達したらファイルへ flush する。
+パスが .gz で終わる場合（または compress=True）は gzip で圧縮する。
+"""
+
+import gzip
+import json
+import time
+from typing import Dict, List, Optional
+
+from sausage import SausageResult
+
+DEFAULT_BUFFER_RECORDS = 1000
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+class JsonlResultWriter:
+    """製造結果を JSON Lines で逐次書き出す"""
+
+    def __init__(self, path: str, compress: Optional[bool] = None,
+                 buffer_records: int = DEFAULT_BUFFER_RECORDS,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        # buffer_records: この件数が溜まったらまとめて書き込む
+        # flush_interval: 前回の flush からこの秒数が経ったら書き込んで flush する
+        if buffer_records < 1:
+            raise ValueError("buffer_records は1以上を指定してください")
+        self.path = path
+        self.compress = path.endswith(".gz") if compress is None else compress
+        self.buffer_records = buffer_records
+        self.flush_interval = flush_interval
+        self.records_written = 0
+        self._buffer: List[str] = []
+        self._last_flush = time.monotonic()
+        if self.compress:
+            self._file = gzip.open(path, "wt", encoding="utf-8")
+        else:
+            self._file = open(path, "w", encoding="utf-8")
+
+    def write(self, result: SausageResult, **extra) -> None:
+        """1本分の結果を書き出す（extra はレコードに追加するフィールド）"""
+        record: Dict = dict(extra)
+        record.update(result.to_dict())
+        self._buffer.append(json.dumps(record, ensure_ascii=False) + "\n")
+        if len(self._buffer) >= self.buffer_records:
+            self._drain()
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def _drain(self) -> None:
+        if self._buffer:
+            self._file.write("".join(self._buffer))
+            self.records_written += len(self._buffer)
+            self._buffer.clear()
+
+    def flush(self) -> None:
+        """バッファを書き込み、下流から読めるようにファイルを flush する"""
+        self._drain()
+        self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+    def __enter__(self) -> "JsonlResultWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
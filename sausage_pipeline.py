@@ -0,0 +1,248 @@
+"""
+ソーセージ製造のステージ型パイプライン（スレッド版）
+
+select → grind → spice → mix → stuff → cook → quality_check の各工程を
+有界キュー付きのステージとし、ステージごとにワーカースレッド数を設定できる。
+下流が詰まると put がブロックして上流が止まる（バックプレッシャー）。
+ステージごとの処理数・稼働時間・キュー深さを記録し、ボトルネックを特定できる。
+工程で例外が起きると以降の品は読み捨てて終了を下流へ伝え、run() が最初の例外を送出する。
+"""
+
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from sausage import PROCESSING_TIME, DeliciousSausageMaker, SausageResult
+
+# 各ステージのワーカーに終了を知らせる番兵
+_STOP = object()
+
+
+@dataclass
+class StageStats:
+    """ステージごとのカウンタ"""
+    name: str
+    workers: int
+    processed: int = 0
+    busy_seconds: float = 0.0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    blocked_puts: int = 0
+
+    def to_dict(self, elapsed: float) -> Dict:
+        return {
+            "name": self.name,
+            "workers": self.workers,
+            "processed": self.processed,
+            "throughput_per_sec": self.processed / elapsed if elapsed > 0 else 0.0,
+            "utilization": self.busy_seconds / (elapsed * self.workers) if elapsed > 0 else 0.0,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "blocked_puts": self.blocked_puts,
+        }
+
+
+class PipelineStage:
+    """入力キューとワーカースレッドを持つ1工程"""
+
+    def __init__(self, name: str, step: Callable[[SausageResult], None],
+                 workers: int, queue_size: int, work_seconds: float,
+                 step_lock: threading.Lock, errors: List[BaseException]):
+        # errors: 全ステージで共有する例外のリスト（最初の1件が run() から送出される）
+        if workers < 1:
+            raise ValueError(f"{name}: ワーカー数は1以上を指定してください")
+        self.name = name
+        self.step = step
+        self.work_seconds = work_seconds
+        self.inbox: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.stats = StageStats(name=name, workers=workers)
+        self.next_stage: Optional["PipelineStage"] = None
+        self.outbox: Optional[list] = None
+        self._step_lock = step_lock
+        self._errors = errors
+        self._stats_lock = threading.Lock()
+        self._running = workers
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def start(self) -> None:
+        for thread in self._threads:
+            thread.start()
+
+    def join(self) -> None:
+        for thread in self._threads:
+            thread.join()
+
+    def put(self, item) -> None:
+        """キューに投入する（満杯ならブロックしてバックプレッシャーをかける）"""
+        try:
+            self.inbox.put_nowait(item)
+        except queue.Full:
+            with self._stats_lock:
+                self.stats.blocked_puts += 1
+            self.inbox.put(item)
+        depth = self.inbox.qsize()
+        with self._stats_lock:
+            self.stats.queue_depth = depth
+            self.stats.max_queue_depth = max(self.stats.max_queue_depth, depth)
+
+    def _worker(self) -> None:
+        try:
+            while True:
+                item = self.inbox.get()
+                if item is _STOP:
+                    break
+                if self._errors:
+                    # どこかの工程が失敗したら、上流を止めないよう残りは読み捨てる
+                    continue
+                index, result = item
+                started = time.perf_counter()
+                time.sleep(self.work_seconds)
+                try:
+                    # 乱数源はメーカーで共有しているので、工程の処理本体は直列化する
+                    with self._step_lock:
+                        self.step(result)
+                except Exception as e:
+                    with self._step_lock:
+                        self._errors.append(e)
+                    continue
+                busy = time.perf_counter() - started
+                with self._stats_lock:
+                    self.stats.processed += 1
+                    self.stats.busy_seconds += busy
+                    self.stats.queue_depth = self.inbox.qsize()
+                if self.next_stage is not None:
+                    self.next_stage.put(item)
+                else:
+                    self.outbox.append(item)
+        finally:
+            # 最後のワーカーが抜けたら下流に終了を伝える
+            with self._stats_lock:
+                self._running -= 1
+                last = self._running == 0
+            if last and self.next_stage is not None:
+                for _ in range(self.next_stage.stats.workers):
+                    self.next_stage.put(_STOP)
+
+
+class SausagePipeline:
+    """工程ごとに有界キューとワーカースレッドを持つ製造パイプライン"""
+
+    def __init__(self, maker: Optional[DeliciousSausageMaker] = None,
+                 workers: Optional[Dict[str, int]] = None,
+                 queue_size: int = 8, time_scale: float = 1.0):
+        # workers: 工程名 -> ワーカースレッド数（省略した工程は1）
+        # queue_size: 各工程の入力キューの上限
+        # time_scale: PROCESSING_TIME に掛ける倍率
+        self.maker = maker if maker is not None else DeliciousSausageMaker(verbose=False)
+        self.workers = {stage: 1 for stage in PROCESSING_TIME}
+        self.workers.update(workers or {})
+        unknown = set(self.workers) - set(PROCESSING_TIME)
+        if unknown:
+            raise ValueError(f"不明な工程: {', '.join(sorted(unknown))}")
+        self.queue_size = queue_size
+        self.time_scale = time_scale
+        self.stages: List[PipelineStage] = []
+        self._errors: List[BaseException] = []
+        self._started = 0.0
+        self._finished: Optional[float] = None
+
+    def _build(self) -> List[PipelineStage]:
+        step_lock = threading.Lock()
+        self._errors = []
+        stages = [
+            PipelineStage(stage, step, self.workers[stage], self.queue_size,
+                          PROCESSING_TIME[stage] * self.time_scale, step_lock, self._errors)
+            for stage, step in self.maker.stage_steps()
+        ]
+        for upstream, downstream in zip(stages, stages[1:]):
+            upstream.next_stage = downstream
+        return stages
+
+    def run(self, n: int) -> List[SausageResult]:
+        """n本をパイプラインに流し、投入順に並べた結果を返す（工程で例外が起きたら最初のものを送出する）"""
+        if n < 0:
+            raise ValueError("製造本数は0以上を指定してください")
+        self.stages = self._build()
+        finished: list = []
+        self.stages[-1].outbox = finished
+
+        self._started = time.perf_counter()
+        self._finished = None
+        for stage in self.stages:
+            stage.start()
+
+        first = self.stages[0]
+        for index in range(n):
+            first.put((index, SausageResult()))
+        for _ in range(first.stats.workers):
+            first.put(_STOP)
+
+        for stage in self.stages:
+            stage.join()
+        self._finished = time.perf_counter()
+        if self._errors:
+            raise self._errors[0]
+
+        finished.sort(key=lambda item: item[0])
+        return [result for _, result in finished]
+
+    def elapsed(self) -> float:
+        end = self._finished if self._finished is not None else time.perf_counter()
+        return end - self._started if self._started else 0.0
+
+    def snapshot(self) -> List[Dict]:
+        """実行中でも呼べるステージごとのカウンタ"""
+        elapsed = self.elapsed()
+        return [stage.stats.to_dict(elapsed) for stage in self.stages]
+
+    def bottleneck(self) -> Optional[str]:
+        """稼働率が最も高い工程名"""
+        stats = self.snapshot()
+        if not stats:
+            return None
+        return max(stats, key=lambda s: s["utilization"])["name"]
+
+
+def parse_workers(spec: str) -> Dict[str, int]:
+    """'mix=3,cook=3' 形式のワーカー数指定を解析する"""
+    workers = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, count = part.partition("=")
+        if name not in PROCESSING_TIME or not count.isdigit():
+            raise ValueError(f"ワーカー指定が不正です: {part}")
+        workers[name] = int(count)
+    return workers
+
+
+def main():
+    """パイプラインで製造し、工程ごとのカウンタを表示する"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="ソーセージ製造パイプライン（スレッド版）")
+    parser.add_argument("-n", type=int, default=20, help="製造本数")
+    parser.add_argument("--workers", type=parse_workers, default={},
+                        help="工程ごとのワーカー数（例: mix=3,cook=3）")
+    parser.add_argument("--queue-size", type=int, default=8, help="各工程のキュー上限")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="工程時間の倍率")
+    args = parser.parse_args()
+
+    pipeline = SausagePipeline(workers=args.workers, queue_size=args.queue_size,
+                               time_scale=args.time_scale)
+    results = pipeline.run(args.n)
+
+    print(f"{len(results)}本を{pipeline.elapsed():.2f}秒で製造しました")
+    print(f"{'工程':<14}{'ワーカー':>8}{'処理数':>8}{'本/秒':>10}{'稼働率':>8}{'最大キュー':>10}{'待ち':>6}")
+    for s in pipeline.snapshot():
+        print(f"{s['name']:<14}{s['workers']:>8}{s['processed']:>8}"
+              f"{s['throughput_per_sec']:>10.1f}{s['utilization']:>8.0%}"
+              f"{s['max_queue_depth']:>10}{s['blocked_puts']:>6}")
+    print(f"ボトルネック: {pipeline.bottleneck()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+ソーセージ製造の工程別プロファイラ
+
+DeliciousSausageMaker のフックとして登録し、工程ごとの実時間・CPU時間・
+確保ブロック数の増減・シミュレーション待機時間を集計する。
+値は対数バケットのヒストグラムに溜めるので、本数が増えてもメモリは一定。
+p50/p95/p99 を表・JSON・Prometheus テキスト形式で出力できる。
+"""
+
+import json
+import math
+from typing import Dict
+
+# 集計する指標（on_stage の引数順）
+METRICS = ("wall_seconds", "cpu_seconds", "allocated_blocks", "simulated_seconds")
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LogHistogram:
+    """相対誤差 growth 以内で分位点を推定できる対数バケットのヒストグラム
+
+    0以下の値（確保ブロック数の減少や待機なしの0秒など）は値ごとに数える。
+    """
+
+    def __init__(self, growth: float = 1.02, smallest: float = 1e-9):
+        self.growth = growth
+        self.smallest = smallest
+        self._log_growth = math.log(growth)
+        self.buckets: Dict[int, int] = {}
+        self.non_positive: Dict[float, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def record(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if value <= 0:
+            self.non_positive[value] = self.non_positive.get(value, 0) + 1
+            return
+        index = int(math.log(max(value, self.smallest) / self.smallest) / self._log_growth)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other: "LogHistogram") -> None:
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        for value, count in other.non_positive.items():
+            self.non_positive[value] = self.non_positive.get(value, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """q分位点を返す（バケットの上端で近似し、最大値で頭打ち）"""
+        if self.count == 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = 0
+        for value in sorted(self.non_positive):
+            seen += self.non_positive[value]
+            if seen > rank:
+                return value
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return min(self.smallest * self.growth ** (index + 1), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class StageProfiler:
+    """工程ごとの計測値を集計するフック"""
+
+    def __init__(self):
+        self.histograms: Dict[str, Dict[str, LogHistogram]] = {}
+
+    def on_stage(self, stage: str, wall_seconds: float, cpu_seconds: float,
+                 allocated_blocks: int, simulated_seconds: float) -> None:
+        histograms = self.histograms.get(stage)
+        if histograms is None:
+            histograms = self.histograms[stage] = {metric: LogHistogram() for metric in METRICS}
+        for metric, value in zip(METRICS, (wall_seconds, cpu_seconds, allocated_blocks, simulated_seconds)):
+            histograms[metric].record(value)
+
+    def fork(self) -> "StageProfiler":
+        """並列製造のワーカー用に空の複製を作る"""
+        return StageProfiler()
+
+    def merge(self, other: "StageProfiler") -> None:
+        for stage, histograms in other.histograms.items():
+            mine = self.histograms.setdefault(stage, {metric: LogHistogram() for metric in METRICS})
+            for metric, histogram in histograms.items():
+                mine[metric].merge(histogram)
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """工程 -> 指標 -> {count, sum, mean, min, max, p50, p95, p99}"""
+        summary = {}
+        for stage, histograms in self.histograms.items():
+            summary[stage] = {}
+            for metric, histogram in histograms.items():
+                stats = {
+                    "count": histogram.count,
+                    "sum": histogram.total,
+                    "mean": histogram.mean,
+                    "min": histogram.min,
+                    "max": histogram.max,
+                }
+                for q in QUANTILES:
+                    stats[f"p{int(q * 100)}"] = histogram.quantile(q)
+                summary[stage][metric] = stats
+        return summary
+
+    def to_json(self) -> str:
+        return json.dumps(self.summary(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self, prefix: str = "sausage_stage") -> str:
+        """Prometheus のテキスト形式（summary 型）で出力する"""
+        lines = []
+        for metric in METRICS:
+            name = f"{prefix}_{metric}"
+            lines.append(f"# TYPE {name} summary")
+            for stage, histograms in self.histograms.items():
+                histogram = histograms[metric]
+                for q in QUANTILES:
+                    lines.append(f'{name}{{stage="{stage}",quantile="{q}"}} {histogram.quantile(q):.9g}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.total:.9g}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def to_text(self) -> str:
+        """工程別の内訳表"""
+        lines = [f"{'stage':<14}{'calls':>8}{'wall p50':>12}{'wall p95':>12}{'wall p99':>12}"
+                 f"{'cpu p50':>12}{'blocks p50':>12}{'simulated':>12}"]
+        for stage, histograms in self.histograms.items():
+            wall = histograms["wall_seconds"]
+            cpu = histograms["cpu_seconds"]
+            blocks = histograms["allocated_blocks"]
+            simulated = histograms["simulated_seconds"]
+            lines.append(
+                f"{stage:<14}{wall.count:>8}"
+                f"{wall.quantile(0.5) * 1e6:>10.1f}us{wall.quantile(0.95) * 1e6:>10.1f}us"
+                f"{wall.quantile(0.99) * 1e6:>10.1f}us{cpu.quantile(0.5) * 1e6:>10.1f}us"
+                f"{blocks.quantile(0.5):>12.0f}{simulated.total:>11.0f}s"
+            )
+        return "\n".join(lines)
+
+    def export(self, fmt: str = "text") -> str:
+        exporters = {"text": self.to_text, "json": self.to_json, "prometheus": self.to_prometheus}
+        if fmt not in exporters:
+            raise ValueError(f"不明な出力形式: {fmt}")
+        return exporters[fmt]()
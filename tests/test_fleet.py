@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from mame_fleet import DeviceConnection, FleetManager, SerialConnection
+from mame_sim import start_fleet, start_tcp_fleet
+
+
+def test_connection_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        DeviceConnection("/dev/null")
+
+
+async def _with_fleet(transport: str, count: int, body):
+    if transport == "tcp":
+        devices = await start_tcp_fleet(count)
+        addresses = [device.address for device in devices]
+    else:
+        devices = await start_fleet(count)
+        addresses = [device.path for device in devices]
+    fleet = FleetManager(addresses, timeout=2.0)
+    try:
+        return await body(fleet, addresses)
+    finally:
+        fleet.close()
+        for device in devices:
+            device.close()
+        if transport == "tcp":
+            await asyncio.gather(*(device.wait_closed() for device in devices))
+
+
+@pytest.mark.parametrize("transport", ["pty", "tcp"])
+def test_poll_status_from_simulated_devices(transport):
+    async def body(fleet, addresses):
+        assert await fleet.connect() == len(addresses)
+        assert all(c.json_enabled for c in fleet.connections.values())
+        first = (await fleet.poll_status()).summary()
+        second = (await fleet.poll_status()).summary()
+        return first, second
+
+    first, second = asyncio.run(_with_fleet(transport, 3, body))
+    for summary in (first, second):
+        assert summary["devices"] == summary["reachable"] == 3
+        assert sum(summary["states"].values()) == 3
+        assert summary["latency_max_ms"] is not None
+
+
+@pytest.mark.parametrize("transport", ["pty", "tcp"])
+def test_broadcast_command_returns_response_per_device(transport):
+    async def body(fleet, addresses):
+        await fleet.connect()
+        responses = await fleet.broadcast("set score 5")
+        config = await fleet.broadcast("config")
+        return addresses, responses, config
+
+    addresses, responses, config = asyncio.run(_with_fleet(transport, 2, body))
+    assert [r.device for r in responses] == addresses
+    assert all(r.ok and r.lines == ["検知スコア閾値: 5"] for r in responses)
+    assert all("検知スコア閾値: 5" in r.lines for r in config)
+
+
+def test_unreachable_device_is_reported_without_blocking_others():
+    async def body(fleet, addresses):
+        fleet.connections["/nonexistent/mame"] = SerialConnection("/nonexistent/mame")
+        connected = await fleet.connect()
+        return connected, (await fleet.poll_status()).summary()
+
+    connected, summary = asyncio.run(_with_fleet("pty", 2, body))
+    assert connected == 2
+    assert summary["devices"] == 3
+    assert summary["reachable"] == 2
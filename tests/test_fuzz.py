@@ -0,0 +1,29 @@
+import mame_host
+from mame_fuzz import check, generate, run_firmware
+
+
+def test_fixed_seed_batch_matches_simulator():
+    records = generate(200, seed=1)
+    results = run_firmware(records, timeout=60)
+
+    assert len(results) == 200
+    problems, timings = check(results)
+    assert problems == []
+    assert sum(len(values) for values in timings.values()) == 200
+
+
+def test_generate_is_deterministic():
+    assert generate(200, seed=7) == generate(200, seed=7)
+    assert generate(200, seed=7) != generate(200, seed=8)
+    assert all(b"reset" not in record.lower() for record in generate(500, seed=7))
+
+
+def test_setting_range_mismatch_is_reported():
+    with open(mame_host.FIRMWARE_PATH, encoding="utf-8") as f:
+        source = f.read()
+    original = '&config.detectionThreshold, 1, 6, "検知スコア閾値"'
+    assert source.count(original) == 1
+    broken = source.replace(original, '&config.detectionThreshold, 1, 7, "検知スコア閾値"')
+
+    problems, _ = check(run_firmware(generate(2000, seed=1), source=broken, timeout=60))
+    assert problems
@@ -0,0 +1,46 @@
+import asyncio
+
+import numpy as np
+
+from mame_ingest import IngestService
+from mame_sim import start_fleet
+from mame_store import ColumnarStore
+
+
+async def _ingest(store: ColumnarStore, devices: int, seconds: float, **options) -> IngestService:
+    fleet = await start_fleet(devices)
+    service = IngestService(store, **options)
+    try:
+        await service.start([device.path for device in fleet])
+        await asyncio.sleep(seconds)
+    finally:
+        await service.stop()
+        for device in fleet:
+            device.close()
+    return service
+
+
+def test_records_from_pty_devices_land_in_store(tmp_path):
+    store = ColumnarStore(str(tmp_path))
+    service = asyncio.run(_ingest(store, 2, 1.0, poll_interval=0.05, batch_size=5, flush_interval=0.2))
+
+    stats = service.total_stats()
+    assert stats["parse_errors"] == 0
+    assert stats["records"] > 10
+    assert stats["records_written"] == stats["records"]
+    paths = [source.path for source in service.sources]
+    assert sum(store.length(path) for path in paths) == stats["records"]
+    for path in paths:
+        data = store.read(path)
+        assert len(data["host_time"]) > 0
+        assert np.all(np.diff(data["host_time"]) >= 0)
+        assert np.all(data["valid"] == 1)
+
+
+def test_binary_frames_from_pty_devices_land_in_store(tmp_path):
+    store = ColumnarStore(str(tmp_path))
+    service = asyncio.run(_ingest(store, 1, 1.5, binary=True, batch_size=3, flush_interval=0.2))
+
+    stats = service.total_stats()
+    assert stats["records"] > 0
+    assert store.length(service.sources[0].path) == stats["records"] == stats["records_written"]
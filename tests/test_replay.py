@@ -0,0 +1,34 @@
+import pytest
+
+from mame_replay import DetectorConfig, PreparedSamples, replay_scalar, replay_vectorized, synthetic_samples
+
+CONFIGS = [
+    DetectorConfig(),
+    DetectorConfig(detection_threshold=3, alert_duration=1000),
+    DetectorConfig(temp_threshold=2.5, distance_threshold=20.0, detection_threshold=5, alert_duration=7000),
+    DetectorConfig(detection_threshold=1, alert_duration=200),
+]
+
+
+def assert_same(scalar, vectorized):
+    assert vectorized.events == scalar.events
+    assert vectorized.total_detections == scalar.total_detections
+    assert vectorized.error_count == scalar.error_count
+    assert vectorized.state == scalar.state
+    assert vectorized.samples == scalar.samples
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=lambda c: f"score{c.detection_threshold}-alert{c.alert_duration}")
+@pytest.mark.parametrize("false_trigger_rate", [0.0, 0.02])
+def test_vectorized_matches_scalar_on_synthetic_trace(config, false_trigger_rate):
+    samples = synthetic_samples(20000, seed=3, false_trigger_rate=false_trigger_rate)
+    scalar = replay_scalar(samples, config)
+    assert scalar.total_detections > 0
+    assert_same(scalar, replay_vectorized(samples, config))
+
+
+def test_prepared_samples_can_be_replayed_with_several_configs():
+    samples = synthetic_samples(5000, seed=11)
+    prepared = PreparedSamples(samples)
+    for config in CONFIGS:
+        assert_same(replay_scalar(samples, config), replay_vectorized(prepared, config))
@@ -0,0 +1,84 @@
+import numpy as np
+
+from mame_protocol import MONITORING
+from mame_replay import DetectorConfig, replay_scalar, replay_vectorized
+
+INTERVAL = 200
+
+
+def trace(n, pir1=(), pir2=(), object_temp=22.0):
+    """PIR の反応位置だけを指定した手作りのサンプル列（温度差0、距離一定）"""
+    pir1_column = np.zeros(n, dtype=bool)
+    pir1_column[list(pir1)] = True
+    pir2_column = np.zeros(n, dtype=bool)
+    pir2_column[list(pir2)] = True
+    return {
+        "timestamp": np.arange(n, dtype=np.int64) * INTERVAL,
+        "pir1": pir1_column,
+        "pir2": pir2_column,
+        "object_temp": np.full(n, object_temp, dtype=np.float32),
+        "ambient_temp": np.full(n, 22.0, dtype=np.float32),
+        "distance": np.full(n, 100.0, dtype=np.float32),
+        "valid": np.ones(n, dtype=bool),
+    }
+
+
+def replay_both(samples, config):
+    scalar = replay_scalar(samples, config)
+    vectorized = replay_vectorized(samples, config)
+    assert vectorized.events == scalar.events
+    assert vectorized.error_count == scalar.error_count
+    assert vectorized.state == scalar.state
+    return scalar
+
+
+def event_indices(result):
+    return [event.index for event in result.events]
+
+
+def test_alert_duration_zero_returns_to_monitoring_on_the_same_sample():
+    # PIR だけでスコア3。10サンプルおきの反応は、既定のアラート時間（3000ms）なら2回目が無視される
+    samples = trace(40, pir1=[0, 1, 10, 11, 20, 21])
+    assert event_indices(replay_both(samples, DetectorConfig(detection_threshold=3))) == [2, 22]
+
+    result = replay_both(samples, DetectorConfig(detection_threshold=3, alert_duration=0))
+    assert event_indices(result) == [2, 12, 22]
+    assert result.total_detections == 3
+    assert result.state == MONITORING
+
+
+def test_alert_duration_zero_on_last_sample():
+    result = replay_both(trace(3, pir1=[0, 1]), DetectorConfig(detection_threshold=3, alert_duration=0))
+    assert event_indices(result) == [2]
+    assert result.state == MONITORING
+
+
+def test_alert_expiring_on_a_firing_sample_drops_that_event():
+    # 2回目の検知イベントは index 12（t=2400）。アラート開始は t=400
+    samples = trace(30, pir1=[0, 1, 10, 11])
+    assert event_indices(replay_both(samples, DetectorConfig(detection_threshold=3, alert_duration=2000))) == [2]
+    assert event_indices(replay_both(samples, DetectorConfig(detection_threshold=3, alert_duration=1800))) == [2, 12]
+
+
+def test_score_equal_to_threshold_fires():
+    config = DetectorConfig(detection_threshold=3)
+    assert event_indices(replay_both(trace(20, pir1=[0, 1]), config)) == [2]
+    assert event_indices(replay_both(trace(20, pir1=[0, 1]), DetectorConfig(detection_threshold=4))) == []
+
+
+def test_threshold_crossed_at_window_edge():
+    config = DetectorConfig(detection_threshold=3)
+    # 0 と 6 の反応は 6, 7 の2サンプルで同じ窓に入る → 7 で確定
+    assert event_indices(replay_both(trace(20, pir1=[0, 6]), config)) == [7]
+    # 0 と 7 は 7 の1サンプルだけ同じ窓に入り、8 で 0 が窓から抜けるので確定しない
+    assert event_indices(replay_both(trace(20, pir1=[0, 7]), config)) == []
+    # 0 と 8 は同じ窓に入らない
+    assert event_indices(replay_both(trace(20, pir1=[0, 8]), config)) == []
+
+
+def test_temperature_exactly_at_threshold_does_not_score():
+    # 温度差がちょうど閾値（5.00°C）なら加点しない。PIR と合わせても 3 < 4
+    at_threshold = trace(20, pir1=[0, 1], object_temp=27.0)
+    assert event_indices(replay_both(at_threshold, DetectorConfig())) == []
+    above_threshold = trace(20, pir1=[0, 1], object_temp=27.25)
+    assert event_indices(replay_both(above_threshold, DetectorConfig())) == [2]
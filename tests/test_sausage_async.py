@@ -0,0 +1,29 @@
+import asyncio
+import random
+
+from sausage import DeliciousSausageMaker, SimulatedClock
+from sausage_async import AsyncSausageMaker
+
+
+def test_maker_can_be_reused_across_event_loops():
+    maker = AsyncSausageMaker(DeliciousSausageMaker(rng=random.Random(1), verbose=False, clock=SimulatedClock()),
+                              time_scale=0.001)
+    first = asyncio.run(maker.make_batch(5))
+    second = asyncio.run(maker.make_batch(5))
+
+    assert len(first) == len(second) == 5
+    for result in first + second:
+        assert result.grade
+        assert result.total_score == result.base_score + result.spice_score + result.cooking_bonus
+
+
+def test_single_sausage_matches_sync_maker():
+    maker = AsyncSausageMaker(DeliciousSausageMaker(rng=random.Random(4), verbose=False, clock=SimulatedClock()),
+                              time_scale=0.0)
+    result = asyncio.run(maker.produce())
+    expected = DeliciousSausageMaker(rng=random.Random(4), verbose=False, clock=SimulatedClock()).produce()
+
+    assert result.meat_types == expected.meat_types
+    assert result.spices == expected.spices
+    assert result.total_score == expected.total_score
+    assert result.grade == expected.grade
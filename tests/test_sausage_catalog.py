@@ -0,0 +1,67 @@
+import copy
+import pickle
+import random
+
+import pytest
+
+from sausage import DeliciousSausageMaker, SimulatedClock
+
+NEW_MEAT = {"flavor": 99, "description": "試作"}
+
+MUTATIONS = {
+    "setitem": lambda table: table.__setitem__("試作肉", dict(NEW_MEAT)),
+    "delitem": lambda table: table.__delitem__(next(iter(table))),
+    "update": lambda table: table.update({"試作肉": dict(NEW_MEAT)}),
+    "ior": lambda table: table.__ior__({"試作肉": dict(NEW_MEAT)}),
+    "setdefault": lambda table: table.setdefault("試作肉", dict(NEW_MEAT)),
+    "pop": lambda table: table.pop(next(iter(table))),
+    "popitem": lambda table: table.popitem(),
+    "nested": lambda table: table[next(iter(table))].__setitem__("flavor", 99),
+}
+
+
+def maker():
+    return DeliciousSausageMaker(verbose=False, clock=SimulatedClock(), rng=random.Random(0))
+
+
+@pytest.mark.parametrize("mutation", MUTATIONS.values(), ids=MUTATIONS.keys())
+def test_mutations_rebuild_catalog(mutation):
+    sausage_maker = maker()
+    before = sausage_maker.catalog
+    mutation(sausage_maker.meat_options)
+    after = sausage_maker.catalog
+
+    assert after is not before
+    assert after.meat_flavor == {meat: info["flavor"] for meat, info in sausage_maker.meat_options.items()}
+
+
+def test_in_place_or_keeps_catalog_table():
+    sausage_maker = maker()
+    table = sausage_maker.meat_options
+    table |= {"試作肉": dict(NEW_MEAT)}
+
+    assert sausage_maker.meat_options is table
+    assert sausage_maker.catalog.meat_flavor["試作肉"] == 99
+    # 入れ子の dict も包まれているので、後からの変更も通知される
+    sausage_maker.meat_options["試作肉"]["flavor"] = 1
+    assert sausage_maker.catalog.meat_flavor["試作肉"] == 1
+
+
+def test_setdefault_existing_key_keeps_catalog():
+    sausage_maker = maker()
+    before = sausage_maker.catalog
+    meat = next(iter(sausage_maker.meat_options))
+    sausage_maker.meat_options.setdefault(meat, dict(NEW_MEAT))
+    assert sausage_maker.catalog is before
+
+
+@pytest.mark.parametrize("duplicate", [copy.deepcopy, lambda m: pickle.loads(pickle.dumps(m))])
+def test_copies_notify_only_themselves(duplicate):
+    original = maker()
+    original_catalog = original.catalog
+    clone = duplicate(original)
+    clone.meat_options["試作肉"] = dict(NEW_MEAT)
+
+    assert original.catalog is original_catalog
+    assert "試作肉" in clone.catalog.meat_flavor
+    assert "試作肉" not in original.catalog.meat_flavor
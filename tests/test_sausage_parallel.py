@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from sausage import (
+    DeliciousSausageMaker,
+    SimulatedClock,
+    derive_seed,
+    iter_batch_parallel,
+    make_batch_parallel,
+)
+from sausage_profile import StageProfiler
+
+
+def test_derive_seed_is_stable():
+    # 値が変わると過去の master_seed で再現できなくなるので固定値で確認する
+    assert derive_seed(0, 0) == 12426054289685354689
+    assert derive_seed(0, 1) == 17227200041832915037
+    assert derive_seed(42, 3) == 11043869433078333928
+    assert derive_seed(42, 3) == derive_seed(42, 3)
+    assert derive_seed(42, 3) != derive_seed(42, 4)
+    assert derive_seed(42, 3) != derive_seed(43, 3)
+
+
+@pytest.mark.parametrize("chunk_size", [7, 100])
+def test_worker_count_does_not_change_results(chunk_size):
+    n = 250
+    serial = list(iter_batch_parallel(n, master_seed=123, workers=1, chunk_size=chunk_size))
+    parallel = list(iter_batch_parallel(n, master_seed=123, workers=3, chunk_size=chunk_size))
+
+    assert len(serial) == n
+    assert serial == parallel
+
+
+def test_each_chunk_matches_a_seeded_maker():
+    n, chunk_size = 25, 10
+    results = make_batch_parallel(n, master_seed=5, workers=1, chunk_size=chunk_size)
+
+    expected = []
+    for index, start in enumerate(range(0, n, chunk_size)):
+        maker = DeliciousSausageMaker(rng=random.Random(derive_seed(5, index)),
+                                      verbose=False, clock=SimulatedClock())
+        expected.extend(maker.make_batch(min(chunk_size, n - start)))
+    assert results == expected
+
+
+def test_parallel_hook_counts_every_sausage():
+    n = 60
+    serial, parallel = StageProfiler(), StageProfiler()
+    make_batch_parallel(n, master_seed=9, workers=1, chunk_size=16, hook=serial)
+    make_batch_parallel(n, master_seed=9, workers=3, chunk_size=16, hook=parallel)
+
+    assert serial.histograms.keys() == parallel.histograms.keys()
+    for stage, histograms in serial.histograms.items():
+        for metric, histogram in histograms.items():
+            assert histogram.count == n
+            assert parallel.histograms[stage][metric].count == n
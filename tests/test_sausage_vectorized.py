@@ -0,0 +1,35 @@
+import random
+
+import pytest
+
+from sausage import DeliciousSausageMaker, SimulatedClock
+from sausage_vectorized import VectorizedScorer
+
+
+@pytest.mark.parametrize("seed", [0, 1, 42, 2024])
+def test_vectorized_score_matches_scalar_make_batch(seed):
+    n = 500
+    maker = DeliciousSausageMaker(rng=random.Random(seed), verbose=False, clock=SimulatedClock())
+    expected = maker.make_batch(n)
+
+    scorer = VectorizedScorer()
+    scored = scorer.score(scorer.draw_recipes(n, seed))
+    grades = scored.grades()
+
+    for row, result in enumerate(expected):
+        assert scored.base_score[row] == result.base_score
+        assert scored.spice_score[row] == result.spice_score
+        assert scored.cooking_bonus[row] == result.cooking_bonus
+        assert scored.total_score[row] == result.total_score
+        assert grades[row] == result.grade
+
+
+def test_encode_results_round_trips_scalar_results():
+    maker = DeliciousSausageMaker(rng=random.Random(7), verbose=False, clock=SimulatedClock())
+    results = maker.make_batch(200)
+
+    scorer = VectorizedScorer()
+    scored = scorer.score(scorer.encode_results(results))
+
+    assert list(scored.total_score) == [result.total_score for result in results]
+    assert scored.grades() == [result.grade for result in results]
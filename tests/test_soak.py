@@ -0,0 +1,41 @@
+import pytest
+
+import mame_host
+from mame_soak import check, default_report_minutes, run_soak
+
+
+def firmware_with_loop_prefix(code: str) -> str:
+    with open(mame_host.FIRMWARE_PATH, encoding="utf-8") as f:
+        source = f.read()
+    assert source.count("void loop() {") == 1
+    return source.replace("void loop() {", "void loop() {\n  " + code, 1)
+
+
+@pytest.mark.parametrize("hours", [0.2, 1, 3])
+def test_default_report_interval_gives_two_intervals(hours):
+    points = run_soak(hours, command_seconds=5)
+    assert len(points) >= 2
+    assert check(points) == []
+    # NeoPixel のピクセルバッファがヒープに乗っている（計測が空振りしていない）
+    assert points[-1].allocations > 0
+    assert points[-1].heap_in_use > 0
+    assert default_report_minutes(24) == 60
+
+
+@pytest.mark.parametrize("leak", [
+    "void *volatile block = malloc(8); free(block);",
+    "delete new int(1);",
+])
+def test_allocations_in_loop_are_reported(leak):
+    points = run_soak(0.2, source=firmware_with_loop_prefix(leak))
+    problems = check(points)
+    assert any("malloc" in problem for problem in problems)
+
+
+def test_growing_heap_is_reported():
+    # 10分ごとに16バイト確保したままにする（volatile に入れないと最適化で消える）
+    leak = ("static void *volatile leaked; static unsigned long lastLeak = 0; "
+            "if (millis() - lastLeak > 600000UL) { lastLeak = millis(); leaked = malloc(16); }")
+    points = run_soak(1, report_minutes=10, source=firmware_with_loop_prefix(leak))
+    problems = check(points)
+    assert any("空きメモリが減少" in problem for problem in problems)
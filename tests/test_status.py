@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+from mame_ingest import IngestService
+from mame_sim import start_fleet
+from mame_status import FleetStatusCache, StatusServer
+from mame_store import ColumnarStore, device_dirname
+
+
+async def http_get(port: int, path: str):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode("ascii"))
+        head = await reader.readuntil(b"\r\n\r\n")
+        body = await reader.read()
+    finally:
+        writer.close()
+    return int(head.split(b" ", 2)[1]), json.loads(body)
+
+
+async def _serve_fleet(store_root: str, count: int, paths_to_get):
+    fleet = await start_fleet(count)
+    paths = [device.path for device in fleet]
+    cache = FleetStatusCache(ttl=0.0)
+    service = IngestService(ColumnarStore(store_root), poll_interval=0.05,
+                            on_status=cache.on_status, on_sensor=cache.on_sensor, status_interval=0.2)
+    cache.sensor_stats = service.sensor_stats
+    server = StatusServer(cache, port=0)
+    await server.start()
+    await service.start(paths)
+    try:
+        await asyncio.sleep(0.8)
+        responses = {path: await http_get(server.port, path) for path in paths_to_get(paths)}
+    finally:
+        server.close()
+        await server.wait_closed()
+        await service.stop()
+        for device in fleet:
+            device.close()
+    return paths, responses
+
+
+def test_devices_route_serves_each_simulated_device(tmp_path):
+    paths, responses = asyncio.run(_serve_fleet(
+        str(tmp_path), 2,
+        lambda paths: ["/status", "/status/summary", "/devices/unknown"]
+        + [f"/devices/{device_dirname(path)}" for path in paths]))
+
+    code, status = responses["/status"]
+    assert code == 200
+    assert sorted(status["devices"]) == sorted(device_dirname(path) for path in paths)
+    code, summary = responses["/status/summary"]
+    assert code == 200
+    assert summary["devices"] == summary["reachable"] == 2
+
+    for path in paths:
+        code, device = responses[f"/devices/{device_dirname(path)}"]
+        assert code == 200
+        assert device["device"] == path
+        assert device["name"] == device_dirname(path)
+        assert device["version"] is not None   # printJsonStatus が届いている
+        assert not device["stale"]
+    assert responses["/devices/unknown"][0] == 404
+
+
+def test_colliding_device_names_are_disambiguated():
+    now = [0.0]
+    cache = FleetStatusCache(ttl=0.0, clock=lambda: now[0])
+    server = StatusServer(cache, port=0)
+    for device, detections in (("/dev/ttyACM0", 1), ("dev/ttyACM0", 2), ("/dev/ttyACM0/", 3)):
+        cache.on_status(device, {"state": "MONITORING", "total_detections": detections})
+
+    names = {device: entry.name for device, entry in cache.devices.items()}
+    assert names == {"/dev/ttyACM0": "dev_ttyACM0", "dev/ttyACM0": "dev_ttyACM0_2", "/dev/ttyACM0/": "dev_ttyACM0_3"}
+
+    snapshot = cache.snapshot()
+    assert snapshot["summary"]["devices"] == 3
+    assert snapshot["summary"]["total_detections"] == 6
+    for device, name in names.items():
+        code, body = server.route("GET", f"/devices/{name}")
+        assert code == 200
+        assert json.loads(body)["device"] == device
+
+    # 名前は最初に割り当てたまま変わらない
+    cache.on_status("dev/ttyACM0", {"total_detections": 5})
+    assert cache.devices["dev/ttyACM0"].name == "dev_ttyACM0_2"